@@ -4,6 +4,7 @@ import argparse
 import pickle
 from Graph import *
 from dijkstra import *
+from neoRNA.structure.pairing import BRACKET_FAMILIES, NESTED_BRACKETS, partner_array, graph_edges
 import pdb 
 
 def parse_args():
@@ -11,42 +12,26 @@ def parse_args():
     parser.add_argument("--bpRNA_pickle")
     parser.add_argument("--out_prefix")
     parser.add_argument("--approach",default="inferred",choices=["inferred","bootstrap"])
+    parser.add_argument("--pseudoknots",action="store_true",help="add edges for the pseudoknot pairs as well ([], {}, <>, Aa...). By default only () pairs are edges.")
     return parser.parse_args()
 
 
-def get_graph_representation(bpRNA_entry,approach):
+def get_graph_representation(bpRNA_entry,approach,brackets=NESTED_BRACKETS):
     annotation=bpRNA_entry[approach].split('\n')
     features=annotation[5]
     cur_sequence=annotation[3]
     cur_structure=annotation[4]
     cur_structure_names=annotation[5] 
         
-    #populate all edges in the graph
-    complement_nodes=get_matched_brackets(cur_structure) 
     g=Graph()
-    for node in complement_nodes:
-        #annotate the edges 
-        g.weights[(node,complement_nodes[node])]=1
-        g.edges[node]=[complement_nodes[node]]    
     for i in range(len(cur_sequence)):
-        if i < (len(cur_sequence)-1): 
-            downstream_node=i+1
-            if i not in g.edges:
-                g.edges[i]=[downstream_node]
-            else:
-                g.edges[i].append(downstream_node)
-            g.weights[tuple([i,downstream_node])]=1
-            g.weights[tuple([downstream_node,i])]=1
-        if i > 0:
-            upstream_node=i-1
-            if i not in g.edges:
-                g.edges[i]=[upstream_node]
-            else: 
-                g.edges[i].append(upstream_node)
-            g.weights[tuple([i,upstream_node])]=1
-            g.weights[tuple([upstream_node,i])]=1
+        g.edges[i]=[]
         #annotate the nodes
         g.nodes[i]=(cur_sequence[i],cur_structure_names[i])
+    #populate all edges in the graph: base pairs and backbone, both directions
+    for i,j in graph_edges(partner_array(cur_structure,brackets)).tolist():
+        g.edges[i].append(j)
+        g.weights[(i,j)]=1
     return g
 
 def get_shortest_paths_for_all_nodes(g,cur_id,distance_dict,edge_dict):
@@ -64,22 +49,6 @@ def get_shortest_paths_for_all_nodes(g,cur_id,distance_dict,edge_dict):
             distance_dict[cur_id][(i,j)]=length_shortest_path_i_j
     return distance_dict,edge_dict
 
-def get_matched_brackets(cur_structure):
-    edge_dict=dict()
-    open=[]
-    for i in range(len(cur_structure)):
-        cur_character=cur_structure[i]
-        if cur_character==".":
-            continue 
-        if cur_character=="(":
-            open.append(i)
-        elif cur_character==")":
-            last_open=open.pop()
-            edge_dict[last_open]=i
-            edge_dict[i]=last_open
-    assert len(open)==0
-    return edge_dict 
-
 def main():
     args=parse_args()
     bprna_data=pickle.load(open(args.bpRNA_pickle,'rb'))
@@ -90,9 +59,10 @@ def main():
     #for each isoform, generate a dictionary of all nodes : node_id -> (sequence,structure)
     node_dict=dict() 
     
+    brackets=BRACKET_FAMILIES if args.pseudoknots else NESTED_BRACKETS
     for cur_id in bprna_data:
         print("analyzing id:"+str(cur_id))
-        cur_graph=get_graph_representation(bprna_data[cur_id],args.approach)
+        cur_graph=get_graph_representation(bprna_data[cur_id],args.approach,brackets)
         node_dict[cur_id]=cur_graph.nodes        
         distance_dict,edge_dict=get_shortest_paths_for_all_nodes(cur_graph,cur_id,distance_dict,edge_dict)
         
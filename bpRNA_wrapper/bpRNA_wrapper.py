@@ -3,6 +3,8 @@ import json
 import pickle
 import pdb
 import subprocess
+from neoRNA.structure.bp_rna_annotator import BpRnaAnnotator
+from neoRNA.analysis.bootstrap_ensemble import BootstrapEnsemble
 def parse_args():
     parser=argparse.ArgumentParser(description="Wrapper for bpRNA")
     parser.add_argument("--data_json")
@@ -12,6 +14,13 @@ def parse_args():
     return parser.parse_args()
 
 def get_bpRNA_annotation(input_string):
+    #annotate in-process, same .st text as bpRNA.pl; bpRNA.pl is only needed for pseudoknots
+    #(or for input which is not a single header/sequence/structure record)
+    try:
+        header,sequence_string,structure=input_string.strip('\n').split('\n')
+        return BpRnaAnnotator.to_st(sequence_string,structure)
+    except ValueError:
+        pass
     #use an intermediate tmp file because bpRNA needs it
     out_tmp=open('tmp.dbn','w')
     out_tmp.write(input_string+'\n')
@@ -23,9 +32,21 @@ def get_bpRNA_annotation(input_string):
     return annotation    
 
 
+def get_bootstrap_annotation(bootstraps,structure_id):
+    try:
+        return BpRnaAnnotator.format_st(bootstraps.annotation(structure_id))
+    except ValueError:
+        sequence_string,struct=bootstraps.structure(structure_id)
+        return get_bpRNA_annotation('\n'.join(['>bootstrap',sequence_string,struct]))
+
+
 def main():
     args=parse_args()
     data=json.load(open(args.data_json,'r'))
+    #dedup the bootstrap structures of all the items at once; each item keeps (structure id, count) arrays
+    bootstraps=BootstrapEnsemble.from_items(data['items'])
+    #each unique structure is annotated once, the list index is its structure id
+    bootstrap_annotations=[get_bootstrap_annotation(bootstraps,structure_id) for structure_id in range(bootstraps.structure_count)]
     data_dict=dict()
     for item in data['items']:
         #pdb.set_trace()
@@ -34,23 +55,13 @@ def main():
         data_dict[cur_id]=dict()
         sequence_string=item['sequence_string']
         structure=item['_'.join([args.approach,'structure'])]
-        try:
-            bootstrap_structures=item['bootstrap_structures']
-            data_dict[cur_id]['bootstraps']=dict()
-            struct_tally=dict()
-            #get a tally of how frequent each bootstrapped structure is
-            for struct in bootstrap_structures:
-                if struct not in struct_tally:
-                    struct_tally[struct]=1
-                else:
-                    struct_tally[struct]+=1
-            bootstrap_count=0
-            for struct in struct_tally:
-                header=','.join(['>bootstrap',cur_id+'.'+str(bootstrap_count),'frequency:'+str(struct_tally[struct])])
-                bpRNA_annotation=get_bpRNA_annotation('\n'.join([header,sequence_string,struct]))
-                bootstrap_count+=1
-                data_dict[cur_id]['bootstraps'][bpRNA_annotation]=struct_tally[struct]
-        except:
+        if cur_id in bootstraps:
+            #plain data, readers rebuild the BootstrapEnsemble on load: the annotations of the unique structures
+            #plus the item's structure ids / counts int arrays. the list is shared by the items, so pickle stores it once
+            data_dict[cur_id]['bootstraps']={'annotations':bootstrap_annotations,
+                                             'structure_ids':bootstraps.structure_ids(cur_id),
+                                             'counts':bootstraps.counts(cur_id)}
+        else:
             print("no bootstrap structures for "+str(cur_id)+", continuing")
         header=','.join(['>'+args.approach,cur_id])
         bpRNA_annotation=get_bpRNA_annotation('\n'.join([header,sequence_string,structure]))
@@ -65,9 +76,10 @@ def main():
         outf.write(data_dict[cur_id][args.approach]+'\n')
         i=0
         if 'bootstraps' in data_dict[cur_id]: 
-            for entry in data_dict[cur_id]['bootstraps']:
-                outf.write('>'+cur_id+'.'+str(i)+',bootstrap,count='+str(data_dict[cur_id]['bootstraps'][entry])+'\n')
-                outf.write(entry)
+            cur_bootstraps=data_dict[cur_id]['bootstraps']
+            for structure_id,count in zip(cur_bootstraps['structure_ids'].tolist(),cur_bootstraps['counts'].tolist()):
+                outf.write('>'+cur_id+'.'+str(i)+',bootstrap,count='+str(count)+'\n')
+                outf.write(cur_bootstraps['annotations'][structure_id])
                 i+=1
 
         
@@ -7,6 +7,8 @@ import argparse
 import sys
 sys.path.append("2dGraphs")
 from convert_bpRNA_to_2dGraph import * 
+from neoRNA.analysis.bootstrap_ensemble import BootstrapEnsemble
+from neoRNA.sequence.mutation import MutationType, parse_mutation_syntax
 
 def parse_args():
     parser=argparse.ArgumentParser(description="generate feature matrix for adar edited RNA")
@@ -17,6 +19,7 @@ def parse_args():
     parser.add_argument("--approach",default="computational",choices=["computational","experimental"])
     parser.add_argument("--source",default="NA")
     parser.add_argument("--calculate_2d_distance",action='store_true',default=False)
+    parser.add_argument("--num_downstream_features",type=int,default=2,help="number of non-stem features 3' of the editing site to annotate (x1, x2, ...)")
     return parser.parse_args()
 
 def format_id(rna_id):
@@ -71,79 +74,116 @@ def get_structure_length(features,editing_site,structure_type):
     structure_length=structure_end-structure_start
     return structure_length
 
-def get_downstream_nonstem_info(features,editing_site,annotation):
-    #find the first non-stem feature 3' of editing site (might include the editing site)
-    x1feat_downstream_of_edit_site=None
-    hook_pos=None
-    try:
-        for pos in range(editing_site,len(features)):
-            if features[pos]!="S":
-                x1feat_downstream_of_edit_site=features[pos]
-                hook_pos=pos
-                break
-    except:
-        return None,None,None,None,None,None
-    #get the start & end position of this feature
-    feat_start=None
-    feat_end=None
-    for i in range(hook_pos,0,-1):
-        if features[i]!=x1feat_downstream_of_edit_site:
-            feat_start=i+1
-            break
-    for i in range(hook_pos,len(features)):
-        if features[i]!=x1feat_downstream_of_edit_site:
-            feat_end=i-1
-            break
-    try:
-        x1feat_downstream_of_edit_site_length_editing_strand=feat_end-feat_start+1
-    except:
-        return None,None,None,None,None,None
-    x1feat_downstream_of_edit_site_length_complementary_strand=0
+def get_element_table(features,annotation):
+    '''
+    parse the structure string and the bpRNA element lines (annotation[7::]) once, so the
+    downstream/upstream feature queries below are lookups instead of scans. Returns a dict with
+        runs -- (feature, start, end) of every run of identical characters in features, 0-indexed
+        run_index -- index of the run each position belongs to
+        nonstem_runs -- indices of the non-stem runs, 5' to 3'
+        next_nonstem -- for each position, index in nonstem_runs of the first non-stem run at or after it
+        by_span -- (type, start, end) --> element entry, 0-indexed like features
+        by_name -- element name (i.e. I3.1) --> element entry
+    each element entry has: name, type, start, end, length, 5prime_cp, 3prime_cp, partner
+    (the other strand of an interior loop, or None)
+    '''
+    runs=[]
+    run_index=[0]*len(features)
+    for pos in range(len(features)):
+        if pos==0 or features[pos]!=features[pos-1]:
+            runs.append([features[pos],pos,pos])
+        else:
+            runs[-1][2]=pos
+        run_index[pos]=len(runs)-1
+    runs=[tuple(run) for run in runs]
+    nonstem_runs=[i for i in range(len(runs)) if runs[i][0]!="S"]
+    next_nonstem=[len(nonstem_runs)]*len(features)
+    rank=len(nonstem_runs)
+    for i in range(len(runs)-1,-1,-1):
+        if runs[i][0]!="S":
+            rank-=1
+        for pos in range(runs[i][1],runs[i][2]+1):
+            next_nonstem[pos]=rank
 
-        
-    #now, we know the type of feature, the start/end positions
-    #iterate through bpRNA annotation to get additional info (i.e. closing pairs)
+    by_span=dict()
+    by_name=dict()
     for entry in annotation[7::]:
-        if entry.startswith(x1feat_downstream_of_edit_site):
-            entry_tokens=entry.strip().split(' ')
-            entry_pos=[int(i) for i in entry_tokens[1].split('..')]
-            #Careful! comparing 0-indexed positions to 1-indexing 
-            if (((feat_start+1)==entry_pos[0]) and ((feat_end+1)==entry_pos[1])):
-                #this is the feature we want
-                x1feat_downstream_fo_edit_site_5prime_cp=entry_tokens[4]
-                if len(entry_tokens)>5:
-                    x1feat_downstream_of_edit_site_3prime_cp=entry_tokens[-1]
-                    to_find=None
-                else:
-                    #find the complementary entry for the internal loop
-                    try:
-                        tofind_base=entry_tokens[0].split('.')[0]
-                        found_suffix=entry_tokens[0].split('.')[1]
-                        if found_suffix=="1":
-                            to_find=tofind_base+'.2'
-                        else:
-                            to_find=tofind_base+'.1'
-                    except:
-                        to_find=None
-                        x1feat_downstream_of_edit_site_3prime_cp=None
-                break
-    if(to_find!=None):
-        for entry in annotation[7::]:
-            if entry.startswith(to_find):
-                x1feat_downstream_of_edit_site_3prime_cp=entry.strip().split(' ')[-1]
-                pos_info=entry.strip().split(' ')[1]
-                pos_start=pos_info.split('..')[0]
-                pos_end=pos_info.split('..')[1]
-                x1feat_downstream_of_edit_site_length_complementary_strand=int(pos_end)-int(pos_start)+1 
-                break
-    return x1feat_downstream_of_edit_site \
-        ,x1feat_downstream_of_edit_site_length_editing_strand \
-        ,x1feat_downstream_of_edit_site_length_complementary_strand \
-        ,x1feat_downstream_fo_edit_site_5prime_cp \
-        ,x1feat_downstream_of_edit_site_3prime_cp \
+        entry_tokens=entry.strip().split(' ')
+        #only the loop elements; stems, segments, pseudoknots and NCBPs are not looked up
+        if len(entry_tokens)<3 or entry_tokens[0][0] not in "HBIMXE" or '..' not in entry_tokens[1]:
+            continue
+        #Careful! bpRNA positions are 1-indexed, store them 0-indexed like features
+        entry_pos=[int(i)-1 for i in entry_tokens[1].split('..')]
+        element=dict()
+        element['name']=entry_tokens[0]
+        element['type']=entry_tokens[0][0]
+        element['start']=entry_pos[0]
+        element['end']=entry_pos[1]
+        element['length']=entry_pos[1]-entry_pos[0]+1
+        element['5prime_cp']=entry_tokens[4] if len(entry_tokens)>4 else None
+        element['3prime_cp']=entry_tokens[-1] if len(entry_tokens)>5 else None
+        element['partner']=None
+        by_name[element['name']]=element
+        by_span[(element['type'],element['start'],element['end'])]=element
+    #an interior loop line has one closing pair, the other one is on the partner (.1 <-> .2) line
+    for name in by_name:
+        element=by_name[name]
+        if element['type']!="I" or '.' not in name:
+            continue
+        base,suffix=name.split('.')
+        partner=by_name.get(base+('.2' if suffix=="1" else '.1'))
+        if partner!=None:
+            element['partner']=partner['name']
+            element['3prime_cp']=partner['5prime_cp']
+
+    element_table=dict()
+    element_table['runs']=runs
+    element_table['run_index']=run_index
+    element_table['nonstem_runs']=nonstem_runs
+    element_table['next_nonstem']=next_nonstem
+    element_table['by_span']=by_span
+    element_table['by_name']=by_name
+    return element_table
+
+def get_nonstem_info(element_table,run):
+    #feature type, editing strand length, complementary strand length, closing pairs and end position of a run
+    feat,feat_start,feat_end=element_table['runs'][run]
+    element=element_table['by_span'].get((feat,feat_start,feat_end))
+    if element==None:
+        return feat,feat_end-feat_start+1,0,None,None,feat_end
+    length_complementary_strand=0
+    if element['partner']!=None:
+        length_complementary_strand=element_table['by_name'][element['partner']]['length']
+    return feat \
+        ,element['length'] \
+        ,length_complementary_strand \
+        ,element['5prime_cp'] \
+        ,element['3prime_cp'] \
         ,feat_end
 
-def annotate_structure(editing_levels,bprna_data,approach,calculate_2d_distance):
+def get_downstream_nonstem_features(features,editing_site,annotation,num_features,element_table=None):
+    #the first num_features non-stem features 3' of editing site (the first might include the editing site)
+    #x1 is the first, x2 the next non-stem run after the end of x1, and so on
+    if element_table==None:
+        element_table=get_element_table(features,annotation)
+    empty=(None,None,None,None,None,None)
+    if editing_site==None or editing_site<0 or editing_site>=len(features):
+        return [empty]*num_features
+    first=element_table['next_nonstem'][editing_site]
+    nonstem_runs=element_table['nonstem_runs']
+    downstream=[]
+    for k in range(num_features):
+        if first+k<len(nonstem_runs):
+            downstream.append(get_nonstem_info(element_table,nonstem_runs[first+k]))
+        else:
+            downstream.append(empty)
+    return downstream
+
+def get_downstream_nonstem_info(features,editing_site,annotation,element_table=None):
+    #find the first non-stem feature 3' of editing site (might include the editing site)
+    return get_downstream_nonstem_features(features,editing_site,annotation,1,element_table)[0]
+
+def annotate_structure(editing_levels,bprna_data,approach,calculate_2d_distance,num_downstream_features=2):
     '''
     For each mutation: 
         mfeat
@@ -168,6 +208,8 @@ def annotate_structure(editing_levels,bprna_data,approach,calculate_2d_distance)
     x2feat_downstream_of_edit_site_length_complementary_strand
     x2feat_downstream_of_edit_site_5prime_cp
     x2feat_downstream_of_edit_site_3prime_cp
+
+    ... up to x{num_downstream_features}feat_downstream_of_edit_site
     '''
     structure_features=dict() 
     for cur_id in bprna_data:
@@ -220,35 +262,21 @@ def annotate_structure(editing_levels,bprna_data,approach,calculate_2d_distance)
             editing_levels[cur_id]['mut'][i]['mp_2d_dist_to_edit']=mp_2d_dist_to_edit
                         
             
-        #length of internal loop downstream of editing site, type of loop, closing pair 
-        x1feat_downstream_of_edit_site \
-            ,x1feat_downstream_of_edit_site_length_editing_strand \
-            ,x1feat_downstream_of_edit_site_length_complementary_strand \
-            ,x1feat_downstream_fo_edit_site_5prime_cp \
-            ,x1feat_downstream_of_edit_site_3prime_cp \
-            ,x1feat_downstream_of_edit_site_endpos=get_downstream_nonstem_info(features,editing_site,annotation)
-        
-        x2feat_downstream_of_edit_site \
-            ,x2feat_downstream_of_edit_site_length_editing_strand \
-            ,x2feat_downstream_of_edit_site_length_complementary_strand \
-            ,x2feat_downstream_of_edit_site_5prime_cp \
-            ,x2feat_downstream_of_edit_site_3prime_cp \
-            ,x2feat_downstream_of_edit_site_endpos=get_downstream_nonstem_info(features,x1feat_downstream_of_edit_site_endpos,annotation)
+        #length of internal loop downstream of editing site, type of loop, closing pair
+        element_table=get_element_table(features,annotation)
+        downstream_features=get_downstream_nonstem_features(features,editing_site,annotation,num_downstream_features,element_table)
 
         #store all to dict
         structure_features[cur_id]['editing_feature']=editing_feature
         structure_features[cur_id]['stem_length']=stem_length
         structure_features[cur_id]['hairpin_length']=hairpin_length
-        structure_features[cur_id]['x1feat_downstream_of_edit_site']=x1feat_downstream_of_edit_site
-        structure_features[cur_id]['x1feat_downstream_of_edit_site_length_editing_strand']=x1feat_downstream_of_edit_site_length_editing_strand
-        structure_features[cur_id]['x1feat_downstream_of_edit_site_length_complementary_strand']=x1feat_downstream_of_edit_site_length_complementary_strand
-        structure_features[cur_id]['x1feat_downstream_of_edit_site_5prime_cp']=x1feat_downstream_fo_edit_site_5prime_cp
-        structure_features[cur_id]['x1feat_downstream_of_edit_site_3prime_cp']=x1feat_downstream_of_edit_site_3prime_cp
-        structure_features[cur_id]['x2feat_downstream_of_edit_site']=x2feat_downstream_of_edit_site
-        structure_features[cur_id]['x2feat_downstream_of_edit_site_length_editing_strand']=x2feat_downstream_of_edit_site_length_editing_strand
-        structure_features[cur_id]['x2feat_downstream_of_edit_site_length_complementary_strand']=x2feat_downstream_of_edit_site_length_complementary_strand
-        structure_features[cur_id]['x2feat_downstream_of_edit_site_5prime_cp']=x2feat_downstream_of_edit_site_5prime_cp
-        structure_features[cur_id]['x2feat_downstream_of_edit_site_3prime_cp']=x2feat_downstream_of_edit_site_3prime_cp
+        for k in range(num_downstream_features):
+            prefix='x'+str(k+1)+'feat_downstream_of_edit_site'
+            structure_features[cur_id][prefix]=downstream_features[k][0]
+            structure_features[cur_id][prefix+'_length_editing_strand']=downstream_features[k][1]
+            structure_features[cur_id][prefix+'_length_complementary_strand']=downstream_features[k][2]
+            structure_features[cur_id][prefix+'_5prime_cp']=downstream_features[k][3]
+            structure_features[cur_id][prefix+'_3prime_cp']=downstream_features[k][4]
     return structure_features,editing_levels 
     
 def write_feature_matrix(editing_levels,structure_dict,outf,source):
@@ -301,18 +329,19 @@ def annotate_mutation(mut,editing_site):
     mtype=None
     adist=None
 
-    if mut.lower().startswith('indel'):
-        mtype='indel'
-        mp=mut[5::].split('-')[0]
-    elif mut.lower().startswith('wt'): 
-        #This is wild type
-        mtype="wt"
-    else:
-        mp=mut[:-4]
-        adist=editing_site-int(mp)
-        mref=mut[-4]
-        malt=mut[-1]
-        mtype="mismatch"
+    #lenient parsing: "wt_2" is the wild type, "indel..." an indel
+    mutations=parse_mutation_syntax(mut,strict=False)
+    if not mutations:
+        raise ValueError('Invalid mutation syntax',mut)
+    mutation=mutations[0]
+    mtype=mutation.mut_type
+    if mtype==MutationType.Indel:
+        mp=mutation.position
+    elif mtype==MutationType.Mismatch:
+        mp=mutation.position
+        adist=editing_site-mp
+        mref=mutation.ref_nt
+        malt=mutation.alt_nt
     return mp,adist,mref,malt,mtype
 
 def get_mut_info(editing_levels_dict):
@@ -341,23 +370,37 @@ def get_mut_info(editing_levels_dict):
         editing_levels_dict[cur_id]['mut']=mut_dict 
     return editing_levels_dict
 
-def annotation_base_in_stem_freq(editing_levels_dict,bprna_data,outf,feat_type):
+def get_bootstrap_ensemble(bprna_data):
+    #the ensemble is rebuilt with the stored bpRNA annotations (bpRNA.pl's for pseudoknots), never re-annotated.
+    #pickles from bpRNA_wrapper.py keep the unique annotations plus per-item structure_ids / counts arrays;
+    #older ones keep a {annotation: count} dict per item, and a few embed the ensemble itself
+    ensemble=None
+    for entry in bprna_data:
+        bootstraps=bprna_data[entry].get('bootstraps')
+        if isinstance(bootstraps,BootstrapEnsemble):
+            return bootstraps
+        if not bootstraps:
+            continue
+        if ensemble is None:
+            ensemble=BootstrapEnsemble()
+        if 'structure_ids' in bootstraps:
+            annotations=[bootstraps['annotations'][structure_id] for structure_id in bootstraps['structure_ids']]
+            counts=bootstraps['counts']
+        else:
+            annotations=list(bootstraps.keys())
+            counts=list(bootstraps.values())
+        for annotation,count in zip(annotations,counts):
+            lines=annotation.split('\n')
+            ensemble.add(entry,lines[3],[lines[4]],[int(count)],[annotation])
+    return ensemble
+
+def annotation_base_in_stem_freq(editing_levels_dict,bootstraps,outf,feat_type):
     entries=editing_levels_dict.keys()
     stem_freq=dict()
     for entry in entries:
-        bootstraps=bprna_data[entry]['bootstraps']        
-        struct_len=len(bprna_data[entry]['annotation'].split('\n')[5])
-        stem_count=[0]*struct_len
-        num_bootstraps=0
         #weight frequencies by the number of times the bootstrap is observed. 
-        for bootstrap in bootstraps:
-            bootstrap_count=bootstraps[bootstrap]
-            num_bootstraps+=bootstrap_count
-            structure=bootstrap.split('\n')[5]
-            for base in range(struct_len):
-                if structure[base]==feat_type:
-                    stem_count[base]+=bootstrap_count
-        stem_freq[entry]=[float(i)/num_bootstraps for i in stem_count]
+        stem_freq[entry]=bootstraps.position_profile(entry,feat_type)[:,0].tolist()
+        struct_len=len(stem_freq[entry])
     #write the output file
     outf=open(outf+'.'+feat_type+'.freq.txt','w')
     outf.write('RNA_ID\tEditingLevel\t'+'\t'.join([feat_type+'.base'+str(i) for i in range(struct_len)])+'\n')
@@ -377,14 +420,15 @@ def main():
     
     #what fraction of bases in bootstrapped samples are in specified_feature?
     if (args.annotate_bootstraps==True):
-        annotation_base_in_stem_freq(editing_levels_dict,bprna_data,outf,'S')
-        annotation_base_in_stem_freq(editing_levels_dict,bprna_data,outf,'I')
-        annotation_base_in_stem_freq(editing_levels_dict,bprna_data,outf,'B')
-        annotation_base_in_stem_freq(editing_levels_dict,bprna_data,outf,'H')
+        bootstraps=get_bootstrap_ensemble(bprna_data)
+        annotation_base_in_stem_freq(editing_levels_dict,bootstraps,outf,'S')
+        annotation_base_in_stem_freq(editing_levels_dict,bootstraps,outf,'I')
+        annotation_base_in_stem_freq(editing_levels_dict,bootstraps,outf,'B')
+        annotation_base_in_stem_freq(editing_levels_dict,bootstraps,outf,'H')
     
 
     #annotate computational/experimental
-    structure_dict,editing_levels_dict=annotate_structure(editing_levels_dict,bprna_data,args.approach,args.calculate_2d_distance)
+    structure_dict,editing_levels_dict=annotate_structure(editing_levels_dict,bprna_data,args.approach,args.calculate_2d_distance,args.num_downstream_features)
     source=args.source
     if source.__contains__('_'):
         source=source.replace('_','.') 
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+
+"""
+Bootstrap Ensemble
+--------------------
+
+The bootstrapped structures of a library, deduplicated once for all the items (and their replicates).
+
+Each unique (sequence, structure) gets a "structure id" and is annotated only once (`BpRnaAnnotator`). An item
+keeps two compact arrays - the ids of its structures and how many times each was observed - so the statistics
+are weighted sums over the unique structures:
+- `position_profile` - the weighted frequency of each annotation code (S/H/B/I/M/X/E) at each position.
+- `element_frequencies` - the same, at one position (e.g. the editing site).
+- `expected_features` - the weighted mean of feature engine columns, such as the stem length at the editing site.
+
+A structure can also come with its annotation already made, such as the bpRNA.pl ".st" text of a pseudoknot (see
+`add`). The statistics leave out the structures which cannot be annotated (pseudoknots without a given
+annotation) or do not fit the item's length, see `valid_structures`.
+
+`bootstrap_feature_columns()` / `BootstrapEnsemble.features()` give them as feature columns, by "RNA ID".
+"""
+
+from collections import Counter, OrderedDict
+from itertools import repeat
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from neoRNA.analysis.feature_engine import CompiledStructure, FeatureEngine
+from neoRNA.structure.bp_rna_annotator import BpRnaAnnotation, BpRnaAnnotator
+
+
+# ----------------------------------
+# region Constants
+
+# The codes of the bpRNA annotation string
+ANNOTATION_CODES = 'SHBIMXE'
+
+# Feature engine columns averaged over the bootstraps
+EXPECTED_FEATURES = [
+    'site_length_stem',
+    'stem_length',
+    'all_stem_length',
+]
+
+# endregion
+
+
+# ----------------------------------
+# region Bootstrap Ensemble
+
+class BootstrapEnsemble(object):
+    r"""
+    The bootstrapped structures of a library.
+
+    Usage
+    -------
+
+    >>> ensemble = BootstrapEnsemble.from_items(structure_summary['items'])
+    >>> profile = ensemble.position_profile('001')
+    >>> row = ensemble.features('001', 50)
+
+    """
+
+    def __init__(self):
+        # The unique (sequence, structure), by "structure id"
+        self.__structures: List[Tuple[str, str]] = list()
+        self.__structure_index: Dict[Tuple[str, str], int] = dict()
+
+        # (structure ids, counts) of each item
+        self.__items: Dict[str, Tuple[np.ndarray, np.ndarray]] = OrderedDict()
+
+        # Annotated on first use - or the error, if it cannot be annotated
+        self.__annotations: Dict[int, Union[BpRnaAnnotation, ValueError]] = dict()
+        # Compiled from the annotation on first use, or from the given one (see `add`)
+        self.__compiled_structures: Dict[int, CompiledStructure] = dict()
+
+    # ----------------------------------
+    # region Build
+
+    def add(self, rna_id: str, sequence_str: str, structures: Iterable[str],
+            counts: Optional[Iterable[int]] = None, annotations: Optional[Iterable[str]] = None) -> None:
+        r"""
+        Add the bootstrapped structures of an item. Adding the same item again (a replicate) merges the counts.
+
+        Parameters
+        ----------
+        rna_id: str
+        sequence_str: str
+        structures: Iterable[str]
+            The "dot-bracket" strings, one per bootstrap - repeated as observed.
+        counts: Optional[Iterable[int]]
+            How many times each structure was observed. Default - once.
+        annotations: Optional[Iterable[str]]
+            The bpRNA ".st" text of each structure, used instead of annotating it - e.g. bpRNA.pl's for pseudoknots.
+            Only the first one given for a structure is kept.
+        """
+
+        tally = Counter()
+        for structure, count, annotation in zip(structures, counts if counts is not None else repeat(1),
+                                                annotations if annotations is not None else repeat(None)):
+            key = (sequence_str, structure)
+            structure_id = self.__structure_index.get(key)
+            if structure_id is None:
+                structure_id = len(self.__structures)
+                self.__structure_index[key] = structure_id
+                self.__structures.append(key)
+            if annotation is not None and structure_id not in self.__compiled_structures:
+                self.__compiled_structures[structure_id] = CompiledStructure.from_bprna(annotation)
+            tally[structure_id] += count
+
+        if rna_id in self.__items:
+            structure_ids, counts = self.__items[rna_id]
+            for structure_id, count in zip(structure_ids.tolist(), counts.tolist()):
+                tally[structure_id] += count
+
+        # In the order the structures were first seen
+        structure_ids = sorted(tally)
+        self.__items[rna_id] = (np.array(structure_ids, dtype=np.int32),
+                                np.array([tally[structure_id] for structure_id in structure_ids], dtype=np.int32))
+
+    @classmethod
+    def from_items(cls, items: Iterable[Dict[str, Any]],
+                   structures_key: str = 'bootstrap_structures') -> 'BootstrapEnsemble':
+        r"""
+        Build from the items of "RNA Lib Structure Summary" files. Items without bootstraps are skipped.
+
+        Parameters
+        ----------
+        items: Iterable[Dict[str, Any]]
+            Items with `rna_id`, `sequence_string` and the bootstrapped structures.
+        structures_key: str
+            Default to "bootstrap_structures".
+        """
+
+        ensemble = cls()
+        for item in items:
+            if item.get(structures_key):
+                ensemble.add(item['rna_id'], item['sequence_string'], item[structures_key])
+
+        return ensemble
+
+    # endregion
+
+    # ----------------------------------
+    # region Lookup
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    def __contains__(self, rna_id: str) -> bool:
+        return rna_id in self.__items
+
+    @property
+    def rna_ids(self) -> List[str]:
+        return list(self.__items.keys())
+
+    @property
+    def structure_count(self) -> int:
+        r"""
+        Number of unique structures, for all the items.
+        """
+        return len(self.__structures)
+
+    def structure(self, structure_id: int) -> Tuple[str, str]:
+        r"""
+        (sequence, dot-bracket) of a structure id.
+        """
+        return self.__structures[structure_id]
+
+    def structure_ids(self, rna_id: str) -> np.ndarray:
+        return self.__items[rna_id][0]
+
+    def counts(self, rna_id: str) -> np.ndarray:
+        return self.__items[rna_id][1]
+
+    def weights(self, rna_id: str) -> np.ndarray:
+        r"""
+        The frequency of each structure of the item - the counts, normalized to "1".
+        """
+        counts = self.__items[rna_id][1]
+        return counts / counts.sum()
+
+    def valid_structures(self, rna_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        r"""
+        The structures of an item which the statistics are over, as (structure ids, weights).
+
+        Left out - the structures which cannot be annotated (pseudoknots without a given annotation, or the sequence
+        / structure lengths differ), and the ones not as long as the item's first structure (e.g. a replicate of
+        another sequence). The weights are normalized over the rest. Both arrays are empty if none is left.
+        """
+
+        structure_ids, counts = self.__valid_counts(rna_id)
+        if len(counts) == 0:
+            return structure_ids, np.zeros(0)
+
+        return structure_ids, counts / counts.sum()
+
+    # endregion
+
+    # ----------------------------------
+    # region Annotation
+
+    def annotate(self) -> None:
+        r"""
+        Annotate all the unique structures not annotated yet. The ones which cannot be annotated are skipped.
+        """
+        for structure_id in range(len(self.__structures)):
+            self.is_valid(structure_id)
+
+    def annotation(self, structure_id: int) -> BpRnaAnnotation:
+        r"""
+        The bpRNA annotation of a structure id. See `BpRnaAnnotator.format_st` for its ".st" text.
+
+        Raises
+        ------
+        ValueError
+            If the structure cannot be annotated, see `BpRnaAnnotator.annotate`.
+        """
+
+        annotation = self.__annotations.get(structure_id)
+        if annotation is None:
+            try:
+                annotation = BpRnaAnnotator.annotate(*self.__structures[structure_id])
+            except ValueError as error:
+                annotation = error
+            self.__annotations[structure_id] = annotation
+
+        if isinstance(annotation, ValueError):
+            raise annotation
+        return annotation
+
+    def is_valid(self, structure_id: int) -> bool:
+        r"""
+        If the structure can be annotated, or its annotation is given.
+        """
+
+        if structure_id in self.__compiled_structures:
+            return True
+        try:
+            self.annotation(structure_id)
+        except ValueError:
+            return False
+        return True
+
+    def compiled_structure(self, structure_id: int) -> CompiledStructure:
+        compiled_structure = self.__compiled_structures.get(structure_id)
+        if compiled_structure is None:
+            annotation = self.annotation(structure_id)
+            compiled_structure = CompiledStructure(annotation.sequence, annotation.dot_bracket,
+                                                   annotation.structure_array,
+                                                   [line.strip() for line in annotation.lines])
+            self.__compiled_structures[structure_id] = compiled_structure
+
+        return compiled_structure
+
+    def structure_array(self, structure_id: int) -> str:
+        r"""
+        The bpRNA annotation string of a structure id, like `EEEEESSSSSISSS...`.
+        """
+        return self.compiled_structure(structure_id).annotation
+
+    # endregion
+
+    # ----------------------------------
+    # region Statistics
+
+    def position_profile(self, rna_id: str, codes: str = ANNOTATION_CODES) -> np.ndarray:
+        r"""
+        The weighted frequency of each annotation code at each position.
+
+        Parameters
+        ----------
+        rna_id: str
+        codes: str
+            The annotation codes, one column each. Default - "SHBIMXE".
+
+        Returns
+        -------
+        profile: np.ndarray
+            L x len(codes) array. Row `p - 1` is position `p`. All "NaN" if the item has no valid structures.
+        """
+
+        structure_ids, counts = self.__valid_counts(rna_id)
+        if len(structure_ids) == 0:
+            length = len(self.structure(int(self.structure_ids(rna_id)[0]))[0])
+            return np.full((length, len(codes)), np.nan)
+
+        annotations = [self.structure_array(structure_id) for structure_id in structure_ids.tolist()]
+        # K x L codes, one row per structure
+        annotation_matrix = np.frombuffer(''.join(annotations).encode('ascii'), dtype=np.uint8) \
+            .reshape(len(annotations), -1)
+
+        # The observed counts first, normalized once
+        profile = np.empty((annotation_matrix.shape[1], len(codes)), dtype=np.float64)
+        for column, code in enumerate(codes):
+            profile[:, column] = counts @ (annotation_matrix == ord(code))
+
+        return profile / counts.sum()
+
+    def element_frequencies(self, rna_id: str, position: int, codes: str = ANNOTATION_CODES) -> Dict[str, float]:
+        r"""
+        The weighted frequency of each annotation code at a (1-based) position, such as the editing site.
+        All "None" if the item has no valid structures.
+        """
+
+        structure_ids, weights = self.valid_structures(rna_id)
+        frequencies = OrderedDict((code, 0.0 if len(weights) else None) for code in codes)
+        for structure_id, weight in zip(structure_ids.tolist(), weights.tolist()):
+            code = self.structure_array(structure_id)[position - 1]
+            if code in frequencies:
+                frequencies[code] += weight
+
+        return frequencies
+
+    def expected_features(self, rna_id: str, editing_position: int,
+                          columns: List[str] = None) -> List[Optional[float]]:
+        r"""
+        The weighted mean of feature engine columns (entry level, not per mutation), over the bootstraps.
+
+        A structure where a column is empty (`None`) is left out of its mean - e.g. the expected stem length at
+        the site is over the structures with the site in a stem.
+
+        Parameters
+        ----------
+        rna_id: str
+        editing_position: int
+            1-based.
+        columns: List[str]
+            Default - `EXPECTED_FEATURES`.
+
+        Returns
+        -------
+        values: List[Optional[float]]
+            One per column, "None" if empty in all the structures.
+        """
+
+        engine = _feature_engine(tuple(columns or EXPECTED_FEATURES))
+        totals = np.zeros(len(engine.columns))
+        total_weights = np.zeros(len(engine.columns))
+        for structure_id, weight in zip(*[array.tolist() for array in self.valid_structures(rna_id)]):
+            row = engine.extract(self.compiled_structure(structure_id), editing_position)[0]
+            for index, value in enumerate(row):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    totals[index] += weight * value
+                    total_weights[index] += weight
+
+        return [float(total / total_weight) if total_weight > 0 else None
+                for total, total_weight in zip(totals.tolist(), total_weights.tolist())]
+
+    def features(self, rna_id: str, editing_position: int) -> List[Optional[float]]:
+        r"""
+        The feature row of an item, as `bootstrap_feature_columns()`. All "None" if the item has no (valid)
+        bootstraps.
+        """
+
+        if rna_id not in self.__items:
+            return [None] * len(bootstrap_feature_columns())
+
+        weights = self.valid_structures(rna_id)[1]
+        if len(weights) == 0:
+            return [None] * len(bootstrap_feature_columns())
+
+        return [len(weights), float(weights.max())] \
+            + list(self.element_frequencies(rna_id, editing_position).values()) \
+            + self.expected_features(rna_id, editing_position)
+
+    # endregion
+
+    # ----------------------------------
+    # region Internal Methods
+
+    def __valid_counts(self, rna_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        r"""
+        (structure ids, counts) of the valid structures of an item, see `valid_structures`.
+        """
+
+        structure_ids, counts = self.__items[rna_id]
+        length = len(self.__structures[int(structure_ids[0])][0])
+        valid = np.array([len(self.__structures[structure_id][0]) == length and self.is_valid(structure_id)
+                          for structure_id in structure_ids.tolist()], dtype=bool)
+        return structure_ids[valid], counts[valid]
+
+    # endregion
+
+# endregion
+
+
+# ----------------------------------
+# region Utils
+
+# Feature engines of `expected_features`, by columns
+_FEATURE_ENGINES: Dict[Tuple[str, ...], FeatureEngine] = dict()
+
+
+def _feature_engine(columns: Tuple[str, ...]) -> FeatureEngine:
+    if columns not in _FEATURE_ENGINES:
+        _FEATURE_ENGINES[columns] = FeatureEngine(list(columns))
+    return _FEATURE_ENGINES[columns]
+
+
+def bootstrap_feature_columns() -> List[str]:
+    r"""
+    The columns of `BootstrapEnsemble.features`.
+    """
+
+    return ['bootstrap_structure_count', 'bootstrap_top_frequency'] \
+        + ['bootstrap_site_{}_frequency'.format(code) for code in ANNOTATION_CODES] \
+        + ['bootstrap_expected_{}'.format(column) for column in EXPECTED_FEATURES]
+
+# endregion
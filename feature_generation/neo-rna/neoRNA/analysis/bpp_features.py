@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+
+"""
+BPP Features
+--------------------
+
+Ensemble features from "base pair probability" (BPP) matrices - such as `computational_bpp` /
+`experimental_bpp` of the Biers results - instead of from a single structure.
+
+For each sequence:
+- `unpaired` - the probability of each position to be unpaired, `1 - sum_j P(i, j)`.
+- `entropy` - the Shannon entropy (natural log) of the pairing partner of each position, the "unpaired" state
+  included.
+
+For the editing site (`BPP_SITE_FEATURES`):
+- its unpaired probability and partner entropy, the probability of pairing 5' / 3' of it, its most likely pair.
+- the loop context - the unpaired probability of its neighbours, the mean unpaired probability / entropy
+  of a window around it.
+
+For each mutation (`BPP_MUTATION_FEATURES`):
+- its unpaired probability and its pair probability with the site.
+- the expected distance to the site, when a base pair of the mutated nt may be used as a shortcut:
+  `u(m) |m - s| + sum_j P(m, j) min(|m - s|, 1 + |j - s|)`.
+
+A library is computed in chunks of similar lengths, each one as a padded N x L x L array - no per-sequence loop.
+"""
+
+from collections import namedtuple
+
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+# ----------------------------------
+# region Constants
+
+# Half width of the window around the editing site
+DEFAULT_WINDOW = 3
+
+# Max size (N x L x L) of a chunk
+MAX_CHUNK_CELLS = 2 ** 24
+
+BPP_SITE_FEATURES = [
+    'bpp_site_unpaired',
+    'bpp_site_entropy',
+    'bpp_site_paired_5prime',
+    'bpp_site_paired_3prime',
+    'bpp_site_max_pair',
+    'bpp_prev_unpaired',
+    'bpp_next_unpaired',
+    'bpp_window_unpaired',
+    'bpp_window_entropy',
+]
+
+BPP_MUTATION_FEATURES = [
+    'bpp_mut_unpaired',
+    'bpp_mut_site_pair',
+    'bpp_mut_expected_distance',
+]
+
+# The features of one entry
+# - site: `BPP_SITE_FEATURES` values
+# - mutations: `BPP_MUTATION_FEATURES` values, one list per mutation
+# - unpaired: Unpaired probability of each position
+# - entropy: Partner entropy of each position
+BppFeatures = namedtuple('BppFeatures', ['site', 'mutations', 'unpaired', 'entropy'])
+
+
+def bpp_feature_columns() -> List[str]:
+    return BPP_SITE_FEATURES + BPP_MUTATION_FEATURES
+
+# endregion
+
+
+# ----------------------------------
+# region Matrix
+
+def to_bpp_matrix(bpp: Any) -> np.ndarray:
+    r"""
+    A BPP matrix, as a symmetric float64 array with a zero diagonal.
+
+    Parameters
+    ----------
+    bpp: Any
+        L x L values (nested lists / array). Either the full matrix or one triangle of it.
+
+    Returns
+    -------
+    bpp_matrix: np.ndarray
+    """
+
+    bpp_matrix = np.array(bpp, dtype=np.float64)
+    if bpp_matrix.ndim != 2 or bpp_matrix.shape[0] != bpp_matrix.shape[1]:
+        raise ValueError('A BPP matrix must be square', bpp_matrix.shape)
+
+    bpp_matrix = np.nan_to_num(bpp_matrix)
+    bpp_matrix = np.maximum(bpp_matrix, bpp_matrix.T)
+    np.fill_diagonal(bpp_matrix, 0)
+
+    return bpp_matrix
+
+
+def _xlogx(values: np.ndarray) -> np.ndarray:
+    return values * np.log(np.where(values > 0, values, 1))
+
+
+def position_profiles(bpp_tensor: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Unpaired probability and partner entropy of each position.
+
+    Parameters
+    ----------
+    bpp_tensor: np.ndarray
+        N x L x L BPP matrices. Padding is all "0" (unpaired, with no entropy).
+
+    Returns
+    -------
+    unpaired: np.ndarray
+        N x L
+    entropy: np.ndarray
+        N x L
+    """
+
+    unpaired = np.clip(1 - bpp_tensor.sum(axis=2), 0, 1)
+    entropy = -(_xlogx(bpp_tensor).sum(axis=2) + _xlogx(unpaired))
+
+    return unpaired, entropy
+
+# endregion
+
+
+# ----------------------------------
+# region Features
+
+def site_features(bpp_tensor: np.ndarray, lengths: np.ndarray, sites: np.ndarray, window: int = DEFAULT_WINDOW,
+                  profiles: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+    r"""
+    `BPP_SITE_FEATURES` of a chunk.
+
+    Parameters
+    ----------
+    bpp_tensor: np.ndarray
+        N x L x L, padded.
+    lengths: np.ndarray
+        The length of each sequence.
+    sites: np.ndarray
+        The editing site of each sequence, 0-based. "-1" - no site.
+    window: int
+        Half width of the window around the site.
+    profiles: Optional[Tuple[np.ndarray, np.ndarray]]
+        The `position_profiles` of `bpp_tensor`, if already computed.
+
+    Returns
+    -------
+    features: np.ndarray
+        N x len(BPP_SITE_FEATURES), "nan" for the missing values.
+    """
+
+    count, length = bpp_tensor.shape[:2]
+    features = np.full((count, len(BPP_SITE_FEATURES)), np.nan)
+    valid = np.nonzero((sites >= 0) & (sites < lengths))[0]
+    if len(valid) == 0:
+        return features
+
+    unpaired, entropy = profiles if profiles is not None else position_profiles(bpp_tensor)
+    unpaired, entropy = unpaired[valid], entropy[valid]
+    valid_sites = sites[valid]
+    valid_lengths = lengths[valid]
+    rows = np.arange(len(valid))
+    positions = np.arange(length)
+
+    site_rows = bpp_tensor[valid, valid_sites]
+    features[valid, 0] = unpaired[rows, valid_sites]
+    features[valid, 1] = entropy[rows, valid_sites]
+    features[valid, 2] = (site_rows * (positions[None, :] < valid_sites[:, None])).sum(axis=1)
+    features[valid, 3] = (site_rows * (positions[None, :] > valid_sites[:, None])).sum(axis=1)
+    features[valid, 4] = site_rows.max(axis=1)
+
+    has_prev = valid_sites > 0
+    features[valid[has_prev], 5] = unpaired[rows[has_prev], valid_sites[has_prev] - 1]
+    has_next = valid_sites < valid_lengths - 1
+    features[valid[has_next], 6] = unpaired[rows[has_next], valid_sites[has_next] + 1]
+
+    # Window sums from the cumulative sums, clipped to the sequence
+    start = np.maximum(valid_sites - window, 0)
+    end = np.minimum(valid_sites + window + 1, valid_lengths)
+    for column, profile in [(7, unpaired), (8, entropy)]:
+        cumulative = np.concatenate([np.zeros((len(valid), 1)), np.cumsum(profile, axis=1)], axis=1)
+        features[valid, column] = (cumulative[rows, end] - cumulative[rows, start]) / (end - start)
+
+    return features
+
+
+def mutation_features(bpp_tensor: np.ndarray, sites: np.ndarray, entries: np.ndarray,
+                      mutations: np.ndarray) -> np.ndarray:
+    r"""
+    `BPP_MUTATION_FEATURES` of a chunk.
+
+    Parameters
+    ----------
+    bpp_tensor: np.ndarray
+        N x L x L, padded.
+    sites: np.ndarray
+        The editing site of each sequence, 0-based. "-1" - no site.
+    entries: np.ndarray
+        The sequence of each mutation.
+    mutations: np.ndarray
+        The position of each mutation, 0-based. Must be within its sequence.
+
+    Returns
+    -------
+    features: np.ndarray
+        K x len(BPP_MUTATION_FEATURES), "nan" for the missing values.
+    """
+
+    features = np.full((len(mutations), len(BPP_MUTATION_FEATURES)), np.nan)
+    if len(mutations) == 0:
+        return features
+
+    mutation_rows = bpp_tensor[entries, mutations]
+    unpaired = np.clip(1 - mutation_rows.sum(axis=1), 0, 1)
+    features[:, 0] = unpaired
+
+    mutation_sites = sites[entries]
+    has_site = mutation_sites >= 0
+    features[has_site, 1] = mutation_rows[has_site, mutation_sites[has_site]]
+
+    positions = np.arange(bpp_tensor.shape[1])
+    direct = np.abs(mutations - mutation_sites).astype(np.float64)
+    hop = 1 + np.abs(positions[None, :] - mutation_sites[:, None])
+    expected = unpaired * direct + (mutation_rows * np.minimum(direct[:, None], hop)).sum(axis=1)
+    features[has_site, 2] = expected[has_site]
+
+    return features
+
+# endregion
+
+
+# ----------------------------------
+# region Library
+
+def _to_values(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(value) else value for value in values.tolist()]
+
+
+def compute_library(entries: Iterable[Tuple[Any, Optional[int], List[Optional[int]]]],
+                    window: int = DEFAULT_WINDOW, max_chunk_cells: int = MAX_CHUNK_CELLS) -> List[BppFeatures]:
+    r"""
+    The features of a whole library.
+
+    The entries are sorted by length and cut into chunks of at most `max_chunk_cells` (N x L x L) values, so the
+    padding stays small and the memory is bounded.
+
+    Parameters
+    ----------
+    entries: Iterable[Tuple[Any, Optional[int], List[Optional[int]]]]
+        (BPP matrix, editing position, mutation positions) of each entry. Positions are 1-based, "None" if
+        missing - an entry without BPP matrix gets "None" values only.
+    window: int
+        Half width of the window around the editing site.
+    max_chunk_cells: int
+
+    Returns
+    -------
+    features: List[BppFeatures]
+        In the order of `entries`.
+    """
+
+    entries = list(entries)
+    matrices = [to_bpp_matrix(bpp) if bpp is not None else None for bpp, _, _ in entries]
+
+    results: List[Optional[BppFeatures]] = [None] * len(entries)
+    for index, (bpp_matrix, (_, _, mutation_positions)) in enumerate(zip(matrices, entries)):
+        if bpp_matrix is None:
+            results[index] = BppFeatures([None] * len(BPP_SITE_FEATURES),
+                                         [[None] * len(BPP_MUTATION_FEATURES) for _ in mutation_positions],
+                                         None, None)
+
+    order = sorted([index for index, bpp_matrix in enumerate(matrices) if bpp_matrix is not None],
+                   key=lambda index: len(matrices[index]))
+    chunk_start = 0
+    while chunk_start < len(order):
+        # Sorted - the last one of a chunk is the longest
+        chunk_end = chunk_start + 1
+        while chunk_end < len(order) \
+                and (chunk_end - chunk_start + 1) * len(matrices[order[chunk_end]]) ** 2 <= max_chunk_cells:
+            chunk_end += 1
+        chunk = order[chunk_start:chunk_end]
+        chunk_start = chunk_end
+
+        lengths = np.array([len(matrices[index]) for index in chunk])
+        length = int(lengths.max())
+        bpp_tensor = np.zeros((len(chunk), length, length))
+        for row, index in enumerate(chunk):
+            bpp_tensor[row, :lengths[row], :lengths[row]] = matrices[index]
+
+        sites = np.array([entries[index][1] - 1 if entries[index][1] is not None else -1 for index in chunk])
+        sites[sites >= lengths] = -1
+
+        # Mutations within their sequence
+        mutation_slots = []
+        mutation_entries = []
+        mutation_positions = []
+        for row, index in enumerate(chunk):
+            for slot, position in enumerate(entries[index][2]):
+                if position is not None and 1 <= position <= lengths[row]:
+                    mutation_slots.append((row, slot))
+                    mutation_entries.append(row)
+                    mutation_positions.append(position - 1)
+
+        unpaired, entropy = position_profiles(bpp_tensor)
+        chunk_site_features = site_features(bpp_tensor, lengths, sites, window, (unpaired, entropy))
+        chunk_mutation_features = mutation_features(bpp_tensor, sites, np.array(mutation_entries, dtype=np.int64),
+                                                    np.array(mutation_positions, dtype=np.int64))
+
+        chunk_mutations = [[[None] * len(BPP_MUTATION_FEATURES) for _ in entries[index][2]] for index in chunk]
+        for (row, slot), values in zip(mutation_slots, chunk_mutation_features):
+            chunk_mutations[row][slot] = _to_values(values)
+
+        for row, index in enumerate(chunk):
+            results[index] = BppFeatures(_to_values(chunk_site_features[row]), chunk_mutations[row],
+                                         unpaired[row, :lengths[row]], entropy[row, :lengths[row]])
+
+    return results
+
+# endregion
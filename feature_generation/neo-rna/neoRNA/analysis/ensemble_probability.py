@@ -0,0 +1,678 @@
+# -*- coding: utf-8 -*-
+
+"""
+Ensemble Probability
+--------------------
+
+Probabilities of structures within the Boltzmann ensemble of a sequence, from the partition function.
+
+All probabilities are computed in log space, from free energies: `log P = (G_ensemble - G) / kT`, so no
+exponential of a free energy is ever evaluated alone.
+
+For each sequence:
+- `ensemble_fe` - the ensemble free energy.
+- `log_p_structure` - log probability of a target structure (e.g. the "WT" structure).
+- `log_p_constraint` - log probability of the structures compatible with a constraint string
+  (RNAfold `-C` syntax, see `ConstraintChar`).
+- `pair_probabilities` - the probability of each "soft pair" (e.g. the pairs of the "WT" structure).
+
+Backends:
+- `vienna` - ViennaRNA, through its Python bindings (`RNA` module).
+- `local` - A McCaskill partition function in numpy, with a simplified nearest neighbour model
+  (Turner 2004 stacking, loop initiations and terminal AU / GU penalties, no dangles / mismatches).
+  Slower and coarser than ViennaRNA, but with no dependency.
+- `auto` - `vienna` when the bindings are installed, `local` otherwise.
+"""
+
+import importlib.util
+import math
+import multiprocessing
+from collections import namedtuple
+
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+import numpy as np
+
+from neoRNA.structure.pairing import pair_list, partner_array
+
+
+# ----------------------------------
+# region Constants
+
+# kT at 37 degrees Celsius, in kcal/mol
+KT = 0.0019872 * (37.0 + 273.15)
+
+
+class ConstraintChar(object):
+    """
+    Constraint Characters - as RNAfold `-C`
+
+    - . (no constraint for this base)
+    - | (the corresponding base has to be paired)
+    - x (the base is unpaired)
+    - < (base i is paired with a base j>i)
+    - > (base i is paired with a base j<i)
+    - () (base i pairs base j - no other pair for both, and no crossing pair. The pair itself is not enforced)
+    """
+    NoConstraint = '.'
+    Paired = '|'
+    Unpaired = 'x'
+    PairedDownstream = '<'
+    PairedUpstream = '>'
+    PairOpen = '('
+    PairClose = ')'
+
+
+# Results of one sequence. `None` for the values not requested.
+EnsembleProbability = namedtuple('EnsembleProbability',
+                                 ['ensemble_fe', 'log_p_structure', 'log_p_constraint', 'pair_probabilities'])
+
+# endregion
+
+
+# ----------------------------------
+# region Utils
+
+def decode_soft_pairs(constraint_str: str) -> List[Tuple[int, int]]:
+    r"""
+    Decode the "()" pairs of a constraint (or dot-bracket) string - the "Soft Pairs".
+
+    Parameters
+    ----------
+    constraint_str: str
+
+    Returns
+    -------
+    soft_pairs: List[Tuple[int, int]]
+        (i, j) of each pair, positions start with "0", in the order of the closing brackets.
+        Unmatched brackets are ignored.
+    """
+
+    #
+    return pair_list(partner_array(constraint_str, ConstraintChar.PairOpen + ConstraintChar.PairClose, strict=False))
+
+
+def pair_column_names(soft_pairs: Iterable[Tuple[int, int]]) -> List[str]:
+    r"""
+    The column name of each "soft pair" probability - `p_pair_{i}_{j}`, positions start with "1".
+    """
+    return ['p_pair_{}_{}'.format(i + 1, j + 1) for i, j in soft_pairs]
+
+
+def to_rna(sequence_str: str) -> str:
+    return sequence_str.upper().replace('T', 'U')
+
+# endregion
+
+
+# ----------------------------------
+# region Backends
+
+class EnsembleBackend(object):
+    r"""
+    Ensemble Backend - Base Class
+
+    A backend implements `ensemble_free_energy` and `structure_energy`, and optionally `pair_probabilities` (by
+    default, from the ensemble of each enforced pair). Each worker process gets its own backend instance.
+    """
+
+    # The name used in `ENSEMBLE_BACKENDS`
+    NAME = None
+
+    # ----------------------------------
+    # region Backend
+
+    @property
+    def kT(self) -> float:
+        return KT
+
+    def ensemble_free_energy(self, sequence_str: str, constraint: Optional[str] = None,
+                             enforce_pairs: bool = False) -> float:
+        r"""
+        The ensemble free energy (`-kT log Z`), in kcal/mol.
+
+        Parameters
+        ----------
+        sequence_str: str
+            The sequence.
+        constraint: Optional[str]
+            The constraint string. The ensemble of the compatible structures only.
+        enforce_pairs: bool
+            If the "()" pairs of the constraint have to be formed.
+
+        Returns
+        -------
+        ensemble_fe: float
+            `inf` if no structure is compatible with the constraint.
+        """
+        raise NotImplementedError
+
+    def structure_energy(self, sequence_str: str, structure: str) -> float:
+        r"""
+        The free energy of one structure, in kcal/mol. `inf` if the model does not allow the structure.
+        """
+        raise NotImplementedError
+
+    def pair_probabilities(self, sequence_str: str, pairs: List[Tuple[int, int]],
+                           ensemble_fe: Optional[float] = None) -> List[float]:
+        r"""
+        The probability of each base pair (positions start with "0").
+        """
+        ensemble_fe = self.ensemble_free_energy(sequence_str) if ensemble_fe is None else ensemble_fe
+        probabilities = list()
+        for i, j in pairs:
+            constraint = [ConstraintChar.NoConstraint] * len(sequence_str)
+            constraint[i], constraint[j] = ConstraintChar.PairOpen, ConstraintChar.PairClose
+            pair_fe = self.ensemble_free_energy(sequence_str, ''.join(constraint), enforce_pairs=True)
+            probabilities.append(math.exp((ensemble_fe - pair_fe) / self.kT) if math.isfinite(pair_fe) else 0.0)
+        return probabilities
+
+    def options(self) -> Dict:
+        r"""
+        The constructor arguments, used to re-create the backend in the worker processes.
+        """
+        return {}
+
+    # endregion
+
+    # ----------------------------------
+    # region Methods
+
+    def compute(self, sequence_str: str, target_structure: Optional[str] = None, constraint: Optional[str] = None,
+                soft_pairs: Optional[List[Tuple[int, int]]] = None) -> EnsembleProbability:
+        r"""
+        All ensemble probabilities of one sequence.
+
+        Parameters
+        ----------
+        sequence_str: str
+            The sequence.
+        target_structure: Optional[str]
+            The structure (in "Dot-Bracket") for `log_p_structure`.
+        constraint: Optional[str]
+            The constraint string for `log_p_constraint`.
+        soft_pairs: Optional[List[Tuple[int, int]]]
+            The pairs for `pair_probabilities`, positions start with "0".
+
+        Returns
+        -------
+        ensemble_probability: EnsembleProbability
+        """
+
+        ensemble_fe = self.ensemble_free_energy(sequence_str)
+
+        log_p_structure = None
+        if target_structure:
+            log_p_structure = (ensemble_fe - self.structure_energy(sequence_str, target_structure)) / self.kT
+
+        log_p_constraint = None
+        if constraint:
+            log_p_constraint = (ensemble_fe - self.ensemble_free_energy(sequence_str, constraint)) / self.kT
+
+        pair_probabilities = None
+        if soft_pairs is not None:
+            pair_probabilities = self.pair_probabilities(sequence_str, soft_pairs, ensemble_fe)
+
+        return EnsembleProbability(ensemble_fe, log_p_structure, log_p_constraint, pair_probabilities)
+
+    # endregion
+
+
+class ViennaEnsembleBackend(EnsembleBackend):
+    r"""
+    ViennaRNA partition function.
+    """
+
+    NAME = 'vienna'
+
+    def __init__(self):
+        self.__rna = None
+        self.__kt = KT
+
+    def start(self) -> None:
+        if self.__rna:
+            return
+        try:
+            import RNA
+        except ImportError:
+            raise ValueError("Can't import ViennaRNA Python bindings (\"RNA\" module).\n"
+                             "Please be sure to install ViennaRNA with its Python interface.")
+        self.__rna = RNA
+        self.__kt = 0.0019872 * (RNA.cvar.temperature + 273.15)
+
+    @property
+    def kT(self) -> float:
+        self.start()
+        return self.__kt
+
+    def __fold_compound(self, sequence_str: str, constraint: Optional[str] = None, enforce_pairs: bool = False):
+        self.start()
+        fold_compound = self.__rna.fold_compound(to_rna(sequence_str))
+        if constraint:
+            options = self.__rna.CONSTRAINT_DB_DEFAULT
+            if enforce_pairs:
+                options |= self.__rna.CONSTRAINT_DB_ENFORCE_BP
+            fold_compound.hc_add_from_db(constraint, options)
+        structure, mfe = fold_compound.mfe()
+        if not structure or mfe > 1e6:
+            return None
+        fold_compound.exp_params_rescale(mfe)
+        return fold_compound
+
+    def ensemble_free_energy(self, sequence_str: str, constraint: Optional[str] = None,
+                             enforce_pairs: bool = False) -> float:
+        fold_compound = self.__fold_compound(sequence_str, constraint, enforce_pairs)
+        if fold_compound is None:
+            return math.inf
+        structure, ensemble_fe = fold_compound.pf()
+        return ensemble_fe
+
+    def structure_energy(self, sequence_str: str, structure: str) -> float:
+        self.start()
+        sequence_str = to_rna(sequence_str)
+        for i, j in decode_soft_pairs(structure):
+            if (sequence_str[i], sequence_str[j]) not in PAIR_TYPES:
+                return math.inf
+        return self.__rna.fold_compound(sequence_str).eval_structure(structure)
+
+    def pair_probabilities(self, sequence_str: str, pairs: List[Tuple[int, int]],
+                           ensemble_fe: Optional[float] = None) -> List[float]:
+        fold_compound = self.__fold_compound(sequence_str)
+        fold_compound.pf()
+        # "bpp()" is 1-indexed and upper triangular
+        bpp = fold_compound.bpp()
+        return [float(bpp[min(i, j) + 1][max(i, j) + 1]) for i, j in pairs]
+
+
+# ----------------------------------
+# region Local Model
+
+# Canonical pairs
+PAIR_TYPES = ('CG', 'GC', 'GU', 'UG', 'AU', 'UA')
+PAIR_TYPES = {(pair[0], pair[1]): pair for pair in PAIR_TYPES}
+
+# Turner 2004 stacking - `STACK_ENERGY[type(i, j)][type(q, p)]`, with (p, q) the inner pair
+STACK_ENERGY = {
+    'CG': {'CG': -2.4, 'GC': -3.3, 'GU': -2.1, 'UG': -1.4, 'AU': -2.1, 'UA': -2.1},
+    'GC': {'CG': -3.3, 'GC': -3.4, 'GU': -2.5, 'UG': -1.5, 'AU': -2.2, 'UA': -2.4},
+    'GU': {'CG': -2.1, 'GC': -2.5, 'GU': 1.3, 'UG': -0.5, 'AU': -1.4, 'UA': -1.3},
+    'UG': {'CG': -1.4, 'GC': -1.5, 'GU': -0.5, 'UG': 0.3, 'AU': -0.6, 'UA': -1.0},
+    'AU': {'CG': -2.1, 'GC': -2.2, 'GU': -1.4, 'UG': -0.6, 'AU': -1.1, 'UA': -0.9},
+    'UA': {'CG': -2.1, 'GC': -2.4, 'GU': -1.3, 'UG': -1.0, 'AU': -0.9, 'UA': -1.3},
+}
+
+# Loop initiations, by loop size
+HAIRPIN_ENERGY = [math.inf, math.inf, math.inf, 5.4, 5.6, 5.7, 5.4, 6.0, 5.5, 6.4]
+BULGE_ENERGY = [math.inf, 3.8, 2.8, 3.2, 3.6, 4.0, 4.4, 4.6, 4.7, 4.8, 4.9]
+INTERIOR_ENERGY = [math.inf, math.inf, 0.5, 1.6, 1.1, 2.0, 2.0, 2.2, 2.3, 2.4, 2.5]
+INTERIOR_ASYMMETRY = 0.6
+INTERIOR_ASYMMETRY_MAX = 3.0
+TERMINAL_AU = 0.5
+
+# Multiloop - closing / per branch / per unpaired nt
+ML_CLOSING = 9.3
+ML_INTERN = -0.9
+ML_BASE = 0.0
+
+MIN_HAIRPIN = 3
+MAX_LOOP = 30
+
+# Per-nt free energy used to scale the partition function, against overflow
+SCALE_FE_PER_NT = -0.3
+
+
+def loop_extrapolation(energies: List[float], size: int) -> float:
+    if size < len(energies):
+        return energies[size]
+    return energies[-1] + 1.07856 * math.log(size / (len(energies) - 1))
+
+
+def hairpin_energy(size: int) -> float:
+    return loop_extrapolation(HAIRPIN_ENERGY, size) if size >= MIN_HAIRPIN else math.inf
+
+
+def terminal_penalty(pair_type: str) -> float:
+    return TERMINAL_AU if pair_type in ('AU', 'UA', 'GU', 'UG') else 0.0
+
+
+def interior_loop_energy(size_5: int, size_3: int) -> float:
+    r"""
+    Interior loop / bulge initiation (no stacking, no terminal penalty), for a loop of `size_5` + `size_3` nt.
+    """
+    size = size_5 + size_3
+    if size == 0 or size > MAX_LOOP:
+        return math.inf
+    if size_5 == 0 or size_3 == 0:
+        return loop_extrapolation(BULGE_ENERGY, size)
+    return loop_extrapolation(INTERIOR_ENERGY, size) \
+        + min(INTERIOR_ASYMMETRY_MAX, INTERIOR_ASYMMETRY * abs(size_5 - size_3))
+
+
+def interior_energy(outer_type: str, inner_type: str, size_5: int, size_3: int) -> float:
+    r"""
+    Energy of the loop closed by an outer pair of `outer_type` and an inner pair, `inner_type` as `type(q, p)`.
+    """
+    if size_5 == 0 and size_3 == 0:
+        return STACK_ENERGY[outer_type][inner_type]
+    if size_5 + size_3 == 1:
+        # Single nt bulges keep the stacking of the adjacent pairs
+        return BULGE_ENERGY[1] + STACK_ENERGY[outer_type][inner_type]
+    return interior_loop_energy(size_5, size_3) + terminal_penalty(outer_type) + terminal_penalty(inner_type[::-1])
+
+
+class LocalEnsembleBackend(EnsembleBackend):
+    r"""
+    McCaskill partition function in numpy, with the simplified nearest neighbour model above.
+
+    - Qb[i, j] - structures closed by the pair (i, j)
+    - QM1[i, j] - multiloop segments with exactly one branch, starting at "i"
+    - QM[i, j] - multiloop segments with at least one branch
+    - Z[k] - the exterior loop, for the first "k" nt
+
+    Every nt is scaled by `exp(SCALE_FE_PER_NT / kT)`, so long sequences do not overflow.
+    """
+
+    NAME = 'local'
+
+    # ----------------------------------
+    # region Backend
+
+    def ensemble_free_energy(self, sequence_str: str, constraint: Optional[str] = None,
+                             enforce_pairs: bool = False) -> float:
+        log_z = self.log_partition(sequence_str, constraint, enforce_pairs)
+        return -self.kT * log_z if math.isfinite(log_z) else math.inf
+
+    def structure_energy(self, sequence_str: str, structure: str) -> float:
+        sequence_str = to_rna(sequence_str)
+        if len(sequence_str) != len(structure):
+            raise ValueError('Sequence and structure lengths differ', sequence_str, structure)
+
+        length = len(structure)
+        partners = [-1] * length
+        for i, j in decode_soft_pairs(structure):
+            if (sequence_str[i], sequence_str[j]) not in PAIR_TYPES:
+                return math.inf
+            partners[i], partners[j] = j, i
+
+        def pair_type(i: int, j: int) -> str:
+            return PAIR_TYPES[(sequence_str[i], sequence_str[j])]
+
+        def branches(start: int, end: int) -> List[Tuple[int, int]]:
+            # The pairs directly inside [start, end)
+            pairs, k = list(), start
+            while k < end:
+                if partners[k] > k:
+                    pairs.append((k, partners[k]))
+                    k = partners[k] + 1
+                else:
+                    k += 1
+            return pairs
+
+        # Exterior loop
+        energy = sum(terminal_penalty(pair_type(i, j)) for i, j in branches(0, length))
+
+        # One loop per pair
+        for i in range(length):
+            j = partners[i]
+            if j < i:
+                continue
+            inner_pairs = branches(i + 1, j)
+            if not inner_pairs:
+                energy += hairpin_energy(j - i - 1) + terminal_penalty(pair_type(i, j))
+            elif len(inner_pairs) == 1:
+                p, q = inner_pairs[0]
+                energy += interior_energy(pair_type(i, j), pair_type(q, p), p - i - 1, j - q - 1)
+            else:
+                unpaired = (j - i - 1) - sum(q - p + 1 for p, q in inner_pairs)
+                energy += ML_CLOSING + ML_INTERN + terminal_penalty(pair_type(i, j)) + unpaired * ML_BASE \
+                    + sum(ML_INTERN + terminal_penalty(pair_type(p, q)) for p, q in inner_pairs)
+        return energy
+
+    # endregion
+
+    # ----------------------------------
+    # region Partition Function
+
+    @classmethod
+    def constraint_masks(cls, sequence_str: str, constraint: Optional[str] = None,
+                         enforce_pairs: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        r"""
+        The pairs allowed, and the nt allowed to stay unpaired.
+
+        Returns
+        -------
+        allowed: np.ndarray
+            L x L booleans, upper triangular - (i, j) may pair.
+        unpaired_allowed: np.ndarray
+            L booleans.
+        """
+
+        length = len(sequence_str)
+        nts = np.array(list(sequence_str))
+        allowed = np.zeros((length, length), dtype=bool)
+        for nt_5, nt_3 in PAIR_TYPES:
+            allowed |= (nts[:, None] == nt_5) & (nts[None, :] == nt_3)
+        allowed &= np.triu(np.ones((length, length), dtype=bool), MIN_HAIRPIN + 1)
+        unpaired_allowed = np.ones(length, dtype=bool)
+
+        if not constraint:
+            return allowed, unpaired_allowed
+        if len(constraint) != length:
+            raise ValueError('Sequence and constraint lengths differ', sequence_str, constraint)
+
+        for i, char in enumerate(constraint):
+            if char == ConstraintChar.Unpaired:
+                allowed[i, :] = allowed[:, i] = False
+            elif char in (ConstraintChar.Paired, ConstraintChar.PairedDownstream, ConstraintChar.PairedUpstream):
+                unpaired_allowed[i] = False
+                if char == ConstraintChar.PairedDownstream:
+                    allowed[:, i] = False
+                elif char == ConstraintChar.PairedUpstream:
+                    allowed[i, :] = False
+            elif char not in (ConstraintChar.NoConstraint, ConstraintChar.PairOpen, ConstraintChar.PairClose):
+                raise ValueError('Invalid constraint character', char, constraint)
+
+        positions = np.arange(length)
+        for i, j in decode_soft_pairs(constraint):
+            allowed_ij = allowed[i, j]
+            # No other pair for "i" / "j", and no pair crossing (i, j)
+            allowed[i, :] = allowed[:, i] = allowed[j, :] = allowed[:, j] = False
+            inside = (positions > i) & (positions < j)
+            allowed[np.ix_(inside, ~inside)] = False
+            allowed[np.ix_(~inside, inside)] = False
+            allowed[i, j] = allowed_ij
+            if enforce_pairs:
+                unpaired_allowed[i] = unpaired_allowed[j] = False
+
+        return allowed, unpaired_allowed
+
+    def log_partition(self, sequence_str: str, constraint: Optional[str] = None, enforce_pairs: bool = False) -> float:
+        r"""
+        Natural log of the partition function. `-inf` if no structure is compatible with the constraint.
+        """
+
+        sequence_str = to_rna(sequence_str)
+        length = len(sequence_str)
+        if length == 0:
+            return 0.0
+
+        kt = self.kT
+        allowed, unpaired_allowed = self.constraint_masks(sequence_str, constraint, enforce_pairs)
+
+        # "Bad" (not allowed unpaired) nt count - nt [a, b) may stay unpaired if `bad[b] - bad[a] == 0`
+        bad = np.concatenate([[0], np.cumsum(~unpaired_allowed)])
+
+        # Scale factor per nt
+        log_scale = -SCALE_FE_PER_NT / kt
+        scale_pow = np.exp(-log_scale * np.arange(max(length, MAX_LOOP + 2) + 1))
+
+        # Pair types and Boltzmann weights of the terminal penalties
+        pair_types = dict()
+        terminal_weight = np.zeros((length, length))
+        for i, j in zip(*np.nonzero(allowed)):
+            pair_types[(i, j)] = PAIR_TYPES[(sequence_str[i], sequence_str[j])]
+            terminal_weight[i, j] = math.exp(-terminal_penalty(pair_types[(i, j)]) / kt)
+        branch_weight = terminal_weight * math.exp(-ML_INTERN / kt)
+
+        # Generic interior loops - `loop_weight[size_5, size_3]`, scaled by the loop nt (and the outer pair)
+        loop_weight = np.zeros((MAX_LOOP + 1, MAX_LOOP + 1))
+        for size_5 in range(MAX_LOOP + 1):
+            for size_3 in range(MAX_LOOP + 1 - size_5):
+                if size_5 + size_3 > 1:
+                    loop_weight[size_5, size_3] = math.exp(-interior_loop_energy(size_5, size_3) / kt) \
+                        * scale_pow[size_5 + size_3 + 2]
+
+        qb = np.zeros((length, length))
+        qb_terminal = np.zeros((length, length))     # Qb, with the terminal penalty of the pair
+        qb_branch = np.zeros((length, length))       # Qb, as a multiloop branch
+        qm1 = np.zeros((length, length))
+        qm = np.zeros((length, length))
+
+        for span in range(MIN_HAIRPIN + 1, length):
+            for i in range(0, length - span):
+                j = i + span
+                if allowed[i, j]:
+                    outer_type = pair_types[(i, j)]
+                    weight = 0.0
+
+                    # Hairpin
+                    if bad[j] - bad[i + 1] == 0:
+                        weight += math.exp(-(hairpin_energy(span - 1) + terminal_penalty(outer_type)) / kt) \
+                            * scale_pow[span + 1]
+
+                    # Stack, and single nt bulges
+                    for p, q in ((i + 1, j - 1), (i + 2, j - 1), (i + 1, j - 2)):
+                        if qb[p, q] and bad[p] - bad[i + 1] == 0 and bad[j] - bad[q + 1] == 0:
+                            energy = interior_energy(outer_type, pair_types[(p, q)][::-1], p - i - 1, j - q - 1)
+                            weight += qb[p, q] * math.exp(-energy / kt) * scale_pow[(p - i) + (j - q)]
+
+                    # Other interior loops
+                    p_end = min(i + MAX_LOOP + 2, j - MIN_HAIRPIN - 1)
+                    q_start = max(i + MIN_HAIRPIN + 2, j - MAX_LOOP - 1)
+                    if p_end > i + 1 and j > q_start:
+                        p_range = np.arange(i + 1, p_end)
+                        q_range = np.arange(q_start, j)
+                        left_ok = (bad[p_range] - bad[i + 1]) == 0
+                        right_ok = (bad[j] - bad[q_range + 1]) == 0
+                        window = qb_terminal[i + 1:p_end, q_start:j] * left_ok[:, None] * right_ok[None, :]
+                        weights = loop_weight[p_range - i - 1][:, j - q_range - 1]
+                        weight += float(np.sum(window * weights)) * terminal_weight[i, j]
+
+                    # Multiloop
+                    if span > 2 * (MIN_HAIRPIN + 2):
+                        weight += float(np.dot(qm[i + 1, i + 1:j - 1], qm1[i + 2:j, j - 1])) \
+                            * math.exp(-(ML_CLOSING + ML_INTERN + terminal_penalty(outer_type)) / kt) * scale_pow[2]
+
+                    qb[i, j] = weight
+                    qb_terminal[i, j] = weight * terminal_weight[i, j]
+                    qb_branch[i, j] = weight * branch_weight[i, j]
+
+                # One branch (i, l), then unpaired nt up to "j"
+                l_range = np.arange(i + MIN_HAIRPIN + 1, j + 1)
+                trailing_ok = (bad[j + 1] - bad[l_range + 1]) == 0
+                qm1[i, j] = np.sum(qb_branch[i, i + MIN_HAIRPIN + 1:j + 1] * scale_pow[j - l_range]
+                                   * math.exp(-ML_BASE / kt) ** (j - l_range) * trailing_ok)
+
+                # Unpaired nt (or branches) from "i", then one branch starting at "u"
+                u_range = np.arange(i, j - MIN_HAIRPIN)
+                leading = scale_pow[u_range - i] * math.exp(-ML_BASE / kt) ** (u_range - i) \
+                    * ((bad[u_range] - bad[i]) == 0)
+                previous = np.concatenate([[0.0], qm[i, i:j - MIN_HAIRPIN - 1]])
+                qm[i, j] = np.sum((leading + previous) * qm1[i:j - MIN_HAIRPIN, j])
+
+        # Exterior loop
+        z = np.zeros(length + 1)
+        z[0] = 1.0
+        for k in range(1, length + 1):
+            z[k] = z[k - 1] * scale_pow[1] * unpaired_allowed[k - 1] \
+                + np.dot(z[:k], qb_terminal[:k, k - 1])
+
+        if z[length] <= 0:
+            return -math.inf
+        return math.log(z[length]) + length * log_scale
+
+    # endregion
+
+# endregion
+
+
+ENSEMBLE_BACKENDS: Dict[str, Type[EnsembleBackend]] = {
+    ViennaEnsembleBackend.NAME: ViennaEnsembleBackend,
+    LocalEnsembleBackend.NAME: LocalEnsembleBackend,
+}
+
+
+def get_ensemble_backend(name: str = 'auto', **options) -> EnsembleBackend:
+    r"""
+    Create an ensemble backend by its name - "vienna", "local" or "auto".
+    """
+    if name == 'auto':
+        # ViennaRNA if installed - without importing it here
+        name = ViennaEnsembleBackend.NAME if importlib.util.find_spec('RNA') is not None else LocalEnsembleBackend.NAME
+    if name not in ENSEMBLE_BACKENDS:
+        raise ValueError('Unknown ensemble backend - {}. Available: auto, {}'.format(
+            name, ', '.join(sorted(ENSEMBLE_BACKENDS))))
+    return ENSEMBLE_BACKENDS[name](**options)
+
+# endregion
+
+
+# ----------------------------------
+# region Library
+
+# The backend of the current worker process, and the fixed arguments
+_worker_backend: Optional[EnsembleBackend] = None
+_worker_arguments: Dict = {}
+
+
+def _init_ensemble_worker(backend_class: Type[EnsembleBackend], options: Dict, arguments: Dict):
+    global _worker_backend, _worker_arguments
+    _worker_backend = backend_class(**options)
+    _worker_arguments = arguments
+
+
+def _compute_in_worker(sequence_str: str) -> EnsembleProbability:
+    return _worker_backend.compute(sequence_str, **_worker_arguments)
+
+
+def compute_library(sequences: Iterable[str], backend: EnsembleBackend,
+                    target_structure: Optional[str] = None, constraint: Optional[str] = None,
+                    soft_pairs: Optional[List[Tuple[int, int]]] = None,
+                    workers: int = 1, chunk_size: int = 1) -> Iterator[EnsembleProbability]:
+    r"""
+    The ensemble probabilities of a library of sequences, against the same target structure / constraint /
+    soft pairs (typically from the "WT").
+
+    Parameters
+    ----------
+    sequences: Iterable[str]
+        The sequences.
+    backend: EnsembleBackend
+        See `get_ensemble_backend`.
+    target_structure: Optional[str]
+    constraint: Optional[str]
+    soft_pairs: Optional[List[Tuple[int, int]]]
+        See `EnsembleBackend.compute`.
+    workers: int
+        The number of worker processes. "1" computes in the current process.
+    chunk_size: int
+        The number of sequences sent to a worker at a time.
+
+    Returns
+    -------
+    results: Iterator[EnsembleProbability]
+        One result per sequence, in the input order.
+    """
+
+    sequences = list(sequences)
+    arguments = {'target_structure': target_structure, 'constraint': constraint, 'soft_pairs': soft_pairs}
+    if workers <= 1 or len(sequences) <= 1:
+        for sequence_str in sequences:
+            yield backend.compute(sequence_str, **arguments)
+        return
+
+    with multiprocessing.Pool(min(workers, len(sequences)), initializer=_init_ensemble_worker,
+                              initargs=(type(backend), backend.options(), arguments)) as pool:
+        yield from pool.imap(_compute_in_worker, sequences, chunksize=max(1, chunk_size))
+
+# endregion
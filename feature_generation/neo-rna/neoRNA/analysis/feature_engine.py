@@ -0,0 +1,1330 @@
+# -*- coding: utf-8 -*-
+
+"""
+Feature Engine
+--------------------
+
+Single-pass extraction of the "editing site" ML features.
+
+Each bpRNA record is compiled once into flat arrays (`CompiledStructure`), and every feature column is looked up in
+a registry (`FeatureRegistry`). A new feature is one registered function instead of another generator script.
+
+Two column sets ship with the default registry:
+- `ml_feature_columns()` - the "mutation / site / u1..uN / d1..dN" features, as `ana_gen_ml_features.py`.
+- `rf_feature_columns()` - the "mfeat / x1..xK" features, as `generate_feature_matrix_for_rf_expanded.py`.
+
+"""
+
+import re
+from collections import OrderedDict, deque, namedtuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from neoRNA.structure.pairing import NESTED_BRACKETS, partner_array, to_pair_table
+from neoRNA.structure.secondary_structure import SecondaryStructure
+from neoRNA.structure.secondary_structure_element import SecondaryStructureElementType
+from neoRNA.sequence.mutation import Mutation, MutationType, parse_mutation_syntax
+
+
+# ----------------------------------
+# region Records
+
+# A structure element next to (or containing) the editing site.
+# - element: index in the element table
+# - strand: index in the strand table, the strand which gives the "distance"
+# - distance: "0" for the site, negative for upstream and positive for downstream elements
+Neighbour = namedtuple('Neighbour', ['element', 'strand', 'distance'])
+
+# endregion
+
+
+# ----------------------------------
+# region Compiled Structure
+
+class CompiledStructure(object):
+    r"""
+    A bpRNA record parsed once into flat arrays.
+
+    - Strand table - one row per (non-empty) sequence segment of an element line, e.g. `I1.1 11..11 "C"`.
+    - Element table - one row per element, stems / interior loops / multiloops grouping their strands.
+    - Run table - one row per run of identical characters of the annotation string, e.g. `SSSSS`.
+
+    All positions are 1-based. Positions are mapped to their strand / run through per-position index arrays,
+    so "which element contains position `p`" is a single array lookup.
+
+    "Segment", pseudoknot and non-canonical lines are not part of the tables.
+
+    """
+
+    # Number of tokens of each element line type
+    ELEMENT_LINE_TOKENS = {
+        SecondaryStructureElementType.Stem: 5,
+        SecondaryStructureElementType.Hairpin: 5,
+        SecondaryStructureElementType.Interior: 5,
+        SecondaryStructureElementType.Bulge: 7,
+        SecondaryStructureElementType.Unpaired: 7,
+        SecondaryStructureElementType.Multiloop: 7,
+        SecondaryStructureElementType.End: 3,
+    }
+
+    # ----------------------------------
+    # region Init
+
+    def __init__(self, sequence_str: str, dot_bracket_str: str, annotation_str: str,
+                 element_lines: Iterable[str], reference_id: str = None):
+        r"""
+        Init
+
+        Parameters
+        ----------
+        sequence_str: str
+        dot_bracket_str: str
+        annotation_str: str
+            The bpRNA structure annotation string, like `EEEEESSSSSISSS...`.
+        element_lines: Iterable[str]
+            The bpRNA element lines, like `S1 6..10 "CCUGC" 68..72 "GCGGG"`.
+        reference_id: str
+        """
+        #
+        self.__sequence_str = sequence_str
+        self.__dot_bracket_str = dot_bracket_str
+        self.__annotation_str = annotation_str
+        self.__reference_id = reference_id
+        self.__length = len(annotation_str)
+
+        # Group the element lines by element, e.g. `I3.1` and `I3.2` -> `I3`
+        elements = OrderedDict()
+        for line in element_lines:
+            parsed = self.parse_element_line(line)
+            if parsed is None:
+                continue
+            element_type, line_name, strands, pairs = parsed
+            element_name = line_name.split('.')[0]
+            if element_name not in elements:
+                elements[element_name] = (element_type, [], [])
+            elements[element_name][1].extend([(line_name, strand, pairs) for strand in strands])
+            elements[element_name][2].extend(pairs)
+
+        # Build the tables, strands ordered by element
+        self.__element_name = []
+        self.__element_type = []
+        self.__element_pairs = []
+        element_ptr = [0]
+        self.__strand_name = []
+        self.__strand_sequence = []
+        self.__strand_pairs = []
+        strand_start = []
+        strand_end = []
+        strand_element = []
+        for element_name, (element_type, strands, pairs) in elements.items():
+            # Empty sequences (e.g. zero-length multiloop segments) do not cover any position
+            strands = [(line_name, strand, line_pairs) for line_name, strand, line_pairs in strands if strand[2]]
+            if not strands:
+                continue
+            if element_type == SecondaryStructureElementType.Interior and len(strands) != 2:
+                continue
+            element_index = len(self.__element_name)
+            self.__element_name.append(element_name)
+            self.__element_type.append(element_type)
+            self.__element_pairs.append(pairs)
+            for line_name, (start, end, sequence_str), line_pairs in strands:
+                self.__strand_name.append(line_name)
+                self.__strand_sequence.append(sequence_str)
+                self.__strand_pairs.append(line_pairs)
+                strand_start.append(start)
+                strand_end.append(end)
+                strand_element.append(element_index)
+            element_ptr.append(len(strand_start))
+
+        self.__strand_start = np.array(strand_start, dtype=np.int64)
+        self.__strand_end = np.array(strand_end, dtype=np.int64)
+        self.__strand_element = np.array(strand_element, dtype=np.int64)
+        self.__strand_length = np.array([len(s) for s in self.__strand_sequence], dtype=np.int64)
+        self.__element_ptr = np.array(element_ptr, dtype=np.int64)
+
+        # Per-element last nt
+        if len(self.__element_name) > 0:
+            self.__element_max_end = np.maximum.reduceat(self.__strand_end, self.__element_ptr[:-1])
+        else:
+            self.__element_max_end = np.zeros(0, dtype=np.int64)
+
+        # Interior loops entirely upstream are not reported by `EditingAnalysis` - they are neither "before"
+        # (it skips interior loops) nor "after" the site. Kept as-is for the existing models.
+        self.__element_upstream = np.array(
+            [t != SecondaryStructureElementType.Interior for t in self.__element_type], dtype=bool)
+
+        # Position -> strand, "-1" if no strand covers it. Index "0" is unused.
+        self.__position_strand = np.full(self.__length + 2, -1, dtype=np.int64)
+        if len(strand_start) > 0:
+            spans = self.__strand_end - self.__strand_start + 1
+            positions = np.arange(spans.sum()) - np.repeat(np.cumsum(spans) - spans, spans) \
+                + np.repeat(self.__strand_start, spans)
+            keep = (positions >= 1) & (positions <= self.__length)
+            self.__position_strand[positions[keep]] = np.repeat(np.arange(len(spans)), spans)[keep]
+
+        # Runs of the annotation string
+        codes = np.frombuffer(annotation_str.encode('ascii'), dtype=np.uint8)
+        boundaries = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        self.__run_start = np.concatenate([[0], boundaries]).astype(np.int64) + 1
+        self.__run_end = np.concatenate([boundaries, [len(codes)]]).astype(np.int64)
+        self.__run_code = codes[self.__run_start - 1] if len(codes) > 0 else codes
+        self.__position_run = np.full(self.__length + 2, -1, dtype=np.int64)
+        self.__position_run[1:self.__length + 1] = np.repeat(np.arange(len(self.__run_start)),
+                                                              self.__run_end - self.__run_start + 1)
+
+        # Pair table, filled on first use
+        self.__pair_table = None
+
+    # endregion
+
+    # ----------------------------------
+    # region Constructors
+
+    @classmethod
+    def from_bprna(cls, record: Union[str, Iterable[str]], reference_id: str = None) -> 'CompiledStructure':
+        r"""
+        Compile a bpRNA record - the text of a `.st` file, or its lines.
+
+        Header lines (`>001,inferred`) and comment lines (`#Name: ...`) are optional. The first three remaining
+        lines are the sequence, dot-bracket and annotation strings, followed by the page line and the elements.
+
+        Parameters
+        ----------
+        record: Union[str, Iterable[str]]
+        reference_id: str
+            Defaults to the first field of the `>` header, or the `#Name` value.
+
+        Returns
+        -------
+        compiled_structure: CompiledStructure
+        """
+
+        lines = record.splitlines() if isinstance(record, str) else [line.rstrip('\n') for line in record]
+
+        body = []
+        header_id = None
+        name_id = None
+        for line in lines:
+            if not line.strip():
+                continue
+            if line[0] == '>':
+                header_id = line[1:].split(',')[0].strip()
+            elif line[0] == '#':
+                if line.startswith('#Name:'):
+                    name_id = line[6:].strip()
+            else:
+                body.append(line.strip())
+
+        if len(body) < 3:
+            raise ValueError('A bpRNA record needs the sequence, dot-bracket and annotation lines', record)
+
+        if reference_id is None:
+            reference_id = header_id if header_id is not None else name_id
+
+        return cls(body[0], body[1], body[2], body[4:], reference_id)
+
+    @classmethod
+    def from_secondary_structure(cls, secondary_structure: SecondaryStructure) -> 'CompiledStructure':
+        r"""
+        Compile a `SecondaryStructure` parsed by `BpRnaIO`, from the raw strings of its elements.
+
+        Parameters
+        ----------
+        secondary_structure: SecondaryStructure
+
+        Returns
+        -------
+        compiled_structure: CompiledStructure
+        """
+
+        element_lines = []
+        for element in secondary_structure.elements:
+            # Interior loops and multiloops keep their lines joined by " | "
+            element_lines.extend(element.raw_string.split(' | '))
+
+        return cls(secondary_structure.sequence.sequence_str,
+                   secondary_structure.dot_bracket,
+                   secondary_structure.dot_bracket_annotation,
+                   element_lines,
+                   secondary_structure.reference_id)
+
+    # endregion
+
+    # ----------------------------------
+    # region Properties
+
+    @property
+    def reference_id(self) -> str:
+        return self.__reference_id
+
+    @property
+    def sequence_str(self) -> str:
+        return self.__sequence_str
+
+    @property
+    def dot_bracket(self) -> str:
+        return self.__dot_bracket_str
+
+    @property
+    def annotation(self) -> str:
+        return self.__annotation_str
+
+    @property
+    def length(self) -> int:
+        return self.__length
+
+    @property
+    def element_count(self) -> int:
+        return len(self.__element_name)
+
+    @property
+    def strand_count(self) -> int:
+        return len(self.__strand_name)
+
+    @property
+    def run_count(self) -> int:
+        return len(self.__run_start)
+
+    # endregion
+
+    # ----------------------------------
+    # region Methods - Position
+
+    def nt(self, position: int) -> Optional[str]:
+        r"""
+        The nt at a 1-based position, "None" if out of range.
+        """
+
+        if position is None or not 0 < position <= len(self.__sequence_str):
+            return None
+        return self.__sequence_str[position - 1]
+
+    def annotation_at(self, position: int) -> Optional[str]:
+        r"""
+        The annotation character at a 1-based position, "None" if out of range.
+        """
+
+        if position is None or not 0 < position <= self.__length:
+            return None
+        return self.__annotation_str[position - 1]
+
+    def strand_at(self, position: int) -> int:
+        r"""
+        The strand covering a 1-based position, "-1" if none.
+        """
+
+        if position is None or not 0 < position <= self.__length:
+            return -1
+        return int(self.__position_strand[position])
+
+    def run_at(self, position: int) -> int:
+        r"""
+        The annotation run covering a 1-based position, "-1" if out of range.
+        """
+
+        if position is None or not 0 < position <= self.__length:
+            return -1
+        return int(self.__position_run[position])
+
+    # endregion
+
+    # ----------------------------------
+    # region Methods - Tables
+
+    def element_type(self, element: int) -> str:
+        return self.__element_type[element]
+
+    def element_name(self, element: int) -> str:
+        return self.__element_name[element]
+
+    def element_pairs(self, element: int) -> List[str]:
+        r"""
+        The closing pairs of an element, like `['C:G', 'G:C']`, in the order of its lines.
+        """
+        return self.__element_pairs[element]
+
+    def element_strands(self, element: int) -> range:
+        return range(int(self.__element_ptr[element]), int(self.__element_ptr[element + 1]))
+
+    def strand_element(self, strand: int) -> int:
+        return int(self.__strand_element[strand])
+
+    def strand_name(self, strand: int) -> str:
+        return self.__strand_name[strand]
+
+    def strand_sequence(self, strand: int) -> str:
+        return self.__strand_sequence[strand]
+
+    def strand_pairs(self, strand: int) -> List[str]:
+        r"""
+        The closing pairs on the line of a strand.
+        """
+        return self.__strand_pairs[strand]
+
+    def strand_span(self, strand: int) -> Tuple[int, int]:
+        return int(self.__strand_start[strand]), int(self.__strand_end[strand])
+
+    def strand_length(self, strand: int) -> int:
+        return int(self.__strand_length[strand])
+
+    def run_span(self, run: int) -> Tuple[int, int]:
+        return int(self.__run_start[run]), int(self.__run_end[run])
+
+    def run_code(self, run: int) -> Optional[str]:
+        if run < 0 or run >= len(self.__run_start):
+            return None
+        return chr(self.__run_code[run])
+
+    def runs_with_code(self, code: str, first: int = 0, last: int = None, invert: bool = False) -> np.ndarray:
+        r"""
+        Indices of the runs in `[first, last]` whose character is (or, with `invert`, is not) `code`.
+        """
+
+        last = len(self.__run_start) - 1 if last is None else last
+        matched = self.__run_code[first:last + 1] == ord(code)
+        if invert:
+            matched = ~matched
+        return np.flatnonzero(matched) + first
+
+    # endregion
+
+    # ----------------------------------
+    # region Methods - Analysis
+
+    def neighbours(self, position: int) -> Tuple[Optional[Neighbour], List[Neighbour], List[Neighbour]]:
+        r"""
+        Locate the elements around a position, with the same rules as `EditingAnalysis`.
+
+        - site - the element containing the position.
+        - upstream - elements whose strands all end before the position. Distance is measured from the last nt.
+        - downstream - the remaining elements. Distance is measured from the first strand starting after
+            the position, so a stem enclosing the site is "downstream".
+
+        Parameters
+        ----------
+        position: int
+            The "editing position", 1-based.
+
+        Returns
+        -------
+        site: Optional[Neighbour]
+        upstream: List[Neighbour]
+            Ordered from the closest one.
+        downstream: List[Neighbour]
+            Ordered from the closest one.
+        """
+
+        site = None
+        site_element = -1
+        site_strand = self.strand_at(position)
+        if site_strand >= 0:
+            site_element = int(self.__strand_element[site_strand])
+            site = Neighbour(site_element, site_strand, 0)
+
+        if len(self.__element_name) == 0:
+            return site, [], []
+
+        not_site = np.arange(len(self.__element_name)) != site_element
+        before = (self.__element_max_end < position) & not_site
+
+        # Upstream - the closest "end" first
+        upstream_elements = np.flatnonzero(before & self.__element_upstream)
+        upstream_end = self.__element_max_end[upstream_elements]
+        order = np.argsort(-upstream_end, kind='mergesort')
+        upstream = [Neighbour(int(e), int(self.__position_strand[end]), int(end - position))
+                    for e, end in zip(upstream_elements[order], upstream_end[order])]
+
+        # Downstream - the closest "start" after the position first
+        after_start = np.where(self.__strand_start > position, self.__strand_start, self.__length + 1)
+        element_after_start = np.minimum.reduceat(after_start, self.__element_ptr[:-1])
+        downstream_elements = np.flatnonzero(~before & not_site & (element_after_start <= self.__length))
+        downstream_start = element_after_start[downstream_elements]
+        order = np.argsort(downstream_start, kind='mergesort')
+        downstream = [Neighbour(int(e), int(self.__position_strand[start]), int(start - position))
+                      for e, start in zip(downstream_elements[order], downstream_start[order])]
+
+        return site, upstream, downstream
+
+    def complementary_strand(self, strand: int, first: bool = True) -> int:
+        r"""
+        The other strand of a stem / interior loop, "-1" if none.
+
+        As `EditingAnalysisItem`, strands are told apart by their sequence, so the two strands of a palindromic
+        stem have no complementary strand.
+
+        Parameters
+        ----------
+        strand: int
+        first: bool
+            Pick the first (`complementary_strand_sequence`) or the last (`complementary_nt`) match.
+        """
+
+        sequence_str = self.__strand_sequence[strand]
+        candidates = [s for s in self.element_strands(self.strand_element(strand))
+                      if self.__strand_sequence[s] != sequence_str]
+        if not candidates:
+            return -1
+        return candidates[0] if first else candidates[-1]
+
+    def pair_table(self) -> np.ndarray:
+        r"""
+        The partner of each 1-based position ("0" if unpaired), from the "()" pairs of the dot-bracket string.
+        """
+
+        if self.__pair_table is None:
+            pair_table = to_pair_table(partner_array(self.__dot_bracket_str, NESTED_BRACKETS))
+            pair_table[0] = 0
+            self.__pair_table = pair_table
+
+        return self.__pair_table
+
+    def graph_distances(self, position: int) -> np.ndarray:
+        r"""
+        Shortest-path distances from a position to every position of the 2D graph - nts linked by the backbone
+        and by base pairs. The distance is the number of nts on the path, as `2dGraphs/dijkstra.py`.
+
+        Parameters
+        ----------
+        position: int
+            1-based.
+
+        Returns
+        -------
+        distances: np.ndarray
+            Indexed by 1-based position, "-1" if not reachable.
+        """
+
+        pair_table = self.pair_table()
+        length = len(pair_table) - 1
+        distances = np.full(length + 1, -1, dtype=np.int64)
+        if not 0 < position <= length:
+            return distances
+
+        distances[position] = 1
+        queue = deque([position])
+        while queue:
+            current = queue.popleft()
+            for next_position in (current - 1, current + 1, pair_table[current]):
+                if 0 < next_position <= length and distances[next_position] < 0:
+                    distances[next_position] = distances[current] + 1
+                    queue.append(next_position)
+
+        return distances
+
+    # endregion
+
+    # ----------------------------------
+    # region Methods - Static
+
+    @classmethod
+    def parse_element_line(cls, line: str) -> Optional[Tuple[str, str, List[Tuple[int, int, str]], List[str]]]:
+        r"""
+        Parse one bpRNA element line.
+
+        Example lines:
+        - S1 6..10 "CCUGC" 68..72 "GCGGG"
+        - H1 36..40 "UCCCA" (35,41) G:C
+        - B1 55..55 "U" (54,23) C:G (56,22) A:U
+
+        Parameters
+        ----------
+        line: str
+
+        Returns
+        -------
+        parsed: Optional[Tuple[str, str, List[Tuple[int, int, str]], List[str]]]
+            (element type, line name, strands as (start, end, sequence), closing pairs). "None" for lines which
+            are not part of the tables (segments, pseudoknots, etc.) or malformed.
+        """
+
+        tokens = line.split()
+        if not tokens:
+            return None
+
+        line_name = tokens[0]
+        element_type = line_name.rstrip('0123456789.')
+        if cls.ELEMENT_LINE_TOKENS.get(element_type) != len(tokens):
+            return None
+
+        if element_type == SecondaryStructureElementType.Stem:
+            strands = [cls.__parse_strand(tokens[1], tokens[2]), cls.__parse_strand(tokens[3], tokens[4])]
+            pairs = []
+        else:
+            strands = [cls.__parse_strand(tokens[1], tokens[2])]
+            pairs = tokens[4::2]
+
+        return element_type, line_name, strands, pairs
+
+    @staticmethod
+    def __parse_strand(span_str: str, sequence_str: str) -> Tuple[int, int, str]:
+        start, end = span_str.split('..')
+        return int(start), int(end), sequence_str.strip('"')
+
+    # endregion
+
+
+# endregion
+
+
+# ----------------------------------
+# region Feature Context
+
+class FeatureContext(object):
+    r"""
+    Everything a feature function may need for one (structure, editing position) entry.
+
+    The element neighbours, annotation runs and 2D distances are computed on first use and shared by all
+    the columns and mutations of the entry.
+
+    """
+
+    def __init__(self, structure: CompiledStructure, editing_position: int, mutations: List[Mutation] = None,
+                 wt_structure: CompiledStructure = None, wt_sequence: str = None):
+        #
+        self.structure = structure
+        self.editing_position = editing_position
+        self.mutations = mutations if mutations is not None else []
+        self.wt_structure = wt_structure
+        self.wt_sequence = wt_sequence
+
+        #
+        self.__neighbours = None
+        self.__downstream_runs = None
+        self.__graph_distances = None
+
+    @property
+    def site(self) -> Optional[Neighbour]:
+        return self.__get_neighbours()[0]
+
+    @property
+    def upstream(self) -> List[Neighbour]:
+        return self.__get_neighbours()[1]
+
+    @property
+    def downstream(self) -> List[Neighbour]:
+        return self.__get_neighbours()[2]
+
+    @property
+    def site_struct(self) -> Optional[str]:
+        site = self.site
+        return self.structure.element_type(site.element) if site else None
+
+    @property
+    def downstream_runs(self) -> np.ndarray:
+        r"""
+        The non-stem annotation runs from the editing site on (the site's own run included).
+        """
+
+        if self.__downstream_runs is None:
+            site_run = self.structure.run_at(self.editing_position)
+            if site_run < 0:
+                self.__downstream_runs = np.zeros(0, dtype=np.int64)
+            else:
+                self.__downstream_runs = self.structure.runs_with_code(SecondaryStructureElementType.Stem,
+                                                                       first=site_run, invert=True)
+
+        return self.__downstream_runs
+
+    @property
+    def graph_distances(self) -> np.ndarray:
+        if self.__graph_distances is None:
+            self.__graph_distances = self.structure.graph_distances(self.editing_position)
+
+        return self.__graph_distances
+
+    def __get_neighbours(self):
+        if self.__neighbours is None:
+            self.__neighbours = self.structure.neighbours(self.editing_position)
+
+        return self.__neighbours
+
+# endregion
+
+
+# ----------------------------------
+# region Feature Registry
+
+class FeatureRegistry(object):
+    r"""
+    Registry of feature columns.
+
+    A column is either registered under its exact name, or belongs to a "slot family" - a name pattern like
+    `u2_length` made of a "slot" (`u2`, the 2nd upstream element) and a "template" (`length`). Templates are
+    written once per family and work for any slot, so `u7_length` needs no extra code.
+
+    Feature functions take `(context, mutation)`. "Per mutation" features get one value per mutation, the
+    others are computed once per entry.
+
+    """
+
+    def __init__(self):
+        self.__features: Dict[str, Tuple[Callable, bool]] = OrderedDict()
+        self.__families: Dict[str, Tuple[Any, Callable]] = OrderedDict()
+        self.__templates: Dict[str, Dict[str, Callable]] = OrderedDict()
+
+    # ----------------------------------
+    # region Registration
+
+    def feature(self, name: str, per_mutation: bool = False):
+        r"""
+        Decorator - register a feature function `f(context, mutation)` under an exact column name.
+        """
+
+        def register(function):
+            self.__features[name] = (function, per_mutation)
+            return function
+
+        return register
+
+    def family(self, family: str, pattern: str, resolver: Callable, default_template: str = None) -> None:
+        r"""
+        Register a slot family.
+
+        Parameters
+        ----------
+        family: str
+        pattern: str
+            A regex with the named groups `slot` and `template`.
+        resolver: Callable
+            `resolver(context, slot)` - the object the templates of this family work on (e.g. a `Neighbour`),
+            "None" if the slot is empty.
+        default_template: str
+            The template used when the `template` group does not match.
+        """
+
+        self.__families[family] = (re.compile(pattern), resolver, default_template)
+        self.__templates.setdefault(family, OrderedDict())
+
+    def template(self, family: str, template: str):
+        r"""
+        Decorator - register a template function `f(context, item)` of a slot family.
+        """
+
+        def register(function):
+            self.__templates[family][template] = function
+            return function
+
+        return register
+
+    # endregion
+
+    # ----------------------------------
+    # region Lookup
+
+    def names(self) -> List[str]:
+        return list(self.__features.keys())
+
+    def templates(self, family: str) -> List[str]:
+        return list(self.__templates[family].keys())
+
+    def resolve(self, column: str) -> Tuple[Callable, bool]:
+        r"""
+        Find the feature function of a column.
+
+        Returns
+        -------
+        resolved: Tuple[Callable, bool]
+            A `f(context, mutation)` function and its "per mutation" flag.
+        """
+
+        if column in self.__features:
+            return self.__features[column]
+
+        for family, (regex, resolver, default_template) in self.__families.items():
+            matched = regex.match(column)
+            if not matched:
+                continue
+            template = matched.group('template') or default_template
+            if template not in self.__templates[family]:
+                continue
+            slot = matched.group('slot')
+            function = self.__templates[family][template]
+            return (lambda context, mutation: function(context, resolver(context, slot))), False
+
+        raise ValueError('Unknown feature column', column)
+
+    # endregion
+
+
+# The default registry
+REGISTRY = FeatureRegistry()
+
+# endregion
+
+
+# ----------------------------------
+# region Feature Engine
+
+class FeatureEngine(object):
+    r"""
+    Extract a set of feature columns for each (structure, editing position, mutation syntax) entry.
+
+    Usage
+    -------
+
+    >>> engine = FeatureEngine(ml_feature_columns())
+    >>> structure = CompiledStructure.from_bprna(bprna_annotation)
+    >>> rows = engine.extract(structure, 50, '44GtoA')
+
+    """
+
+    def __init__(self, columns: List[str], registry: FeatureRegistry = None):
+        r"""
+        Init
+
+        Parameters
+        ----------
+        columns: List[str]
+            The column names, resolved once here. Unknown names raise a `ValueError`.
+        registry: FeatureRegistry
+            Defaults to `REGISTRY`.
+        """
+        #
+        self.__registry = registry if registry is not None else REGISTRY
+        self.__columns = list(columns)
+        self.__resolved = [self.__registry.resolve(column) for column in self.__columns]
+
+    @property
+    def columns(self) -> List[str]:
+        return self.__columns
+
+    def extract(self, structure: CompiledStructure, editing_position: int, mutation_syntax: str = None,
+                wt_structure: CompiledStructure = None, wt_sequence: str = None) -> List[List[Any]]:
+        r"""
+        Extract the feature rows of one entry - one row per mutation, or a single row if there is none.
+
+        Parameters
+        ----------
+        structure: CompiledStructure
+        editing_position: int
+            1-based.
+        mutation_syntax: str
+            See `parse_mutation_syntax`. For a malformed syntax, the mutation features are `None`.
+        wt_structure: CompiledStructure
+            The "WT" structure, for the `mut_ref_struct` feature.
+        wt_sequence: str
+            The "WT" sequence, for the `num_mutations` of "indel" entries.
+
+        Returns
+        -------
+        rows: List[List[Any]]
+        """
+
+        mutations = parse_mutation_syntax(mutation_syntax, strict=False)
+        context = FeatureContext(structure, editing_position, mutations, wt_structure, wt_sequence)
+
+        # Entry-level values once
+        values = [None if per_mutation else function(context, None)
+                  for function, per_mutation in self.__resolved]
+
+        rows = []
+        for mutation in (context.mutations or [None]):
+            # NOTE: a malformed syntax gives `None` for every mutation feature - the other features still count
+            rows.append([(function(context, mutation) if mutations is not None else None)
+                         if per_mutation else values[i]
+                         for i, (function, per_mutation) in enumerate(self.__resolved)])
+
+        return rows
+
+# endregion
+
+
+# ----------------------------------
+# region Features - Element Slots (site, u1..uN, d1..dN)
+
+def _resolve_element_slot(context: FeatureContext, slot: str) -> Optional[Neighbour]:
+    if slot == 'site':
+        return context.site
+    neighbours = context.upstream if slot[0] == 'u' else context.downstream
+    index = int(slot[1:]) - 1
+    return neighbours[index] if 0 <= index < len(neighbours) else None
+
+
+REGISTRY.family('element', r'^(?P<slot>site|[ud][1-9]\d*)_(?P<template>.+)$', _resolve_element_slot)
+
+
+def _element_length_if(element_type: str):
+    def template(context, neighbour):
+        if neighbour and context.structure.element_type(neighbour.element) == element_type:
+            return context.structure.strand_length(neighbour.strand)
+        return None
+    return template
+
+
+def _element_pair_if(element_type: str, index: int):
+    def template(context, neighbour):
+        if neighbour and context.structure.element_type(neighbour.element) == element_type:
+            return context.structure.element_pairs(neighbour.element)[index]
+        return None
+    return template
+
+
+REGISTRY.template('element', 'exist')(lambda context, neighbour: 1 if neighbour else 0)
+REGISTRY.template('element', 'distance')(lambda context, neighbour: neighbour.distance if neighbour else 0)
+REGISTRY.template('element', 'struct')(
+    lambda context, neighbour: context.structure.element_type(neighbour.element) if neighbour else None)
+REGISTRY.template('element', 'length')(
+    lambda context, neighbour: context.structure.strand_length(neighbour.strand) if neighbour else None)
+REGISTRY.template('element', 'length_stem')(_element_length_if(SecondaryStructureElementType.Stem))
+REGISTRY.template('element', 'length_hairpin')(_element_length_if(SecondaryStructureElementType.Hairpin))
+REGISTRY.template('element', 'length_bulge')(_element_length_if(SecondaryStructureElementType.Bulge))
+REGISTRY.template('element', 'length_internal_es')(_element_length_if(SecondaryStructureElementType.Interior))
+REGISTRY.template('element', '5prm_cp_hairpin')(_element_pair_if(SecondaryStructureElementType.Hairpin, 0))
+REGISTRY.template('element', '5prm_cp_bulge')(_element_pair_if(SecondaryStructureElementType.Bulge, 0))
+REGISTRY.template('element', '3prm_cp_bulge')(_element_pair_if(SecondaryStructureElementType.Bulge, 1))
+REGISTRY.template('element', '5prm_cp_internal')(_element_pair_if(SecondaryStructureElementType.Interior, 0))
+REGISTRY.template('element', '3prm_cp_internal')(_element_pair_if(SecondaryStructureElementType.Interior, 1))
+
+
+@REGISTRY.template('element', 'length_internal_ecs')
+def _element_length_internal_ecs(context, neighbour):
+    if not neighbour or context.structure.element_type(neighbour.element) != SecondaryStructureElementType.Interior:
+        return None
+    ecs = context.structure.complementary_strand(neighbour.strand)
+    return context.structure.strand_length(ecs) if ecs >= 0 else 0
+
+# endregion
+
+
+# ----------------------------------
+# region Features - Editing Site
+
+@REGISTRY.feature('site_prev_nt')
+def _site_prev_nt(context, mutation):
+    return context.structure.nt(context.editing_position - 1) if context.site else None
+
+
+@REGISTRY.feature('site_next_nt')
+def _site_next_nt(context, mutation):
+    return context.structure.nt(context.editing_position + 1) if context.site else None
+
+
+@REGISTRY.feature('site_prev_struct')
+def _site_prev_struct(context, mutation):
+    if not context.site:
+        return None
+    return context.structure.annotation_at(context.structure.strand_span(context.site.strand)[0] - 1)
+
+
+@REGISTRY.feature('site_next_struct')
+def _site_next_struct(context, mutation):
+    if not context.site:
+        return None
+    return context.structure.annotation_at(context.structure.strand_span(context.site.strand)[1] + 1)
+
+
+@REGISTRY.feature('site_1_1')
+def _site_1_1(context, mutation):
+    r"""
+    The nt pair at the site - for a 1:1 interior loop, or a stem.
+    """
+
+    site = context.site
+    if not site:
+        return None
+
+    structure = context.structure
+    site_type = structure.element_type(site.element)
+    if site_type == SecondaryStructureElementType.Interior:
+        ecs = structure.complementary_strand(site.strand)
+        if structure.strand_length(site.strand) == 1 and ecs >= 0 and structure.strand_length(ecs) == 1:
+            return '{}:{}'.format(structure.strand_sequence(site.strand), structure.strand_sequence(ecs))
+    elif site_type == SecondaryStructureElementType.Stem:
+        ecs = structure.complementary_strand(site.strand, first=False)
+        if ecs >= 0:
+            # Same ordering as `EditingAnalysisItem.complementary_nt`
+            start, end = structure.strand_span(site.strand)
+            local_ordering = context.editing_position - start + 1
+            ecs_position = structure.strand_span(ecs)[1] - (end - start + 1) + local_ordering
+            ecs_start, ecs_end = structure.strand_span(ecs)
+            if ecs_start <= ecs_position <= ecs_end:
+                return '{}:{}'.format(structure.nt(context.editing_position), structure.nt(ecs_position))
+
+    return None
+
+# endregion
+
+
+# ----------------------------------
+# region Features - Upstream / Downstream Summary
+
+def _stem_length(context: FeatureContext, neighbours: List[Neighbour]) -> Optional[int]:
+    # Stem length is the length of its 5' strand
+    lengths = [context.structure.strand_length(context.structure.element_strands(n.element)[0])
+               for n in neighbours
+               if context.structure.element_type(n.element) == SecondaryStructureElementType.Stem]
+    return sum(lengths) if lengths else None
+
+
+@REGISTRY.feature('u_count')
+def _u_count(context, mutation):
+    return len(context.upstream)
+
+
+@REGISTRY.feature('d_count')
+def _d_count(context, mutation):
+    return len(context.downstream)
+
+
+@REGISTRY.feature('u_all_stem_length')
+def _u_all_stem_length(context, mutation):
+    return _stem_length(context, context.upstream)
+
+
+@REGISTRY.feature('d_all_stem_length')
+def _d_all_stem_length(context, mutation):
+    return _stem_length(context, context.downstream)
+
+
+@REGISTRY.feature('u_hairpin_length')
+def _u_hairpin_length(context, mutation):
+    for neighbour in context.upstream:
+        if context.structure.element_type(neighbour.element) == SecondaryStructureElementType.Hairpin:
+            return context.structure.strand_length(neighbour.strand)
+    return None
+
+
+@REGISTRY.feature('all_stem_length')
+def _all_stem_length(context, mutation):
+    lengths = [length for length in [_stem_length(context, [context.site] if context.site else []),
+                                     _stem_length(context, context.upstream),
+                                     _stem_length(context, context.downstream)]
+               if length is not None]
+    return sum(lengths) if lengths else None
+
+# endregion
+
+
+# ----------------------------------
+# region Features - Mutation
+
+def _mismatch(mutation: Optional[Mutation]) -> bool:
+    return mutation is not None and mutation.mut_type == MutationType.Mismatch
+
+
+@REGISTRY.feature('num_mutations', per_mutation=True)
+def _num_mutations(context, mutation):
+    if _mismatch(mutation):
+        return len(context.mutations)
+    if mutation is not None and mutation.mut_type == MutationType.Indel:
+        wt_sequence = context.wt_sequence
+        if wt_sequence is None and context.wt_structure is not None:
+            wt_sequence = context.wt_structure.sequence_str
+        return len(context.structure.sequence_str) - len(wt_sequence) if wt_sequence is not None else None
+    return 0
+
+
+@REGISTRY.feature('mut_exist', per_mutation=True)
+def _mut_exist(context, mutation):
+    return 1 if mutation is not None and mutation.mut_type in [MutationType.Mismatch, MutationType.Indel] else 0
+
+
+@REGISTRY.feature('mut_type', per_mutation=True)
+def _mut_type(context, mutation):
+    return mutation.mut_type if mutation is not None else None
+
+
+@REGISTRY.feature('mut_pos', per_mutation=True)
+def _mut_pos(context, mutation):
+    return mutation.position if _mismatch(mutation) else None
+
+
+@REGISTRY.feature('mut_site_dist', per_mutation=True)
+def _mut_site_dist(context, mutation):
+    return mutation.position - context.editing_position if _mismatch(mutation) else None
+
+
+@REGISTRY.feature('mut_ref_nt', per_mutation=True)
+def _mut_ref_nt(context, mutation):
+    return mutation.ref_nt if _mismatch(mutation) else None
+
+
+@REGISTRY.feature('mut_nt', per_mutation=True)
+def _mut_nt(context, mutation):
+    return mutation.alt_nt if _mismatch(mutation) else None
+
+
+@REGISTRY.feature('mut_struct', per_mutation=True)
+def _mut_struct(context, mutation):
+    return context.structure.annotation_at(mutation.position) if _mismatch(mutation) else None
+
+
+@REGISTRY.feature('mut_ref_struct', per_mutation=True)
+def _mut_ref_struct(context, mutation):
+    if not _mismatch(mutation) or context.wt_structure is None:
+        return None
+    return context.wt_structure.annotation_at(mutation.position)
+
+
+def _neighbour_run_code(context: FeatureContext, position: int, offset: int) -> Optional[str]:
+    run = context.structure.run_at(position)
+    return context.structure.run_code(run + offset) if run >= 0 else None
+
+
+@REGISTRY.feature('mut_prev_struct', per_mutation=True)
+def _mut_prev_struct(context, mutation):
+    return _neighbour_run_code(context, mutation.position, -1) if _mismatch(mutation) else None
+
+
+@REGISTRY.feature('mut_next_struct', per_mutation=True)
+def _mut_next_struct(context, mutation):
+    return _neighbour_run_code(context, mutation.position, 1) if _mismatch(mutation) else None
+
+
+@REGISTRY.feature('mut_same_as_site', per_mutation=True)
+def _mut_same_as_site(context, mutation):
+    if not _mismatch(mutation):
+        return None
+    return 1 if context.structure.annotation_at(mutation.position) == context.site_struct else 0
+
+# endregion
+
+
+# ----------------------------------
+# region Features - Random Forest Set (mfeat, x1..xK)
+
+def _mutation_position(mutation: Optional[Mutation], context: FeatureContext) -> Optional[int]:
+    if mutation is None or mutation.position is None or context.structure.run_at(mutation.position) < 0:
+        return None
+    return mutation.position
+
+
+@REGISTRY.feature('mp', per_mutation=True)
+def _mp(context, mutation):
+    return mutation.position if mutation is not None else None
+
+
+@REGISTRY.feature('adist', per_mutation=True)
+def _adist(context, mutation):
+    return context.editing_position - mutation.position if _mismatch(mutation) else None
+
+
+@REGISTRY.feature('mref', per_mutation=True)
+def _mref(context, mutation):
+    return mutation.ref_nt if mutation is not None else None
+
+
+@REGISTRY.feature('malt', per_mutation=True)
+def _malt(context, mutation):
+    return mutation.alt_nt if mutation is not None else None
+
+
+@REGISTRY.feature('mtype', per_mutation=True)
+def _mtype(context, mutation):
+    return mutation.mut_type if mutation is not None else None
+
+
+@REGISTRY.feature('mfeat', per_mutation=True)
+def _mfeat(context, mutation):
+    return context.structure.annotation_at(_mutation_position(mutation, context))
+
+
+@REGISTRY.feature('mfeat_prev', per_mutation=True)
+def _mfeat_prev(context, mutation):
+    position = _mutation_position(mutation, context)
+    return _neighbour_run_code(context, position, -1) if position is not None else None
+
+
+@REGISTRY.feature('mfeat_next', per_mutation=True)
+def _mfeat_next(context, mutation):
+    position = _mutation_position(mutation, context)
+    return _neighbour_run_code(context, position, 1) if position is not None else None
+
+
+@REGISTRY.feature('mfeat_same_as_edit', per_mutation=True)
+def _mfeat_same_as_edit(context, mutation):
+    position = _mutation_position(mutation, context)
+    if position is None:
+        return None
+    return 1 if context.structure.run_at(position) == context.structure.run_at(context.editing_position) else 0
+
+
+@REGISTRY.feature('mp_2d_dist_to_edit', per_mutation=True)
+def _mp_2d_dist_to_edit(context, mutation):
+    position = _mutation_position(mutation, context)
+    if position is None:
+        return None
+    distance = int(context.graph_distances[position])
+    return distance if distance > 0 else None
+
+
+@REGISTRY.feature('editing_feature')
+def _editing_feature(context, mutation):
+    return context.structure.annotation_at(context.editing_position)
+
+
+def _closest_run_length(context: FeatureContext, code: str) -> Optional[int]:
+    # Length of the closest run of `code` at or before the editing site, counted up to the site if the site
+    # is inside it
+    site_run = context.structure.run_at(context.editing_position)
+    if site_run < 0:
+        return None
+    runs = context.structure.runs_with_code(code, last=site_run)
+    if len(runs) == 0:
+        return None
+    start, end = context.structure.run_span(int(runs[-1]))
+    return min(end, context.editing_position) - start + 1
+
+
+@REGISTRY.feature('stem_length')
+def _rf_stem_length(context, mutation):
+    return _closest_run_length(context, SecondaryStructureElementType.Stem)
+
+
+@REGISTRY.feature('hairpin_length')
+def _rf_hairpin_length(context, mutation):
+    return _closest_run_length(context, SecondaryStructureElementType.Hairpin)
+
+
+def _resolve_downstream_run(context: FeatureContext, slot: str) -> Optional[Tuple[int, int]]:
+    # (run, strand matching the run exactly or "-1") of the k-th non-stem run from the editing site on
+    index = int(slot) - 1
+    runs = context.downstream_runs
+    if not 0 <= index < len(runs):
+        return None
+    run = int(runs[index])
+    start, end = context.structure.run_span(run)
+    strand = context.structure.strand_at(start)
+    if strand >= 0 and context.structure.strand_span(strand) != (start, end):
+        strand = -1
+    return run, strand
+
+
+REGISTRY.family('downstream_run', r'^x(?P<slot>[1-9]\d*)feat_downstream_of_edit_site(?:_(?P<template>.+))?$',
+                _resolve_downstream_run, default_template='struct')
+
+
+def _interior_partner(context: FeatureContext, strand: int) -> int:
+    if strand < 0 or context.structure.element_type(context.structure.strand_element(strand)) \
+            != SecondaryStructureElementType.Interior:
+        return -1
+    return [s for s in context.structure.element_strands(context.structure.strand_element(strand)) if s != strand][0]
+
+
+@REGISTRY.template('downstream_run', 'struct')
+def _run_struct(context, item):
+    return context.structure.run_code(item[0]) if item else None
+
+
+@REGISTRY.template('downstream_run', 'length_editing_strand')
+def _run_length_editing_strand(context, item):
+    if not item:
+        return None
+    start, end = context.structure.run_span(item[0])
+    return end - start + 1
+
+
+@REGISTRY.template('downstream_run', 'length_complementary_strand')
+def _run_length_complementary_strand(context, item):
+    if not item:
+        return None
+    partner = _interior_partner(context, item[1])
+    return context.structure.strand_length(partner) if partner >= 0 else 0
+
+
+@REGISTRY.template('downstream_run', '5prime_cp')
+def _run_5prime_cp(context, item):
+    if not item or item[1] < 0:
+        return None
+    pairs = context.structure.strand_pairs(item[1])
+    return pairs[0] if pairs else None
+
+
+@REGISTRY.template('downstream_run', '3prime_cp')
+def _run_3prime_cp(context, item):
+    if not item or item[1] < 0:
+        return None
+    pairs = context.structure.strand_pairs(item[1])
+    if len(pairs) > 1:
+        return pairs[-1]
+    # An interior loop line has one pair, the other one is on its partner line
+    partner = _interior_partner(context, item[1])
+    return context.structure.strand_pairs(partner)[-1] if partner >= 0 else None
+
+# endregion
+
+
+# ----------------------------------
+# region Column Sets
+
+# Per-element columns of the "upstream" / "downstream" slots
+ELEMENT_FEATURE_TEMPLATE = [
+    'exist',
+    'distance',
+
+    'struct',
+    'length',
+    'length_stem',
+    'length_hairpin',
+    'length_bulge',
+    'length_internal_es',
+    'length_internal_ecs',
+    '5prm_cp_hairpin',
+    '5prm_cp_bulge',
+    '3prm_cp_bulge',
+    '5prm_cp_internal',
+    '3prm_cp_internal',
+]
+
+MUTATION_FEATURES = [
+    'num_mutations',
+    'mut_exist',
+    'mut_type',
+    'mut_pos',
+    'mut_site_dist',
+    'mut_ref_nt',
+    'mut_nt',
+    'mut_struct',
+    'mut_ref_struct',
+    'mut_prev_struct',
+    'mut_next_struct',
+    'mut_same_as_site',
+]
+
+SITE_FEATURES = [
+    'site_struct',
+
+    'site_prev_nt',
+    'site_next_nt',
+    'site_prev_struct',
+    'site_next_struct',
+    'site_1_1',
+] + ['site_' + template for template in ELEMENT_FEATURE_TEMPLATE[3:]]
+
+RF_MUTATION_FEATURES = ['mp', 'adist', 'mref', 'malt', 'mtype',
+                        'mfeat', 'mfeat_prev', 'mfeat_next', 'mfeat_same_as_edit', 'mp_2d_dist_to_edit']
+
+RF_DOWNSTREAM_RUN_TEMPLATE = ['', '_length_editing_strand', '_length_complementary_strand', '_5prime_cp', '_3prime_cp']
+
+
+def ml_feature_columns(num_upstream_elements: int = 3, num_downstream_elements: int = 3) -> List[str]:
+    r"""
+    The columns of `ana_gen_ml_features.py` (after `rna_id`, `editing_value`, `free_energy`, `sim_nor_score`).
+    """
+
+    columns = MUTATION_FEATURES + ['all_stem_length'] + SITE_FEATURES
+    columns += ['u_count', 'u_all_stem_length', 'u_hairpin_length']
+    for index in range(1, num_upstream_elements + 1):
+        columns += ['u{}_{}'.format(index, template) for template in ELEMENT_FEATURE_TEMPLATE]
+    columns += ['d_count', 'd_all_stem_length']
+    for index in range(1, num_downstream_elements + 1):
+        columns += ['d{}_{}'.format(index, template) for template in ELEMENT_FEATURE_TEMPLATE]
+
+    return columns
+
+
+def rf_feature_columns(num_downstream_features: int = 2) -> List[str]:
+    r"""
+    The columns of `generate_feature_matrix_for_rf_expanded.py` (after `cur_id`, `source`, `editing_level`,
+    `num_mutations`).
+    """
+
+    columns = RF_MUTATION_FEATURES + ['editing_feature', 'stem_length', 'hairpin_length']
+    for index in range(1, num_downstream_features + 1):
+        columns += ['x{}feat_downstream_of_edit_site{}'.format(index, template)
+                    for template in RF_DOWNSTREAM_RUN_TEMPLATE]
+
+    return columns
+
+# endregion
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+"""
+The `neoRNA` CLI - subcommands over a shared, in-process `LibraryContext`.
+
+"""
@@ -0,0 +1,670 @@
+# -*- coding: utf-8 -*-
+
+"""
+CLI Commands
+--------------------
+
+The subcommands of the `neoRNA` CLI. Each one is a `Command` - its arguments and a `run(args, context)` function
+working on the shared `LibraryContext`.
+
+- annotate - bpRNA annotation of the structures of a summary (".st" files).
+- fold - (Re-)fold the sequences of a summary, with a `BatchFoldRunner` backend.
+- features - The ML feature matrix of a summary (see `ana_gen_ml_features.py`).
+- simscore - SimTree similarity of the structures against the "WT".
+- qc-barcode - Count the reads matching each barcode of a RNA Lib.
+- qc-mut - Read depth at the mutations of a profiled RNA Lib.
+- render - Structure images of a summary (VARNA, or SVG).
+- summary - Index and query a summary.
+"""
+
+import csv
+import logging
+import os
+import re
+
+from collections import Counter, OrderedDict, namedtuple
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from neoRNA.cli.context import LibraryContext
+
+
+logger = logging.getLogger('neo_rna.cli')
+
+
+# ----------------------------------
+# region Command Registry
+
+# A subcommand
+# - name: The subcommand name
+# - help: One-line description
+# - add_arguments: `add_arguments(parser)`
+# - run: `run(args, context)`
+Command = namedtuple('Command', ['name', 'help', 'add_arguments', 'run'])
+
+# All subcommands, by name
+COMMANDS: Dict[str, Command] = OrderedDict()
+
+
+def command(name: str, help: str, add_arguments: Callable):
+    r"""
+    Decorator - register a `run(args, context)` function as a subcommand.
+    """
+
+    def register(function):
+        COMMANDS[name] = Command(name, help, add_arguments, function)
+        return function
+
+    return register
+
+# endregion
+
+
+# ----------------------------------
+# region Utils
+
+def _add_summary_argument(parser) -> None:
+    parser.add_argument('summary',
+                        metavar='rna_lib_struct_summary_file.json',
+                        help='The file path to the "RNA Lib Structure Summary" file (".json" or ".jsonl").')
+    parser.add_argument('--overlay', dest='overlays',
+                        action='append', default=None,
+                        help='An "overlay" file (".jsonl") of updated records, merged into the summary items, such as '
+                             'the output of "util_adjust_sequence.py". Can be repeated - later overlays win.')
+
+
+def _add_data_type_argument(parser) -> None:
+    parser.add_argument('--data_type',
+                        action="store", default='computational',
+                        help='Data type - computational | experimental. Default: "computational".')
+
+
+def _output_path(path: str) -> str:
+    path = os.path.abspath(path.strip())
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    return path
+
+
+def write_csv(file_path: str, headers: List[str], rows: Iterable[List[Any]]) -> int:
+    r"""
+    Write the rows, with the headers line, as a "csv" file.
+
+    Returns
+    -------
+    count: int
+        The number of rows.
+    """
+
+    count = 0
+    with open(_output_path(file_path), 'w', newline='') as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(headers)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+
+    return count
+
+
+def find_wt_item(items: Iterable[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    r"""
+    The "WT" item of a summary - the first one with the "wt" mutation syntax.
+    """
+
+    for rna_item in items:
+        mutation_syntax = rna_item.get('mutation_syntax')
+        if mutation_syntax and mutation_syntax.strip().lower().startswith('wt'):
+            return rna_item
+
+    return None
+
+
+def mismatch_positions(mutation_syntax: Optional[str]) -> List[Optional[int]]:
+    r"""
+    The position of each mutation - `None` for the "indel" / "wt" ones, a single `None` if there is no mutation.
+
+    It is one per feature row of `FeatureEngine.extract`.
+    """
+
+    from neoRNA.sequence.mutation import MutationType, parse_mutation_syntax
+
+    return [mutation.position if mutation is not None and mutation.mut_type == MutationType.Mismatch else None
+            for mutation in parse_mutation_syntax(mutation_syntax, strict=False) or [None]]
+
+# endregion
+
+
+# ----------------------------------
+# region annotate
+
+def add_annotate_arguments(parser) -> None:
+    _add_summary_argument(parser)
+    _add_data_type_argument(parser)
+    parser.add_argument('--out_folder',
+                        action='store', default=None,
+                        help='The output folder of the ".st" files, one per item. '
+                             'Without it, the annotations are only kept for the next steps.')
+
+
+@command('annotate', 'bpRNA annotation of the structures of a summary.', add_annotate_arguments)
+def run_annotate(args, context: LibraryContext) -> int:
+    structure_key = '_'.join([args.data_type, 'structure'])
+
+    count = 0
+    for rna_item in context.summary_items(args.summary, args.overlays):
+        structure_str = rna_item.get(structure_key)
+        if not structure_str:
+            continue
+
+        rna_id = rna_item['rna_id']
+        st_str = context.st_str(rna_item['sequence_string'], structure_str, name=rna_id)
+        if args.out_folder:
+            os.makedirs(args.out_folder, exist_ok=True)
+            with open(os.path.join(args.out_folder, '{}.st'.format(rna_id)), 'w') as outfile:
+                outfile.write(st_str)
+        count += 1
+
+    logger.info('Annotated: {}'.format(count))
+    return 0
+
+# endregion
+
+
+# ----------------------------------
+# region fold
+
+def add_fold_arguments(parser) -> None:
+    _add_summary_argument(parser)
+    parser.add_argument('--backend',
+                        action='store', default='vienna',
+                        help='The folding backend - biers | vienna | stub. Default: "vienna".')
+    parser.add_argument('--max_bootstrap',
+                        action='store', type=int, default=0,
+                        help='The number of bootstraps, for the "biers" backend.')
+    parser.add_argument('--out',
+                        action='store', default=None,
+                        help='The updated summary file (".json" or ".jsonl"). '
+                             'Without it, the structures are only kept for the next steps.')
+
+
+@command('fold', 'Fold the sequences of a summary - "computational_structure" / "computational_bpp".',
+         add_fold_arguments)
+def run_fold(args, context: LibraryContext) -> int:
+    import numpy as np
+
+    from neoRNA.util.runner.batch_fold_runner import get_fold_runner
+
+    options = {'max_bootstrap': args.max_bootstrap} if args.backend == 'biers' else {}
+    fold_runner = get_fold_runner(args.backend, **options)
+
+    # The folding runs in worker processes - each distinct sequence once
+    items = [dict(rna_item) for rna_item in context.summary_items(args.summary, args.overlays)]
+    sequences = [rna_item.get('sequence_string') for rna_item in items]
+    for index, structure_str, bpp in fold_runner.fold_distinct(sequences, workers=context.workers):
+        items[index]['computational_structure'] = structure_str
+        items[index]['computational_bpp'] = np.asarray(bpp).tolist()
+
+    logger.info('Folded: {}, distinct sequences: {}'.format(len(items), len(set(filter(None, sequences)))))
+
+    # The next steps get the new structures, by either file name
+    context.update_summary_items(args.summary, items, args.overlays)
+    if args.out:
+        from neoRNA.util.file_utils import FileUtils
+        FileUtils.save_json_items(_output_path(args.out), iter(items))
+        context.update_summary_items(args.out, items)
+
+    return 0
+
+# endregion
+
+
+# ----------------------------------
+# region features
+
+def add_features_arguments(parser) -> None:
+    _add_summary_argument(parser)
+    _add_data_type_argument(parser)
+    parser.add_argument('--wt', dest='wt_sequence',
+                        action="store", default='',
+                        help='"WT" sequence.')
+    parser.add_argument('--num_upstream_elements',
+                        action='store', type=int, default=3,
+                        help='The number of "upstream" structure elements. Default: 3.')
+    parser.add_argument('--num_downstream_elements',
+                        action='store', type=int, default=3,
+                        help='The number of "downstream" structure elements. Default: 3.')
+    parser.add_argument('--free_energy',
+                        action="store_true", default=False,
+                        help='Fill the "free_energy" column, by RNAfold.')
+    parser.add_argument('--simtree', dest='simtree_location',
+                        action="store", default=None,
+                        help='The "path" to the SimTree jar package, to fill the "sim_nor_score" column.')
+    parser.add_argument('--bootstrap_features',
+                        action="store_true", default=False,
+                        help='Add the features of the "bootstrap structures" of the items.')
+    parser.add_argument('--bpp_features',
+                        action="store_true", default=False,
+                        help='Add the features of the "base pair probability" matrix ("<data_type>_bpp") of '
+                             'the items.')
+    parser.add_argument('--out',
+                        action='store', default='output.csv',
+                        help='Filename / path of features output file.')
+
+
+@command('features', 'The ML feature matrix of a summary.', add_features_arguments)
+def run_features(args, context: LibraryContext) -> int:
+    from neoRNA.analysis.bootstrap_ensemble import bootstrap_feature_columns
+    from neoRNA.analysis.bpp_features import bpp_feature_columns, compute_library as compute_bpp_features
+    from neoRNA.analysis.feature_engine import ml_feature_columns
+
+    items = context.summary_items(args.summary, args.overlays)
+    structure_key = '_'.join([args.data_type, 'structure'])
+    feature_engine = context.feature_engine(ml_feature_columns(args.num_upstream_elements,
+                                                               args.num_downstream_elements))
+    wt_sequence = args.wt_sequence.strip() or None
+
+    # WT structure
+    wt_item = find_wt_item(items)
+    wt_structure = context.compiled_structure(wt_item['sequence_string'], wt_item[structure_key]) \
+        if wt_item is not None and wt_item.get(structure_key) else None
+
+    # SimTree against the WT - in the worker pool
+    sim_scores = dict()
+    if args.simtree_location and wt_structure is not None:
+        structures = sorted(set(rna_item[structure_key] for rna_item in items))
+        scores = context.map(lambda structure_str: context.simtree_score(args.simtree_location, structure_str,
+                                                                         wt_structure.dot_bracket)[0],
+                             structures)
+        sim_scores = dict(zip(structures, scores))
+
+    bootstrap_ensemble = context.bootstrap_ensemble(args.summary, args.overlays) if args.bootstrap_features else None
+    bootstrap_columns = bootstrap_feature_columns() if args.bootstrap_features else []
+
+    # BPP features - the whole library at once
+    bpp_columns = bpp_feature_columns() if args.bpp_features else []
+    bpp_results = compute_bpp_features([(rna_item.get('_'.join([args.data_type, 'bpp'])),
+                                         rna_item['A-to-I_editing_site'],
+                                         mismatch_positions(rna_item.get('mutation_syntax')))
+                                        for rna_item in items]) if args.bpp_features else [None] * len(items)
+
+    def generate_rows():
+        for rna_item, bpp_result in zip(items, bpp_results):
+            rna_id = rna_item['rna_id']
+            sequence_str = rna_item['sequence_string']
+            structure_str = rna_item[structure_key]
+            editing_position = rna_item['A-to-I_editing_site']
+
+            fe_ensemble = context.free_energy(sequence_str)[0] if args.free_energy else None
+            feature_rows = feature_engine.extract(context.compiled_structure(sequence_str, structure_str),
+                                                  editing_position, rna_item.get('mutation_syntax'),
+                                                  wt_structure=wt_structure, wt_sequence=wt_sequence)
+            bootstrap_row = bootstrap_ensemble.features(rna_id, editing_position) \
+                if bootstrap_ensemble is not None else []
+            bpp_rows = [bpp_result.site + mutation_values for mutation_values in bpp_result.mutations] \
+                if bpp_result is not None else [[]] * len(feature_rows)
+
+            for feature_row, bpp_row in zip(feature_rows, bpp_rows):
+                yield [rna_id, rna_item['A-to-I_editing_level'], fe_ensemble, sim_scores.get(structure_str)] \
+                    + feature_row + bootstrap_row + bpp_row
+
+    headers = [
+        'rna_id',
+        'editing_value',
+        'free_energy',
+        'sim_nor_score',
+    ] + feature_engine.columns + bootstrap_columns + bpp_columns
+    count = write_csv(args.out, headers, generate_rows())
+    logger.info('Feature rows: {} - {}'.format(count, args.out))
+
+    return 0
+
+# endregion
+
+
+# ----------------------------------
+# region simscore
+
+def add_simscore_arguments(parser) -> None:
+    _add_summary_argument(parser)
+    parser.add_argument('--simtree', dest='simtree_location',
+                        action="store", required=True,
+                        help='The "path" to the SimTree jar package.')
+    parser.add_argument('--data_types',
+                        action='store', default='computational,experimental',
+                        help='The data types to compare, separated by ",". Default: "computational,experimental".')
+    parser.add_argument('--out',
+                        action='store', default='output.csv',
+                        help='Filename / path of output file.')
+
+
+@command('simscore', 'SimTree similarity of the structures against the "WT".', add_simscore_arguments)
+def run_simscore(args, context: LibraryContext) -> int:
+    items = context.summary_items(args.summary, args.overlays)
+    data_types = [data_type.strip() for data_type in args.data_types.split(',') if data_type.strip()]
+    wt_item = find_wt_item(items) or dict()
+
+    # (structure, WT structure) of each data type - each distinct pair once, in the worker pool
+    jobs = list()
+    for rna_item in items:
+        for data_type in data_types:
+            structure_key = '_'.join([data_type, 'structure'])
+            if rna_item.get(structure_key) and wt_item.get(structure_key):
+                jobs.append((rna_item[structure_key], wt_item[structure_key]))
+    jobs = sorted(set(jobs))
+    scores = dict(zip(jobs, context.map(
+        lambda job: context.simtree_score(args.simtree_location, job[0], job[1])[0], jobs)))
+
+    def generate_rows():
+        for rna_item in items:
+            row = [rna_item['rna_id'], rna_item.get('A-to-I_editing_level')]
+            for data_type in data_types:
+                structure_key = '_'.join([data_type, 'structure'])
+                row.append(scores.get((rna_item.get(structure_key), wt_item.get(structure_key))))
+            yield row
+
+    headers = ['rna_id', 'editing_value'] + ['sim_nor_score_{}'.format(data_type) for data_type in data_types]
+    write_csv(args.out, headers, generate_rows())
+
+    return 0
+
+# endregion
+
+
+# ----------------------------------
+# region qc-barcode
+
+def add_qc_barcode_arguments(parser) -> None:
+    parser.add_argument('rna_lib_def',
+                        metavar='rna_lib_def_file',
+                        help='The file path to RNA Lib definition file.')
+    parser.add_argument('read_file',
+                        help='The "read" file to check.')
+    parser.add_argument('--prefix_count',
+                        action='store', type=int, default=0,
+                        help='The "number" of nt "before" the barcode.')
+    parser.add_argument('--extra_nt',
+                        action='store', default='C',
+                        help='The "extra" nt which is behind the barcode')
+    parser.add_argument('--out',
+                        action='store', default='qc_barcode.csv',
+                        help='The output file.')
+
+
+def count_barcode_reads(lines: Iterable[str], barcodes: List[str], prefix_count: int,
+                        extra_nt: str) -> Dict[str, List[int]]:
+    r"""
+    Count the lines matching each barcode - in a single pass over the lines.
+
+    For a barcode `B` (and its reverse complement `R`), after `prefix_count` nt, the counts of:
+    - `B`
+    - `B` + 4 nt + `R`
+    - `B` + extra nt
+    - `B` + extra nt + 3 nt + `R`
+
+    Parameters
+    ----------
+    lines: Iterable[str]
+        The lines of the read file - as `grep`, all the lines are checked.
+    barcodes: List[str]
+    prefix_count: int
+    extra_nt: str
+
+    Returns
+    -------
+    counts: Dict[str, List[int]]
+        The 4 counts, by barcode.
+    """
+
+    from neoRNA.sequence.sequence import Sequence
+
+    reverses = {barcode: str(Sequence(barcode).get_reverse_complement()) for barcode in barcodes}
+    lengths = sorted(set(len(barcode) for barcode in barcodes))
+    prefix_regex = re.compile('^[ATCG]{{{}}}'.format(prefix_count))
+    tail_regex = re.compile('[ATCG]*')
+
+    counts = {barcode: [0, 0, 0, 0] for barcode in barcodes}
+    for line in lines:
+        if not prefix_regex.match(line):
+            continue
+        for length in lengths:
+            barcode = line[prefix_count:prefix_count + length]
+            if barcode not in counts:
+                continue
+            barcode_counts = counts[barcode]
+            reverse = reverses[barcode]
+            barcode_counts[0] += 1
+
+            # The nt between - [ATCG] only
+            rest = line[prefix_count + length:]
+            between = tail_regex.match(rest).end()
+            if between >= 4 and rest[4:4 + len(reverse)] == reverse:
+                barcode_counts[1] += 1
+            if rest[:len(extra_nt)] == extra_nt:
+                barcode_counts[2] += 1
+                extra_between = tail_regex.match(rest, len(extra_nt)).end() - len(extra_nt)
+                if extra_between >= 3 and rest[len(extra_nt) + 3:len(extra_nt) + 3 + len(reverse)] == reverse:
+                    barcode_counts[3] += 1
+
+    return counts
+
+
+@command('qc-barcode', 'Count the reads matching each barcode of a RNA Lib.', add_qc_barcode_arguments)
+def run_qc_barcode(args, context: LibraryContext) -> int:
+    library_items = context.library_items(args.rna_lib_def)
+    if not os.path.exists(args.read_file):
+        raise ValueError('"Read" file does not exist.', args.read_file)
+
+    barcodes = [rna_item.barcode.barcode for rna_item in library_items]
+    with open(args.read_file) as infile:
+        counts = count_barcode_reads(infile, barcodes, args.prefix_count, args.extra_nt)
+
+    headers = [
+        'RNA_ID',
+        'Barcode',
+        'Matched - Barcode',
+        'Matched - Barcode + Revers',
+        'Matched - Barcode(extra 1 nt)',
+        'Matched - Barcode(extra 1 nt) + Reverse'
+    ]
+    write_csv(args.out, headers, ([rna_item.rna_id, rna_item.barcode.barcode] + counts[rna_item.barcode.barcode]
+                                  for rna_item in library_items))
+
+    return 0
+
+# endregion
+
+
+# ----------------------------------
+# region qc-mut
+
+def add_qc_mut_arguments(parser) -> None:
+    parser.add_argument('rna_lib_profiling',
+                        metavar='rna_lib_profiling.rbin',
+                        help='The file path to RNA Lib profiling result file.')
+    parser.add_argument('--trim_right',
+                        action='store', type=int, default=13,
+                        help='The number of nt at the 3\' end left out of the mutations. Default: 13.')
+    parser.add_argument('--out',
+                        action='store', default='qc_mut_mapping.csv',
+                        help='The output filename.')
+
+
+@command('qc-mut', 'Read depth at the mutations of a profiled RNA Lib.', add_qc_mut_arguments)
+def run_qc_mut(args, context: LibraryContext) -> int:
+    rna_library = context.library(args.rna_lib_profiling)
+    wt_id = rna_library.wide_type_rna_id
+    wt_rna_sequence = rna_library.wide_type_rna_sequence
+
+    def generate_rows():
+        for rna_item in rna_library.rna_items:
+            if rna_item.rna_id == wt_id:
+                continue
+
+            mut_positions, mut_syntax_list = rna_item.sequence.generate_mutation_syntax(
+                wt_rna_sequence, seq_type_rna=True, sequence_end=-args.trim_right if args.trim_right else None)
+            # Ignore if no "mutation"
+            if not mut_positions:
+                continue
+
+            modified_depth = rna_item.modified_read_depth
+            for position, mut_syntax in zip(mut_positions, mut_syntax_list):
+                profile = rna_item.profile_dict[str(position)]
+                yield [rna_item.rna_id, rna_item.barcode.barcode,
+                       position, profile.nt_sequence, mut_syntax,
+                       profile.modified_read_depth, profile.modified_effective_depth, modified_depth,
+                       profile.modified_read_depth / modified_depth if modified_depth else None]
+
+    headers = [
+        'RNA_ID',
+        'Barcode',
+        'Mut Position',
+        'Mut Sequence',
+        'Mut Syntax',
+        'Mut Depth',
+        'Mut Effective Depth',
+        'Total Read Depth',
+        'Mapping Rate'
+    ]
+    write_csv(args.out, headers, generate_rows())
+
+    return 0
+
+# endregion
+
+
+# ----------------------------------
+# region render
+
+def add_render_arguments(parser) -> None:
+    _add_summary_argument(parser)
+    parser.add_argument('--renderer',
+                        action="store", choices=['varna', 'svg'], default='svg',
+                        help='"varna" - PNG images by VARNA (Java). "svg" - SVG images, in Python. Default: "svg".')
+    parser.add_argument('--varna', dest='varna_location',
+                        action="store", default=None,
+                        help='The "path" to VARNA jar package. Not needed for the "svg" renderer.')
+    parser.add_argument('--force',
+                        action="store_true",
+                        help='Render all images, even the ones which are up to date.')
+    parser.add_argument('--out_folder',
+                        action='store', required=True,
+                        help='The output folder.')
+
+
+def render_jobs(items: Iterable[Dict[str, Any]], runner: Any, out_folder: str) -> List[Dict[str, Any]]:
+    r"""
+    The image jobs of the summary items (see `VarnaRunner.gen_struct_images`) - one per structure, with the editing
+    site and the mismatches highlighted.
+    """
+
+    jobs = list()
+    for rna_item in items:
+        editing_position = rna_item['A-to-I_editing_site']
+        mutation_syntax = rna_item.get('mutation_syntax')
+        rna_id_str = '{}-{}'.format(rna_item['rna_id'], mutation_syntax) if mutation_syntax is not None \
+            else '{}'.format(rna_item['rna_id'])
+
+        highlight_regions = [{'nt_range': '{0}-{0}'.format(editing_position), 'fill': '#0B4F6C'}]
+        annotations = [{'annotation_str': 'E-{}'.format(editing_position), 'anchor': '{}'.format(editing_position)}]
+        for position in filter(None, mismatch_positions(mutation_syntax)):
+            highlight_regions.append({'nt_range': '{0}-{0}'.format(position), 'fill': '#C55337'})
+            annotations.append({'annotation_str': 'M-{}'.format(position), 'anchor': '{}'.format(position)})
+
+        options = {
+            'baseNum': '#000000',
+            'highlightRegion': runner.gen_highlight_region_str(highlight_regions),
+            'annotations': runner.gen_annotation_str(annotations),
+            'title': rna_id_str
+        }
+
+        for data_type in ['computational', 'experimental']:
+            structure_str = rna_item.get('_'.join([data_type, 'structure']))
+            if not structure_str:
+                continue
+            jobs.append({
+                'sequence': rna_item['sequence_string'],
+                'structure': structure_str,
+                'out_file': os.path.join(out_folder, data_type, '{}.{}'.format(rna_id_str, runner.IMAGE_EXTENSION)),
+                'options': options,
+            })
+
+    return jobs
+
+
+@command('render', 'Structure images of a summary.', add_render_arguments)
+def run_render(args, context: LibraryContext) -> int:
+    from neoRNA.util.runner.svg_structure_runner import SvgStructureRunner
+    from neoRNA.util.runner.verna_runner import VarnaRunner
+
+    if args.renderer == 'varna' and not args.varna_location:
+        raise ValueError('"--varna" is needed for the "varna" renderer.')
+    runner = SvgStructureRunner() if args.renderer == 'svg' else VarnaRunner(args.varna_location)
+
+    out_folder = os.path.abspath(args.out_folder)
+    jobs = render_jobs(context.summary_items(args.summary, args.overlays), runner, out_folder)
+    for folder in set(os.path.dirname(job['out_file']) for job in jobs):
+        os.makedirs(folder, exist_ok=True)
+
+    report = runner.render_struct_images(jobs, workers=context.workers, skip_existing=not args.force)
+    logger.info('Images: {}, rendered: {}, up to date: {}, failed: {}'.format(
+        len(jobs), len(report.rendered_files), len(report.up_to_date_files), len(report.failed_files)))
+    for failed_file in report.failed_files:
+        logger.error('Image failed: {}'.format(failed_file))
+
+    return 1 if report.failed_files else 0
+
+# endregion
+
+
+# ----------------------------------
+# region summary
+
+def add_summary_arguments(parser) -> None:
+    _add_summary_argument(parser)
+    parser.add_argument('--editing_levels',
+                        action='store', default=None,
+                        help='The "editing levels" CSV to join. Optional.')
+    parser.add_argument('--rebuild',
+                        action='store_true',
+                        help='Rebuild the index, even if it is up to date.')
+    parser.add_argument('--mutation_count',
+                        action='store', type=int, default=None,
+                        help='Only the items with this number of mutations.')
+    parser.add_argument('--position',
+                        action='append', type=int, default=None,
+                        help='Only the items with a mutation at this position. Can be repeated.')
+    parser.add_argument('--structure',
+                        action='store', default=None,
+                        help='Only the items with this structure (of "--data_type").')
+    _add_data_type_argument(parser)
+    parser.add_argument('--out',
+                        action='store', default=None,
+                        help='The output "csv" file of the matching items. Without it, only the counts are logged.')
+
+
+@command('summary', 'Index and query a summary.', add_summary_arguments)
+def run_summary(args, context: LibraryContext) -> int:
+    options = dict()
+    if args.editing_levels:
+        options['editing_level_file_path'] = args.editing_levels
+    if args.rebuild:
+        options['rebuild'] = True
+    index = context.summary_index(args.summary, args.overlays, **options)
+
+    rna_ids = index.query(mutation_count=args.mutation_count, positions=args.position,
+                          structure=args.structure, data_type=args.data_type)
+    mutation_counts = Counter(index.record(rna_id)['mutation_count'] for rna_id in rna_ids)
+    logger.info('Items: {} of {}, WT: {}, by mutation count: {}'.format(
+        len(rna_ids), len(index), index.wt_rna_id,
+        ', '.join('{}: {}'.format(count, mutation_counts[count])
+                  for count in sorted(mutation_counts, key=lambda count: (count is None, count)))))
+
+    if args.out:
+        columns = ['rna_id', 'mutation_syntax', 'mutation_type', 'mutation_count', 'editing_site', 'editing_level']
+        write_csv(args.out, columns, ([index.record(rna_id)[column] for column in columns] for rna_id in rna_ids))
+
+    return 0
+
+# endregion
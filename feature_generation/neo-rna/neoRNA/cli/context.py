@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+"""
+Library Context
+--------------------
+
+The in-process state shared by the steps of a `neoRNA` CLI run.
+
+Each step of a run (`neoRNA fold ... + annotate ... + features ...`) gets the same context, so the data loaded and
+computed by one step is reused by the next ones, instead of being re-read from disk:
+- The "structure summary" items and their index, by file (and "overlay" files).
+- The RNA Lib definitions / profiling objects, by file.
+- The bpRNA annotation of each unique (sequence, structure) - annotated once for all the steps.
+- The feature engines, bootstrap ensembles, free energies and SimTree scores.
+- One worker pool, created on first use.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from neoRNA.analysis.feature_engine import CompiledStructure, FeatureEngine
+from neoRNA.util.file_utils import FileUtils
+
+
+logger = logging.getLogger('neo_rna.cli')
+
+
+class LibraryContext(object):
+    r"""
+    The shared state of a CLI run.
+
+    Usage
+    -------
+
+    >>> with LibraryContext(workers=4) as context:
+    ...     items = context.summary_items('rna_lib_structure_summary.json')
+    ...     structure = context.compiled_structure(items[0]['sequence_string'], items[0]['computational_structure'])
+
+    """
+
+    def __init__(self, workers: int = 1, work_folder: Optional[str] = None):
+        r"""
+        Init
+
+        Parameters
+        ----------
+        workers: int
+            The number of workers of the pool.
+        work_folder: Optional[str]
+            The folder for the temp files of the external tools. Default - a temp folder, removed on `close`.
+        """
+
+        self.__workers: int = max(1, workers or 1)
+        self.__work_folder: Optional[str] = work_folder
+        self.__own_work_folder: bool = work_folder is None
+
+        # Loaded files, by absolute path - summaries by (summary, overlays)
+        self.__summaries: Dict[Tuple[str, ...], List[Dict[str, Any]]] = dict()
+        self.__summary_indexes: Dict[Tuple[str, ...], Any] = dict()
+        self.__libraries: Dict[str, Any] = dict()
+        self.__library_items: Dict[str, List[Any]] = dict()
+        self.__bootstrap_ensembles: Dict[Tuple[str, ...], Any] = dict()
+
+        # bpRNA annotation, by (sequence, structure)
+        self.__st_strs: Dict[Tuple[str, str], str] = dict()
+        self.__compiled_structures: Dict[Tuple[str, str], CompiledStructure] = dict()
+
+        # Feature engines, by columns
+        self.__feature_engines: Dict[Tuple[str, ...], FeatureEngine] = dict()
+
+        # External tools - results by input
+        self.__free_energies: Dict[str, Tuple[Optional[float], Optional[str]]] = dict()
+        self.__simtree_scores: Dict[Tuple[str, str, str], Tuple[Optional[float], Optional[str]]] = dict()
+        # RNAfold / SimTree write temp files in their working folder - one runner per thread, each in its own folder
+        self.__thread_local = threading.local()
+
+        self.__pool: Optional[ThreadPool] = None
+        self.__lock = threading.Lock()
+
+    # ----------------------------------
+    # region Lifecycle
+
+    def __enter__(self) -> 'LibraryContext':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        r"""
+        Stop the worker pool, and remove the temp work folder.
+        """
+
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+        if self.__own_work_folder and self.__work_folder is not None:
+            shutil.rmtree(self.__work_folder, ignore_errors=True)
+            self.__work_folder = None
+
+    @property
+    def workers(self) -> int:
+        return self.__workers
+
+    @property
+    def work_folder(self) -> str:
+        if self.__work_folder is None:
+            self.__work_folder = tempfile.mkdtemp(prefix='neorna_')
+        os.makedirs(self.__work_folder, exist_ok=True)
+        return self.__work_folder
+
+    def map(self, function: Callable, items: Iterable[Any]) -> List[Any]:
+        r"""
+        Map a function over the items with the worker pool, in the input order.
+
+        The pool is a thread pool - meant for the steps waiting on external tools (SimTree, bpRNA.pl, etc.).
+        """
+
+        items = list(items)
+        if self.__workers <= 1 or len(items) <= 1:
+            return [function(item) for item in items]
+
+        if self.__pool is None:
+            self.__pool = ThreadPool(self.__workers)
+        return self.__pool.map(function, items)
+
+    # endregion
+
+    # ----------------------------------
+    # region Files
+
+    def summary_items(self, summary_file_path: str,
+                      overlay_file_paths: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        r"""
+        The items of a "structure summary" file (".json" or ".jsonl"), with the "overlay" files merged, loaded once.
+        """
+
+        key = self.__summary_key(summary_file_path, overlay_file_paths)
+        if key not in self.__summaries:
+            for file_path in key:
+                if not os.path.exists(file_path):
+                    raise ValueError('"RNA Lib Structure Summary" file does not exist.', file_path)
+            self.__summaries[key] = list(FileUtils.load_json_items_with_overlay(key[0], list(key[1:])))
+            logger.info('Summary items: {} - {}'.format(len(self.__summaries[key]), ', '.join(key)))
+
+        return self.__summaries[key]
+
+    def update_summary_items(self, summary_file_path: str, items: List[Dict[str, Any]],
+                             overlay_file_paths: Optional[List[str]] = None) -> None:
+        r"""
+        Replace the items of a summary file (with these overlays) for the next steps, such as after re-folding.
+        """
+
+        key = self.__summary_key(summary_file_path, overlay_file_paths)
+        self.__summaries[key] = items
+        self.__summary_indexes.pop(key, None)
+        self.__bootstrap_ensembles.pop(key, None)
+
+    def summary_index(self, summary_file_path: str, overlay_file_paths: Optional[List[str]] = None,
+                      **kwargs) -> Any:
+        r"""
+        The `StructureSummaryIndex` of a summary file. See `StructureSummaryIndex.load` for the `kwargs`.
+        """
+
+        from neoRNA.library.summary_index import StructureSummaryIndex
+
+        key = self.__summary_key(summary_file_path, overlay_file_paths)
+        if key not in self.__summary_indexes or kwargs:
+            self.__summary_indexes[key] = StructureSummaryIndex.load(key[0], overlay_file_paths=list(key[1:]),
+                                                                     **kwargs)
+
+        return self.__summary_indexes[key]
+
+    def library(self, rna_lib_profiling_file_path: str) -> Any:
+        r"""
+        The `RnaLibrary` of a profiling file (see `LibraryIO`).
+        """
+
+        from neoRNA.io.library_io import LibraryIO
+
+        key = os.path.abspath(rna_lib_profiling_file_path)
+        if key not in self.__libraries:
+            if not os.path.exists(key):
+                raise ValueError('"RNA Lib profiling" file does not exist.', rna_lib_profiling_file_path)
+            self.__libraries[key] = LibraryIO.as_python_object(key)
+
+        return self.__libraries[key]
+
+    def library_items(self, rna_lib_def_file_path: str) -> List[Any]:
+        r"""
+        The `LibraryItem` list of a RNA Lib definition file.
+        """
+
+        from neoRNA import io
+
+        key = os.path.abspath(rna_lib_def_file_path)
+        if key not in self.__library_items:
+            if not os.path.exists(key):
+                raise ValueError('"RNA Lib" definition file does not exist.', rna_lib_def_file_path)
+            self.__library_items[key] = list(io.parse(key, 'rna-lib-def'))
+
+        return self.__library_items[key]
+
+    def bootstrap_ensemble(self, summary_file_path: str, overlay_file_paths: Optional[List[str]] = None) -> Any:
+        r"""
+        The `BootstrapEnsemble` of the items of a summary file (with the "overlay" files merged).
+        """
+
+        from neoRNA.analysis.bootstrap_ensemble import BootstrapEnsemble
+
+        key = self.__summary_key(summary_file_path, overlay_file_paths)
+        if key not in self.__bootstrap_ensembles:
+            self.__bootstrap_ensembles[key] \
+                = BootstrapEnsemble.from_items(self.summary_items(key[0], list(key[1:])))
+
+        return self.__bootstrap_ensembles[key]
+
+    @classmethod
+    def __summary_key(cls, summary_file_path: str, overlay_file_paths: Optional[List[str]]) -> Tuple[str, ...]:
+        r"""
+        The key of a summary with its overlays - the absolute paths, overlays in the order to apply.
+        """
+        return tuple(os.path.abspath(file_path) for file_path in [summary_file_path] + list(overlay_file_paths or []))
+
+    # endregion
+
+    # ----------------------------------
+    # region Structure
+
+    def st_str(self, sequence_str: str, structure_str: str, name: Optional[str] = None) -> str:
+        r"""
+        The bpRNA ".st" text of a structure, annotated once.
+
+        The annotation is done in-process (`BpRnaAnnotator`). `bpRNA.pl` is only run for the structures with
+        pseudoknots.
+
+        Parameters
+        ----------
+        sequence_str: str
+        structure_str: str
+        name: Optional[str]
+            The "#Name" of the record. Default - "tmp", as `bpRNA.pl` names it after the input file.
+        """
+
+        from neoRNA.structure.bp_rna_annotator import BpRnaAnnotator
+
+        key = (sequence_str, structure_str)
+        st_str = self.__st_strs.get(key)
+        if st_str is None:
+            try:
+                st_str = BpRnaAnnotator.to_st(sequence_str, structure_str)
+            except ValueError:
+                # Pseudoknots - only `bpRNA.pl` handles them
+                st_str = self.__run_bprna_pl(sequence_str, structure_str)
+            self.__st_strs[key] = st_str
+
+        if name is not None and name != BpRnaAnnotator.DEFAULT_NAME:
+            st_str = st_str.replace('#Name: {}'.format(BpRnaAnnotator.DEFAULT_NAME), '#Name: {}'.format(name), 1)
+
+        return st_str
+
+    def compiled_structure(self, sequence_str: str, structure_str: str) -> CompiledStructure:
+        r"""
+        The `CompiledStructure` of a structure, for the feature engines.
+        """
+
+        key = (sequence_str, structure_str)
+        compiled_structure = self.__compiled_structures.get(key)
+        if compiled_structure is None:
+            compiled_structure = CompiledStructure.from_bprna(self.st_str(sequence_str, structure_str))
+            self.__compiled_structures[key] = compiled_structure
+
+        return compiled_structure
+
+    def feature_engine(self, columns: List[str]) -> FeatureEngine:
+        key = tuple(columns)
+        if key not in self.__feature_engines:
+            self.__feature_engines[key] = FeatureEngine(list(columns))
+        return self.__feature_engines[key]
+
+    def __run_bprna_pl(self, sequence_str: str, structure_str: str) -> str:
+        folder = tempfile.mkdtemp(dir=self.work_folder)
+        try:
+            FileUtils.save_file(os.path.join(folder, 'tmp.dbn'), '\n'.join(['>tmp', sequence_str, structure_str, '']))
+            subprocess.call(['bpRNA.pl', 'tmp.dbn'], cwd=folder, stdout=subprocess.PIPE)
+            with open(os.path.join(folder, 'tmp.st')) as infile:
+                return infile.read()
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    # endregion
+
+    # ----------------------------------
+    # region External Tools
+
+    def free_energy(self, sequence_str: str) -> Tuple[Optional[float], Optional[str]]:
+        r"""
+        The ensemble free energy (RNAfold) of a sequence, computed once. Thread safe.
+        """
+
+        from neoRNA.util.runner.rnafold_runner import RnaFoldRunner
+
+        if sequence_str not in self.__free_energies:
+            # NOTE: RNAfold uses fixed temp file names - in the folder of the thread's runner
+            runner = getattr(self.__thread_local, 'rnafold_runner', None)
+            if runner is None:
+                runner = self.__thread_local.rnafold_runner = RnaFoldRunner(tempfile.mkdtemp(dir=self.work_folder))
+            free_energy = runner.extract_free_energy(sequence_str)
+            with self.__lock:
+                self.__free_energies[sequence_str] = free_energy
+
+        return self.__free_energies[sequence_str]
+
+    def simtree_score(self, simtree_location: str, structure_str_1: str,
+                      structure_str_2: str) -> Tuple[Optional[float], Optional[str]]:
+        r"""
+        The SimTree (normalized score, flipping modes) of two structures, computed once. Thread safe.
+        """
+
+        from neoRNA.util.runner.simtree_runner import SimTreeRunner
+
+        key = (simtree_location, structure_str_1, structure_str_2)
+        if key not in self.__simtree_scores:
+            runners = getattr(self.__thread_local, 'simtree_runners', None)
+            if runners is None:
+                runners = self.__thread_local.simtree_runners = dict()
+            if simtree_location not in runners:
+                runners[simtree_location] = SimTreeRunner(simtree_location, tempfile.mkdtemp(dir=self.work_folder))
+            self.__simtree_scores[key] = runners[simtree_location].compare_rna_structure(structure_str_1,
+                                                                                         structure_str_2)
+
+        return self.__simtree_scores[key]
+
+    # endregion
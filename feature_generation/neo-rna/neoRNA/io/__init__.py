@@ -12,44 +12,135 @@ For each of the "file type", it provides:
 
 from __future__ import print_function
 
-from typing import Any
+import importlib
 
-from neoRNA.util.file_utils import FileUtils
-
-# IOes
-from .fasta_io import FastaIO
-from .library_def_io import LibraryDefinitionIO
+from typing import Any, Dict, List, Union
 
-from .shape_profile_io import ShapeProfileIO
-from .shape_reactivity_io import ShapeReactivityIO
-
-from .dot_bracket_io import DotBracketIO
-from .bpp_io import BasePairProbabilityIO
-from .bp_rna_io import BpRnaIO
+from neoRNA.util.file_utils import FileUtils
 
 
 # ----------------------------------
 # region File Type to IO Mapping
 
-_FileTypeToIO = {
+# The IO of each "file type", as "module:class" - imported on first use, since the IO modules pull in Biopython,
+# the structure model, etc.
+_FileTypeToIO: Dict[str, Union[str, type]] = {
     # Sequence
-    "fasta": FastaIO,
-    "dot-bracket": DotBracketIO,
+    "fasta": "neoRNA.io.fasta_io:FastaIO",
+    "dot-bracket": "neoRNA.io.dot_bracket_io:DotBracketIO",
 
     # RNA Lib
-    "rna-lib-def": LibraryDefinitionIO,
+    "rna-lib-def": "neoRNA.io.library_def_io:LibraryDefinitionIO",
 
     #
-    "bpp": BasePairProbabilityIO,
+    "bpp": "neoRNA.io.bpp_io:BasePairProbabilityIO",
 
     # Tool - ShapeMapper 2
-    "shape-profile": ShapeProfileIO,
-    "shape-reactivity": ShapeReactivityIO,
+    "shape-profile": "neoRNA.io.shape_profile_io:ShapeProfileIO",
+    "shape-reactivity": "neoRNA.io.shape_reactivity_io:ShapeReactivityIO",
 
     # Tool - bpRNA
-    "bp-rna": BpRnaIO,
+    "bp-rna": "neoRNA.io.bp_rna_io:BpRnaIO",
 }
 
+# The "entry point" group of the IO plugins - `file type = module:class`, such as
+#   entry_points={'neoRNA.io': ['my-format = my_package.my_io:MyIO']}
+IO_ENTRY_POINT_GROUP = 'neoRNA.io'
+
+# If the "entry points" are loaded into `_FileTypeToIO`
+_entry_points_loaded = False
+
+# The IO classes of the package, for `from neoRNA.io import FastaIO`
+_IO_CLASSES = {target.split(':')[1]: target for target in _FileTypeToIO.values()}
+
+
+def register(file_type: str, io: Union[str, type]) -> None:
+    r"""
+    Register the IO of a "file type". It replaces the existing one, if any.
+
+    Parameters
+    ----------
+    file_type: str
+    io: Union[str, type]
+        The IO class, or its "module:class" path to import it on first use.
+    """
+
+    if not file_type:
+        raise ValueError("File type required.")
+    if isinstance(io, str) and ':' not in io:
+        raise ValueError("The IO path must be \"module:class\"", io)
+
+    _FileTypeToIO[file_type] = io
+
+
+def _load_entry_points() -> None:
+    r"""
+    Register the IOs of the "entry points" - once, and without replacing the package ones.
+    """
+
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+
+    from importlib import metadata
+    try:
+        entry_points = metadata.entry_points(group=IO_ENTRY_POINT_GROUP)
+    except TypeError:
+        # Python < 3.10
+        entry_points = metadata.entry_points().get(IO_ENTRY_POINT_GROUP, [])
+
+    for entry_point in entry_points:
+        _FileTypeToIO.setdefault(entry_point.name, entry_point.value)
+
+
+def file_types() -> List[str]:
+    r"""
+    All the available "file types", the plugins included.
+    """
+
+    _load_entry_points()
+    return list(_FileTypeToIO.keys())
+
+
+def get_io(file_type: str) -> type:
+    r"""
+    The IO class of a "file type", imported on first use.
+
+    Parameters
+    ----------
+    file_type: str
+
+    Returns
+    -------
+    io: type
+    """
+
+    # Parameter check
+    if not file_type:
+        raise ValueError("File type required.")
+    if file_type not in _FileTypeToIO:
+        # Only look for the plugins when needed
+        _load_entry_points()
+    if file_type not in _FileTypeToIO:
+        raise ValueError("File type not exist. Available options: {}".format(" | ".join(file_types())))
+
+    io = _FileTypeToIO[file_type]
+    if isinstance(io, str):
+        module_name, class_name = io.split(':')
+        io = getattr(importlib.import_module(module_name), class_name)
+        _FileTypeToIO[file_type] = io
+
+    return io
+
+
+def __getattr__(name: str) -> Any:
+    # The IO classes, imported on first access
+    if name in _IO_CLASSES:
+        module_name, class_name = _IO_CLASSES[name].split(':')
+        return getattr(importlib.import_module(module_name), class_name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
 # endregion
 
 # ----------------------------------
@@ -83,20 +174,15 @@ def parse(handle: Any, file_type: str):
 
     """
 
-    # Parameter check
-    if not file_type:
-        raise ValueError("File type required.")
-    if file_type not in _FileTypeToIO:
-        raise ValueError("File type not exist. Available options: {}".format(" | ".join(list(_FileTypeToIO.keys()))))
+    # Map the file type to its IO - before opening the file
+    io = get_io(file_type)
 
     # Handle the input
     mode = 'rU'
     iterator = None
     with FileUtils.as_handle(handle, mode) as fp:
-        # Map the file type to a parsing iterator:
-        if file_type in _FileTypeToIO:
-            io = _FileTypeToIO[file_type]
-            iterator = io.parse_iterator(fp)
+        # The parsing iterator
+        iterator = io.parse_iterator(fp)
 
         # Iterate
         if iterator:
@@ -129,22 +215,15 @@ def write(records: Any, handle: Any, file_type: str):
 
     """
 
-    # Parameter check
-    if not file_type:
-        raise ValueError("File type required.")
-    if file_type not in _FileTypeToIO:
-        raise ValueError(
-            "File type not exist. Available options: {}".format(" | ".join(list(_FileTypeToIO.keys()))))
+    # Map the file format to a writer
+    io = get_io(file_type)
 
     #
     count = 0
     mode = 'w'
 
     with FileUtils.as_handle(handle, mode) as fp:
-        # Map the file format to a writer
-        if file_type in _FileTypeToIO:
-            io = _FileTypeToIO[file_type]
-            iterator = io.parse_iterator(fp)
+        iterator = io.parse_iterator(fp)
 
     return count
 
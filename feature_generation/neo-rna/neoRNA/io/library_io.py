@@ -6,8 +6,10 @@ IO - RNA Library
 """
 
 import json
+import os
 
 from neoRNA.library.rna_library import RnaLibrary
+from neoRNA.library.shape_mapper.profile_arrays import ProfileArrays
 from neoRNA.util.file_utils import FileUtils
 from neoRNA.util.json_serializable import as_python_object
 
@@ -27,6 +29,9 @@ class LibraryIO(object):
         r"""
         Parse the RNA Lib bin file and decode it as a "Python Object".
 
+        The profile data of the items is attached from the arrays next to the file, if any - as memory maps.
+        Files from before the arrays keep the profile data inline.
+
         Parameters
         ----------
         rna_lib_profiling_file: str
@@ -37,11 +42,25 @@ class LibraryIO(object):
         parsed_rna_lib: RnaLibrary
             The parsed RNA Lib object.
 
+        Raises
+        ------
+        ValueError
+            If the arrays folder is missing, but the items have ShapeMapper results without inline profile data.
+
         """
 
         object_str = FileUtils.load_file_as_str(rna_lib_profiling_file)
         python_object: RnaLibrary = json.loads(object_str, object_hook=as_python_object)
 
+        profile_folder = ProfileArrays.folder_path(rna_lib_profiling_file)
+        if os.path.isdir(profile_folder):
+            ProfileArrays.load(profile_folder).attach(python_object.rna_items)
+        elif any(getattr(rna_item, 'shape_profile_file', None) and not rna_item.profile_list
+                 for rna_item in python_object.rna_items):
+            # The profile data is only in the arrays - not copied along with the file
+            # (items pickled before `shape_profile_file` keep their profile data inline)
+            raise ValueError('The profile arrays folder of the RNA Lib file is missing.', profile_folder)
+
         #
         return python_object
 
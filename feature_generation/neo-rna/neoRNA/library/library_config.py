@@ -60,7 +60,7 @@ class RnaLibConfig(object):
         for key, value in defaults.items():
             setattr(self, key, value)
 
-        with open(config_file, 'rU') as infile:
+        with open(config_file, 'r') as infile:
             self.__config: Dict[str, Any] = yaml.safe_load(infile)
 
         # Override by the config file.
@@ -7,13 +7,16 @@ RNA Library Item
 
 import numpy
 
-from typing import List, Dict
+from typing import List, Dict, Optional, TYPE_CHECKING
 
 from neoRNA.library.shape_mapper.shape_profile_item import ShapeProfileItem
 from neoRNA.library.shape_mapper.shape_reactivity_item import ShapeReactivityItem
 from neoRNA.sequence.sequence import Sequence
 from neoRNA.sequence.barcode import Barcode
 
+if TYPE_CHECKING:
+    from neoRNA.library.shape_mapper.profile_arrays import ItemProfileArrays
+
 
 class LibraryItem(object):
     """
@@ -71,6 +74,16 @@ class LibraryItem(object):
         self.shape_reactivity_list: List[ShapeReactivityItem] = []
         self.shape_reactivity_dict: Dict[str, ShapeReactivityItem] = {}
 
+        # ----------
+        # Profile data and Shape Reactivity, as arrays - see `ProfileArrays.attach`
+        # - The lists / dicts above are built from them, when first used.
+        self.profile_arrays: Optional['ItemProfileArrays'] = None
+
+        # ----------
+        # The ShapeMapper 2.x output files - "profile" and "shape" (reactivity)
+        self.shape_profile_file: Optional[str] = None
+        self.shape_reactivity_file: Optional[str] = None
+
         # ----------
         # Reactivity from "OWN" method - a diff. method from ShapeMapper 2.x
         #
@@ -86,6 +99,69 @@ class LibraryItem(object):
 
     # endregion
 
+    # ----------------------------------
+    # region Properties - Profile Data
+    #
+    # NOTE:
+    # - The values are kept in `__dict__`, under the same names - the same as the pickled objects of the older
+    #   versions, which do not have `profile_arrays`.
+
+    @property
+    def profile_arrays(self) -> Optional['ItemProfileArrays']:
+        return self.__dict__.get('profile_arrays')
+
+    @profile_arrays.setter
+    def profile_arrays(self, profile_arrays: Optional['ItemProfileArrays']):
+        self.__dict__['profile_arrays'] = profile_arrays
+
+    def __profile_data(self, name: str):
+        value = self.__dict__.get(name)
+        if not value and self.profile_arrays is not None:
+            if name == 'profile_list':
+                value = self.profile_arrays.profile_items()
+            elif name == 'shape_reactivity_list':
+                value = self.profile_arrays.shape_reactivity_items()
+            else:
+                # The `dict`, indexed by "nt position"
+                value = dict((item.nt_position, item) for item in self.__profile_data(name[:-len('dict')] + 'list'))
+            self.__dict__[name] = value
+
+        return value
+
+    @property
+    def profile_list(self) -> List[ShapeProfileItem]:
+        return self.__profile_data('profile_list')
+
+    @profile_list.setter
+    def profile_list(self, profile_list: List[ShapeProfileItem]):
+        self.__dict__['profile_list'] = profile_list
+
+    @property
+    def profile_dict(self) -> Dict[str, ShapeProfileItem]:
+        return self.__profile_data('profile_dict')
+
+    @profile_dict.setter
+    def profile_dict(self, profile_dict: Dict[str, ShapeProfileItem]):
+        self.__dict__['profile_dict'] = profile_dict
+
+    @property
+    def shape_reactivity_list(self) -> List[ShapeReactivityItem]:
+        return self.__profile_data('shape_reactivity_list')
+
+    @shape_reactivity_list.setter
+    def shape_reactivity_list(self, shape_reactivity_list: List[ShapeReactivityItem]):
+        self.__dict__['shape_reactivity_list'] = shape_reactivity_list
+
+    @property
+    def shape_reactivity_dict(self) -> Dict[str, ShapeReactivityItem]:
+        return self.__profile_data('shape_reactivity_dict')
+
+    @shape_reactivity_dict.setter
+    def shape_reactivity_dict(self, shape_reactivity_dict: Dict[str, ShapeReactivityItem]):
+        self.__dict__['shape_reactivity_dict'] = shape_reactivity_dict
+
+    # endregion
+
     # ----------------------------------
     # region Properties
 
@@ -183,6 +259,12 @@ class LibraryItem(object):
         """
 
         if reactivity_type == 'shape':
+            if not self.__dict__.get('shape_reactivity_list') and self.profile_arrays is not None:
+                # From the arrays - "NaN" for "None"
+                shape_reactivity = self.profile_arrays.shape_reactivity
+                return numpy.where(numpy.isnan(shape_reactivity), ShapeReactivityItem.NUMBER_FOR_NONE,
+                                   shape_reactivity).tolist()
+
             # Convert "None"
             return [item.shape_reactivity if item.shape_reactivity is not None else ShapeReactivityItem.NUMBER_FOR_NONE
                     for item in self.shape_reactivity_list]
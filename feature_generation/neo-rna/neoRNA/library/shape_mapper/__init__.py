@@ -16,6 +16,9 @@ import os
 SHAPE_RESULTS_FOLDER_NAME = 'shapemapper_results'
 SHAPE_TEMP_FOLDER_NAME = 'shapemapper_temp'
 
+# The output files of each RNA Lib item, by RNA ID - under the result folder
+SHAPE_INDEX_FILE_NAME = 'shape_index.json'
+
 # The "naming pattern" for the RNA Lib item result folder.
 # Format: [rna_id]_[barcode]_out
 RNA_ITEM_SHAPE_RESULT_FOLDER_NAME_PATTERN = '{}_{}_out'
@@ -44,6 +47,7 @@ def get_shape2_path(path_type: str, working_folder: str,
         Available options:
         - results - folder, result folder
         - temp - folder, temp folder
+        - index - file, the output files of each RNA Lib item (see `ShapeMapperScheduler`)
         - profile - file, profile file
         - shape - file, shape data file
     working_folder: str
@@ -64,6 +68,8 @@ def get_shape2_path(path_type: str, working_folder: str,
         return os.path.join(working_folder, SHAPE_RESULTS_FOLDER_NAME)
     if path_type == 'temp':
         return os.path.join(working_folder, SHAPE_TEMP_FOLDER_NAME)
+    if path_type == 'index':
+        return os.path.join(working_folder, SHAPE_RESULTS_FOLDER_NAME, SHAPE_INDEX_FILE_NAME)
     if path_type == 'profile':
         return os.path.join(working_folder, SHAPE_RESULTS_FOLDER_NAME,
                             RNA_ITEM_SHAPE_RESULT_FOLDER_NAME_PATTERN.format(rna_id, rna_barcode),
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+"""
+ShapeMapper 2.x Profile Arrays
+================
+
+The ShapeMapper 2.x "profile" / "shape" data of a RNA Lib, as compact arrays.
+
+- `read_item_profile` reads the two files of an item into an `ItemProfileArrays` - one row per "nt".
+- `ingest_profiles` reads the files of all the items, in chunks across worker processes, and merges them into one
+    `ProfileArrays` - the rows of all the items, one after another.
+- `ProfileArrays` is saved as a folder of ".npy" files, next to the RNA Lib profiling file. It is loaded as memory
+    maps - each item gets views of its rows, nothing is read before it is used.
+
+A missing value ("nan" in the files, or no value) is `NaN`.
+
+Usage
+-------
+
+>>> profile_arrays = ingest_profiles([(profile_file, shape_file), ...], rna_ids, workers=4)
+>>> profile_arrays.save(ProfileArrays.folder_path('rna_lib.rbin'))
+>>> ProfileArrays.load(ProfileArrays.folder_path('rna_lib.rbin')).attach(rna_library.rna_items)
+"""
+
+import json
+import math
+import multiprocessing
+import os
+
+from collections import namedtuple
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from neoRNA.io.shape_profile_io import ShapeProfileIO
+from neoRNA.library.shape_mapper.shape_profile_item import ShapeProfileItem
+from neoRNA.library.shape_mapper.shape_reactivity_item import ShapeReactivityItem
+
+
+# The value columns of a "profile" file - in the file order, after "Nucleotide" and "Sequence".
+# The names are the ones of `ShapeProfileItem`.
+PROFILE_COLUMNS = [
+    'modified_mutations', 'modified_read_depth', 'modified_effective_depth', 'modified_rate',
+    'untreated_mutations', 'untreated_read_depth', 'untreated_effective_depth', 'untreated_rate',
+    'denatured_mutations', 'denatured_read_depth', 'denatured_effective_depth', 'denatured_rate',
+    'reactivity_profile', 'reactivity_stderr', 'hq_profile', 'hq_stderr', 'norm_profile', 'norm_stderr',
+]
+PROFILE_COLUMN_INDEX = dict((column, index) for index, column in enumerate(PROFILE_COLUMNS))
+
+# The "Norm" columns - empty for the "nt" not in "high quality"
+NORM_COLUMN = PROFILE_COLUMN_INDEX['norm_profile']
+
+
+def _to_float(value: Optional[str]) -> float:
+    # "nan" is parsed as `NaN` by `float`
+    return float(value) if value else math.nan
+
+
+def _to_optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else float(value)
+
+
+class ItemProfileArrays(namedtuple('ItemProfileArrays',
+                                   ['positions', 'sequence', 'values', 'high_quality', 'shape_reactivity'])):
+    r"""
+    The profile data of a RNA Lib item - one row per "nt" of the "profile" file.
+
+    - positions: int32, the "nt" positions.
+    - sequence: S1, the "nt" of each position.
+    - values: float64, (rows, `PROFILE_COLUMNS`)
+    - high_quality: bool, if the "nt" has "Norm" values.
+    - shape_reactivity: float64, the "shape" reactivity of each position.
+    """
+
+    def __len__(self):
+        return len(self.positions)
+
+    def column(self, column: str) -> np.ndarray:
+        return self.values[:, PROFILE_COLUMN_INDEX[column]]
+
+    def profile_items(self) -> List[ShapeProfileItem]:
+        r"""
+        The rows, as `ShapeProfileItem` - the same as parsing the "profile" file.
+        """
+        values = self.values.tolist()
+        return [ShapeProfileItem.from_values(str(position), nt.decode(), dict(zip(PROFILE_COLUMNS, row)), hq)
+                for position, nt, row, hq in zip(self.positions.tolist(), self.sequence.tolist(), values,
+                                                 self.high_quality.tolist())]
+
+    def shape_reactivity_items(self) -> List[ShapeReactivityItem]:
+        r"""
+        The "shape" reactivity, as `ShapeReactivityItem` - the same as parsing the "shape" file.
+        """
+        return [ShapeReactivityItem.from_value(str(position), _to_optional(value))
+                for position, value in zip(self.positions.tolist(), self.shape_reactivity.tolist())]
+
+
+def read_item_profile(profile_file: Optional[str], shape_file: Optional[str]) -> ItemProfileArrays:
+    r"""
+    Read the "profile" and "shape" files of an item.
+
+    Parameters
+    ----------
+    profile_file: Optional[str]
+        The "profile" file. Empty arrays if `None`.
+    shape_file: Optional[str]
+        The "shape" file. The reactivity is aligned to the "profile" positions - `NaN` for a missing one.
+
+    Returns
+    -------
+    item_profile: ItemProfileArrays
+    """
+
+    rows = []
+    if profile_file is not None:
+        with open(profile_file) as handle:
+            rows = list(ShapeProfileIO.parse(handle))
+
+    total_columns = len(PROFILE_COLUMNS)
+    positions = np.fromiter((int(row[0]) for row in rows), dtype=np.int32, count=len(rows))
+    sequence = np.array([row[1].strip() for row in rows], dtype='S1')
+    values = np.array([[_to_float(value) for value in row[2:2 + total_columns]] for row in rows],
+                      dtype=np.float64).reshape(len(rows), total_columns)
+    high_quality = np.array([bool(row[2 + NORM_COLUMN]) for row in rows], dtype=bool)
+
+    shape_reactivity = np.full(len(rows), np.nan)
+    if shape_file is not None and len(rows):
+        with open(shape_file) as handle:
+            shape_rows = [line.split('\t') for line in handle if line.strip()]
+        # Align to the profile positions
+        row_index = dict((position, index) for index, position in enumerate(positions.tolist()))
+        for shape_row in shape_rows:
+            index = row_index.get(int(shape_row[0]))
+            value = _to_float(shape_row[1].strip()) if len(shape_row) > 1 else math.nan
+            if index is not None and value != ShapeReactivityItem.NUMBER_FOR_NONE:
+                shape_reactivity[index] = value
+
+    return ItemProfileArrays(positions, sequence, values, high_quality, shape_reactivity)
+
+
+def _read_chunk(entries: List[Tuple[Optional[str], Optional[str]]]) -> List[ItemProfileArrays]:
+    return [read_item_profile(profile_file, shape_file) for profile_file, shape_file in entries]
+
+
+class ProfileArrays(object):
+    r"""
+    The profile data of all the items of a RNA Lib - their rows one after another.
+
+    The rows of the item "i" are `offsets[i]:offsets[i + 1]`.
+    """
+
+    # The files, in the folder
+    META_FILE_NAME = 'meta.json'
+    ARRAY_NAMES = ['offsets', 'positions', 'sequence', 'values', 'high_quality', 'shape_reactivity']
+
+    VERSION = 1
+
+    # ----------------------------------
+    # region Init
+
+    def __init__(self, rna_ids: List[str], offsets: np.ndarray, positions: np.ndarray, sequence: np.ndarray,
+                 values: np.ndarray, high_quality: np.ndarray, shape_reactivity: np.ndarray):
+        if len(offsets) != len(rna_ids) + 1:
+            raise ValueError('The offsets do not match the items.', len(offsets), len(rna_ids))
+
+        self.rna_ids: List[str] = list(rna_ids)
+        self.offsets = offsets
+        self.positions = positions
+        self.sequence = sequence
+        self.values = values
+        self.high_quality = high_quality
+        self.shape_reactivity = shape_reactivity
+
+        self.__index: Dict[str, int] = dict((rna_id, index) for index, rna_id in enumerate(self.rna_ids))
+
+    @classmethod
+    def merge(cls, rna_ids: List[str], item_profiles: List[ItemProfileArrays]) -> 'ProfileArrays':
+        r"""
+        Merge the arrays of the items - into arrays allocated once, for all the rows.
+        """
+
+        if len(rna_ids) != len(item_profiles):
+            raise ValueError('The profiles do not match the items.', len(item_profiles), len(rna_ids))
+
+        offsets = np.zeros(len(item_profiles) + 1, dtype=np.int64)
+        np.cumsum([len(item_profile) for item_profile in item_profiles], out=offsets[1:])
+        total_rows = int(offsets[-1])
+
+        positions = np.empty(total_rows, dtype=np.int32)
+        sequence = np.empty(total_rows, dtype='S1')
+        values = np.empty((total_rows, len(PROFILE_COLUMNS)), dtype=np.float64)
+        high_quality = np.empty(total_rows, dtype=bool)
+        shape_reactivity = np.empty(total_rows, dtype=np.float64)
+        for index, item_profile in enumerate(item_profiles):
+            rows = slice(offsets[index], offsets[index + 1])
+            positions[rows] = item_profile.positions
+            sequence[rows] = item_profile.sequence
+            values[rows] = item_profile.values
+            high_quality[rows] = item_profile.high_quality
+            shape_reactivity[rows] = item_profile.shape_reactivity
+
+        return cls(rna_ids, offsets, positions, sequence, values, high_quality, shape_reactivity)
+
+    # endregion
+
+    # ----------------------------------
+    # region Items
+
+    def __len__(self):
+        return len(self.rna_ids)
+
+    def __contains__(self, rna_id: str) -> bool:
+        return rna_id in self.__index
+
+    def item(self, rna_id: str) -> ItemProfileArrays:
+        r"""
+        The rows of an item - as views, no copy.
+        """
+
+        index = self.__index.get(rna_id)
+        if index is None:
+            raise ValueError('No profile data of the RNA item.', rna_id)
+
+        rows = slice(int(self.offsets[index]), int(self.offsets[index + 1]))
+        # NOTE: `np.asarray` - plain arrays, not memory maps, once pickled to other processes
+        return ItemProfileArrays(np.asarray(self.positions[rows]), np.asarray(self.sequence[rows]),
+                                 np.asarray(self.values[rows]), np.asarray(self.high_quality[rows]),
+                                 np.asarray(self.shape_reactivity[rows]))
+
+    def attach(self, rna_items: Iterable) -> int:
+        r"""
+        Attach the rows of each item to its `LibraryItem` (`profile_arrays`).
+
+        Returns
+        -------
+        total_attached: int
+        """
+
+        total_attached = 0
+        for rna_item in rna_items:
+            if rna_item.rna_id in self.__index:
+                rna_item.profile_arrays = self.item(rna_item.rna_id)
+                total_attached += 1
+
+        return total_attached
+
+    # endregion
+
+    # ----------------------------------
+    # region File
+
+    @classmethod
+    def folder_path(cls, rna_lib_file: str) -> str:
+        r"""
+        The folder of the arrays of a RNA Lib profiling file - "data.rbin" -> "data_profile".
+        """
+        return os.path.splitext(rna_lib_file)[0] + '_profile'
+
+    def save(self, folder: str) -> None:
+        os.makedirs(folder, exist_ok=True)
+        for name in self.ARRAY_NAMES:
+            np.save(os.path.join(folder, name + '.npy'), getattr(self, name))
+
+        with open(os.path.join(folder, self.META_FILE_NAME), 'w') as outfile:
+            json.dump({'version': self.VERSION, 'columns': PROFILE_COLUMNS, 'rna_ids': self.rna_ids}, outfile)
+
+    @classmethod
+    def load(cls, folder: str, mmap_mode: Optional[str] = 'r') -> 'ProfileArrays':
+        r"""
+        Load the arrays of a folder - as read-only memory maps by default.
+        """
+
+        with open(os.path.join(folder, cls.META_FILE_NAME)) as infile:
+            meta = json.load(infile)
+        if meta.get('columns') != PROFILE_COLUMNS:
+            raise ValueError('The profile columns do not match.', folder)
+
+        arrays = dict((name, np.load(os.path.join(folder, name + '.npy'), mmap_mode=mmap_mode))
+                      for name in cls.ARRAY_NAMES)
+        return cls(meta['rna_ids'], **arrays)
+
+    # endregion
+
+
+def ingest_profiles(entries: List[Tuple[Optional[str], Optional[str]]], rna_ids: List[str],
+                    workers: int = 1, chunk_size: Optional[int] = None) -> ProfileArrays:
+    r"""
+    Read the "profile" / "shape" files of the items, and merge them into one `ProfileArrays`.
+
+    Parameters
+    ----------
+    entries: List[Tuple[Optional[str], Optional[str]]]
+        The (profile file, shape file) of each item.
+    rna_ids: List[str]
+        The RNA ID of each item.
+    workers: int
+        The number of worker processes. "1" reads in the current process.
+    chunk_size: Optional[int]
+        The number of items read by a worker at a time. Default - a few chunks per worker.
+
+    Returns
+    -------
+    profile_arrays: ProfileArrays
+    """
+
+    entries = list(entries)
+    if workers <= 1 or len(entries) <= 1:
+        return ProfileArrays.merge(rna_ids, _read_chunk(entries))
+
+    if not chunk_size:
+        chunk_size = max(1, int(math.ceil(len(entries) / float(workers * 4))))
+    chunks = [entries[start:start + chunk_size] for start in range(0, len(entries), chunk_size)]
+
+    item_profiles = []
+    with multiprocessing.Pool(min(workers, len(chunks))) as pool:
+        for chunk_profiles in pool.imap(_read_chunk, chunks):
+            item_profiles.extend(chunk_profiles)
+
+    return ProfileArrays.merge(rna_ids, item_profiles)
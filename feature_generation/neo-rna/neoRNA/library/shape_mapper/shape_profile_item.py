@@ -5,7 +5,7 @@ ShapeMapper 2.x Profile Item
 ================
 """
 
-from typing import List
+from typing import Dict, List
 
 
 class ShapeProfileItem(object):
@@ -90,7 +90,31 @@ class ShapeProfileItem(object):
             # Not in "HQ"
             self.in_high_quality = False
             self.norm_profile = None
-            self.norm_profile = None
+            self.norm_stderr = None
+
+    @classmethod
+    def from_values(cls, nt_position: str, nt_sequence: str, values: Dict[str, float],
+                    in_high_quality: bool) -> 'ShapeProfileItem':
+        r"""
+        Init from the parsed values, such as the ones of `ItemProfileArrays` - `NaN` for "None".
+
+        Parameters
+        ----------
+        nt_position: str
+        nt_sequence: str
+        values: Dict[str, float]
+            The values, by attribute name.
+        in_high_quality: bool
+        """
+
+        item = cls.__new__(cls)
+        item.nt_position = nt_position
+        item.nt_sequence = nt_sequence
+        for name, value in values.items():
+            setattr(item, name, None if value != value else value)
+        item.in_high_quality = in_high_quality
+
+        return item
 
     # endregion
 
@@ -5,7 +5,7 @@ ShapeMapper 2.x - Shape Reactivity Item
 ================
 """
 
-from typing import List
+from typing import List, Optional
 
 
 class ShapeReactivityItem(object):
@@ -48,6 +48,18 @@ class ShapeReactivityItem(object):
         self.shape_reactivity = float(data_list[1].strip()) \
             if data_list[1].strip() != self.NUMBER_FOR_NONE else None
 
+    @classmethod
+    def from_value(cls, nt_position: str, shape_reactivity: Optional[float]) -> 'ShapeReactivityItem':
+        r"""
+        Init from the parsed value, such as the one of `ItemProfileArrays`.
+        """
+
+        item = cls.__new__(cls)
+        item.nt_position = nt_position
+        item.shape_reactivity = shape_reactivity
+
+        return item
+
     # endregion
 
     # ----------------------------------
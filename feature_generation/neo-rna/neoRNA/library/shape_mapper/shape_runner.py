@@ -9,17 +9,28 @@ CMD runner for "ShapeMapper".
 
 import json
 import os
+import shlex
 import subprocess
 
-from typing import Dict, Any
+from collections import namedtuple
+from typing import Dict, Any, Optional
 
 from neoRNA.library.library_config import RnaLibConfig
 from neoRNA.library.library_item import LibraryItem
+from neoRNA.library.shape_mapper import get_shape2_path, \
+    RNA_ITEM_SHAPE_RESULT_FOLDER_NAME_PATTERN, RNA_ITEM_SHAPE_TEMP_FOLDER_NAME_PATTERN
 
 from neoRNA.util.json_serializable import as_python_object
 from neoRNA.util.file_utils import FileUtils
 
 
+# A "ShapeMapper 2.x" job of a RNA Lib item
+#   - command: the "CMD", as a list of arguments - to run in "data_folder".
+#   - threads: the number of threads of the job.
+ShapeMapperJob = namedtuple('ShapeMapperJob', ['rna_id', 'barcode', 'command', 'data_folder',
+                                               'output_folder', 'temp_folder', 'threads'])
+
+
 class ShapeMapperRunner(object):
     """
     CMD runner for "ShapeMapper".
@@ -61,6 +72,9 @@ class ShapeMapperRunner(object):
     # ----------------------------------
     # region ShapeMapper v2x
 
+    # The executable of ShapeMapper 2.x
+    SHAPE_MAPPER_V2_EXECUTABLE = 'shapemapper'
+
     @classmethod
     def shape_mapper_v2(cls, configs_json: str, rna_item_json: str):
         """
@@ -82,13 +96,51 @@ class ShapeMapperRunner(object):
 
         Returns
         -------
-
+        output_folder_path: str
+            The ShapeMapper output folder of the item.
         """
 
         #
         configs: RnaLibConfig = json.loads(configs_json, object_hook=as_python_object)
         rna_item: LibraryItem = json.loads(rna_item_json, object_hook=as_python_object)
 
+        job = cls.shape_mapper_v2_job(configs, rna_item, threads=configs['shape_threads_per_job'])
+
+        # Run CMD
+        try:
+            print(' '.join(job.command))
+            return_code = subprocess.call(job.command, cwd=job.data_folder)
+        except OSError as error:
+            print('ShapeMapper 2.x command running error - ', error.args)
+            raise
+
+        if return_code != 0:
+            raise ValueError('ShapeMapper 2.x command failed.', job.rna_id, return_code)
+
+        return job.output_folder
+
+    @classmethod
+    def shape_mapper_v2_job(cls, configs: RnaLibConfig, rna_item: LibraryItem,
+                            threads: Optional[int] = None, executable: Optional[str] = None) -> ShapeMapperJob:
+        r"""
+        Prepare the "ShapeMapper 2.x" job of a RNA Lib item - its "target" sequence file, folders and "CMD".
+
+        Parameters
+        ----------
+        configs: RnaLibConfig
+            The "RNA Lib" configs.
+        rna_item: LibraryItem
+            The RNA Lib Item object
+        threads: Optional[int]
+            The number of threads of the job (`--nproc`). Default - ShapeMapper default.
+        executable: Optional[str]
+            The ShapeMapper executable. Default - "shapemapper", on the `PATH`.
+
+        Returns
+        -------
+        job: ShapeMapperJob
+        """
+
         rna_id = rna_item.rna_id
         barcode = rna_item.barcode
         sequence = rna_item.sequence
@@ -99,20 +151,20 @@ class ShapeMapperRunner(object):
             raise ValueError('"Working Folder" does not exist. ')
 
         # Create the folder for "shapemapper" results
-        shapemapper_results_folder_path = os.path.join(working_folder, 'shapemapper_results')
-        if not os.path.exists(shapemapper_results_folder_path):
-            os.mkdir(shapemapper_results_folder_path)
+        shapemapper_results_folder_path = get_shape2_path('results', working_folder)
+        os.makedirs(shapemapper_results_folder_path, exist_ok=True)
         # Output folder for ShapeMapper results
         output_folder_path = \
-            os.path.join(shapemapper_results_folder_path, '{}_{}_out'.format(rna_id, barcode.barcode))
+            os.path.join(shapemapper_results_folder_path,
+                         RNA_ITEM_SHAPE_RESULT_FOLDER_NAME_PATTERN.format(rna_id, barcode.barcode))
 
         # Create the folder for "shapemapper" temp results
-        shapemapper_temp_folder_path = os.path.join(working_folder, 'shapemapper_temp')
-        if not os.path.exists(shapemapper_temp_folder_path):
-            os.mkdir(shapemapper_temp_folder_path)
+        shapemapper_temp_folder_path = get_shape2_path('temp', working_folder)
+        os.makedirs(shapemapper_temp_folder_path, exist_ok=True)
         # Output folder for ShapeMapper results
         temp_folder_path = \
-            os.path.join(shapemapper_temp_folder_path, '{}_{}_temp'.format(rna_id, barcode.barcode))
+            os.path.join(shapemapper_temp_folder_path,
+                         RNA_ITEM_SHAPE_TEMP_FOLDER_NAME_PATTERN.format(rna_id, barcode.barcode))
 
         # Create "target" sequence file - "RNA_ID.fa"
         # Here, it needs to be "DNA" sequence
@@ -128,47 +180,39 @@ class ShapeMapperRunner(object):
             data_folder_path = os.path.join(configs['data_source_folder_path'], barcode.barcode)
 
         # Prepare "CMD"
-        cmd = 'shapemapper --target {} '.format(rna_sequence_file_path)
-        cmd += ' --out {} '.format(output_folder_path)
-        cmd += ' --log {} '.format(os.path.join(output_folder_path, 'shapemapper_log.txt'))
-        cmd += ' --temp {} '.format(temp_folder_path)
+        cmd = [executable or cls.SHAPE_MAPPER_V2_EXECUTABLE, '--target', rna_sequence_file_path]
+        cmd += ['--out', output_folder_path]
+        cmd += ['--log', os.path.join(output_folder_path, 'shapemapper_log.txt')]
+        cmd += ['--temp', temp_folder_path]
         if configs['shape_min_read_depth']:
-            cmd += ' --min-depth {} '.format(configs['shape_min_read_depth'])
+            cmd += ['--min-depth', str(configs['shape_min_read_depth'])]
+        if threads:
+            cmd += ['--nproc', str(threads)]
 
         if configs['shape_use_folder'] is True:
             # Use folder parameter
-            cmd += ' --modified --folder {} '\
-                .format(os.path.join(data_folder_path, configs['shape_modified_folder']))
-            cmd += ' --untreated --folder {} ' \
-                .format(os.path.join(data_folder_path, configs['shape_untreated_folder']))
+            cmd += ['--modified', '--folder', os.path.join(data_folder_path, configs['shape_modified_folder'])]
+            cmd += ['--untreated', '--folder', os.path.join(data_folder_path, configs['shape_untreated_folder'])]
             # Check if need to include `denatured` data
-            if configs['shape_denatured_folder'] != '':
-                cmd += ' --denatured --folder {} '\
-                    .format(os.path.join(data_folder_path, configs['shape_denatured_folder']))
+            if configs['shape_denatured_folder']:
+                cmd += ['--denatured', '--folder', os.path.join(data_folder_path, configs['shape_denatured_folder'])]
         else:
-            cmd += ' --modified --R1 {} --R2 {}'\
-                .format(os.path.join(data_folder_path, configs['shape_modified_r1']),
-                        os.path.join(data_folder_path, configs['shape_modified_r2']))
-            cmd += ' --untreated --R1 {} --R2 {}' \
-                .format(os.path.join(data_folder_path, configs['shape_untreated_r1']),
-                        os.path.join(data_folder_path, configs['shape_untreated_r2']))
-            if configs['shape_denatured_r1'] != '':
-                cmd += ' --denatured --R1 {} --R2 {}' \
-                    .format(os.path.join(data_folder_path, configs['shape_denatured_r1']),
-                            os.path.join(data_folder_path, configs['shape_denatured_r2']))
+            cmd += ['--modified',
+                    '--R1', os.path.join(data_folder_path, configs['shape_modified_r1']),
+                    '--R2', os.path.join(data_folder_path, configs['shape_modified_r2'])]
+            cmd += ['--untreated',
+                    '--R1', os.path.join(data_folder_path, configs['shape_untreated_r1']),
+                    '--R2', os.path.join(data_folder_path, configs['shape_untreated_r2'])]
+            if configs['shape_denatured_r1']:
+                cmd += ['--denatured',
+                        '--R1', os.path.join(data_folder_path, configs['shape_denatured_r1']),
+                        '--R2', os.path.join(data_folder_path, configs['shape_denatured_r2'])]
 
         # Check if there is extra flags
-        if configs['shape_extra_flags'] != '':
-            cmd += ' {} '.format(configs['shape_extra_flags'])
+        if configs['shape_extra_flags']:
+            cmd += shlex.split(configs['shape_extra_flags'])
 
-        # Run CMD
-        try:
-            print(cmd)
-            os.chdir(data_folder_path)
-            subprocess.call(cmd, shell=True)
-        except OSError as error:
-            print('ShapeMapper 2.x command running error - ', error.args)
+        return ShapeMapperJob(rna_id, barcode.barcode, cmd, data_folder_path, output_folder_path, temp_folder_path,
+                              threads or 1)
 
     # endregion
-
-
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""
+ShapeMapper Scheduler
+================
+
+Run the "ShapeMapper 2.x" jobs of a RNA Lib, in parallel.
+
+- Each job asks for a number of threads (`--nproc`). The jobs are packed so that the running ones never ask for more
+    than the total cores - a job which does not fit waits, while the smaller ones behind it may start.
+- The temp folder of a job is removed as soon as the job finishes - only the results stay on the disk.
+    No new job starts while the free space of the temp folder is below a limit.
+- The "profile" / "shape" files of each job are indexed into the "ShapeMapper index" file (see `get_shape2_path`),
+    which is used to build the RNA Lib profiling file.
+
+Usage
+-------
+
+>>> scheduler = ShapeMapperScheduler(configs, total_cores=16, threads_per_job=4)
+>>> results = scheduler.run(rna_items)
+>>> [rna_id for rna_id, result in results.items() if not result.ok]
+[]
+"""
+
+import glob
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+
+from collections import namedtuple, OrderedDict
+from typing import Dict, List, Optional
+
+from neoRNA.library.library_config import RnaLibConfig
+from neoRNA.library.library_item import LibraryItem
+from neoRNA.library.shape_mapper import get_shape2_path
+from neoRNA.library.shape_mapper.shape_runner import ShapeMapperRunner, ShapeMapperJob
+from neoRNA.util.file_utils import FileUtils
+
+
+logger = logging.getLogger('neo_rna.shape_mapper')
+
+
+class ShapeMapperResult(namedtuple('ShapeMapperResult', ['rna_id', 'barcode', 'return_code', 'output_folder',
+                                                         'profile_file', 'shape_file', 'threads', 'elapsed'])):
+    r"""
+    The result of a "ShapeMapper 2.x" job.
+    """
+
+    @property
+    def ok(self) -> bool:
+        return self.return_code == 0 and self.profile_file is not None and self.shape_file is not None
+
+
+class ShapeMapperScheduler(object):
+    r"""
+    ShapeMapper Scheduler
+
+    The defaults are from the "RNA Lib" configs:
+    - `shape_total_cores` - the total cores of the jobs. Default - all the cores.
+    - `shape_threads_per_job` - the threads of a job. Default - "1".
+    - `shape_min_free_disk_gb` - the free space (GB) of the temp folder, to start a new job. Default - no limit.
+    - `shape_executable` - the ShapeMapper executable. Default - "shapemapper", on the `PATH`.
+    """
+
+    # Wait between two checks of the running jobs (seconds)
+    POLL_INTERVAL = 0.2
+
+    # The stdout / stderr of a job, under its output folder
+    JOB_OUTPUT_FILE_NAME = 'shapemapper_stdout.txt'
+
+    # The output files of a job - "{name}_{rna_id}{suffix}"
+    PROFILE_FILE_SUFFIX = '_profile.txt'
+    SHAPE_FILE_SUFFIX = '.shape'
+
+    # ----------------------------------
+    # region Init
+
+    def __init__(self, configs: RnaLibConfig,
+                 total_cores: Optional[int] = None, threads_per_job: Optional[int] = None,
+                 min_free_disk_gb: Optional[float] = None, executable: Optional[str] = None):
+        r"""
+        Init
+
+        Parameters
+        ----------
+        configs: RnaLibConfig
+            The "RNA Lib" configs.
+        total_cores: Optional[int]
+            The total cores of the running jobs.
+        threads_per_job: Optional[int]
+            The threads of a job.
+        min_free_disk_gb: Optional[float]
+            The free space (GB) of the temp folder, to start a new job.
+        executable: Optional[str]
+            The ShapeMapper executable.
+        """
+
+        self.__configs: RnaLibConfig = configs
+
+        self.total_cores: int = \
+            max(1, int(total_cores or configs['shape_total_cores'] or os.cpu_count() or 1))
+        self.threads_per_job: int = max(1, int(threads_per_job or configs['shape_threads_per_job'] or 1))
+        self.min_free_disk_gb: Optional[float] = \
+            min_free_disk_gb if min_free_disk_gb is not None else configs['shape_min_free_disk_gb']
+        self.executable: Optional[str] = executable or configs['shape_executable']
+
+        if not configs.working_folder:
+            raise ValueError('"Working Folder" does not exist. ')
+
+    # endregion
+
+    # ----------------------------------
+    # region Run
+
+    def run(self, rna_items: List[LibraryItem],
+            threads: Optional[Dict[str, int]] = None) -> 'OrderedDict[str, ShapeMapperResult]':
+        r"""
+        Run the ShapeMapper jobs of the RNA Lib items, and save the "ShapeMapper index" file.
+
+        Parameters
+        ----------
+        rna_items: List[LibraryItem]
+            The RNA Lib items.
+        threads: Optional[Dict[str, int]]
+            The threads of the jobs, by RNA ID - for the ones which do not use `threads_per_job`.
+            A job asking for more than the total cores gets the total cores.
+
+        Returns
+        -------
+        results: OrderedDict[str, ShapeMapperResult]
+            The job results, by RNA ID - in the order of the items.
+        """
+
+        threads = threads or {}
+        queue: List[ShapeMapperJob] = []
+        for rna_item in rna_items:
+            job_threads = min(self.total_cores, max(1, threads.get(rna_item.rna_id, self.threads_per_job)))
+            queue.append(ShapeMapperRunner.shape_mapper_v2_job(self.__configs, rna_item, threads=job_threads,
+                                                               executable=self.executable))
+
+        results: Dict[str, ShapeMapperResult] = dict()
+        # The running jobs - (job, process, output file, start time)
+        running = []
+        try:
+            while queue or running:
+                # Start the jobs which fit in the free cores - in order
+                free_cores = self.total_cores - sum(job.threads for job, _, _, _ in running)
+                for job in list(queue):
+                    if job.threads > free_cores:
+                        continue
+                    if running and not self.__has_free_disk():
+                        logger.info('Low disk space - wait for the running jobs.')
+                        break
+
+                    queue.remove(job)
+                    running.append(self.__start(job))
+                    free_cores -= job.threads
+
+                time.sleep(self.POLL_INTERVAL if running else 0)
+
+                # Collect the finished jobs
+                for entry in list(running):
+                    job, process, output_file, start_time = entry
+                    if process.poll() is None:
+                        continue
+
+                    running.remove(entry)
+                    output_file.close()
+                    results[job.rna_id] = self.__finish(job, process.returncode, time.time() - start_time)
+        finally:
+            # Stop the running jobs, if interrupted
+            for job, process, output_file, _ in running:
+                process.kill()
+                process.wait()
+                output_file.close()
+                shutil.rmtree(job.temp_folder, ignore_errors=True)
+
+        ordered_results = OrderedDict((rna_item.rna_id, results[rna_item.rna_id]) for rna_item in rna_items)
+        self.save_index(self.__configs.working_folder, ordered_results)
+
+        failed = [result.rna_id for result in ordered_results.values() if not result.ok]
+        logger.info('ShapeMapper jobs: {}, failed: {}'.format(len(ordered_results), len(failed)))
+        if failed:
+            logger.error('ShapeMapper failed RNA IDs: {}'.format(', '.join(failed)))
+
+        return ordered_results
+
+    def __has_free_disk(self) -> bool:
+        if not self.min_free_disk_gb:
+            return True
+
+        free_gb = shutil.disk_usage(get_shape2_path('temp', self.__configs.working_folder)).free / 1024 ** 3
+        return free_gb >= self.min_free_disk_gb
+
+    def __start(self, job: ShapeMapperJob):
+        logger.info('ShapeMapper start: {} - {} thread(s)'.format(job.rna_id, job.threads))
+
+        os.makedirs(job.output_folder, exist_ok=True)
+        output_file = open(os.path.join(job.output_folder, self.JOB_OUTPUT_FILE_NAME), 'w')
+        try:
+            process = subprocess.Popen(job.command, cwd=job.data_folder,
+                                       stdout=output_file, stderr=subprocess.STDOUT)
+        except OSError:
+            output_file.close()
+            raise
+
+        return job, process, output_file, time.time()
+
+    @classmethod
+    def __finish(cls, job: ShapeMapperJob, return_code: int, elapsed: float) -> ShapeMapperResult:
+        # The temp files are not needed anymore
+        shutil.rmtree(job.temp_folder, ignore_errors=True)
+
+        profile_file = cls.find_output_file(job.output_folder, job.rna_id, cls.PROFILE_FILE_SUFFIX)
+        shape_file = cls.find_output_file(job.output_folder, job.rna_id, cls.SHAPE_FILE_SUFFIX)
+
+        result = ShapeMapperResult(job.rna_id, job.barcode, return_code, job.output_folder,
+                                   profile_file, shape_file, job.threads, elapsed)
+        if result.ok:
+            logger.info('ShapeMapper done: {} - {:.1f} s'.format(job.rna_id, elapsed))
+        else:
+            logger.error('ShapeMapper failed: {} - return code {}, see {}'.format(
+                job.rna_id, return_code, os.path.join(job.output_folder, cls.JOB_OUTPUT_FILE_NAME)))
+
+        return result
+
+    # endregion
+
+    # ----------------------------------
+    # region Index
+
+    @classmethod
+    def find_output_file(cls, output_folder: str, rna_id: str, suffix: str) -> Optional[str]:
+        r"""
+        Find an output file of a job - by its default name ("Pipeline_{rna_id}{suffix}"), or with another `--name`.
+        """
+
+        file_path = os.path.join(output_folder, 'Pipeline_{}{}'.format(rna_id, suffix))
+        if os.path.exists(file_path):
+            return file_path
+
+        file_paths = sorted(glob.glob(os.path.join(output_folder, '*_{}{}'.format(rna_id, suffix))))
+        return file_paths[0] if file_paths else None
+
+    @classmethod
+    def save_index(cls, working_folder: str, results: Dict[str, ShapeMapperResult]) -> str:
+        r"""
+        Save the "ShapeMapper index" file - the output files of the jobs, by RNA ID.
+        """
+
+        index_file_path = get_shape2_path('index', working_folder)
+        FileUtils.save_json_to_file(index_file_path, OrderedDict(
+            (rna_id, result._asdict()) for rna_id, result in results.items()))
+
+        return index_file_path
+
+    @classmethod
+    def load_index(cls, working_folder: str) -> Dict[str, ShapeMapperResult]:
+        r"""
+        Load the "ShapeMapper index" file. Empty if the file does not exist - such as for a run by PyPPL.
+        """
+
+        index_file_path = get_shape2_path('index', working_folder)
+        if not os.path.exists(index_file_path):
+            return OrderedDict()
+
+        with open(index_file_path) as infile:
+            index = json.load(infile, object_pairs_hook=OrderedDict)
+        return OrderedDict((rna_id, ShapeMapperResult(**values)) for rna_id, values in index.items())
+
+    # endregion
@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+
+"""
+Structure Summary Index
+================
+
+An index over an "RNA Lib Structure Summary" file, built once and persisted next to it (`<summary>.index.json`).
+
+It answers, without scanning the items:
+- the item of an `rna_id`
+- the "WT" item
+- the items with a mutation at a position / with a number of mutations / with a structure (by hash)
+
+The "editing levels" CSV can be joined on load (see `load_editing_levels`), and "overlay" files (the updated
+records only, see `FileUtils.load_json_overlay`) merged into the items.
+"""
+
+import os
+import csv
+import json
+import hashlib
+from collections import defaultdict
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from neoRNA.sequence.mutation import MutationType, parse_mutation_syntax
+from neoRNA.util.file_utils import FileUtils
+
+
+# ----------------------------------
+# region Editing Levels
+
+# Columns of the "editing levels" CSV
+EDITING_LEVEL_COLUMNS = {
+    'rna_id': 'RNA_ID_STR',
+    'editing_level': 'Avg',
+    'editing_position': 'Editing_position',
+}
+
+# Values for a missing editing level
+EMPTY_EDITING_LEVELS = ('NA', '#N/A', '')
+
+
+def load_editing_levels(file_path: str, rna_id_column: str = EDITING_LEVEL_COLUMNS['rna_id'],
+                        editing_level_column: str = EDITING_LEVEL_COLUMNS['editing_level'],
+                        editing_position_column: str = EDITING_LEVEL_COLUMNS['editing_position']) \
+        -> Tuple[Dict[str, Optional[float]], Dict[str, Optional[int]]]:
+    r"""
+    Load the "editing levels" CSV.
+
+    Parameters
+    ----------
+    file_path: str
+        The CSV file path.
+    rna_id_column: str
+    editing_level_column: str
+    editing_position_column: str
+        The column names. Default to "RNA_ID_STR", "Avg" and "Editing_position".
+
+    Returns
+    -------
+    editing_levels: Dict[str, Optional[float]]
+        Editing level by "RNA ID". `None` for "NA" / "#N/A".
+    editing_positions: Dict[str, Optional[int]]
+        Editing position by "RNA ID". `None` for "NA" / "#N/A".
+    """
+
+    #
+    editing_levels = {}
+    editing_positions = {}
+    with open(file_path, newline='') as infile:
+        for line in csv.DictReader(infile):
+            rna_id = line[rna_id_column]
+            #
+            score = line[editing_level_column]
+            editing_levels[rna_id] = float(score) if score not in EMPTY_EDITING_LEVELS else None
+            #
+            position = line[editing_position_column]
+            editing_positions[rna_id] = int(position) if position not in EMPTY_EDITING_LEVELS else None
+
+    return editing_levels, editing_positions
+
+# endregion
+
+
+# ----------------------------------
+# region Index
+
+def structure_hash(structure: str) -> str:
+    r"""
+    The hash of a structure string - the same structure always gives the same hash.
+    """
+    return hashlib.sha1(structure.encode('ascii')).hexdigest()[:16]
+
+
+class StructureSummaryIndex(object):
+    r"""
+    Structure Summary Index
+
+    One record per summary item, with:
+    - rna_id
+    - mutation_syntax, mutation_type (`MutationType`, `None` without syntax)
+    - mutation_positions - the positions of the mismatches, or the span of an "indel" (if known)
+    - mutation_count - number of mismatches, "1" for an "indel", "0" for the "WT"
+    - structure_hashes - hash of each `<data_type>_structure` of the item, by data type
+    - editing_level, editing_site - from the item, or from the joined "editing levels"
+
+    The items themselves are only loaded by `get` - by line offset for ".jsonl" summaries, or all at once (then
+    cached) for ".json" summaries. The records of the "overlay" files, if any, are merged into the items - both the
+    index records and the items returned by `get`.
+    """
+
+    # The index file - next to the summary
+    INDEX_FILE_SUFFIX = '.index.json'
+    INDEX_VERSION = 1
+
+    # Structure keys - `<data_type>_structure`
+    STRUCTURE_KEY_SUFFIX = '_structure'
+
+    # ----------------------------------
+    # region Init
+
+    def __init__(self, records: List[Dict[str, Any]], summary_file_path: Optional[str] = None,
+                 offsets: Optional[List[int]] = None, overlay_file_paths: Optional[List[str]] = None):
+        r"""
+        Init
+
+        Parameters
+        ----------
+        records: List[Dict[str, Any]]
+            The index records, in the summary order.
+        summary_file_path: Optional[str]
+            The summary file, to load the items from.
+        offsets: Optional[List[int]]
+            The byte offset of each item, for ".jsonl" summaries.
+        overlay_file_paths: Optional[List[str]]
+            The overlay files merged into the items, in the order to apply.
+        """
+
+        self.__records = records
+        self.__summary_file_path = summary_file_path
+        self.__offsets = offsets
+        self.__items = None
+        self.__overlay_file_paths = list(overlay_file_paths or [])
+        self.__overlay_records = FileUtils.load_json_overlay(self.__overlay_file_paths)
+
+        # Lookup tables
+        self.__by_rna_id = dict()
+        self.__by_position = defaultdict(list)
+        self.__by_count = defaultdict(list)
+        self.__by_structure = defaultdict(list)
+        self.__wt_indices = list()
+        for index, record in enumerate(records):
+            self.__by_rna_id[record['rna_id']] = index
+            for position in record['mutation_positions']:
+                self.__by_position[position].append(index)
+            self.__by_count[record['mutation_count']].append(index)
+            for data_type, hash_str in record['structure_hashes'].items():
+                self.__by_structure[(data_type, hash_str)].append(index)
+            if record['mutation_type'] == MutationType.WildType:
+                self.__wt_indices.append(index)
+
+    # endregion
+
+    # ----------------------------------
+    # region Build / Persist
+
+    @classmethod
+    def index_file_path(cls, summary_file_path: str) -> str:
+        return summary_file_path + cls.INDEX_FILE_SUFFIX
+
+    @classmethod
+    def build_record(cls, rna_item: Dict[str, Any]) -> Dict[str, Any]:
+        r"""
+        The index record of one summary item.
+        """
+
+        mutation_syntax = rna_item.get('mutation_syntax')
+        # Malformed "mutation syntax" - no mutation type / count
+        mutations = parse_mutation_syntax(mutation_syntax, strict=False)
+
+        mutation_type = mutations[0].mut_type if mutations else None
+        mutation_positions = list()
+        for mutation in mutations or []:
+            if mutation.mut_type == MutationType.Mismatch:
+                mutation_positions.append(mutation.position)
+            elif mutation.mut_type == MutationType.Indel and mutation.position is not None:
+                mutation_positions.extend(range(mutation.position, max(mutation.position, mutation.end_position) + 1))
+        mutation_count = None
+        if mutation_type == MutationType.WildType:
+            mutation_count = 0
+        elif mutation_type == MutationType.Indel:
+            mutation_count = 1
+        elif mutation_type == MutationType.Mismatch:
+            mutation_count = len(mutations)
+
+        return {
+            'rna_id': rna_item['rna_id'],
+            'mutation_syntax': mutation_syntax,
+            'mutation_type': mutation_type,
+            'mutation_positions': mutation_positions,
+            'mutation_count': mutation_count,
+            'structure_hashes': {key[:-len(cls.STRUCTURE_KEY_SUFFIX)]: structure_hash(value)
+                                 for key, value in rna_item.items()
+                                 if key.endswith(cls.STRUCTURE_KEY_SUFFIX) and isinstance(value, str)},
+            'editing_level': rna_item.get('A-to-I_editing_level'),
+            'editing_site': rna_item.get('A-to-I_editing_site'),
+        }
+
+    @classmethod
+    def build(cls, summary_file_path: str, overlay_file_paths: Optional[List[str]] = None) \
+            -> 'StructureSummaryIndex':
+        r"""
+        Build the index of a summary file (with the overlays merged), in one pass.
+        """
+
+        #
+        if summary_file_path.endswith('.jsonl'):
+            overlay_records = FileUtils.load_json_overlay(overlay_file_paths)
+            unmatched_keys = set(overlay_records)
+
+            records, offsets = list(), list()
+            with open(summary_file_path, 'rb') as infile:
+                offset = infile.tell()
+                for line in iter(infile.readline, b''):
+                    if line.strip():
+                        rna_item = json.loads(line)
+                        if rna_item.get('rna_id') in overlay_records:
+                            rna_item.update(overlay_records[rna_item['rna_id']])
+                            unmatched_keys.discard(rna_item['rna_id'])
+                        records.append(cls.build_record(rna_item))
+                        offsets.append(offset)
+                    offset = infile.tell()
+
+            if unmatched_keys:
+                raise ValueError('The overlay records do not match any item.', sorted(unmatched_keys))
+            return cls(records, summary_file_path, offsets, overlay_file_paths)
+
+        records = [cls.build_record(rna_item)
+                   for rna_item in FileUtils.load_json_items_with_overlay(summary_file_path, overlay_file_paths)]
+        return cls(records, summary_file_path, overlay_file_paths=overlay_file_paths)
+
+    @classmethod
+    def load(cls, summary_file_path: str, editing_level_file_path: Optional[str] = None,
+             rebuild: bool = False, overlay_file_paths: Optional[List[str]] = None,
+             **editing_level_columns) -> 'StructureSummaryIndex':
+        r"""
+        Load the index of a summary file - from the index file if it is up to date, or built (and saved).
+
+        Parameters
+        ----------
+        summary_file_path: str
+            The summary file.
+        editing_level_file_path: Optional[str]
+            The "editing levels" CSV to join. Optional.
+        rebuild: bool
+            Always build the index.
+        overlay_file_paths: Optional[List[str]]
+            The overlay files to merge, in the order to apply. Optional.
+        editing_level_columns:
+            The column names of the "editing levels" CSV, see `load_editing_levels`.
+
+        Returns
+        -------
+        index: StructureSummaryIndex
+        """
+
+        #
+        index_file_path = cls.index_file_path(summary_file_path)
+        fingerprint = cls.__fingerprint(summary_file_path, overlay_file_paths)
+
+        index = None
+        if not rebuild and os.path.exists(index_file_path):
+            with open(index_file_path) as infile:
+                index_json = json.load(infile)
+            if index_json.get('version') == cls.INDEX_VERSION and index_json.get('summary') == fingerprint:
+                index = cls(index_json['records'], summary_file_path, index_json.get('offsets'), overlay_file_paths)
+
+        if index is None:
+            index = cls.build(summary_file_path, overlay_file_paths)
+            index.save(index_file_path)
+
+        if editing_level_file_path:
+            index.join_editing_levels(*load_editing_levels(editing_level_file_path, **editing_level_columns))
+
+        return index
+
+    def save(self, index_file_path: Optional[str] = None) -> None:
+        r"""
+        Save the index, by default next to the summary file.
+        """
+
+        index_file_path = index_file_path or self.index_file_path(self.__summary_file_path)
+        with open(index_file_path, 'w') as outfile:
+            json.dump({
+                'version': self.INDEX_VERSION,
+                'summary': self.__fingerprint(self.__summary_file_path, self.__overlay_file_paths),
+                'records': self.__records,
+                'offsets': self.__offsets,
+            }, outfile)
+
+    def join_editing_levels(self, editing_levels: Dict[str, Optional[float]],
+                            editing_positions: Optional[Dict[str, Optional[int]]] = None) -> None:
+        r"""
+        Join the editing levels / positions (by "RNA ID"). Items without a value keep their own.
+        """
+        for record in self.__records:
+            rna_id = record['rna_id']
+            if rna_id in editing_levels:
+                record['editing_level'] = editing_levels[rna_id]
+            if editing_positions and rna_id in editing_positions:
+                record['editing_site'] = editing_positions[rna_id]
+
+    # endregion
+
+    # ----------------------------------
+    # region Properties
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+    def __contains__(self, rna_id: str) -> bool:
+        return rna_id in self.__by_rna_id
+
+    @property
+    def rna_ids(self) -> List[str]:
+        return [record['rna_id'] for record in self.__records]
+
+    @property
+    def wt_rna_id(self) -> Optional[str]:
+        r"""
+        The "RNA ID" of the "WT" item. The last one, if there are several.
+        """
+        return self.__records[self.__wt_indices[-1]]['rna_id'] if self.__wt_indices else None
+
+    # endregion
+
+    # ----------------------------------
+    # region Methods - Lookup
+
+    def record(self, rna_id: str) -> Dict[str, Any]:
+        r"""
+        The index record of an item.
+        """
+        return self.__records[self.__by_rna_id[rna_id]]
+
+    def get(self, rna_id: str) -> Dict[str, Any]:
+        r"""
+        The summary item, with the overlay record merged, and the joined editing level / site.
+        """
+
+        index = self.__by_rna_id[rna_id]
+        if self.__offsets is not None:
+            with open(self.__summary_file_path, 'rb') as infile:
+                infile.seek(self.__offsets[index])
+                rna_item = json.loads(infile.readline())
+        else:
+            if self.__items is None:
+                self.__items = list(FileUtils.load_json_items(self.__summary_file_path))
+            rna_item = dict(self.__items[index])
+        rna_item.update(self.__overlay_records.get(rna_id, {}))
+
+        record = self.__records[index]
+        rna_item['A-to-I_editing_level'] = record['editing_level']
+        rna_item['A-to-I_editing_site'] = record['editing_site']
+        return rna_item
+
+    def wt(self) -> Optional[Dict[str, Any]]:
+        r"""
+        The "WT" summary item.
+        """
+        return self.get(self.wt_rna_id) if self.wt_rna_id is not None else None
+
+    def items(self, rna_ids: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+        r"""
+        The summary items - all of them by default, in the summary order.
+        """
+        for rna_id in (self.rna_ids if rna_ids is None else rna_ids):
+            yield self.get(rna_id)
+
+    def by_mutation_position(self, position: int) -> List[str]:
+        return [self.__records[index]['rna_id'] for index in self.__by_position.get(position, [])]
+
+    def by_mutation_count(self, count: Optional[int]) -> List[str]:
+        return [self.__records[index]['rna_id'] for index in self.__by_count.get(count, [])]
+
+    def by_structure(self, structure: str, data_type: str = 'computational', hashed: bool = False) -> List[str]:
+        r"""
+        The items with a structure (of `data_type`). `structure` is the hash with `hashed`.
+        """
+        key = (data_type, structure if hashed else structure_hash(structure))
+        return [self.__records[index]['rna_id'] for index in self.__by_structure.get(key, [])]
+
+    def query(self, mutation_count: Optional[int] = None, positions: Optional[Iterable[int]] = None,
+              structure: Optional[str] = None, data_type: str = 'computational',
+              predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[str]:
+        r"""
+        The items matching all given conditions, in the summary order.
+
+        Parameters
+        ----------
+        mutation_count: Optional[int]
+            The number of mutations.
+        positions: Optional[Iterable[int]]
+            At least one mutation at one of these positions.
+        structure: Optional[str]
+            The structure (of `data_type`).
+        data_type: str
+        predicate: Optional[Callable[[Dict[str, Any]], bool]]
+            A condition on the index record.
+
+        Returns
+        -------
+        rna_ids: List[str]
+
+        Examples
+        --------
+        Single mutants in a stem - `index.query(mutation_count=1, positions=stem_positions)`.
+        """
+
+        candidates = None
+
+        def narrow(indices: Iterable[int]):
+            nonlocal candidates
+            candidates = set(indices) if candidates is None else candidates & set(indices)
+
+        if mutation_count is not None:
+            narrow(self.__by_count.get(mutation_count, []))
+        if positions is not None:
+            narrow(index for position in positions for index in self.__by_position.get(position, []))
+        if structure is not None:
+            narrow(self.__by_structure.get((data_type, structure_hash(structure)), []))
+        if candidates is None:
+            candidates = range(len(self.__records))
+
+        return [self.__records[index]['rna_id'] for index in sorted(candidates)
+                if predicate is None or predicate(self.__records[index])]
+
+    # endregion
+
+    # ----------------------------------
+    # region Internal Methods
+
+    @classmethod
+    def __fingerprint(cls, summary_file_path: str, overlay_file_paths: Optional[List[str]] = None) -> Dict[str, Any]:
+        stat = os.stat(summary_file_path)
+        fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        # An index with overlays is only valid for the same overlay files, unchanged
+        if overlay_file_paths:
+            fingerprint['overlays'] = [dict(path=os.path.abspath(overlay_file_path),
+                                            **cls.__fingerprint(overlay_file_path))
+                                       for overlay_file_path in overlay_file_paths]
+        return fingerprint
+
+    # endregion
+
+# endregion
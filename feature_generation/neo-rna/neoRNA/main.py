@@ -5,14 +5,38 @@
 from __future__ import print_function
 
 import argparse
+import logging
 import sys
 
 from neoRNA import metadata
+from neoRNA.cli.commands import COMMANDS
+from neoRNA.cli.context import LibraryContext
+
+# The token separating the steps of a run, such as `neoRNA fold lib.json + features lib.json`
+STEP_SEPARATOR = '+'
+
+
+def split_steps(arguments):
+    """Split the command-line arguments into the steps of a run.
+
+    :param arguments: command-line arguments, without the program name
+    :type arguments: :class:`list`
+    """
+    steps = [[]]
+    for argument in arguments:
+        if argument == STEP_SEPARATOR:
+            steps.append([])
+        else:
+            steps[-1].append(argument)
+    return steps
 
 
 def main(argv):
     """Program entry point.
 
+    The steps of a run share one `LibraryContext` - the data loaded, the annotations and the worker pool of a step
+    are reused by the next ones.
+
     :param argv: command-line arguments
     :type argv: :class:`list`
     """
@@ -42,9 +66,43 @@ URL: <{url}>
         action='version',
         version='{0} {1}'.format(metadata.project, metadata.version))
 
-    arg_parser.parse_args(args=argv[1:])
-
-    print(epilog)
+    # Global options - given once, before the first step. Suppressed defaults tell if a step sets them.
+    arg_parser.add_argument(
+        '--workers',
+        action='store', type=int, default=argparse.SUPPRESS,
+        help='The number of workers, shared by all the steps. Default: 1.')
+    arg_parser.add_argument(
+        '--work_folder',
+        action='store', default=argparse.SUPPRESS,
+        help='The folder of the temp files. Default: a temp folder, removed at the end.')
+
+    # Subcommands
+    subparsers = arg_parser.add_subparsers(
+        dest='command', metavar='command',
+        title='commands (chain several with "{}")'.format(STEP_SEPARATOR))
+    for command in COMMANDS.values():
+        command.add_arguments(subparsers.add_parser(command.name, help=command.help, description=command.help))
+
+    steps = [arg_parser.parse_args(args=step) for step in split_steps(argv[1:])]
+    if len(steps) == 1 and not steps[0].command:
+        print(epilog)
+        return 0
+    for step in steps:
+        if not step.command:
+            arg_parser.error('a command is required for each step')
+    for step in steps[1:]:
+        if hasattr(step, 'workers') or hasattr(step, 'work_folder'):
+            arg_parser.error('--workers / --work_folder go before the first step, they are shared by all the steps')
+
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s - %(message)s')
+
+    with LibraryContext(workers=getattr(steps[0], 'workers', 1),
+                        work_folder=getattr(steps[0], 'work_folder', None)) as context:
+        for step in steps:
+            status = COMMANDS[step.command].run(step, context)
+            if status:
+                return status
 
     return 0
 
@@ -8,4 +8,6 @@
 from .sequence import Sequence
 from .barcode import Barcode
 from .base_pair import BasePair
+from .mutation import Mutation, MutationType, MutationTable, parse_mutation_syntax, format_mutation_syntax, \
+    call_mutations
 
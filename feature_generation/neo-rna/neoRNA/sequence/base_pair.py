@@ -17,6 +17,8 @@ class BasePair(object):
 
     """
 
+    __slots__ = ('__nt_pair', '__position_pair')
+
     # ----------------------------------
     # region Init
 
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mutation
+================
+
+"Mutation syntax" parsing / formatting, and library-wide mutation calling against a "WT" sequence.
+
+Syntax:
+- `46AtoG` - a mismatch at nt position `46`, from "A" to "G". Several are joined by ",": `46AtoG,51CtoU`.
+- `indel` - an insertion / deletion. Optionally with its span on the "WT" sequence: `indel45` or `indel45-47`.
+- `wt` - the wild type.
+"""
+
+import re
+from collections import namedtuple
+
+from typing import List, Optional, Iterable
+
+import numpy as np
+
+
+class MutationType(object):
+    """
+    Mutation Types
+
+    - Mismatch - mismatch
+    - Insertion / Deletion - indel
+    - Wild Type - wt
+    """
+    Mismatch = 'mismatch'
+    Indel = 'indel'
+    WildType = 'wt'
+
+
+# One mutation. Positions start with "1", `end_position` closes the span of an "indel" (same as `position`
+# for a mismatch)
+Mutation = namedtuple('Mutation', ['mut_type', 'position', 'ref_nt', 'alt_nt', 'end_position'], defaults=(None,))
+
+
+# ----------------------------------
+# region Syntax
+
+MISMATCH_SYNTAX_REGEX = re.compile(r'^(?P<position>[1-9][0-9]*)(?P<ref_nt>[ACGTUN])to(?P<alt_nt>[ACGTUN])$',
+                                   re.IGNORECASE)
+INDEL_SYNTAX_REGEX = re.compile(r'^indel(?:(?P<position>[1-9][0-9]*)(?:-(?P<end_position>[1-9][0-9]*))?)?$',
+                                re.IGNORECASE)
+WT_SYNTAX_REGEX = re.compile(r'^wt$', re.IGNORECASE)
+
+
+def parse_mutation_syntax(mutation_syntax: Optional[str], strict: bool = True) -> Optional[List[Mutation]]:
+    r"""
+    Parse a "mutation syntax" string.
+
+    Parameters
+    ----------
+    mutation_syntax: Optional[str]
+        Such as `44GtoA,51CtoU`, `indel`, `indel45-47` or `WT`. Case insensitive.
+    strict: bool
+        If `False`, the "lenient" mode of the older scripts - a syntax which starts with "wt" (`wt_2`) is the
+        "wt", one which starts with "indel" is an "indel" (without its span), and any other malformed syntax
+        gives `None` instead of raising.
+
+    Returns
+    -------
+    mutations: Optional[List[Mutation]]
+        One `Mutation` per mismatch, or a single "indel" / "wt" one. Empty if no syntax is given.
+        `None` for a malformed syntax, if not `strict`.
+
+    Raises
+    ------
+    ValueError
+        If the syntax is malformed, and `strict`.
+    """
+
+    if mutation_syntax is None:
+        return []
+
+    syntax = mutation_syntax.strip()
+    if WT_SYNTAX_REGEX.match(syntax):
+        return [Mutation(MutationType.WildType, None, None, None)]
+
+    matched = INDEL_SYNTAX_REGEX.match(syntax)
+    if matched:
+        position = int(matched.group('position')) if matched.group('position') else None
+        end_position = int(matched.group('end_position')) if matched.group('end_position') else position
+        return [Mutation(MutationType.Indel, position, None, None, end_position)]
+
+    mutations = []
+    for mutation_str in syntax.split(','):
+        matched = MISMATCH_SYNTAX_REGEX.match(mutation_str.strip())
+        if not matched:
+            if strict:
+                raise ValueError('Invalid mutation syntax', mutation_syntax)
+            if syntax.lower().startswith(MutationType.WildType):
+                return [Mutation(MutationType.WildType, None, None, None)]
+            if syntax.lower().startswith(MutationType.Indel):
+                return [Mutation(MutationType.Indel, None, None, None)]
+            return None
+        position = int(matched.group('position'))
+        mutations.append(Mutation(MutationType.Mismatch, position,
+                                  matched.group('ref_nt').upper(), matched.group('alt_nt').upper(), position))
+
+    return mutations
+
+
+def format_mutation_syntax(mutations: Iterable[Mutation]) -> Optional[str]:
+    r"""
+    Format mutations as a "mutation syntax" string - the reverse of `parse_mutation_syntax`.
+
+    Parameters
+    ----------
+    mutations: Iterable[Mutation]
+
+    Returns
+    -------
+    mutation_syntax: Optional[str]
+        `None` if there is no mutation.
+    """
+
+    mutations = list(mutations)
+    if not mutations:
+        return None
+
+    if len(mutations) == 1 and mutations[0].mut_type == MutationType.WildType:
+        return MutationType.WildType
+    if len(mutations) == 1 and mutations[0].mut_type == MutationType.Indel:
+        mutation = mutations[0]
+        if mutation.position is None:
+            return MutationType.Indel
+        if mutation.end_position is None or mutation.end_position == mutation.position:
+            return '{}{}'.format(MutationType.Indel, mutation.position)
+        return '{}{}-{}'.format(MutationType.Indel, mutation.position, mutation.end_position)
+
+    syntax_list = []
+    for mutation in mutations:
+        if mutation.mut_type != MutationType.Mismatch:
+            raise ValueError('Only mismatches can be combined', mutation)
+        syntax_list.append('{}{}to{}'.format(mutation.position, mutation.ref_nt, mutation.alt_nt))
+    return ','.join(syntax_list)
+
+# endregion
+
+
+# ----------------------------------
+# region Library
+
+class MutationTable(object):
+    r"""
+    The mutations of a library of sequences against one "WT" sequence, as columns.
+
+    Each record (row of the columns) is one mutation of one sequence:
+    - `sequence_index` - index of the sequence in the library
+    - `mut_type` - `MutationType`
+    - `position` / `end_position` - position (span, for an "indel") on the "WT" sequence, start with "1"
+    - `ref_nt` / `alt_nt` - the "WT" / mutated nt of a mismatch, '' for an "indel"
+
+    Records are sorted by (sequence_index, position).
+    A sequence identical to the "WT" has no record.
+    """
+
+    def __init__(self, sequence_count: int, sequence_index: np.ndarray, mut_type: np.ndarray,
+                 position: np.ndarray, end_position: np.ndarray, ref_nt: np.ndarray, alt_nt: np.ndarray):
+        #
+        self.sequence_count = sequence_count
+        self.sequence_index = sequence_index
+        self.mut_type = mut_type
+        self.position = position
+        self.end_position = end_position
+        self.ref_nt = ref_nt
+        self.alt_nt = alt_nt
+
+        # CSR-style offsets - records of sequence `i` are `[record_ptr[i], record_ptr[i + 1])`
+        self.record_ptr = np.searchsorted(sequence_index, np.arange(sequence_count + 1))
+
+    # ----------------------------------
+    # region Properties
+
+    def __len__(self) -> int:
+        return len(self.position)
+
+    @property
+    def mutation_counts(self) -> np.ndarray:
+        r"""
+        Number of mutations of each sequence.
+        """
+        return np.diff(self.record_ptr)
+
+    # endregion
+
+    # ----------------------------------
+    # region Methods
+
+    def mutations(self, index: int) -> List[Mutation]:
+        r"""
+        The mutations of one sequence.
+        """
+        records = range(self.record_ptr[index], self.record_ptr[index + 1])
+        return [Mutation(str(self.mut_type[record]),
+                         int(self.position[record]),
+                         str(self.ref_nt[record]) if self.mut_type[record] == MutationType.Mismatch else None,
+                         str(self.alt_nt[record]) if self.mut_type[record] == MutationType.Mismatch else None,
+                         int(self.end_position[record]))
+                for record in records]
+
+    def positions(self, index: int) -> List[int]:
+        r"""
+        The mutation positions of one sequence.
+        """
+        return self.position[self.record_ptr[index]:self.record_ptr[index + 1]].tolist()
+
+    def syntax(self, index: int) -> List[str]:
+        r"""
+        The "mutation syntax" of each mutation of one sequence, such as `['12AtoG', '30CtoU']`.
+        """
+        return [format_mutation_syntax([mutation]) for mutation in self.mutations(index)]
+
+    def syntax_strings(self, wt_label: Optional[str] = None) -> List[Optional[str]]:
+        r"""
+        The "mutation syntax" string of every sequence.
+
+        Parameters
+        ----------
+        wt_label: Optional[str]
+            The string for the sequences identical to the "WT" - `None` by default, or e.g. "wt".
+        """
+        return [format_mutation_syntax(self.mutations(index)) or wt_label for index in range(self.sequence_count)]
+
+    # endregion
+
+
+# "T" <-> "U" translation tables, on the byte values
+RNA_TRANSLATION = bytes.maketrans(b'Tt', b'Uu')
+DNA_TRANSLATION = bytes.maketrans(b'Uu', b'Tt')
+
+
+def call_mutations(wt_sequence: str, sequences: List[str],
+                   seq_type_rna: Optional[bool] = None, position_offset: int = 0) -> MutationTable:
+    r"""
+    Call the mutations of all library sequences against the "WT" sequence.
+
+    Sequences of the "WT" length are compared with it at once, as an N x L byte array.
+    A sequence of another length gets one "indel" record, spanning the part of the "WT" sequence between
+    its common prefix and suffix.
+
+    Parameters
+    ----------
+    wt_sequence: str
+        The "WT" sequence.
+    sequences: List[str]
+        The library sequences.
+    seq_type_rna: Optional[bool]
+        `True` to compare as RNA ("T" -> "U"), `False` as DNA ("U" -> "T"). `None` compares the strings as is.
+    position_offset: int
+        Added to every position. Default to "0" - positions start with "1".
+
+    Returns
+    -------
+    mutation_table: MutationTable
+    """
+
+    translation = None if seq_type_rna is None else (RNA_TRANSLATION if seq_type_rna else DNA_TRANSLATION)
+
+    def to_bytes(sequence_str: str) -> bytes:
+        sequence_bytes = sequence_str.encode('ascii')
+        return sequence_bytes.translate(translation) if translation else sequence_bytes
+
+    wt_bytes = to_bytes(wt_sequence)
+    wt_array = np.frombuffer(wt_bytes, dtype=np.uint8)
+    wt_length = len(wt_bytes)
+
+    same_length = np.array([len(sequence_str) == wt_length for sequence_str in sequences], dtype=bool)
+    same_length_indices = np.flatnonzero(same_length)
+
+    # Mismatches - all "same length" sequences in one comparison
+    mismatch_index = np.zeros(0, dtype=np.int64)
+    mismatch_position = np.zeros(0, dtype=np.int64)
+    mismatch_alt = np.zeros(0, dtype=np.uint8)
+    if len(same_length_indices) and wt_length:
+        sequence_array = np.frombuffer(b''.join(to_bytes(sequences[index]) for index in same_length_indices),
+                                       dtype=np.uint8).reshape(len(same_length_indices), wt_length)
+        rows, columns = np.nonzero(sequence_array != wt_array)
+        mismatch_index = same_length_indices[rows]
+        mismatch_position = columns
+        mismatch_alt = sequence_array[rows, columns]
+
+    # Indels - one record per sequence, between the common prefix and suffix
+    indel_index = np.flatnonzero(~same_length)
+    indel_position = np.zeros(len(indel_index), dtype=np.int64)
+    indel_end_position = np.zeros(len(indel_index), dtype=np.int64)
+    for record, index in enumerate(indel_index):
+        sequence_array = np.frombuffer(to_bytes(sequences[index]), dtype=np.uint8)
+        common_length = min(len(sequence_array), wt_length)
+        differ = np.flatnonzero(sequence_array[:common_length] != wt_array[:common_length])
+        prefix = differ[0] if len(differ) else common_length
+        differ = np.flatnonzero(sequence_array[::-1][:common_length - prefix]
+                                != wt_array[::-1][:common_length - prefix])
+        suffix = differ[0] if len(differ) else common_length - prefix
+        # "0-based" start, and the "1-based" end of the span - an insertion has `end < start`
+        indel_position[record] = prefix
+        indel_end_position[record] = wt_length - suffix
+
+    # Merge, sorted by (sequence, position)
+    sequence_index = np.concatenate([mismatch_index, indel_index]).astype(np.int64)
+    position = np.concatenate([mismatch_position, indel_position]).astype(np.int64)
+    order = np.lexsort((position, sequence_index))
+
+    mut_type = np.array([MutationType.Mismatch] * len(mismatch_index) + [MutationType.Indel] * len(indel_index),
+                        dtype=object)
+    end_position = np.concatenate([mismatch_position + 1, indel_end_position]).astype(np.int64)
+    ref_nt = np.concatenate([wt_array[mismatch_position], np.zeros(len(indel_index), dtype=np.uint8)])
+    alt_nt = np.concatenate([mismatch_alt, np.zeros(len(indel_index), dtype=np.uint8)])
+
+    def to_nt(nt_array: np.ndarray) -> np.ndarray:
+        return np.asarray(nt_array, dtype=np.uint8).view('S1').astype(str)
+
+    return MutationTable(len(sequences),
+                         sequence_index[order],
+                         mut_type[order],
+                         position[order] + 1 + position_offset,
+                         end_position[order] + position_offset,
+                         to_nt(ref_nt[order]),
+                         to_nt(alt_nt[order]))
+
+# endregion
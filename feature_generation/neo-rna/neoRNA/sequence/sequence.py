@@ -5,19 +5,30 @@ DNA/RNA sequence
 --------------------
 """
 
-from typing import Tuple, Optional, List
-from Bio.Seq import Seq
+from typing import TYPE_CHECKING, Tuple, Optional, List
+
+from neoRNA.sequence.mutation import call_mutations
+
+if TYPE_CHECKING:
+    from Bio.Seq import Seq
 
 
 class Sequence(object):
     r"""
     An Object definition of DNA/RNA sequence.
 
-    The sequence object is a wrapper based on "Seq" object, with some additional attributes and properties, such as:
+    The sequence is kept as a plain string, with some additional attributes and properties, such as:
     - Position Range - It is useful when the sequence position is "NOT" from "1".
 
+    NOTE:
+    - The Biopython "Seq" object is only created when it is requested (`sequence`, reverse complement, etc.).
+      Parsers create a lot of small sequences, so they are kept as light as possible.
+
     """
 
+    __slots__ = ('__sequence_str', '__seq', '__position_range', '__is_rna_sequence',
+                 '__length', '__start_position', '__end_position')
+
     # ----------------------------------
     # region Init
 
@@ -34,7 +45,8 @@ class Sequence(object):
         """
 
         #
-        self.__sequence: Seq = Seq(sequence_str) if sequence_str else None
+        self.__sequence_str: Optional[str] = str(sequence_str) if sequence_str else None
+        self.__seq: Optional['Seq'] = None
         self.__position_range: range = position_range
 
         # Check sequence type
@@ -53,12 +65,16 @@ class Sequence(object):
     # region Properties
 
     @property
-    def sequence(self) -> Optional[Seq]:
-        return self.__sequence
+    def sequence(self) -> Optional['Seq']:
+        if self.__seq is None and self.__sequence_str:
+            # NOTE: Imported here - Biopython is slow to import and most callers only need the string
+            from Bio.Seq import Seq
+            self.__seq = Seq(self.__sequence_str)
+        return self.__seq
 
     @property
     def sequence_str(self) -> str:
-        return str(self.__sequence) if self.__sequence else None
+        return self.__sequence_str
 
     @property
     def position_range(self) -> range:
@@ -91,21 +107,21 @@ class Sequence(object):
         """
 
         #
-        return self.__sequence is None
+        return self.__sequence_str is None
 
-    def get_reverse_complement(self) -> Optional[Seq]:
+    def get_reverse_complement(self) -> Optional['Seq']:
         r"""
         Get the "reverse complement" sequence.
 
         Returns
         -------
-        reverse_complement: Optional[Seq]
+        reverse_complement: Optional['Seq']
             The "reverse complement" sequence.
         """
 
-        return self.__sequence.reverse_complement() if self.__sequence else None
+        return self.sequence.reverse_complement() if self.__sequence_str else None
 
-    def get_rna_sequence(self) -> Optional[Seq]:
+    def get_rna_sequence(self) -> Optional['Seq']:
         r"""
         Get the "RNA type" of sequence.
 
@@ -114,18 +130,18 @@ class Sequence(object):
 
         Returns
         -------
-        rna_sequence: Optional[Seq]
+        rna_sequence: Optional['Seq']
             The sequence object, in "RNA" type.
         """
 
         #
         if self.__is_rna_sequence:
-            return self.__sequence
+            return self.sequence
         else:
             # A DNA sequence
-            return self.__sequence.transcribe() if self.__sequence else None
+            return self.sequence.transcribe() if self.__sequence_str else None
 
-    def get_dna_sequence(self) -> Optional[Seq]:
+    def get_dna_sequence(self) -> Optional['Seq']:
         r"""
         Get the "DNS type" of sequence.
 
@@ -134,15 +150,15 @@ class Sequence(object):
 
         Returns
         -------
-        rna_sequence: Optional[Seq]
+        rna_sequence: Optional['Seq']
             The sequence object, in "DNA" type.
         """
 
         if self.__is_rna_sequence:
-            return self.__sequence.back_transcribe() if self.__sequence else None
+            return self.sequence.back_transcribe() if self.__sequence_str else None
         else:
             # A DNA sequence
-            return self.__sequence
+            return self.sequence
 
     # endregion
 
@@ -167,7 +183,7 @@ class Sequence(object):
         #
         if self.contain(nt_position):
             #
-            return self.sequence_str[nt_position - self.start_position]
+            return self.__sequence_str[nt_position - self.__start_position]
 
         return None
 
@@ -190,7 +206,7 @@ class Sequence(object):
         #
         if self.contain(nt_position):
             #
-            return self.sequence_str[nt_position - 1] == 'A' or self.sequence_str[nt_position - 1] == 'C'
+            return self.__sequence_str[nt_position - 1] in ('A', 'C')
 
         return False
 
@@ -400,14 +416,14 @@ class Sequence(object):
 
         """
         #
-        if not self.__sequence:
+        if not self.__sequence_str:
             return None, None
 
-        # Get sequence
+        # Get sequence - plain string conversion, same as "transcribe" / "back_transcribe"
         if seq_type_rna:
-            sequence_string = str(self.get_rna_sequence())
+            sequence_string = self.__sequence_str.replace('T', 'U').replace('t', 'u')
         else:
-            sequence_string = str(self.get_dna_sequence())
+            sequence_string = self.__sequence_str.replace('U', 'T').replace('u', 't')
 
         # Ignore the generation, if the `length` is not the same
         if len(sequence_string) != len(base_sequence_string):
@@ -419,19 +435,12 @@ class Sequence(object):
         sequence_string = sequence_string[sequence_slice]
         base_sequence_string_trimmed = base_sequence_string[sequence_slice]
 
-        mut_positions = []
-        mut_syntax = []
-
-        # Loop into the "base sequence" and keep record of each "difference"
-        for idx, nt in enumerate(base_sequence_string_trimmed):
-            if nt != sequence_string[idx]:
-                mut_syntax_str = '{}{}to{}'.format(idx + 1 + sequence_position_counter_offset,
-                                                   nt, sequence_string[idx])
-                mut_positions.append(idx + 1 + sequence_position_counter_offset)
-                mut_syntax.append(mut_syntax_str)
+        # Keep record of each "difference" against the "base sequence"
+        mutation_table = call_mutations(base_sequence_string_trimmed, [sequence_string],
+                                        position_offset=sequence_position_counter_offset)
 
         # Return all syntax as one string
-        return mut_positions, mut_syntax
+        return mutation_table.positions(0), mutation_table.syntax(0)
 
     # endregion
 
@@ -452,7 +461,7 @@ class Sequence(object):
 
         """
 
-        self.__length = len(self.__sequence) if self.__sequence else None
+        self.__length = len(self.__sequence_str) if self.__sequence_str else None
 
         if self.__position_range is None:
             # Use default way to determine the range, start from 1
@@ -466,7 +475,7 @@ class Sequence(object):
 
     def __check_sequence_type(self) -> None:
         r"""
-        Check the "sequence Type" of the property `__sequence` - DNA or RNA.
+        Check the "sequence Type" of the property `__sequence_str` - DNA or RNA.
 
         When checking, it only needs to check if the sequence contains `U` or `T`
 
@@ -477,15 +486,12 @@ class Sequence(object):
         -------
         """
         #
-        if not self.__sequence:
+        if not self.__sequence_str:
             self.__is_rna_sequence = False
             return
 
         #
-        if self.__sequence.upper().find('U') >= 0:
-            self.__is_rna_sequence = True
-        else:
-            self.__is_rna_sequence = False
+        self.__is_rna_sequence = 'U' in self.__sequence_str or 'u' in self.__sequence_str
 
     # endregion
 
@@ -498,10 +504,10 @@ class Sequence(object):
 
         :return:
         """
-        if not self.__sequence:
+        if not self.__sequence_str:
             return ''
 
         # Example: (48,50) CAA
-        return '{} ({}, {})'.format(str(self.__sequence), self.__start_position, self.__end_position)
+        return '{} ({}, {})'.format(self.__sequence_str, self.__start_position, self.__end_position)
 
     # endregion
@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+
+"""
+bpRNA Annotator
+================
+
+A native version of the structure annotation of 'bpRNA' (`bpRNA.pl`).
+
+From a sequence and its "dot-bracket" string, it produces the same "structure array" (S/H/B/I/M/X/E) and the
+same element list - stems, hairpins, bulges, interior loops, multiloops, external loops, ends and segments -
+as the ".st" file of `bpRNA.pl`, without forking the Perl script.
+
+ref: bpRNA - http://bprna.cgrb.oregonstate.edu/download.php#bpRNA
+
+NOTE:
+- Only nested structures ("()" pairs) are supported - pseudoknots are rejected.
+"""
+
+from collections import namedtuple
+from typing import List, Tuple
+
+from neoRNA.sequence.sequence import Sequence
+from neoRNA.sequence.base_pair import BasePair
+from neoRNA.structure.pairing import BRACKET_FAMILIES, NESTED_BRACKETS, partner_array
+from neoRNA.structure.secondary_structure import SecondaryStructure
+from neoRNA.structure.secondary_structure_element import SecondaryStructureElement, SecondaryStructureElementType
+
+
+# ----------------------------------
+# region Annotation
+
+# One element, positions start with "1"
+# - ele_type: SecondaryStructureElementType
+# - label: The label in the ".st" file, like "S1", "I2.1"
+# - spans: (start, end) of each strand
+# - base_pairs: Flanking / closing (i, j) pairs
+# - base_pair_count: Only for "segment"
+AnnotatedElement = namedtuple('AnnotatedElement', ['ele_type', 'label', 'spans', 'base_pairs', 'base_pair_count'])
+
+# The "bpRNA" annotation of a structure
+# - lines: The element lines, in the ".st" file order
+# - elements: The elements - an interior loop or a multiloop is one element, with multiple strands
+BpRnaAnnotation = namedtuple('BpRnaAnnotation', ['sequence', 'dot_bracket', 'structure_array', 'knot_array',
+                                                 'lines', 'elements', 'segment_count'])
+
+# endregion
+
+
+class BpRnaAnnotator(object):
+    r"""
+    Annotate "dot-bracket" structures the way 'bpRNA' does.
+
+    Usage
+    -------
+
+    >>> secondary_structure = BpRnaAnnotator.to_secondary_structure('GGGAAACCC', '(((...)))')
+    >>> st_str = BpRnaAnnotator.to_st('GGGAAACCC', '(((...)))')
+
+    """
+
+    # The "#Name" of a record, as `bpRNA.pl` names it after the input file
+    DEFAULT_NAME = 'tmp'
+
+    # Canonical pairs - the others are reported as "NCBP"
+    CANONICAL_PAIRS = {'AU', 'UA', 'GC', 'CG', 'GU', 'UG'}
+
+    # ----------------------------------
+    # region Annotation
+
+    @classmethod
+    def annotate(cls, sequence_str: str, dot_bracket_str: str) -> BpRnaAnnotation:
+        r"""
+        Annotate a structure.
+
+        Parameters
+        ----------
+        sequence_str: str
+            The sequence.
+        dot_bracket_str: str
+            The "dot-bracket" string. Nested pairs ("()") only.
+
+        Returns
+        -------
+        annotation: BpRnaAnnotation
+        """
+
+        length = len(dot_bracket_str)
+        if len(sequence_str) != length:
+            raise ValueError('Sequence and structure lengths differ', sequence_str, dot_bracket_str)
+        if any(char in BRACKET_FAMILIES and char not in NESTED_BRACKETS for char in set(dot_bracket_str)):
+            raise ValueError('Pseudoknots are not supported', dot_bracket_str)
+
+        # Partner of each position, start with "1". "0" - unpaired, also for the padding at "0" and "length + 1".
+        partners = [0] + (partner_array(dot_bracket_str, NESTED_BRACKETS) + 1).tolist() + [0]
+        structure_array = ['S' if partners[position] else '' for position in range(length + 2)]
+
+        def nt(position: int) -> str:
+            return sequence_str[position - 1]
+
+        def strand(start: int, end: int) -> str:
+            return sequence_str[start - 1:end]
+
+        def pair_str(position: int) -> str:
+            return '({},{}) {}:{}'.format(position, partners[position], nt(position), nt(partners[position]))
+
+        def mark(start: int, end: int, char: str):
+            for position in range(start, end + 1):
+                structure_array[position] = char
+
+        def branches(start: int, end: int) -> List[Tuple[int, int]]:
+            # The pairs directly inside (start, end) - exclusive
+            found = []
+            position = start + 1
+            while position < end:
+                if partners[position]:
+                    found.append((position, partners[position]))
+                    position = partners[position] + 1
+                else:
+                    position += 1
+            return found
+
+        # Stems - runs of stacked pairs
+        stems = []
+        stem_by_start = dict()
+        for i in range(1, length + 1):
+            j = partners[i]
+            if j <= i or (partners[i - 1] == j + 1 and partners[i - 1] > i - 1):
+                continue
+            count = 1
+            while partners[i + count] == j - count and j - count > i + count:
+                count += 1
+            stem_by_start[i] = len(stems)
+            stems.append((i, i + count - 1, j - count + 1, j))
+
+        # Loops - by the pair closing them
+        hairpins, bulges, interiors, multiloops = [], [], [], []
+        inner_stem = dict()
+        for stem_index, (i, inner_i, inner_j, j) in enumerate(stems):
+            inside = branches(inner_i, inner_j)
+            if not inside:
+                hairpins.append((inner_i, inner_j))
+                mark(inner_i + 1, inner_j - 1, 'H')
+            elif len(inside) == 1:
+                p, q = inside[0]
+                inner_stem[stem_index] = stem_by_start[p]
+                if p - inner_i > 1 and inner_j - q > 1:
+                    interiors.append((inner_i, p, q, inner_j))
+                    mark(inner_i + 1, p - 1, 'I')
+                    mark(q + 1, inner_j - 1, 'I')
+                else:
+                    bulges.append((inner_i + 1, p - 1) if p - inner_i > 1 else (q + 1, inner_j - 1))
+                    mark(inner_i + 1, p - 1, 'B')
+                    mark(q + 1, inner_j - 1, 'B')
+            else:
+                multiloops.append((inner_i, inner_j, inside))
+                mark(inner_i + 1, inside[0][0] - 1, 'M')
+                for (p, q), (next_p, next_q) in zip(inside, inside[1:]):
+                    mark(q + 1, next_p - 1, 'M')
+                mark(inside[-1][1] + 1, inner_j - 1, 'M')
+
+        # External loop
+        external = branches(0, length + 1)
+        ends = []
+        external_loops = []
+        if not external:
+            ends.append((1, length))
+        else:
+            if external[0][0] > 1:
+                ends.append((1, external[0][0] - 1))
+            for (p, q), (next_p, next_q) in zip(external, external[1:]):
+                if next_p - q > 1:
+                    external_loops.append((q + 1, next_p - 1))
+            if external[-1][1] < length:
+                ends.append((external[-1][1] + 1, length))
+        if external and external[0][0] == 1 and len(external_loops) > 1:
+            # NOTE: With no 5' end, `bpRNA.pl` reports several external loops as one multiloop, closed by the
+            # first helix
+            inside = external[1:]
+            multiloops.insert(0, (external[0][1], None, inside))
+            for start, end in external_loops:
+                mark(start, end, 'M')
+            external_loops = []
+        for start, end in external_loops:
+            mark(start, end, 'X')
+        for start, end in ends:
+            mark(start, end, 'E')
+
+        # Segments - stems linked by bulges / interior loops
+        linked = set(inner_stem.values())
+        segments = []
+        for stem_index in range(len(stems)):
+            if stem_index in linked:
+                continue
+            chain = [stem_index]
+            while chain[-1] in inner_stem:
+                chain.append(inner_stem[chain[-1]])
+            segments.append(chain)
+
+        # ----------------------------------
+        # Lines / Elements
+
+        lines = []
+        elements = []
+
+        for index, (i, inner_i, inner_j, j) in enumerate(stems, 1):
+            label = 'S{}'.format(index)
+            lines.append('{} {}..{} "{}" {}..{} "{}"'.format(label, i, inner_i, strand(i, inner_i),
+                                                               inner_j, j, strand(inner_j, j)))
+            elements.append(AnnotatedElement(SecondaryStructureElementType.Stem, label,
+                                             [(i, inner_i), (inner_j, j)], [], None))
+
+        for index, (i, j) in enumerate(hairpins, 1):
+            label = 'H{}'.format(index)
+            lines.append('{} {}..{} "{}" {} '.format(label, i + 1, j - 1, strand(i + 1, j - 1), pair_str(i)))
+            elements.append(AnnotatedElement(SecondaryStructureElementType.Hairpin, label,
+                                             [(i + 1, j - 1)], [(i, j)], None))
+
+        for index, (start, end) in enumerate(sorted(bulges), 1):
+            label = 'B{}'.format(index)
+            lines.append('{} {}..{} "{}" {} {} '.format(label, start, end, strand(start, end),
+                                                        pair_str(start - 1), pair_str(end + 1)))
+            elements.append(AnnotatedElement(SecondaryStructureElementType.Bulge, label, [(start, end)],
+                                             [(start - 1, partners[start - 1]), (end + 1, partners[end + 1])],
+                                             None))
+
+        for index, (i, p, q, j) in enumerate(interiors, 1):
+            labels = ['I{}.1'.format(index), 'I{}.2'.format(index)]
+            lines.append('{} {}..{} "{}" {} '.format(labels[0], i + 1, p - 1, strand(i + 1, p - 1), pair_str(i)))
+            lines.append('{} {}..{} "{}" {} '.format(labels[1], q + 1, j - 1, strand(q + 1, j - 1), pair_str(q)))
+            elements.append(AnnotatedElement(SecondaryStructureElementType.Interior, labels[0],
+                                             [(i + 1, p - 1), (q + 1, j - 1)], [(i, j), (q, p)], None))
+
+        for index, (i, j, inside) in enumerate(multiloops, 1):
+            # The strands between the closing pair and the branches, 5' to 3'
+            flanks = [i] + [position for pair in inside for position in pair]
+            if j is not None:
+                flanks.append(j)
+            else:
+                # The external "multiloop" - no strand after the last helix
+                flanks.pop()
+            spans = []
+            base_pairs = []
+            for strand_index in range(0, len(flanks), 2):
+                left, right = flanks[strand_index], flanks[strand_index + 1]
+                label = 'M{}.{}'.format(index, strand_index // 2 + 1)
+                lines.append('{} {}..{} "{}" {} {} '.format(label, left + 1, right - 1, strand(left + 1, right - 1),
+                                                            pair_str(left), pair_str(right)))
+                spans.append((left + 1, right - 1))
+                base_pairs += [(left, partners[left]), (right, partners[right])]
+            elements.append(AnnotatedElement(SecondaryStructureElementType.Multiloop, 'M{}'.format(index),
+                                             spans, base_pairs, None))
+
+        # NOTE: `bpRNA.pl` only marks a single-nt external loop in the structure array
+        external_loops = [(start, end) for start, end in external_loops if end > start]
+        for index, (start, end) in enumerate(external_loops, 1):
+            label = 'X{}'.format(index)
+            lines.append('{} {}..{} "{}" {} {} '.format(label, start, end, strand(start, end),
+                                                        pair_str(start - 1), pair_str(end + 1)))
+            elements.append(AnnotatedElement(SecondaryStructureElementType.Unpaired, label, [(start, end)],
+                                             [(start - 1, partners[start - 1]), (end + 1, partners[end + 1])],
+                                             None))
+
+        for index, (start, end) in enumerate(ends, 1):
+            label = 'E{}'.format(index)
+            lines.append('{} {}..{} "{}" '.format(label, start, end, strand(start, end)))
+            elements.append(AnnotatedElement(SecondaryStructureElementType.End, label, [(start, end)], [], None))
+
+        ncbp_index = 0
+        for i, (start, inner_i, inner_j, j) in enumerate(stems, 1):
+            for offset in range(inner_i - start + 1):
+                left, right = start + offset, j - offset
+                if (nt(left) + nt(right)).upper() not in cls.CANONICAL_PAIRS:
+                    ncbp_index += 1
+                    lines.append('NCBP{} {} {} {} {} S{}'.format(ncbp_index, left, nt(left), right, nt(right), i))
+
+        for index, chain in enumerate(segments, 1):
+            label = 'segment{}'.format(index)
+            i, _, _, j = stems[chain[0]]
+            _, inner_i, inner_j, _ = stems[chain[-1]]
+            base_pair_count = sum(stems[stem_index][1] - stems[stem_index][0] + 1 for stem_index in chain)
+            lines.append('{} {}bp {}..{} {} {}..{} {}'.format(label, base_pair_count, i, inner_i, strand(i, inner_i),
+                                                             inner_j, j, strand(inner_j, j)))
+            elements.append(AnnotatedElement(SecondaryStructureElementType.Segment, label,
+                                             [(i, inner_i), (inner_j, j)], [], base_pair_count))
+
+        return BpRnaAnnotation(sequence_str, dot_bracket_str, ''.join(structure_array[1:length + 1]), 'N' * length,
+                               lines, elements, len(segments))
+
+    # endregion
+
+    # ----------------------------------
+    # region Output
+
+    @classmethod
+    def to_st(cls, sequence_str: str, dot_bracket_str: str, name: str = DEFAULT_NAME) -> str:
+        r"""
+        The annotation, in the ".st" format of `bpRNA.pl`.
+
+        Parameters
+        ----------
+        sequence_str: str
+        dot_bracket_str: str
+        name: str
+            The "#Name" of the record.
+
+        Returns
+        -------
+        st_str: str
+        """
+
+        return cls.format_st(cls.annotate(sequence_str, dot_bracket_str), name)
+
+    @classmethod
+    def to_secondary_structure(cls, sequence_str: str, dot_bracket_str: str,
+                               name: str = DEFAULT_NAME) -> SecondaryStructure:
+        r"""
+        Build the `SecondaryStructure` directly - the same object `BpRnaIO` parses from the ".st" file.
+
+        Parameters
+        ----------
+        sequence_str: str
+        dot_bracket_str: str
+        name: str
+            The "comment" of the structure.
+
+        Returns
+        -------
+        secondary_structure: SecondaryStructure
+        """
+
+        return cls.__build_secondary_structure(cls.annotate(sequence_str, dot_bracket_str), name)
+
+    @classmethod
+    def run(cls, sequence_str: str, dot_bracket_str: str,
+            name: str = DEFAULT_NAME) -> Tuple[str, SecondaryStructure]:
+        r"""
+        Both the ".st" text and the `SecondaryStructure` - the drop-in for running `bpRNA.pl` and parsing its output.
+
+        Parameters
+        ----------
+        sequence_str: str
+        dot_bracket_str: str
+        name: str
+
+        Returns
+        -------
+        ret_tuple: Tuple[str, SecondaryStructure]
+            - st_str: The ".st" text.
+            - secondary_structure: The parsed structure.
+        """
+
+        annotation = cls.annotate(sequence_str, dot_bracket_str)
+        return cls.format_st(annotation, name), cls.__build_secondary_structure(annotation, name)
+
+    @classmethod
+    def format_st(cls, annotation: BpRnaAnnotation, name: str = DEFAULT_NAME) -> str:
+        r"""
+        Format an annotation (from `annotate`) as the ".st" text.
+        """
+
+        # NOTE: `bpRNA.pl` pads the length with spaces when the structure has more than one segment
+        length_format = '#Length:  {} ' if annotation.segment_count > 1 else '#Length: {}'
+        header = ['#Name: {}'.format(name), length_format.format(len(annotation.sequence)), '#PageNumber: 1']
+        return '\n'.join(header + [annotation.sequence, annotation.dot_bracket, annotation.structure_array,
+                                   annotation.knot_array] + annotation.lines) + '\n'
+
+    # endregion
+
+    # ----------------------------------
+    # region Utils
+
+    @classmethod
+    def __build_secondary_structure(cls, annotation: BpRnaAnnotation, name: str) -> SecondaryStructure:
+        sequence_str = annotation.sequence
+        raw_strings = dict()
+        for line in annotation.lines:
+            label = line.split(' ', 1)[0]
+            raw_strings[label] = line.strip()
+
+        elements = []
+        last_multiloop = None
+        for annotated in annotation.elements:
+            if annotated.ele_type == SecondaryStructureElementType.Interior:
+                labels = [annotated.label, annotated.label[:-1] + '2']
+            elif annotated.ele_type == SecondaryStructureElementType.Multiloop:
+                labels = ['{}.{}'.format(annotated.label, index) for index in range(1, len(annotated.spans) + 1)]
+            else:
+                labels = [annotated.label]
+
+            element = SecondaryStructureElement(annotated.ele_type, ' | '.join(raw_strings[label] for label in labels),
+                                                annotated.base_pair_count)
+            for start, end in annotated.spans:
+                element.add_sequence(Sequence(sequence_str[start - 1:end] or None, range(start, end + 1)))
+            for i, j in annotated.base_pairs:
+                element.add_base_pair(BasePair((sequence_str[i - 1], sequence_str[j - 1]), (i, j)))
+
+            # As `BpRnaIO`, a multiloop is only added when the next one starts, the last one after all the others
+            if annotated.ele_type == SecondaryStructureElementType.Multiloop:
+                if last_multiloop is not None:
+                    elements.append(last_multiloop)
+                last_multiloop = element
+            else:
+                elements.append(element)
+        if last_multiloop is not None:
+            elements.append(last_multiloop)
+
+        return SecondaryStructure(name, sequence_str, annotation.dot_bracket,
+                                  annotation.structure_array, annotation.knot_array, elements)
+
+    # endregion
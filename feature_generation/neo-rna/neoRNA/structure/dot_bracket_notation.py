@@ -8,7 +8,11 @@ It help defines the "Dot Bracket Notation" info for a RNA sequence
 """
 
 import json
+
+import numpy as np
+
 from neoRNA.sequence.sequence import Sequence
+from neoRNA.structure import pairing
 from neoRNA.util.file_utils import FileUtils
 
 
@@ -61,6 +65,19 @@ class DotBracketNotation(object):
     # ----------------------------------
     # region Converter
 
+    def partners(self) -> np.ndarray:
+        r"""
+        The partner of each nt (start with "0"), "-1" if unpaired - from all bracket families, including
+        pseudoknots ("[]", "{}", "<>", "Aa" ...).
+
+        Returns
+        -------
+        partners: np.ndarray
+            int32 partner array. See `neoRNA.structure.pairing`.
+        """
+
+        return pairing.partner_array(self.__notation_str)
+
     def to_ct(self):
         r"""
         Convert the "notation string" to "ct" data
@@ -74,89 +91,19 @@ class DotBracketNotation(object):
             CT string list
         """
 
-        ct_str_list = []
+        return pairing.to_ct(self.__sequence.sequence_str, self.partners())
 
-        # Helper stacks
-        stack1 = []
-        stack2 = []
-        stack3 = []
-        stack4 = []
-        stack5 = []
-        stack6 = []
-        stack7 = []
-        stack8 = []
-        stack9 = []
-        stack10 = []
-        stack11 = []
+    def to_bpseq(self):
+        r"""
+        Convert the "notation string" to "bpseq" data
 
-        # Pair into
-        pairs = {}
+        Returns
+        -------
+        bpseq_data: List[str]
+            bpseq string list
+        """
 
-        #
-        sequence = self.__sequence.sequence_str
-
-        for i, c in enumerate(self.__notation_str):
-            if c == '(':
-                stack1.append(i + 1)
-            elif c == '[':
-                stack2.append(i + 1)
-            elif c == '{':
-                stack3.append(i + 1)
-            elif c == '<':
-                stack4.append(i + 1)
-            elif c == 'A':
-                stack5.append(i + 1)
-            elif c == 'B':
-                stack6.append(i + 1)
-            elif c == 'C':
-                stack7.append(i + 1)
-            elif c == 'D':
-                stack8.append(i + 1)
-            elif c == 'E':
-                stack9.append(i + 1)
-            elif c == 'F':
-                stack10.append(i + 1)
-            elif c == 'G':
-                stack11.append(i + 1)
-            elif c == ')':
-                pairs[i + 1] = stack1.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == ']':
-                pairs[i + 1] = stack2.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == '}':
-                pairs[i + 1] = stack3.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == '>':
-                pairs[i + 1] = stack4.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == 'a':
-                pairs[i + 1] = stack5.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == 'b':
-                pairs[i + 1] = stack6.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == 'c':
-                pairs[i + 1] = stack7.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == 'd':
-                pairs[i + 1] = stack8.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == 'e':
-                pairs[i + 1] = stack9.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == 'f':
-                pairs[i + 1] = stack10.pop()
-                pairs[pairs[i + 1]] = i + 1
-            elif c == 'g':
-                pairs[i + 1] = stack11.pop()
-                pairs[pairs[i + 1]] = i + 1
-
-        for i in range(1, len(self.__notation_str) + 1):
-            ct_str_list.append(
-                "%d%s%s%s%d%s%d%s%d%s%d" % (i, ' ', sequence[i - 1], ' ', i - 1, ' ', i + 1, ' ', pairs.get(i, 0), ' ', i))
-
-        return ct_str_list
+        return pairing.to_bpseq(self.__sequence.sequence_str, self.partners())
 
     # endregion
 
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+Dot-Bracket Pairing
+================
+
+Match the brackets of "dot-bracket" strings into "partner arrays", and build the other pairing formats from them.
+
+A "partner array" is an int32 array, one entry per nt: the (0-based) position of the paired nt, "-1" if unpaired.
+
+Bracket families:
+- "()" - nested pairs
+- "[]", "{}", "<>" - pseudoknots
+- "Aa", "Bb", ..., "Zz" - pseudoknots, as used by bpRNA for the higher orders
+
+Each family is matched separately, so pairs of different families may cross.
+"""
+
+from typing import List, Optional, Iterable, Tuple
+
+import numpy as np
+
+# Unpaired nt in a partner array
+UNPAIRED = -1
+
+# All supported families - (opener, closer)
+BRACKET_FAMILIES = '()[]{}<>' + ''.join(chr(code) + chr(code + 32) for code in range(ord('A'), ord('Z') + 1))
+
+# Only the nested pairs
+NESTED_BRACKETS = '()'
+
+
+# ----------------------------------
+# region Utils
+
+def _bracket_families(brackets: Optional[str]) -> List[Tuple[str, str]]:
+    r"""
+    (opener, closer) of the given families, such as "()[]".
+    """
+    if brackets is None:
+        brackets = BRACKET_FAMILIES
+    if len(brackets) % 2 != 0 or len(set(brackets)) != len(brackets):
+        raise ValueError('Brackets must be given as distinct (opener, closer) pairs', brackets)
+
+    return [(brackets[index], brackets[index + 1]) for index in range(0, len(brackets), 2)]
+
+# endregion
+
+
+# ----------------------------------
+# region Pairing
+
+def partner_array(structure: str, brackets: Optional[str] = None, strict: bool = True) -> np.ndarray:
+    r"""
+    Match the brackets of a "dot-bracket" string.
+
+    Parameters
+    ----------
+    structure: str
+        The "dot-bracket" string. Any char which is not a bracket of `brackets` is unpaired.
+    brackets: Optional[str]
+        The bracket families to match, as (opener, closer) pairs - such as "()[]".
+        Default - all families (`BRACKET_FAMILIES`).
+    strict: bool
+        "True" - raise `ValueError` for unbalanced brackets. "False" - unmatched brackets are unpaired.
+
+    Returns
+    -------
+    partners: np.ndarray
+        int32 partner array, "-1" if unpaired.
+    """
+
+    families = _bracket_families(brackets)
+    openers = {opener: index for index, (opener, closer) in enumerate(families)}
+    closers = {closer: index for index, (opener, closer) in enumerate(families)}
+    partners = [UNPAIRED] * len(structure)
+    stacks = [list() for _ in families]
+    for position, char in enumerate(structure):
+        if char in openers:
+            stacks[openers[char]].append(position)
+        elif char in closers:
+            stack = stacks[closers[char]]
+            if stack:
+                partner = stack.pop()
+                partners[position] = partner
+                partners[partner] = position
+            elif strict:
+                raise ValueError('Unbalanced structure', structure)
+
+    if strict and any(stacks):
+        raise ValueError('Unbalanced structure', structure)
+
+    return np.array(partners, dtype=np.int32)
+
+
+def partner_matrix(structures: Iterable[str], brackets: Optional[str] = None,
+                   length: Optional[int] = None) -> np.ndarray:
+    r"""
+    Match the brackets of many "dot-bracket" strings at once.
+
+    Instead of a stack, the brackets of each family are sorted by (structure, nesting level, position) -
+    within a level, the openers and closers then alternate, and each pair is two neighbours.
+
+    Parameters
+    ----------
+    structures: Iterable[str]
+        The "dot-bracket" strings. Shorter ones are padded as unpaired.
+    brackets: Optional[str]
+        The bracket families to match. Default - all families (`BRACKET_FAMILIES`).
+    length: Optional[int]
+        The number of columns. Default - the length of the longest structure.
+
+    Returns
+    -------
+    partners: np.ndarray
+        N x L int32 partner matrix, "-1" if unpaired (or padded).
+    """
+
+    structures = list(structures)
+    if length is None:
+        length = max([len(structure) for structure in structures] or [0])
+    if any(len(structure) > length for structure in structures):
+        raise ValueError('Structure longer than the matrix', length)
+
+    families = _bracket_families(brackets)
+    partners = np.full((len(structures), length), UNPAIRED, dtype=np.int32)
+    if not structures or length == 0:
+        return partners
+
+    codes = np.frombuffer(''.join(structure.ljust(length, '.') for structure in structures)
+                          .encode('ascii', 'replace'), dtype=np.uint8).reshape(len(structures), length)
+    # Skip the families not used at all
+    char_counts = np.bincount(codes.ravel(), minlength=256)
+    for opener, closer in families:
+        if not char_counts[ord(opener)] and not char_counts[ord(closer)]:
+            continue
+        step = (codes == ord(opener)).astype(np.int32) - (codes == ord(closer))
+        rows, columns = np.nonzero(step)
+        if len(rows) == 0:
+            continue
+
+        depth = np.cumsum(step, axis=1)
+        unbalanced = np.nonzero((depth.min(axis=1) < 0) | (depth[:, -1] != 0))[0]
+        if len(unbalanced) > 0:
+            raise ValueError('Unbalanced structure', structures[unbalanced[0]])
+
+        # The level of an opener is the depth after it, of a closer the depth before it
+        level = depth[rows, columns] + (step[rows, columns] < 0)
+        order = np.lexsort((columns, level, rows))
+        rows, columns = rows[order], columns[order]
+        pair_rows, left, right = rows[0::2], columns[0::2], columns[1::2]
+        partners[pair_rows, left] = right
+        partners[pair_rows, right] = left
+
+    return partners
+
+# endregion
+
+
+# ----------------------------------
+# region Formats
+
+def pair_list(partners: np.ndarray) -> List[Tuple[int, int]]:
+    r"""
+    (i, j) of each pair, i < j, 0-based - in the order of the closing brackets.
+    """
+    closing = np.nonzero((partners >= 0) & (partners < np.arange(len(partners))))[0]
+    return [(int(partners[j]), int(j)) for j in closing]
+
+
+def to_pair_table(partners: np.ndarray) -> np.ndarray:
+    r"""
+    ViennaRNA style pair table - the 1-based partner of each nt ("0" if unpaired), and `[0]` holds the length.
+    """
+    pair_table = np.empty(len(partners) + 1, dtype=np.int32)
+    pair_table[0] = len(partners)
+    pair_table[1:] = partners + 1
+    return pair_table
+
+
+def to_ct(sequence_str: str, partners: np.ndarray) -> List[str]:
+    r"""
+    The lines of a "ct" record (without the header line).
+
+    Each line: index, nt, previous index, next index, partner ("0" if unpaired), natural numbering - all 1-based.
+
+    ref:
+    - ct - http://projects.binf.ku.dk/pgardner/bralibase/RNAformats.html
+    """
+    return ['{} {} {} {} {} {}'.format(index, sequence_str[index - 1], index - 1, index + 1, partner + 1, index)
+            for index, partner in enumerate(partners.tolist(), 1)]
+
+
+def to_bpseq(sequence_str: str, partners: np.ndarray) -> List[str]:
+    r"""
+    The lines of a "bpseq" record - index, nt, partner ("0" if unpaired), all 1-based.
+    """
+    return ['{} {} {}'.format(index, sequence_str[index - 1], partner + 1)
+            for index, partner in enumerate(partners.tolist(), 1)]
+
+
+def graph_edges(partners: np.ndarray) -> np.ndarray:
+    r"""
+    The edges of the 2D graph of a structure - nts linked by base pairs and by the backbone.
+
+    Both directions of an edge are included. For each nt (0-based), in order: its partner, the next nt,
+    the previous nt - the order used by `2dGraphs`.
+
+    Returns
+    -------
+    edges: np.ndarray
+        E x 2 int32 array of (from, to).
+    """
+    length = len(partners)
+    positions = np.arange(length, dtype=np.int32)
+    targets = np.stack([partners.astype(np.int32), positions + 1, positions - 1], axis=1)
+    valid = (targets >= 0) & (targets < length)
+    sources = np.repeat(positions, 3).reshape(length, 3)
+    return np.stack([sources[valid], targets[valid]], axis=1)
+
+# endregion
@@ -7,6 +7,8 @@ RNA Secondary Structure
 
 from typing import List, Optional
 
+import numpy as np
+
 from neoRNA.sequence.sequence import Sequence
 from neoRNA.structure.secondary_structure_element import SecondaryStructureElement, SecondaryStructureElementType
 from neoRNA.util.parser.comment_parser import CommentParser
@@ -51,6 +53,9 @@ class SecondaryStructure(object):
         self.__dot_bracket_validation_str = dot_bracket_validation_str
         self.__elements = elements
 
+        # Built on first use - see `element_spans`
+        self.__element_spans: Optional[np.ndarray] = None
+
         #
         self.__reference_id = reference_id if reference_id else self.__parse_id_from_comment(self.__comment)
 
@@ -75,6 +80,25 @@ class SecondaryStructure(object):
     def elements(self) -> List[SecondaryStructureElement]:
         return self.__elements
 
+    @property
+    def element_spans(self) -> np.ndarray:
+        r"""
+        The position spans of all the elements.
+
+        An "N x 3" int array, one row for each sequence of the elements - (element index, start, end).
+        Sequences without position info are not included.
+        """
+        if self.__element_spans is None:
+            spans = list()
+            for element_index, element in enumerate(self.__elements):
+                element_spans = element.spans
+                for index in range(0, len(element_spans), 2):
+                    if element_spans[index]:
+                        spans.append((element_index, element_spans[index], element_spans[index + 1]))
+            self.__element_spans = np.array(spans, dtype=np.int64).reshape(-1, 3)
+
+        return self.__element_spans
+
     @property
     def reference_id(self)-> str:
         return self.__reference_id
@@ -102,6 +126,28 @@ class SecondaryStructure(object):
             elif element.ele_type == element_type:
                 yield element
 
+    def get_elements_at(self, position: int, element_type=None) -> List[SecondaryStructureElement]:
+        r"""
+        Get the elements which contain the given "position", in the element order.
+
+        Parameters
+        ----------
+        position: int
+            The "position" to be checked. Start from "1".
+        element_type: str
+            Only get the elements of this type. Optional.
+
+        Returns
+        -------
+        elements: List[SecondaryStructureElement]
+            The elements. A "Segment" overlaps its "Stems" and loops, so there may be more than one.
+        """
+
+        spans = self.element_spans
+        hits = np.unique(spans[(spans[:, 1] <= position) & (position <= spans[:, 2]), 0])
+        return [self.__elements[index] for index in hits
+                if element_type is None or self.__elements[index].ele_type == element_type]
+
     def get_annotation(self, position: int) -> Optional[str]:
         r"""
         Get the "annotation string" based on the given "position".
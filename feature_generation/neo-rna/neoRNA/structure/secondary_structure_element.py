@@ -5,6 +5,7 @@ Secondary Structure Element
 --------------------
 """
 
+from array import array
 from typing import Optional, List, Tuple
 
 from neoRNA.sequence import Sequence, BasePair
@@ -78,8 +79,16 @@ class SecondaryStructureElement(object):
 
     Each of the "structure element" type has its own properties to help define it.
 
+    ## Spans
+
+    The (start, end) positions of the sequences are also kept in a flat int array, so the position checks
+    (`is_contain`, `is_before`, `distance`) do not need to go through each `Sequence` object.
+
     """
 
+    __slots__ = ('__ele_type', '__raw_string', '__base_pair_count',
+                 '__sequence_list', '__base_pair_list', '__spans')
+
     # ----------------------------------
     # region Init
 
@@ -100,6 +109,9 @@ class SecondaryStructureElement(object):
         self.__sequence_list: List[Sequence] = list()
         self.__base_pair_list: List[BasePair] = list()
 
+        # (start, end) of each sequence, in the order of `sequence_list`. "0" - no position info.
+        self.__spans = array('l')
+
     # endregion
 
     # ----------------------------------
@@ -156,7 +168,19 @@ class SecondaryStructureElement(object):
 
     @sequence_list.setter
     def sequence_list(self, sequence_list: List[Sequence]):
-        self.__sequence_list = sequence_list
+        self.__sequence_list = list()
+        self.__spans = array('l')
+        for sequence in sequence_list:
+            self.add_sequence(sequence)
+
+    @property
+    def spans(self) -> array:
+        r"""
+        The (start, end) positions of the sequences, flattened - `[start_1, end_1, start_2, end_2, ...]`.
+
+        "0" is used for a sequence without position info.
+        """
+        return self.__spans
 
     @property
     def base_pair_list(self) -> List[BasePair]:
@@ -196,6 +220,8 @@ class SecondaryStructureElement(object):
         """
 
         self.__sequence_list.append(sequence)
+        self.__spans.append(sequence.start_position or 0)
+        self.__spans.append(sequence.end_position or 0)
 
     def add_base_pair(self, base_pair: BasePair):
         r"""
@@ -234,12 +260,14 @@ class SecondaryStructureElement(object):
 
         """
 
-        if nt_position is None:
+        if not nt_position:
             return False, None
 
-        for sequence in self.__sequence_list:
-            if sequence.contain(nt_position) is True:
-                return True, sequence
+        nt_position = int(nt_position)
+        spans = self.__spans
+        for index in range(0, len(spans), 2):
+            if spans[index] and spans[index] <= nt_position <= spans[index + 1]:
+                return True, self.__sequence_list[index // 2]
 
         return False, None
 
@@ -264,9 +292,14 @@ class SecondaryStructureElement(object):
         if nt_position is None:
             return False
 
-        for sequence in self.__sequence_list:
-            # Ignore "empty" sequence
-            if not sequence.is_empty() and not sequence.is_before(nt_position):
+        nt_position = int(nt_position)
+        spans = self.__spans
+        for index in range(0, len(spans), 2):
+            if spans[index]:
+                if spans[index + 1] >= nt_position:
+                    return False
+            elif not self.__sequence_list[index // 2].is_empty():
+                # Ignore "empty" sequence
                 return False
 
         return True
@@ -334,14 +367,17 @@ class SecondaryStructureElement(object):
 
         #
         from sys import maxsize
+        nt_position = int(nt_position)
+        spans = self.__spans
         if self.is_before(nt_position):
             ret_distance = -maxsize - 1  # Max negative int
             ret_sequence = None
-            for sequence in self.__sequence_list:
-                distance = sequence.distance(nt_position)
+            for index in range(0, len(spans), 2):
+                # Use the "end-nt"
+                distance = spans[index + 1] - nt_position if spans[index] else None
                 if distance and distance > ret_distance:
                     ret_distance = distance
-                    ret_sequence = sequence
+                    ret_sequence = self.__sequence_list[index // 2]
 
             #
             return ret_distance, ret_sequence
@@ -349,11 +385,12 @@ class SecondaryStructureElement(object):
             # After
             ret_distance = maxsize
             ret_sequence = None
-            for sequence in self.__sequence_list:
-                distance = sequence.distance(nt_position, is_before=False)
+            for index in range(0, len(spans), 2):
+                # Use the "start-nt"
+                distance = spans[index] - nt_position if spans[index] else None
                 if distance and 0 < distance < ret_distance:
                     ret_distance = distance
-                    ret_sequence = sequence
+                    ret_sequence = self.__sequence_list[index // 2]
 
             #
             return ret_distance, ret_sequence
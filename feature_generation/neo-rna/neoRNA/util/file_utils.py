@@ -20,8 +20,6 @@ import csv
 
 from typing import Dict, Any, List, Optional
 
-from jinja2 import Environment, FileSystemLoader
-
 
 class FileUtils(object):
     """
@@ -208,6 +206,149 @@ class FileUtils(object):
                                    indent=4, ensure_ascii=True)
         cls.save_file(file_path, json_contents)
 
+    @classmethod
+    def save_json_items(cls, file_path: str, items, items_key: str = 'items') -> int:
+        """
+        Save a stream of JSON items as a file, one item at a time.
+
+        - ".jsonl" files get one item per line.
+        - Otherwise, the items are written as `{"items": [...]}`, in the same layout as `save_json_to_file`.
+
+        Parameters
+        ----------
+        file_path: str
+            File path to be saved.
+        items: Iterable[Dict[str, Any]]
+            The JSON items. Can be a generator - it is consumed while writing.
+        items_key: str
+            The key of the item list, for ".json" files.
+
+        Returns
+        -------
+        item_count: int
+            The number of items written.
+
+        """
+
+        #
+        item_count = 0
+        with open(file_path, 'w') as outfile:
+            if file_path.endswith('.jsonl'):
+                for item in items:
+                    outfile.write(json.dumps(item, sort_keys=True, ensure_ascii=True) + '\n')
+                    item_count += 1
+                return item_count
+
+            outfile.write('{{\n    {}: ['.format(json.dumps(items_key)))
+            for item in items:
+                item_str = json.dumps(item, sort_keys=True, indent=4, ensure_ascii=True)
+                outfile.write(',\n' if item_count else '\n')
+                outfile.write('\n'.join('        ' + line for line in item_str.split('\n')))
+                item_count += 1
+            outfile.write('\n    ]\n}' if item_count else ']\n}')
+
+        return item_count
+
+    @classmethod
+    def load_json_items(cls, file_path: str, items_key: str = 'items'):
+        """
+        Iterate the JSON items of a file saved by `save_json_items` (or `save_json_to_file`).
+
+        Parameters
+        ----------
+        file_path: str
+            File path to be loaded.
+        items_key: str
+            The key of the item list, for ".json" files.
+
+        Returns
+        -------
+        items: Iterator[Dict[str, Any]]
+            The JSON items. ".jsonl" files are read one line at a time.
+
+        """
+
+        #
+        if file_path.endswith('.jsonl'):
+            with open(file_path) as infile:
+                for line in infile:
+                    if line.strip():
+                        yield json.loads(line)
+            return
+
+        with open(file_path) as infile:
+            yield from json.load(infile)[items_key]
+
+    @classmethod
+    def load_json_overlay(cls, overlay_file_paths: Optional[List[str]], key_field: str = 'rna_id') \
+            -> Dict[str, Dict[str, Any]]:
+        """
+        Load the records of "overlay" files, merged by `key_field`. Later overlays win.
+
+        Parameters
+        ----------
+        overlay_file_paths: Optional[List[str]]
+            The overlay files, in the order to apply.
+        key_field: str
+            The field matching items and overlay records.
+
+        Returns
+        -------
+        overlay_records: Dict[str, Dict[str, Any]]
+            The merged overlay record, by key.
+
+        """
+
+        #
+        overlay_records = dict()
+        for overlay_file_path in overlay_file_paths or []:
+            for record in cls.load_json_items(overlay_file_path):
+                overlay_records.setdefault(record[key_field], dict()).update(record)
+
+        return overlay_records
+
+    @classmethod
+    def load_json_items_with_overlay(cls, file_path: str, overlay_file_paths: Optional[List[str]] = None,
+                                     key_field: str = 'rna_id', items_key: str = 'items'):
+        """
+        Iterate the JSON items of a file, with the records of "overlay" files merged in.
+
+        An "overlay" is a ".jsonl" file holding the updated records only (see `util_adjust_sequence.py`).
+        Each overlay record updates the fields of the item with the same `key_field`. Later overlays win.
+        Overlay records which do not match any item raise `ValueError`, once all the items are yielded.
+
+        Parameters
+        ----------
+        file_path: str
+            File path to be loaded.
+        overlay_file_paths: Optional[List[str]]
+            The overlay files, in the order to apply.
+        key_field: str
+            The field matching items and overlay records.
+        items_key: str
+            The key of the item list, for ".json" files.
+
+        Returns
+        -------
+        items: Iterator[Dict[str, Any]]
+            The merged JSON items, in the order of the base file. Only the overlays are kept in memory.
+
+        """
+
+        #
+        overlay_records = cls.load_json_overlay(overlay_file_paths, key_field)
+
+        unmatched_keys = set(overlay_records)
+        for item in cls.load_json_items(file_path, items_key):
+            record = overlay_records.get(item.get(key_field))
+            if record:
+                item.update(record)
+                unmatched_keys.discard(item.get(key_field))
+            yield item
+
+        if unmatched_keys:
+            raise ValueError('The overlay records do not match any item.', sorted(unmatched_keys))
+
     # endregion
 
     # ----------------------------------
@@ -298,6 +439,9 @@ class FileUtils(object):
         -------
         """
 
+        # NOTE: Imported here - `jinja2` is slow to import and only needed for the templates
+        from jinja2 import Environment, FileSystemLoader
+
         # Load the template file
         jinja2_env = Environment(loader=FileSystemLoader(source_folder), trim_blocks=True)
         template = jinja2_env.get_template(template_file)
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+
+"""
+Batch Fold Runners
+================
+
+Fold many sequences through a pluggable "folding backend", optionally across worker processes.
+
+Backends:
+- `biers` - `rna_structure` from Biers, through the MATLAB engine (see `MatlabRunner`).
+- `vienna` - ViennaRNA, through its Python bindings (`RNA` module).
+- `stub` - No folding. An open structure and an empty BPP matrix, for dry runs and tests.
+"""
+
+import multiprocessing
+
+from typing import Tuple, Optional, Iterable, Iterator, Dict, Type, List
+
+import numpy as np
+
+
+class BatchFoldRunner(object):
+    r"""
+    Batch Fold Runner - Base Class
+
+    A backend implements `fold`, and optionally `start` / `stop` for any per-process setup
+    (such as the MATLAB engine). Each worker process gets its own backend instance.
+    """
+
+    # The name used in `FOLD_BACKENDS`
+    NAME = None
+
+    # ----------------------------------
+    # region Backend
+
+    def start(self) -> None:
+        r"""
+        Per-process setup, called once before the first `fold`.
+        """
+
+    def stop(self) -> None:
+        r"""
+        Per-process teardown.
+        """
+
+    def fold(self, sequence_str: str) -> Tuple[str, np.ndarray]:
+        r"""
+        Fold one sequence.
+
+        Parameters
+        ----------
+        sequence_str: str
+            The sequence, in string.
+
+        Returns
+        -------
+        structure: str
+            Predicted structure string, in "Dot-Bracket" format.
+        bpp: np.ndarray
+            L x L base pair probability (bpp) matrix.
+        """
+        raise NotImplementedError
+
+    # endregion
+
+    # ----------------------------------
+    # region Batch
+
+    def fold_batch(self, sequences: Iterable[str],
+                   workers: int = 1, chunk_size: int = 1) -> Iterator[Tuple[int, str, np.ndarray]]:
+        r"""
+        Fold a batch of sequences.
+
+        Parameters
+        ----------
+        sequences: Iterable[str]
+            The sequences.
+        workers: int
+            The number of worker processes. "1" folds in the current process.
+        chunk_size: int
+            The number of sequences sent to a worker at a time.
+
+        Returns
+        -------
+        results: Iterator[Tuple[int, str, np.ndarray]]
+            (index, structure, bpp) of each sequence, in the input order.
+        """
+        sequences = list(sequences)
+        if workers <= 1 or len(sequences) <= 1:
+            self.start()
+            try:
+                for index, sequence_str in enumerate(sequences):
+                    structure, bpp = self.fold(sequence_str)
+                    yield index, structure, bpp
+            finally:
+                self.stop()
+            return
+
+        with multiprocessing.Pool(min(workers, len(sequences)),
+                                  initializer=_init_fold_worker, initargs=(type(self), self.options())) as pool:
+            results = pool.imap(_fold_in_worker, sequences, chunksize=max(1, chunk_size))
+            for index, (structure, bpp) in enumerate(results):
+                yield index, structure, bpp
+
+    def fold_distinct(self, sequences: List[Optional[str]],
+                      workers: int = 1, chunk_size: Optional[int] = None) -> Iterator[Tuple[int, str, np.ndarray]]:
+        r"""
+        Fold a batch of sequences, each distinct sequence only once.
+
+        The results of a sequence are only kept until its last occurrence has been yielded.
+
+        Parameters
+        ----------
+        sequences: List[Optional[str]]
+            The sequences. Empty ones (or `None`) are skipped.
+        workers: int
+            The number of worker processes. "1" folds in the current process.
+        chunk_size: Optional[int]
+            The number of sequences sent to a worker at a time. Default - spread evenly across the workers.
+
+        Returns
+        -------
+        results: Iterator[Tuple[int, str, np.ndarray]]
+            (index, structure, bpp) of each non-empty sequence, in the input order.
+        """
+
+        # Distinct sequences, in the order of their first occurrence
+        unique_index = dict()
+        sequence_unique = list()
+        for sequence_str in sequences:
+            sequence_unique.append(unique_index.setdefault(sequence_str, len(unique_index)) if sequence_str else -1)
+        last_use = dict()
+        for index, unique in enumerate(sequence_unique):
+            last_use[unique] = index
+
+        if chunk_size is None:
+            chunk_size = max(1, len(unique_index) // (max(1, workers) * 16))
+        fold_results = self.fold_batch(list(unique_index), workers=workers, chunk_size=chunk_size)
+        folded = dict()
+        for index, unique in enumerate(sequence_unique):
+            if unique < 0:
+                continue
+            while unique not in folded:
+                fold_index, structure, bpp = next(fold_results)
+                folded[fold_index] = (structure, bpp)
+            structure, bpp = folded[unique]
+            if last_use[unique] == index:
+                del folded[unique]
+            yield index, structure, bpp
+
+    def options(self) -> Dict:
+        r"""
+        The constructor arguments, used to re-create the backend in the worker processes.
+        """
+        return {}
+
+    # endregion
+
+
+# ----------------------------------
+# region Worker Process
+
+# The backend of the current worker process
+_worker_runner: Optional[BatchFoldRunner] = None
+
+
+def _init_fold_worker(runner_class: Type[BatchFoldRunner], options: Dict):
+    global _worker_runner
+    _worker_runner = runner_class(**options)
+    _worker_runner.start()
+
+
+def _fold_in_worker(sequence_str: str) -> Tuple[str, np.ndarray]:
+    return _worker_runner.fold(sequence_str)
+
+# endregion
+
+
+# ----------------------------------
+# region Backends
+
+class BiersFoldRunner(BatchFoldRunner):
+    r"""
+    Fold with `rna_structure` from Biers, through the MATLAB engine.
+
+    NOTE: The MATLAB engine is started once per process.
+    """
+
+    NAME = 'biers'
+
+    def __init__(self, max_bootstrap: int = 0):
+        self.max_bootstrap = max_bootstrap
+
+    def options(self) -> Dict:
+        return {'max_bootstrap': self.max_bootstrap}
+
+    def start(self) -> None:
+        # Imported here - "matlab.engine" is only available with a MATLAB install
+        from neoRNA.util.runner.matlab_runner import MatlabRunner
+        MatlabRunner.start_engine()
+
+    def stop(self) -> None:
+        from neoRNA.util.runner.matlab_runner import MatlabRunner
+        MatlabRunner.stop_engine()
+        MatlabRunner.MATLAB_ENGINE = None
+
+    def fold(self, sequence_str: str) -> Tuple[str, np.ndarray]:
+        from neoRNA.util.runner.matlab_runner import MatlabRunner
+        biers_seqpos_out = range(1, len(sequence_str))
+        biers_offset = 0  # ALWAYS "0"
+        structure, bpp, bootstrap \
+            = MatlabRunner.rna_structure(sequence_str, biers_offset, biers_seqpos_out,
+                                         max_bootstrap=self.max_bootstrap)
+        return structure, np.array(bpp, dtype=np.float64)
+
+
+class ViennaFoldRunner(BatchFoldRunner):
+    r"""
+    Fold with ViennaRNA - MFE structure and the partition function BPP matrix.
+    """
+
+    NAME = 'vienna'
+
+    def __init__(self):
+        self.__rna = None
+
+    def start(self) -> None:
+        if self.__rna:
+            return
+        try:
+            import RNA
+        except ImportError:
+            raise ValueError("Can't import ViennaRNA Python bindings (\"RNA\" module).\n"
+                             "Please be sure to install ViennaRNA with its Python interface.")
+        self.__rna = RNA
+
+    def fold(self, sequence_str: str) -> Tuple[str, np.ndarray]:
+        self.start()
+        fold_compound = self.__rna.fold_compound(sequence_str)
+        structure, mfe = fold_compound.mfe()
+        fold_compound.exp_params_rescale(mfe)
+        fold_compound.pf()
+        # "bpp()" is 1-indexed, with an unused first row / column, and upper triangular
+        bpp = np.array(fold_compound.bpp(), dtype=np.float64)[1:, 1:]
+        return structure, bpp + bpp.T
+
+
+class StubFoldRunner(BatchFoldRunner):
+    r"""
+    No folding - an open structure and an all-zero BPP matrix.
+    """
+
+    NAME = 'stub'
+
+    def fold(self, sequence_str: str) -> Tuple[str, np.ndarray]:
+        return '.' * len(sequence_str), np.zeros((len(sequence_str), len(sequence_str)))
+
+
+FOLD_BACKENDS: Dict[str, Type[BatchFoldRunner]] = {
+    BiersFoldRunner.NAME: BiersFoldRunner,
+    ViennaFoldRunner.NAME: ViennaFoldRunner,
+    StubFoldRunner.NAME: StubFoldRunner,
+}
+
+
+def get_fold_runner(name: str, **options) -> BatchFoldRunner:
+    r"""
+    Create a fold runner by its backend name - "biers", "vienna" or "stub".
+    """
+    if name not in FOLD_BACKENDS:
+        raise ValueError('Unknown fold backend - {}. Available: {}'.format(name, ', '.join(sorted(FOLD_BACKENDS))))
+    return FOLD_BACKENDS[name](**options)
+
+# endregion
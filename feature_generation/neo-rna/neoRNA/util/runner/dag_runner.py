@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+
+"""
+DAG Runners
+================
+
+A small local executor for the "RNA Lib" pipelines - an alternative to PyPPL.
+
+The pipeline is a list of `Stage`, each depending on zero or more upstream stages:
+- A "per-item" stage runs once per item key. An item is sent to it as soon as all its upstream stages finish that
+    key - items are streamed between the stages, with no "collapse" in between.
+- A "collect" stage (`per_item=False`) runs once, after all its upstream stages finish all the items, on the
+    results of the items that succeeded.
+
+Each stage has its own worker pool, sized by the resource the stage is bound to (see `StageResource`). A failed
+run is retried with an exponential backoff. The items which still fail - and the items downstream of them - are
+reported in the `DagReport`, along with the throughput of each stage.
+
+Usage
+-------
+
+>>> runner = DagRunner([
+...     Stage('fold', fold_item, StageResource.Matlab),
+...     Stage('annotate', annotate_item, StageResource.Io, depends=['fold']),
+...     Stage('summary', summarize, StageResource.Cpu, depends=['annotate'], per_item=False),
+... ])
+>>> report = runner.run([(rna_id, rna_item_json) for rna_id, rna_item_json in items])
+>>> report.ok
+True
+"""
+
+import logging
+import os
+import time
+import traceback
+
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+logger = logging.getLogger('neo_rna.runner')
+
+
+class StageResource(object):
+    r"""
+    The resource a stage is bound to. It decides the kind and the default size of the stage pool.
+    """
+
+    # MATLAB engine - only "1" engine at a time, in its own process
+    Matlab = 'matlab'
+
+    # CPU bound - one process per core
+    Cpu = 'cpu'
+
+    # IO bound, or waiting on external tools - threads
+    Io = 'io'
+
+    @classmethod
+    def default_workers(cls, resource: str) -> int:
+        cpu_count = os.cpu_count() or 1
+        if resource == cls.Matlab:
+            return 1
+        elif resource == cls.Cpu:
+            return cpu_count
+        elif resource == cls.Io:
+            return min(32, cpu_count + 4)
+
+        raise ValueError('Unknown stage resource.', resource)
+
+    @classmethod
+    def uses_processes(cls, resource: str) -> bool:
+        return resource in [cls.Matlab, cls.Cpu]
+
+
+class Stage(object):
+    r"""
+    A stage of the pipeline.
+    """
+
+    def __init__(self, name: str, function: Callable, resource: str = StageResource.Cpu,
+                 workers: Optional[int] = None, depends: Optional[List[str]] = None,
+                 per_item: bool = True, retries: int = 2, backoff: float = 1.0):
+        r"""
+        Init
+
+        Parameters
+        ----------
+        name: str
+            The stage name, unique in the pipeline.
+        function: Callable
+            The function to run, with one argument:
+            - The item value, for a per-item stage with no upstream stage.
+            - The result of the upstream stage, for a stage with one upstream stage.
+            - A dict of the results by upstream stage name, for a stage with several upstream stages.
+            A collect stage gets an `OrderedDict` of these, by item key.
+            NOTE: for the process pools, it needs to be picklable - a module function, or a `functools.partial` of it.
+        resource: str
+            The resource the stage is bound to. See `StageResource`.
+        workers: Optional[int]
+            The size of the stage pool. Default - by the resource.
+        depends: Optional[List[str]]
+            The names of the upstream stages.
+        per_item: bool
+            If the stage runs per item. If not, it is a collect stage.
+        retries: int
+            The number of retries of a failed run.
+        backoff: float
+            The wait (seconds) before the first retry, doubled for each next one.
+        """
+
+        if not name:
+            raise ValueError('Stage name is missing.')
+        if retries < 0 or backoff < 0:
+            raise ValueError('Stage retries / backoff can not be negative.', name)
+
+        self.name: str = name
+        self.function: Callable = function
+        self.resource: str = resource
+        self.workers: int = workers if workers else StageResource.default_workers(resource)
+        self.depends: List[str] = list(depends or [])
+        self.per_item: bool = per_item
+        self.retries: int = retries
+        self.backoff: float = backoff
+
+    def __repr__(self):
+        return 'Stage({!r}, {}, workers={}, depends={})'.format(self.name, self.resource, self.workers, self.depends)
+
+
+# The run stats of a stage
+#   - busy_time: the total run time of the items, in the workers, including the retries.
+#   - wall_time: from the first item sent to the stage, to the last one finished.
+#   - throughput: the finished items per second of "wall_time".
+StageStats = namedtuple('StageStats',
+                        ['stage', 'done', 'failed', 'skipped', 'attempts', 'busy_time', 'wall_time', 'throughput'])
+
+# A failed item of a stage. "key" is `None` for a collect stage.
+StageFailure = namedtuple('StageFailure', ['stage', 'key', 'error', 'attempts'])
+
+
+class DagReport(object):
+    r"""
+    The report of a `DagRunner` run.
+    """
+
+    def __init__(self, stats: 'OrderedDict[str, StageStats]', failures: List[StageFailure],
+                 skipped: 'OrderedDict[str, List[Any]]', results: 'OrderedDict[str, OrderedDict]', wall_time: float):
+        self.stats = stats
+        self.failures = failures
+        self.skipped = skipped
+        self.results = results
+        self.wall_time = wall_time
+
+    @property
+    def ok(self) -> bool:
+        r"""
+        If all the items of all the stages finished.
+        """
+        return not self.failures and not any(self.skipped.values())
+
+    def format(self) -> str:
+        r"""
+        The report, as a text table - one row per stage, then the failures.
+        """
+
+        lines = ['{:<20} {:>8} {:>8} {:>8} {:>8} {:>10} {:>10} {:>10}'.format(
+            'stage', 'done', 'failed', 'skipped', 'attempts', 'busy (s)', 'wall (s)', 'items/s')]
+        for stats in self.stats.values():
+            lines.append('{:<20} {:>8} {:>8} {:>8} {:>8} {:>10.2f} {:>10.2f} {:>10.2f}'.format(*stats))
+        lines.append('Total: {:.2f} s'.format(self.wall_time))
+
+        for failure in self.failures:
+            lines.append('FAILED - {} - {} - after {} attempt(s)\n{}'.format(
+                failure.stage, failure.key, failure.attempts, failure.error))
+
+        return '\n'.join(lines)
+
+
+def _run_task(function: Callable, value: Any, retries: int, backoff: float) -> Tuple[bool, Any, int, float]:
+    r"""
+    Run one item of a stage, in the stage worker, with retries.
+
+    The errors are returned as text rather than raised, since not all of them can be sent back from a worker process.
+
+    Returns
+    -------
+    succeeded: bool
+    result: Any
+        The result, or the error (with its traceback) if it failed.
+    attempts: int
+    busy_time: float
+    """
+
+    start = time.perf_counter()
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            result = function(value)
+            return True, result, attempts, time.perf_counter() - start
+        except Exception:
+            if attempts > retries:
+                return False, traceback.format_exc().strip(), attempts, time.perf_counter() - start
+            time.sleep(backoff * 2 ** (attempts - 1))
+
+
+class DagRunner(object):
+    r"""
+    DAG Runner
+
+    Run the stages of a pipeline on a set of items. See the module doc.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        r"""
+        Init
+
+        Parameters
+        ----------
+        stages: List[Stage]
+            The stages. The upstream stages of a stage need to be listed before it.
+        """
+
+        self.__stages: 'OrderedDict[str, Stage]' = OrderedDict()
+        for stage in stages:
+            if stage.name in self.__stages:
+                raise ValueError('Duplicate stage.', stage.name)
+            for depend in stage.depends:
+                if depend not in self.__stages:
+                    # Either unknown, or not listed before - which is also the case of a cycle
+                    raise ValueError('Unknown upstream stage, or not listed before the stage.', stage.name, depend)
+            if stage.depends:
+                per_item_depends = set(self.__stages[depend].per_item for depend in stage.depends)
+                if len(per_item_depends) > 1:
+                    raise ValueError('The upstream stages need to be either all per-item, or all collect stages.',
+                                     stage.name)
+                if stage.per_item and per_item_depends == {False}:
+                    raise ValueError('A per-item stage can not depend on a collect stage.', stage.name)
+            self.__stages[stage.name] = stage
+
+        if not self.__stages:
+            raise ValueError('No stages to run.')
+
+        # Downstream stages, by stage
+        self.__downstream: Dict[str, List[str]] = dict((name, []) for name in self.__stages)
+        for stage in self.__stages.values():
+            for depend in stage.depends:
+                self.__downstream[depend].append(stage.name)
+
+    @property
+    def stages(self) -> List[Stage]:
+        return list(self.__stages.values())
+
+    def run(self, items: Iterable[Tuple[Any, Any]]) -> DagReport:
+        r"""
+        Run the pipeline.
+
+        Parameters
+        ----------
+        items: Iterable[Tuple[Any, Any]]
+            The (key, value) of each item. The value is the input of the stages with no upstream stage.
+
+        Returns
+        -------
+        report: DagReport
+        """
+
+        items = OrderedDict(items)
+        keys = list(items.keys())
+
+        results: 'OrderedDict[str, OrderedDict]' = OrderedDict((name, OrderedDict()) for name in self.__stages)
+        failed: Dict[str, set] = dict((name, set()) for name in self.__stages)
+        skipped: 'OrderedDict[str, List[Any]]' = OrderedDict((name, []) for name in self.__stages)
+        failures: List[StageFailure] = []
+
+        attempts: Dict[str, int] = dict((name, 0) for name in self.__stages)
+        busy_times: Dict[str, float] = dict((name, 0.0) for name in self.__stages)
+        first_sent: Dict[str, float] = dict()
+        last_done: Dict[str, float] = dict()
+
+        executors: Dict[str, Executor] = dict()
+        pending: Dict[Future, Tuple[str, Any]] = dict()
+
+        def expected(name: str) -> int:
+            return len(keys) if self.__stages[name].per_item else 1
+
+        def settled(name: str) -> int:
+            return len(results[name]) + len(failed[name]) + len(skipped[name])
+
+        def stage_input(stage: Stage, key: Any) -> Any:
+            if not stage.depends:
+                return items[key]
+            if len(stage.depends) == 1:
+                return results[stage.depends[0]][key]
+            return OrderedDict((depend, results[depend][key]) for depend in stage.depends)
+
+        def submit(stage: Stage, key: Any, value: Any) -> None:
+            if stage.name not in executors:
+                pool_type = ProcessPoolExecutor if StageResource.uses_processes(stage.resource) else ThreadPoolExecutor
+                executors[stage.name] = pool_type(max_workers=stage.workers)
+            first_sent.setdefault(stage.name, time.perf_counter())
+            future = executors[stage.name].submit(_run_task, stage.function, value, stage.retries, stage.backoff)
+            pending[future] = (stage.name, key)
+
+        def skip(name: str, key: Any) -> None:
+            r"""
+            Skip an item in the downstream stages of a failed (or skipped) one.
+            """
+            for downstream in self.__downstream[name]:
+                stage = self.__stages[downstream]
+                if not stage.per_item:
+                    # A collect stage only skips the failed items - unless the whole upstream stage failed
+                    if not self.__stages[name].per_item and None not in skipped[downstream]:
+                        skipped[downstream].append(None)
+                        skip(downstream, None)
+                elif key not in skipped[downstream]:
+                    skipped[downstream].append(key)
+                    skip(downstream, key)
+
+        def submit_ready(name: str, key: Any) -> None:
+            r"""
+            Send an item to the per-item downstream stages which have all its upstream results.
+            """
+            for downstream in self.__downstream[name]:
+                stage = self.__stages[downstream]
+                if stage.per_item and all(key in results[depend] for depend in stage.depends):
+                    submit(stage, key, stage_input(stage, key))
+
+        submitted_collects = set()
+
+        def submit_collects() -> None:
+            for stage in self.__stages.values():
+                if stage.per_item or stage.name in submitted_collects or skipped[stage.name]:
+                    continue
+                if any(settled(depend) < expected(depend) for depend in stage.depends):
+                    continue
+
+                submitted_collects.add(stage.name)
+                if not stage.depends:
+                    value = OrderedDict(items)
+                elif not self.__stages[stage.depends[0]].per_item:
+                    value = stage_input(stage, None)
+                else:
+                    value = OrderedDict((key, stage_input(stage, key)) for key in keys
+                                        if all(key in results[depend] for depend in stage.depends))
+                submit(stage, None, value)
+
+        start = time.perf_counter()
+        try:
+            for stage in self.__stages.values():
+                if stage.per_item and not stage.depends:
+                    for key in keys:
+                        submit(stage, key, items[key])
+            submit_collects()
+
+            while pending:
+                done, _ = wait(list(pending.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, key = pending.pop(future)
+                    try:
+                        succeeded, result, task_attempts, busy_time = future.result()
+                    except Exception as error:
+                        # Such as a result which can not be sent back, or a broken worker process
+                        succeeded, result, task_attempts, busy_time = False, repr(error), 1, 0.0
+
+                    attempts[name] += task_attempts
+                    busy_times[name] += busy_time
+                    last_done[name] = time.perf_counter()
+
+                    if succeeded:
+                        results[name][key] = result
+                        submit_ready(name, key)
+                    else:
+                        failed[name].add(key)
+                        failures.append(StageFailure(name, key, result, task_attempts))
+                        logger.error('Stage "{}" failed on "{}", after {} attempt(s): {}'.format(
+                            name, key, task_attempts, result.splitlines()[-1] if result else ''))
+                        skip(name, key)
+
+                submit_collects()
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+        wall_time = time.perf_counter() - start
+
+        stats: 'OrderedDict[str, StageStats]' = OrderedDict()
+        for name in self.__stages:
+            stage_wall_time = last_done[name] - first_sent[name] if name in last_done else 0.0
+            done_count = len(results[name])
+            stats[name] = StageStats(name, done_count, len(failed[name]), len(skipped[name]), attempts[name],
+                                     busy_times[name], stage_wall_time,
+                                     done_count / stage_wall_time if stage_wall_time > 0 else 0.0)
+
+        # The results and the failures in the stage / input order, rather than the finishing order
+        for name, stage in self.__stages.items():
+            if stage.per_item:
+                results[name] = OrderedDict((key, results[name][key]) for key in keys if key in results[name])
+        stage_order = dict((name, index) for index, name in enumerate(self.__stages))
+        key_order = dict((key, index) for index, key in enumerate(keys))
+        failures.sort(key=lambda failure: (stage_order[failure.stage], key_order.get(failure.key, -1)))
+
+        report = DagReport(stats, failures, skipped, results, wall_time)
+        logger.info('DAG run report:\n{}'.format(report.format()))
+
+        return report
@@ -35,14 +35,18 @@ class RnaFoldRunner(object):
     # ----------------------------------
     # region Init
 
-    def __init__(self):
+    def __init__(self, work_folder: Optional[str] = None):
         r"""
         Init
 
         Parameters
         ----------
+        work_folder: Optional[str]
+            The folder RNAfold runs in - for the temp files and its ".ps" outputs. Default to the current folder.
         """
 
+        self.work_folder: Optional[str] = work_folder
+
     # endregion
 
     # ----------------------------------
@@ -80,7 +84,7 @@ class RnaFoldRunner(object):
             content_list.append(constraint)
 
         #
-        FileUtils.save_file(self.DEFAULT_SEQUENCE_FILE, '\n'.join(content_list))
+        FileUtils.save_file(self.__work_file_path(self.DEFAULT_SEQUENCE_FILE), '\n'.join(content_list))
 
         # Call
         cmd = self.BASE_CMD_STR_TEMPLATE.format(flags=' '.join(flag_list),
@@ -88,12 +92,13 @@ class RnaFoldRunner(object):
                                                 output_file=self.DEFAULT_OUTPUT_FILE)
         try:
             # print(cmd)
-            subprocess.call(cmd, shell=True, stdout=subprocess.PIPE)
+            subprocess.call(cmd, shell=True, stdout=subprocess.PIPE, cwd=self.work_folder)
         except OSError as error:
             print('RNAfold command running error - ', error.args)
 
         #
-        result_content_str = FileUtils.load_file_as_str(self.DEFAULT_OUTPUT_FILE, no_newline=False)
+        result_content_str = FileUtils.load_file_as_str(self.__work_file_path(self.DEFAULT_OUTPUT_FILE),
+                                                        no_newline=False)
 
         # Parse the value from the contents
         if not constraint:
@@ -110,8 +115,12 @@ class RnaFoldRunner(object):
 
     def cleanup(self):
         #
-        os.remove(self.DEFAULT_SEQUENCE_FILE) if os.path.exists(self.DEFAULT_SEQUENCE_FILE) else None
-        os.remove(self.DEFAULT_OUTPUT_FILE) if os.path.exists(self.DEFAULT_SEQUENCE_FILE) else None
+        for file_name in [self.DEFAULT_SEQUENCE_FILE, self.DEFAULT_OUTPUT_FILE]:
+            file_path = self.__work_file_path(file_name)
+            os.remove(file_path) if os.path.exists(file_path) else None
+
+    def __work_file_path(self, file_name: str) -> str:
+        return os.path.join(self.work_folder, file_name) if self.work_folder else file_name
 
     # endregion
 
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+
+"""
+SVG Structure Runner
+================
+
+A pure-Python stand-in for `VarnaRunner` - draws the RNA structure straight to SVG, without Java.
+
+It takes the same "options" dicts (including the `highlightRegion` / `annotations` strings made by
+`gen_highlight_region_str` / `gen_annotation_str`), so a script can switch between the two.
+"""
+
+import math
+import multiprocessing
+from xml.sax.saxutils import escape
+
+from typing import List, Dict, Tuple
+
+from neoRNA.structure.pairing import NESTED_BRACKETS, partner_array, to_pair_table
+from neoRNA.util.runner.verna_runner import VarnaRunner
+
+
+class SvgStructureRunner(VarnaRunner):
+    r"""
+    SVG Structure Runner
+
+    The layout is the radial ("naview-like") layout of `simple_xy_coordinates` in ViennaRNA: every loop is drawn
+    as a regular polygon and every stem as a ladder.
+
+    Supported options:
+    - title
+    - highlightRegion - fill / outline of nt ranges
+    - annotations - text next to an anchor nt
+    - bp - color of base pair lines
+    - baseNum - color of the nt numbering ("#FFFFFF" hides it), every `periodNum` nt
+    - resolution - size ratio
+    """
+
+    IMAGE_EXTENSION = 'svg'
+
+    # Layout constants
+    BACKBONE_LENGTH = 15.0
+    NT_RADIUS = 5.5
+    MARGIN = 30.0
+
+    # ----------------------------------
+    # region Init
+
+    def __init__(self, varna_location: str = None):
+        r"""
+        Init
+
+        Parameters
+        ----------
+        varna_location: str
+            Not used - kept so the runner can replace `VarnaRunner` as is.
+
+        """
+        super(SvgStructureRunner, self).__init__(varna_location)
+
+    # endregion
+
+    # ----------------------------------
+    # region Methods - RNA Structure Image
+
+    def gen_struct_image(self, rna_sequence: str, rna_structure: str, out_file: str,
+                         options: dict = None):
+        r"""
+        Generate RNA Structure image, as SVG.
+
+        Parameters
+        ----------
+        rna_sequence: str
+            The RNA sequence
+        rna_structure: str
+            A well-parenthesized expression with dots whose size matches that of the input sequence.
+        out_file: str
+            The output file. Always written as SVG.
+        options: dict
+            The "VARNA" options. Optional.
+
+        Returns
+        -------
+        """
+        render_svg(self.gen_params(rna_sequence, rna_structure, out_file, options))
+
+    def render_batch(self, params_list: List[Dict], workers: int = 1) -> List[int]:
+        r"""
+        Render the images of a batch, across worker processes.
+        """
+        if workers > 1 and len(params_list) > 1:
+            with multiprocessing.Pool(min(workers, len(params_list))) as pool:
+                return pool.map(render_svg, params_list, chunksize=max(1, len(params_list) // (workers * 4)))
+        return [render_svg(params) for params in params_list]
+
+    # endregion
+
+
+# ----------------------------------
+# region Layout
+
+def pair_table(rna_structure: str, brackets: str = '()[]{}<>') -> List[int]:
+    r"""
+    Partner of each nt (start with "1"), "0" if unpaired. `[0]` holds the length, as in ViennaRNA.
+    """
+    return to_pair_table(partner_array(rna_structure, brackets)).tolist() + [0]
+
+
+def radial_layout(rna_structure: str, backbone_length: float = 15.0) -> List[Tuple[float, float]]:
+    r"""
+    (x, y) of each nt - loops as regular polygons, stems as ladders.
+
+    Pseudoknot brackets ("[]", "{}", "<>") are drawn as unpaired.
+    """
+    # Nested pairs only
+    table = pair_table(rna_structure, NESTED_BRACKETS)
+    length = table[0]
+    if length == 0:
+        return []
+    angle = [0.0] * (length + 5)
+
+    def loop(i: int, j: int):
+        # Vertices of the loop polygon - "i" and "j" already
+        count = 2
+        remember = []
+        i_old = i - 1
+        j += 1
+        while i != j:
+            partner = table[i] if i <= length else 0
+            if not partner or i == 0:
+                i += 1
+                count += 1
+            else:
+                count += 2
+                k, l = i, partner
+                remember += [k, l]
+                i = partner + 1
+
+                start_k, start_l = k, l
+                ladder = 0
+                while True:
+                    k += 1
+                    l -= 1
+                    ladder += 1
+                    if not (table[k] == l and table[k] > k):
+                        break
+
+                fill = ladder - 2
+                if ladder >= 2:
+                    # Loop entries and exits get an additional PI / 2
+                    angle[start_k + 1 + fill] += math.pi / 2
+                    angle[start_l - 1 - fill] += math.pi / 2
+                    angle[start_k] += math.pi / 2
+                    angle[start_l] += math.pi / 2
+                    # Straight backbone along the stem
+                    for offset in range(fill, 0, -1):
+                        angle[start_k + offset] = math.pi
+                        angle[start_l - offset] = math.pi
+                if k <= l:
+                    loop(k, l)
+
+        # Bending angle in the loop polygon
+        polygon = math.pi * (count - 2) / count
+        remember.append(j)
+        begin = max(i_old, 0)
+        for index in range(0, len(remember), 2):
+            for offset in range(remember[index] - begin + 1):
+                angle[begin + offset] += polygon
+            if index + 1 < len(remember):
+                begin = remember[index + 1]
+
+    loop(0, length + 1)
+
+    #
+    coordinates = [(0.0, 0.0)]
+    alpha = 0.0
+    for i in range(1, length):
+        x, y = coordinates[-1]
+        coordinates.append((x + backbone_length * math.cos(alpha), y + backbone_length * math.sin(alpha)))
+        alpha += math.pi - angle[i + 1]
+    return coordinates
+
+# endregion
+
+
+# ----------------------------------
+# region SVG
+
+def parse_option_list(option_str: str) -> List[Tuple[str, Dict[str, str]]]:
+    r"""
+    Parse a VARNA option list, like `47-47:fill=#0B4F6C,outline=#FFFFFF;5-5:fill=#C55337`.
+
+    Returns
+    -------
+    options: List[Tuple[str, Dict[str, str]]]
+        (head, {key: value}) of each entry.
+    """
+    entries = []
+    for entry_str in (option_str or '').split(';'):
+        if not entry_str.strip():
+            continue
+        head, _, params_str = entry_str.partition(':')
+        params = dict(param.split('=', 1) for param in params_str.split(',') if '=' in param)
+        entries.append((head, params))
+    return entries
+
+
+def outward_direction(coordinates: List[Tuple[float, float]], table: List[int], index: int) -> Tuple[float, float]:
+    r"""
+    Unit vector pointing away from the structure at nt `index` (start with "0").
+    """
+    x, y = coordinates[index]
+    partner = table[index + 1]
+    if partner:
+        dx, dy = x - coordinates[partner - 1][0], y - coordinates[partner - 1][1]
+    else:
+        neighbours = [coordinates[n] for n in (index - 1, index + 1) if 0 <= n < len(coordinates)]
+        dx = x - sum(n[0] for n in neighbours) / len(neighbours) if neighbours else 0.0
+        dy = y - sum(n[1] for n in neighbours) / len(neighbours) if neighbours else -1.0
+        if len(neighbours) == 1 or math.hypot(dx, dy) < 1e-6:
+            # End of the chain, or straight backbone - perpendicular to it
+            ax, ay = neighbours[0] if neighbours else (x, y + 1.0)
+            dx, dy = -(y - ay), x - ax
+    norm = math.hypot(dx, dy) or 1.0
+    return dx / norm, dy / norm
+
+
+def gen_svg(params: Dict) -> str:
+    r"""
+    The SVG document of one image, from the VARNA-style parameters (see `VarnaRunner.gen_params`).
+    """
+    sequence = params['sequenceDBN']
+    structure = params['structureDBN']
+    if len(sequence) != len(structure):
+        raise ValueError('Sequence and structure lengths differ', sequence, structure)
+
+    scale = float(params.get('resolution', 1.0))
+    backbone_length = SvgStructureRunner.BACKBONE_LENGTH
+    nt_radius = SvgStructureRunner.NT_RADIUS
+    margin = SvgStructureRunner.MARGIN
+    title = str(params.get('title', ''))
+
+    coordinates = radial_layout(structure, backbone_length)
+    table = pair_table(structure, NESTED_BRACKETS)
+
+    # Shift into the view box
+    min_x = min([x for x, y in coordinates] or [0.0])
+    min_y = min([y for x, y in coordinates] or [0.0])
+    max_x = max([x for x, y in coordinates] or [0.0])
+    max_y = max([y for x, y in coordinates] or [0.0])
+    top = margin + (20.0 if title else 0.0)
+    coordinates = [(x - min_x + margin, y - min_y + top) for x, y in coordinates]
+    width = max_x - min_x + 2 * margin
+    height = max_y - min_y + margin + top
+
+    # Highlights / annotations
+    fills = dict()
+    for nt_range, region in parse_option_list(params.get('highlightRegion')):
+        start, _, end = nt_range.partition('-')
+        for position in range(int(start), int(end or start) + 1):
+            fills[position] = (region.get('fill', SvgStructureRunner.DEFAULT_HIGHLIGHT_REGION_OPTIONS['fill']),
+                               region.get('outline', SvgStructureRunner.DEFAULT_HIGHLIGHT_REGION_OPTIONS['outline']))
+
+    elements = ['<rect width="100%" height="100%" fill="#FFFFFF"/>']
+    if title:
+        elements.append('<text x="{:.1f}" y="{:.1f}" font-size="14" text-anchor="middle" '
+                        'font-family="Helvetica,Arial,sans-serif">{}</text>'.format(width / 2, margin, escape(title)))
+
+    # Backbone and base pairs
+    if coordinates:
+        elements.append('<polyline fill="none" stroke="#999999" stroke-width="1" points="{}"/>'.format(
+            ' '.join('{:.1f},{:.1f}'.format(x, y) for x, y in coordinates)))
+    pair_color = params.get('bp', '#000000')
+    for position in range(1, len(structure) + 1):
+        partner = table[position]
+        if partner > position:
+            (x1, y1), (x2, y2) = coordinates[position - 1], coordinates[partner - 1]
+            elements.append('<line x1="{:.1f}" y1="{:.1f}" x2="{:.1f}" y2="{:.1f}" stroke="{}" '
+                            'stroke-width="1.5"/>'.format(x1, y1, x2, y2, pair_color))
+
+    # nt
+    for position, ((x, y), nt) in enumerate(zip(coordinates, sequence), 1):
+        text_color = '#000000'
+        if position in fills:
+            fill, outline = fills[position]
+            elements.append('<circle cx="{:.1f}" cy="{:.1f}" r="{:.1f}" fill="{}" stroke="{}"/>'.format(
+                x, y, nt_radius, fill, outline))
+            text_color = '#FFFFFF'
+        elements.append('<text x="{:.1f}" y="{:.1f}" font-size="8" text-anchor="middle" dominant-baseline="central" '
+                        'font-family="Helvetica,Arial,sans-serif" fill="{}">{}</text>'.format(
+                            x, y, text_color, escape(nt)))
+
+    # nt numbering
+    number_color = params.get('baseNum', '#FFFFFF')
+    period = int(params.get('periodNum', 10))
+    if number_color.upper() != '#FFFFFF':
+        for position in list(range(period, len(sequence) + 1, period)):
+            dx, dy = outward_direction(coordinates, table, position - 1)
+            x, y = coordinates[position - 1]
+            elements.append('<text x="{:.1f}" y="{:.1f}" font-size="6" text-anchor="middle" '
+                            'dominant-baseline="central" font-family="Helvetica,Arial,sans-serif" '
+                            'fill="{}">{}</text>'.format(x + dx * 2.2 * nt_radius, y + dy * 2.2 * nt_radius,
+                                                         number_color, position))
+
+    # Annotations
+    for annotation_str, annotation in parse_option_list(params.get('annotations')):
+        anchor = int(annotation.get('anchor', 0))
+        if not 1 <= anchor <= len(coordinates):
+            continue
+        dx, dy = outward_direction(coordinates, table, anchor - 1)
+        x, y = coordinates[anchor - 1]
+        elements.append('<text x="{:.1f}" y="{:.1f}" font-size="{}" text-anchor="middle" dominant-baseline="central" '
+                        'font-family="Helvetica,Arial,sans-serif" fill="{}">{}</text>'.format(
+                            x + dx * 4 * nt_radius, y + dy * 4 * nt_radius,
+                            annotation.get('size', '6'), annotation.get('outline', '#000000'),
+                            escape(annotation_str)))
+
+    return '\n'.join([
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{:.0f}" height="{:.0f}" viewBox="0 0 {:.1f} {:.1f}">'.format(
+            width * scale, height * scale, width, height),
+    ] + elements + ['</svg>', ''])
+
+
+def render_svg(params: Dict) -> int:
+    r"""
+    Write the SVG of one image into `params['o']`.
+
+    Returns
+    -------
+    return_code: int
+        "0" on success, as `VarnaRunner.render_batch`.
+    """
+    try:
+        svg_str = gen_svg(params)
+    except ValueError as error:
+        print('SVG rendering error - ', error.args)
+        return 1
+    with open(params['o'], 'w') as outfile:
+        outfile.write(svg_str)
+    return 0
+
+# endregion
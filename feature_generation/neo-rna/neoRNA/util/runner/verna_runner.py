@@ -9,8 +9,16 @@ The running wrapper for "VARNA.jar"
 
 import os
 import subprocess
+import hashlib
+import json
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
-from typing import List
+from typing import List, Dict
+
+
+# The outcome of `VarnaRunner.render_struct_images` - the image files, by what happened to them
+StructImageReport = namedtuple('StructImageReport', ['rendered_files', 'failed_files', 'up_to_date_files'])
 
 
 class VarnaRunner(object):
@@ -23,6 +31,12 @@ class VarnaRunner(object):
     """
 
     BASE_CMD_STR_TEMPLATE = 'java -cp {} fr.orsay.lri.varna.applications.VARNAcmd {}'
+    # The image format used by the scripts
+    IMAGE_EXTENSION = 'png'
+    BASE_CMD = ['java', '-cp', '{varna_location}', 'fr.orsay.lri.varna.applications.VARNAcmd']
+
+    # Per-folder record of the rendered images - "file name" -> "render key"
+    MANIFEST_FILE = '.varna_manifest.json'
 
     # Default options used for "VARNA.jar"
     DEFAULT_OPTIONS = {
@@ -70,7 +84,7 @@ class VarnaRunner(object):
         """
 
         self.varna_location = varna_location
-        self.varna_options = self.DEFAULT_OPTIONS
+        self.varna_options = dict(self.DEFAULT_OPTIONS)
 
     # endregion
 
@@ -117,6 +131,158 @@ class VarnaRunner(object):
         except OSError as error:
             print('VARNA.jar command running error - ', error.args)
 
+    def gen_struct_images(self, jobs: List[Dict], workers: int = 1, skip_existing: bool = True) -> List[str]:
+        r"""
+        Generate many RNA Structure images, in parallel.
+
+        Each job is a dict with `sequence`, `structure`, `out_file` and optional `options` (as in `gen_struct_image`).
+        An image is skipped when it exists and was rendered from the same sequence, structure and options - the
+        "render key" of each image is kept in a manifest file of its output folder.
+
+        Parameters
+        ----------
+        jobs: List[Dict]
+            The image jobs.
+        workers: int
+            The number of VARNA processes to run at a time.
+        skip_existing: bool
+            If skip the images which are up to date.
+
+        Returns
+        -------
+        rendered_files: List[str]
+            The images rendered by this call. See `render_struct_images` for the failed / skipped ones.
+        """
+
+        return self.render_struct_images(jobs, workers, skip_existing).rendered_files
+
+    def render_struct_images(self, jobs: List[Dict], workers: int = 1,
+                             skip_existing: bool = True) -> StructImageReport:
+        r"""
+        The same as `gen_struct_images` - with the images which failed, and the ones skipped as up to date.
+
+        Returns
+        -------
+        report: StructImageReport
+        """
+
+        #
+        manifests = dict()
+        pending = list()
+        up_to_date_files = list()
+        for job in jobs:
+            params = self.gen_params(job['sequence'], job['structure'], job['out_file'], job.get('options'))
+            out_folder, out_file_name = os.path.split(os.path.abspath(job['out_file']))
+            if out_folder not in manifests:
+                manifests[out_folder] = self.load_manifest(out_folder)
+
+            #
+            render_key = self.gen_render_key(params)
+            if skip_existing and os.path.exists(job['out_file']) \
+                    and manifests[out_folder].get(out_file_name) == render_key:
+                up_to_date_files.append(os.path.join(out_folder, out_file_name))
+                continue
+            pending.append((out_folder, out_file_name, render_key, params))
+
+        #
+        return_codes = self.render_batch([params for _, _, _, params in pending], workers)
+
+        #
+        rendered_files = list()
+        failed_files = list()
+        for (out_folder, out_file_name, render_key, params), return_code in zip(pending, return_codes):
+            if return_code != 0:
+                manifests[out_folder].pop(out_file_name, None)
+                failed_files.append(os.path.join(out_folder, out_file_name))
+                continue
+            manifests[out_folder][out_file_name] = render_key
+            rendered_files.append(os.path.join(out_folder, out_file_name))
+
+        for out_folder, manifest in manifests.items():
+            self.save_manifest(out_folder, manifest)
+
+        return StructImageReport(rendered_files, failed_files, up_to_date_files)
+
+    def render_batch(self, params_list: List[Dict], workers: int = 1) -> List[int]:
+        r"""
+        Render the images of a batch, one VARNA process per image.
+
+        Parameters
+        ----------
+        params_list: List[Dict]
+            The final parameters of each image, see `gen_params`.
+        workers: int
+            The number of VARNA processes to run at a time.
+
+        Returns
+        -------
+        return_codes: List[int]
+            "0" for each image rendered successfully.
+        """
+
+        cmds = [self.gen_cmd(params) for params in params_list]
+
+        # Each job is a "java" process - threads are enough to run them in parallel
+        if workers > 1 and len(cmds) > 1:
+            with ThreadPool(min(workers, len(cmds))) as pool:
+                return_codes = pool.map(_run_cmd, cmds, chunksize=1)
+        else:
+            return_codes = [_run_cmd(cmd) for cmd in cmds]
+
+        for cmd, return_code in zip(cmds, return_codes):
+            if return_code != 0:
+                print('VARNA.jar command running error - ', return_code, ' '.join(cmd))
+        return return_codes
+
+    def gen_params(self, rna_sequence: str, rna_structure: str, out_file: str, options: dict = None) -> Dict:
+        r"""
+        The final VARNA parameters of one image - the options of the runner (`varna_options`), updated by `options`.
+        """
+        params = {
+            'sequenceDBN': rna_sequence,
+            'structureDBN': rna_structure,
+            'o': out_file,
+        }
+        params.update(self.varna_options)
+        if options:
+            params.update(options)
+        return params
+
+    def gen_cmd(self, params: Dict) -> List[str]:
+        r"""
+        The VARNA command, as an argument list (no shell).
+        """
+        cmd = [arg.format(varna_location=self.varna_location) for arg in self.BASE_CMD]
+        for param, value in params.items():
+            cmd += ['-{}'.format(param), str(value)]
+        return cmd
+
+    @classmethod
+    def gen_render_key(cls, params: Dict) -> str:
+        r"""
+        The hash of everything which affects an image - sequence, structure and options.
+        """
+        key_params = {param: str(value) for param, value in params.items() if param != 'o'}
+        return hashlib.sha1(json.dumps(key_params, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def load_manifest(cls, out_folder: str) -> Dict[str, str]:
+        manifest_file = os.path.join(out_folder, cls.MANIFEST_FILE)
+        if not os.path.exists(manifest_file):
+            return dict()
+        try:
+            with open(manifest_file) as infile:
+                return json.load(infile)
+        except ValueError:
+            return dict()
+
+    @classmethod
+    def save_manifest(cls, out_folder: str, manifest: Dict[str, str]):
+        if not os.path.isdir(out_folder):
+            return
+        with open(os.path.join(out_folder, cls.MANIFEST_FILE), 'w') as outfile:
+            json.dump(manifest, outfile, sort_keys=True, indent=1)
+
     # endregion
 
     # ----------------------------------
@@ -144,7 +310,7 @@ class VarnaRunner(object):
         region_str_list = []
         for region_options in regions:
             #
-            options = self.DEFAULT_HIGHLIGHT_REGION_OPTIONS
+            options = dict(self.DEFAULT_HIGHLIGHT_REGION_OPTIONS)
             options.update(region_options)
 
             #
@@ -185,7 +351,7 @@ class VarnaRunner(object):
         annotation_str_list = []
         for annotation_options in annotations:
             #
-            options = self.DEFAULT_ANNOTATION_OPTIONS
+            options = dict(self.DEFAULT_ANNOTATION_OPTIONS)
             options.update(annotation_options)
 
             #
@@ -270,3 +436,16 @@ class VarnaRunner(object):
         return separator.join(param_str_items)
 
     # endregion
+
+
+# ----------------------------------
+# region Utils
+
+def _run_cmd(cmd: List[str]) -> int:
+    try:
+        return subprocess.call(cmd, stdout=subprocess.DEVNULL)
+    except OSError as error:
+        print('VARNA.jar command running error - ', error.args)
+        return -1
+
+# endregion
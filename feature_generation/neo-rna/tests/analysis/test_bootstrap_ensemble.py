@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import pickle
+
+import numpy as np
+import pytest
+
+from neoRNA.analysis.bootstrap_ensemble import BootstrapEnsemble, bootstrap_feature_columns, ANNOTATION_CODES
+from neoRNA.analysis.feature_engine import CompiledStructure, FeatureEngine
+from neoRNA.structure.bp_rna_annotator import BpRnaAnnotator
+
+parametrize = pytest.mark.parametrize
+
+SEQUENCE = 'GGGAAACCCAGGCAAAAGCUUAA'
+STRUCTURE_1 = '(((...)))..((.(....))).'
+STRUCTURE_2 = '((.....))..((......))..'
+STRUCTURE_3 = '.......................'
+
+ITEMS = [
+    {'rna_id': '001', 'sequence_string': SEQUENCE,
+     'bootstrap_structures': [STRUCTURE_1, STRUCTURE_2, STRUCTURE_1, STRUCTURE_3]},
+    {'rna_id': '002', 'sequence_string': SEQUENCE,
+     'bootstrap_structures': [STRUCTURE_2, STRUCTURE_2]},
+    {'rna_id': '003', 'sequence_string': SEQUENCE},
+]
+
+
+@pytest.fixture
+def ensemble():
+    return BootstrapEnsemble.from_items(ITEMS)
+
+
+class TestBootstrapEnsemble(object):
+
+    def test_dedup(self, ensemble):
+        assert ensemble.rna_ids == ['001', '002'] and '003' not in ensemble
+        # Deduplicated across the items
+        assert ensemble.structure_count == 3
+        assert ensemble.structure_ids('001').tolist() == [0, 1, 2]
+        assert ensemble.counts('001').tolist() == [2, 1, 1]
+        assert ensemble.structure_ids('002').tolist() == [1]
+
+        # A replicate merges the counts
+        ensemble.add('002', SEQUENCE, [STRUCTURE_1, STRUCTURE_2])
+        assert ensemble.structure_count == 3
+        assert ensemble.structure_ids('002').tolist() == [0, 1]
+        assert ensemble.counts('002').tolist() == [1, 3]
+        assert ensemble.weights('002').tolist() == [0.25, 0.75]
+
+    def test_annotation(self, ensemble):
+        assert BpRnaAnnotator.format_st(ensemble.annotation(1)) == BpRnaAnnotator.to_st(SEQUENCE, STRUCTURE_2)
+
+        restored = pickle.loads(pickle.dumps(ensemble))
+        assert restored.counts('001').tolist() == [2, 1, 1]
+        assert restored.annotation(0).structure_array == ensemble.annotation(0).structure_array
+
+    def test_position_profile(self, ensemble):
+        profile = ensemble.position_profile('001')
+        assert profile.shape == (len(SEQUENCE), len(ANNOTATION_CODES))
+        assert np.allclose(profile.sum(axis=1), 1)
+
+        # Reference - loop over the bootstraps
+        weights = ensemble.weights('001')
+        for column, code in enumerate(ANNOTATION_CODES):
+            expected = [sum(weight for structure_id, weight in zip(ensemble.structure_ids('001'), weights)
+                            if ensemble.annotation(structure_id).structure_array[position] == code)
+                        for position in range(len(SEQUENCE))]
+            assert np.allclose(profile[:, column], expected)
+
+        assert ensemble.element_frequencies('001', 1) == \
+            dict(zip(ANNOTATION_CODES, profile[0].tolist()))
+
+    def test_features(self, ensemble):
+        columns = bootstrap_feature_columns()
+        row = dict(zip(columns, ensemble.features('001', 2)))
+        assert row['bootstrap_structure_count'] == 3
+        assert row['bootstrap_top_frequency'] == 0.5
+        assert row['bootstrap_site_S_frequency'] == 0.75
+        assert row['bootstrap_site_E_frequency'] == 0.25
+
+        # Weighted over the structures with the site in a stem
+        engine = FeatureEngine(['site_length_stem'])
+        lengths = [engine.extract(CompiledStructure.from_bprna(BpRnaAnnotator.to_st(SEQUENCE, structure)), 2)[0][0]
+                   for structure in [STRUCTURE_1, STRUCTURE_2]]
+        assert row['bootstrap_expected_site_length_stem'] == pytest.approx((2 * lengths[0] + lengths[1]) / 3)
+
+        assert ensemble.features('003', 2) == [None] * len(columns)
+
+    def test_invalid_structures(self, ensemble):
+        # A pseudoknot, and a replicate of another length - both left out
+        ensemble.add('001', SEQUENCE, ['((..[[..))..]]...' + '.' * 6])
+        ensemble.add('001', SEQUENCE[:-1], [STRUCTURE_3[:-1]] * 4)
+        assert ensemble.structure_ids('001').tolist() == [0, 1, 2, 3, 4]
+        structure_ids, weights = ensemble.valid_structures('001')
+        assert structure_ids.tolist() == [0, 1, 2] and weights.tolist() == [0.5, 0.25, 0.25]
+
+        assert ensemble.position_profile('001').shape == (len(SEQUENCE), len(ANNOTATION_CODES))
+        assert np.allclose(ensemble.position_profile('001').sum(axis=1), 1)
+        assert ensemble.features('001', 2)[:2] == [3, 0.5]
+
+        # No valid structures
+        ensemble.add('004', SEQUENCE, ['((..[[..))..]]...' + '.' * 6])
+        assert np.isnan(ensemble.position_profile('004')).all()
+        assert set(ensemble.element_frequencies('004', 2).values()) == {None}
+        assert ensemble.features('004', 2) == [None] * len(bootstrap_feature_columns())
+        with pytest.raises(ValueError):
+            ensemble.annotation(ensemble.structure_ids('004')[0])
+
+    def test_given_annotations(self, ensemble):
+        # A pseudoknot with its annotation given (as bpRNA.pl's) - counted, not left out
+        pseudoknot = '((..[[..))..]]...' + '.' * 6
+        pseudoknot_annotation = BpRnaAnnotator.to_st(SEQUENCE, STRUCTURE_1).replace(STRUCTURE_1, pseudoknot)
+        ensemble.add('001', SEQUENCE, [pseudoknot], counts=[4], annotations=[pseudoknot_annotation])
+        assert ensemble.counts('001').tolist() == [2, 1, 1, 4]
+        assert ensemble.is_valid(3)
+        assert ensemble.structure_array(3) == ensemble.annotation(0).structure_array
+        with pytest.raises(ValueError):
+            ensemble.annotation(3)
+
+        structure_ids, weights = ensemble.valid_structures('001')
+        assert structure_ids.tolist() == [0, 1, 2, 3] and weights.tolist() == [0.25, 0.125, 0.125, 0.5]
+        assert ensemble.features('001', 2)[:2] == [4, 0.5]
+        assert np.allclose(ensemble.position_profile('001').sum(axis=1), 1)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+import numpy as np
+import pytest
+
+from neoRNA.analysis.bpp_features import BPP_SITE_FEATURES, BPP_MUTATION_FEATURES, compute_library, \
+    to_bpp_matrix
+
+parametrize = pytest.mark.parametrize
+
+
+def random_bpp(length, seed):
+    r"""
+    An upper triangular BPP matrix, each position paired with a total probability below "1".
+    """
+    random_state = np.random.RandomState(seed)
+    bpp = np.triu(random_state.rand(length, length) ** 4, k=4)
+    scale = np.maximum((bpp + bpp.T).sum(axis=1), 1)
+    return (bpp / np.maximum.outer(scale, scale)).tolist()
+
+
+def reference_features(bpp, site, mutation_positions, window=3):
+    r"""
+    One position at a time.
+    """
+    matrix = np.array(bpp)
+    matrix = np.maximum(matrix, matrix.T)
+    length = len(matrix)
+
+    def unpaired(i):
+        return max(0.0, 1 - sum(matrix[i]))
+
+    def entropy(i):
+        probabilities = [p for p in list(matrix[i]) + [unpaired(i)] if p > 0]
+        return -sum(p * math.log(p) for p in probabilities)
+
+    s = site - 1
+    window_positions = range(max(s - window, 0), min(s + window + 1, length))
+    site_row = [sum(matrix[s][:s]), sum(matrix[s][s + 1:]), max(matrix[s])]
+    site_values = [unpaired(s), entropy(s)] + site_row + [
+        unpaired(s - 1) if s > 0 else None,
+        unpaired(s + 1) if s < length - 1 else None,
+        sum(unpaired(i) for i in window_positions) / len(window_positions),
+        sum(entropy(i) for i in window_positions) / len(window_positions),
+    ]
+
+    mutation_values = []
+    for position in mutation_positions:
+        m = position - 1
+        direct = abs(m - s)
+        expected = unpaired(m) * direct + sum(matrix[m][j] * min(direct, 1 + abs(j - s)) for j in range(length))
+        mutation_values.append([unpaired(m), matrix[m][s], expected])
+
+    return site_values, mutation_values
+
+
+ENTRIES = [
+    (random_bpp(30, 1), 10, [3, 25]),
+    (random_bpp(12, 2), 1, [12]),
+    (random_bpp(45, 3), 45, []),
+    (random_bpp(20, 4), 7, [7, 18, 1]),
+]
+
+
+def assert_values(values, expected):
+    assert len(values) == len(expected)
+    for value, expected_value in zip(values, expected):
+        if expected_value is None:
+            assert value is None
+        else:
+            assert value == pytest.approx(expected_value)
+
+
+class TestBppFeatures(object):
+
+    def test_to_bpp_matrix(self):
+        matrix = to_bpp_matrix([[0.5, 0.2, 0], [0, 0, 0.1], [0, 0, 0]])
+        assert matrix.tolist() == [[0, 0.2, 0], [0.2, 0, 0.1], [0, 0.1, 0]]
+
+        with pytest.raises(ValueError):
+            to_bpp_matrix([[0, 0.1]])
+
+    @parametrize('max_chunk_cells', [1, 1000, 2 ** 24])
+    def test_compute_library(self, max_chunk_cells):
+        results = compute_library(ENTRIES, max_chunk_cells=max_chunk_cells)
+        assert len(results) == len(ENTRIES)
+
+        for (bpp, site, mutation_positions), result in zip(ENTRIES, results):
+            site_values, mutation_values = reference_features(bpp, site, mutation_positions)
+            assert len(result.site) == len(BPP_SITE_FEATURES)
+            assert_values(result.site, site_values)
+            assert len(result.mutations) == len(mutation_positions)
+            for values, expected in zip(result.mutations, mutation_values):
+                assert len(values) == len(BPP_MUTATION_FEATURES)
+                assert_values(values, expected)
+            assert len(result.unpaired) == len(bpp) and len(result.entropy) == len(bpp)
+
+    def test_missing(self):
+        results = compute_library([(None, 5, [1]), (random_bpp(10, 5), None, [2, None, 40])])
+
+        assert results[0].site == [None] * len(BPP_SITE_FEATURES)
+        assert results[0].mutations == [[None] * len(BPP_MUTATION_FEATURES)]
+
+        # No site - only the unpaired probability of a mutation
+        assert results[1].site == [None] * len(BPP_SITE_FEATURES)
+        assert results[1].mutations[0][0] is not None and results[1].mutations[0][1:] == [None, None]
+        assert results[1].mutations[1:] == [[None] * len(BPP_MUTATION_FEATURES)] * 2
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import math
+import pytest
+
+from neoRNA.analysis.ensemble_probability import KT, PAIR_TYPES, MIN_HAIRPIN, LocalEnsembleBackend, \
+    decode_soft_pairs, pair_column_names, get_ensemble_backend, compute_library
+
+parametrize = pytest.mark.parametrize
+
+
+def enumerate_structures(sequence_str):
+    r"""
+    All nested structures with canonical pairs - the brute force ensemble.
+    """
+
+    def pairs_in(i, j):
+        if i > j:
+            yield []
+            return
+        yield from pairs_in(i + 1, j)
+        for k in range(i + MIN_HAIRPIN + 1, j + 1):
+            if (sequence_str[i], sequence_str[k]) in PAIR_TYPES:
+                for inside in pairs_in(i + 1, k - 1):
+                    for outside in pairs_in(k + 1, j):
+                        yield [(i, k)] + inside + outside
+
+    for pairs in pairs_in(0, len(sequence_str) - 1):
+        structure = ['.'] * len(sequence_str)
+        for i, j in pairs:
+            structure[i], structure[j] = '(', ')'
+        yield ''.join(structure)
+
+
+class TestLocalEnsembleBackend(object):
+
+    @parametrize('sequence_str', ['GGGGAAACCCCAGGGAAA', 'GCCUGAUACGAGUCGG', 'GGACAAAAGUCGCAAAAGCAUCC'])
+    def test_brute_force(self, sequence_str):
+        backend = LocalEnsembleBackend()
+        energies = {structure: backend.structure_energy(sequence_str, structure)
+                    for structure in enumerate_structures(sequence_str)}
+        weights = {structure: math.exp(-energy / KT) for structure, energy in energies.items()
+                   if math.isfinite(energy)}
+        partition = sum(weights.values())
+
+        # Partition function
+        ensemble_fe = backend.ensemble_free_energy(sequence_str)
+        assert ensemble_fe == pytest.approx(-KT * math.log(partition))
+
+        # Target structure
+        mfe_structure = min(energies, key=energies.get)
+        result = backend.compute(sequence_str, target_structure=mfe_structure)
+        assert math.exp(result.log_p_structure) == pytest.approx(weights[mfe_structure] / partition)
+
+        # Constraint - the first 3 nt unpaired
+        constraint = 'xxx' + '.' * (len(sequence_str) - 3)
+        result = backend.compute(sequence_str, constraint=constraint)
+        expected = sum(weight for structure, weight in weights.items() if structure.startswith('...')) / partition
+        assert math.exp(result.log_p_constraint) == pytest.approx(expected)
+
+        # Soft pairs
+        soft_pairs = decode_soft_pairs(mfe_structure)
+        result = backend.compute(sequence_str, soft_pairs=soft_pairs)
+        for (i, j), probability in zip(soft_pairs, result.pair_probabilities):
+            expected = sum(weight for structure, weight in weights.items()
+                           if (i, j) in decode_soft_pairs(structure)) / partition
+            assert probability == pytest.approx(expected)
+
+    def test_constraint(self):
+        backend = LocalEnsembleBackend()
+        sequence_str = 'GGGGAAACCCCAGGGAAA'
+        # Not enforced - the pair may stay open
+        assert backend.ensemble_free_energy(sequence_str, '(' + '.' * 9 + ')' + '.' * 7) \
+            <= backend.ensemble_free_energy(sequence_str, '(' + '.' * 9 + ')' + '.' * 7, enforce_pairs=True)
+        # No structure is compatible
+        assert backend.ensemble_free_energy(sequence_str, 'x' * 4 + '|' + '.' * 13) == math.inf
+        # Non-canonical target pair
+        assert backend.structure_energy('GGGGAAAACCAC', '((((....))))') == math.inf
+        with pytest.raises(ValueError):
+            backend.ensemble_free_energy(sequence_str, '?' * len(sequence_str))
+
+
+class TestLibrary(object):
+
+    def test_decode_soft_pairs(self):
+        assert decode_soft_pairs('((.x.)).)') == [(1, 5), (0, 6)]
+        assert pair_column_names([(1, 5)]) == ['p_pair_2_6']
+
+    @parametrize('workers', [1, 2])
+    def test_compute_library(self, workers):
+        sequences = ['GGGGAAACCCCAGGGAAA', 'GGGGAAACCCCUGGGAAA', 'GGGTAAACCCCAGGGAAA']
+        backend = get_ensemble_backend('local')
+        results = list(compute_library(sequences, backend, target_structure='((((...))))' + '.' * 7,
+                                       constraint='((((...))))' + '.' * 7, soft_pairs=[(0, 10), (3, 7)],
+                                       workers=workers))
+        assert len(results) == 3
+        for sequence_str, result in zip(sequences, results):
+            expected = backend.compute(sequence_str, target_structure='((((...))))' + '.' * 7,
+                                       constraint='((((...))))' + '.' * 7, soft_pairs=[(0, 10), (3, 7)])
+            assert result.ensemble_fe == pytest.approx(expected.ensemble_fe)
+            assert result.log_p_structure <= result.log_p_constraint <= 0
+            assert len(result.pair_probabilities) == 2
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            get_ensemble_backend('mfold')
+
+    def test_auto_backend(self):
+        try:
+            import RNA  # noqa: F401
+            expected = 'vienna'
+        except ImportError:
+            expected = 'local'
+        assert get_ensemble_backend('auto').NAME == expected
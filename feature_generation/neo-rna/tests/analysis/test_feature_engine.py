@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+
+import functools
+import gzip
+import io
+import json
+import os
+import pickle
+import sys
+import zipfile
+
+import numpy as np
+import pytest
+
+from neoRNA.analysis.editing_analysis import EditingAnalysis
+from neoRNA.analysis.feature_engine import CompiledStructure, FeatureEngine, FeatureRegistry, \
+    ml_feature_columns, rf_feature_columns, MUTATION_FEATURES
+from neoRNA.io.bp_rna_io import BpRnaIO
+from neoRNA.structure import SecondaryStructureElementType
+from neoRNA.structure.bp_rna_annotator import BpRnaAnnotator
+
+parametrize = pytest.mark.parametrize
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+EXAMPLE_FILE_PATH = os.path.join(TESTS_DIR, 'io', 'example_files', 'bprna_example.st')
+FEATURE_GENERATION_DIR = os.path.dirname(os.path.dirname(TESTS_DIR))
+REPO_DIR = os.path.dirname(FEATURE_GENERATION_DIR)
+BPRNA_FILE_PATH = os.path.join(REPO_DIR, 'bpRNA_wrapper', 'bpRNA.txt.gz')
+
+
+# ----------------------------------
+# region Test Data
+
+SOURCE_DATA_DIR = os.path.join(REPO_DIR, 'source_data')
+
+# The structure summaries of the other substrates - (file, member in the zip file, structure key)
+SUBSTRATE_SUMMARIES = {
+    'TTYH2_BC': (os.path.join('2018_08_24-TTYH2-Struct_Summary', 'TTYH2_BC', '1', 'rna_lib-structure-summary.json.gz'),
+                 None, 'experimental_structure'),
+    'TTYH2_ECS_BC': (os.path.join('2018_08_24-TTYH2-Struct_Summary', 'TTYH2_ECS_BC', '1',
+                                  'rna_lib-structure-summary.json.gz'),
+                     None, 'experimental_structure'),
+    'AJUBA_BC': (os.path.join('2018_11_13-AJUBA_BC-Structure_Summary-Reference_Only', 'rna_lib-structure_summary.json.zip'),
+                 'rna_lib-structure_summary.json', 'reference_structure'),
+}
+SUBSTRATES = ['NEIL1'] + sorted(SUBSTRATE_SUMMARIES)
+
+
+def load_neil1_records(limit=None):
+    r"""
+    The example record plus the bundled NEIL1 "inferred" bpRNA records, as "#Name..." texts.
+    """
+
+    with open(EXAMPLE_FILE_PATH) as handle:
+        records = [handle.read()]
+
+    if os.path.exists(BPRNA_FILE_PATH):
+        with gzip.open(BPRNA_FILE_PATH, 'rt') as handle:
+            chunks = handle.read().split('>')
+        for chunk in chunks:
+            header, _, body = chunk.partition('\n')
+            if header.endswith(',inferred'):
+                records.append(body.strip() + '\n')
+            if limit and len(records) > limit:
+                break
+
+    return records
+
+
+@functools.lru_cache(maxsize=None)
+def load_summary_items(substrate):
+    file_name, member, structure_key = SUBSTRATE_SUMMARIES[substrate]
+    file_path = os.path.join(SOURCE_DATA_DIR, file_name)
+    if not os.path.exists(file_path):
+        return []
+
+    if member:
+        with zipfile.ZipFile(file_path) as archive:
+            with archive.open(member) as handle:
+                summary = json.load(handle)
+    else:
+        with gzip.open(file_path, 'rt') as handle:
+            summary = json.load(handle)
+
+    # NOTE: the (rare) pseudoknotted structures are left out - the bpRNA annotator does not support them
+    return [(item['rna_id'], item['sequence_string'], item[structure_key]) for item in summary['items']
+            if item.get(structure_key) and set(item[structure_key]) <= set('().')]
+
+
+def load_records(substrate='NEIL1', limit=None):
+    r"""
+    The bpRNA records of a substrate, as "#Name..." texts.
+
+    - NEIL1: the bundled bpRNA records.
+    - The others: annotated from the structures of their structure summary.
+    """
+
+    if substrate == 'NEIL1':
+        return load_neil1_records(limit)
+
+    items = load_summary_items(substrate)
+    if not items:
+        pytest.skip('The structure summary of {} is not available'.format(substrate))
+
+    return [BpRnaAnnotator.to_st(sequence_str, dot_bracket_str, name=rna_id)
+            for rna_id, sequence_str, dot_bracket_str in items[:limit]]
+
+
+def legacy_stem_length_defined(features, site_index):
+    r"""
+    If the legacy `get_structure_length` finds a stem run - at or 5' of the site, not touching the first "nt".
+    """
+
+    stem_end = next((index for index in range(site_index, 0, -1) if features[index] == 'S'), None)
+    if stem_end is None:
+        return False
+    return any(features[index] != 'S' for index in range(stem_end, 0, -1))
+
+
+# endregion
+
+
+# ----------------------------------
+# region Legacy Reference - `ana_gen_ml_features.py`
+
+def legacy_item_features(analysis_item=None, represent_sequence=None):
+    struct = analysis_item.element_type if analysis_item else None
+    length = length_stem = length_hairpin = length_bulge = length_interior_es = length_interior_ecs = None
+    five_hairpin = five_bulge = three_bulge = five_interior = three_interior = None
+
+    if analysis_item:
+        if represent_sequence:
+            length = represent_sequence.length
+        if struct == SecondaryStructureElementType.Stem:
+            length_stem = length
+        elif struct == SecondaryStructureElementType.Hairpin:
+            length_hairpin = length
+            five_hairpin = analysis_item.closing_base_pair()
+        elif struct == SecondaryStructureElementType.Bulge:
+            length_bulge = length
+            five_bulge = analysis_item.closing_base_pair()
+            three_bulge = analysis_item.closing_base_pair(five_prim=False)
+        elif struct == SecondaryStructureElementType.Interior:
+            length_interior_es = length
+            five_interior = analysis_item.closing_base_pair()
+            ecs = analysis_item.complementary_strand_sequence(represent_sequence)
+            length_interior_ecs = ecs.length if ecs else 0
+            three_interior = analysis_item.closing_base_pair(five_prim=False)
+
+    return [struct, length, length_stem, length_hairpin, length_bulge, length_interior_es, length_interior_ecs,
+            five_hairpin, five_bulge, three_bulge, five_interior, three_interior]
+
+
+def legacy_bprna_features(secondary_structure, editing_position, num_upstream=3, num_downstream=3):
+    sequence = secondary_structure.sequence
+    all_stem_length = None
+    u_all_stem_length = u_hairpin_length = d_all_stem_length = None
+
+    analysis = EditingAnalysis(secondary_structure, editing_position)
+    analysis.analysis()
+    by_distance = analysis.analysis_items_by_distance
+
+    site_items = [by_distance[d] for d in sorted(by_distance) if d == 0]
+    upstream = [by_distance[d] + (d,) for d in sorted(by_distance, reverse=True) if d < 0]
+    downstream = [by_distance[d] + (d,) for d in sorted(by_distance) if d > 0]
+
+    site_features = None
+    if site_items:
+        site_item, site_sequence = site_items[0]
+        site_features = legacy_item_features(site_item, site_sequence)
+        site_1_1 = None
+        if site_item.element_type == SecondaryStructureElementType.Interior:
+            ecs = site_item.complementary_strand_sequence(site_sequence)
+            if site_sequence.length == 1 and ecs and ecs.length == 1:
+                site_1_1 = '{}:{}'.format(site_sequence.sequence_str, ecs.sequence_str)
+        if site_item.element_type == SecondaryStructureElementType.Stem:
+            _, ecs_nt = site_item.complementary_nt(site_sequence, editing_position)
+            if ecs_nt:
+                site_1_1 = '{}:{}'.format(sequence.get_nt(editing_position), ecs_nt)
+        site_features[1:1] = [sequence.get_nt(editing_position - 1), sequence.get_nt(editing_position + 1),
+                              secondary_structure.get_annotation(site_sequence.start_position - 1),
+                              secondary_structure.get_annotation(site_sequence.end_position + 1),
+                              site_1_1]
+        if site_item.element_type == SecondaryStructureElementType.Stem:
+            all_stem_length = site_item.loop_length()
+
+    upstream_features = []
+    for item, sequence_item, distance in upstream:
+        upstream_features.append([1, distance] + legacy_item_features(item, sequence_item))
+        if item.element_type == SecondaryStructureElementType.Stem:
+            u_all_stem_length = (u_all_stem_length or 0) + item.loop_length()
+        if u_hairpin_length is None and item.element_type == SecondaryStructureElementType.Hairpin:
+            u_hairpin_length = item.loop_length()
+    downstream_features = []
+    for item, sequence_item, distance in downstream:
+        downstream_features.append([1, distance] + legacy_item_features(item, sequence_item))
+        if item.element_type == SecondaryStructureElementType.Stem:
+            d_all_stem_length = (d_all_stem_length or 0) + item.loop_length()
+    for length in [u_all_stem_length, d_all_stem_length]:
+        if length is not None:
+            all_stem_length = (all_stem_length or 0) + length
+
+    empty = [0, 0] + legacy_item_features()
+    features = [all_stem_length] + site_features + [len(upstream), u_all_stem_length, u_hairpin_length]
+    for index in range(num_upstream):
+        features += upstream_features[index] if index < len(upstream_features) else empty
+    features += [len(downstream), d_all_stem_length]
+    for index in range(num_downstream):
+        features += downstream_features[index] if index < len(downstream_features) else empty
+
+    return features
+
+
+# endregion
+
+
+# ----------------------------------
+# region Legacy Reference - `generate_feature_matrix_for_rf_expanded.py`
+
+def import_rf_generator():
+    if not os.path.exists(os.path.join(FEATURE_GENERATION_DIR, 'generate_feature_matrix_for_rf_expanded.py')):
+        pytest.skip('generate_feature_matrix_for_rf_expanded.py not available')
+    pytest.importorskip('pandas')
+    for path in [os.path.join(REPO_DIR, '2dGraphs'), FEATURE_GENERATION_DIR]:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import generate_feature_matrix_for_rf_expanded
+    return generate_feature_matrix_for_rf_expanded
+
+
+# endregion
+
+
+class TestCompiledStructure(object):
+
+    def test_tables(self):
+        with open(EXAMPLE_FILE_PATH) as handle:
+            structure = CompiledStructure.from_bprna(handle.read())
+
+        assert structure.reference_id == '114_RNA'
+        assert structure.length == 81
+        # S1-S4, H1, B1, I1, I2, E1, E2 - "segment" lines are not elements
+        assert structure.element_count == 10
+        assert structure.strand_count == 16
+        assert structure.run_count == 15
+
+        strand = structure.strand_at(28)
+        assert structure.strand_name(strand) == 'I2.1'
+        assert structure.strand_span(strand) == (27, 29)
+        assert structure.element_pairs(structure.strand_element(strand)) == ['U:A', 'G:C']
+        assert structure.run_span(structure.run_at(28)) == (27, 29)
+        assert structure.strand_at(0) == -1
+        assert structure.strand_at(82) == -1
+
+    def test_from_secondary_structure(self):
+        with open(EXAMPLE_FILE_PATH) as handle:
+            text = handle.read()
+        secondary_structure = next(BpRnaIO.parse_iterator(io.StringIO(text)))
+
+        compiled = CompiledStructure.from_secondary_structure(secondary_structure)
+        reference = CompiledStructure.from_bprna(text)
+        engine = FeatureEngine(ml_feature_columns())
+        for position in range(1, reference.length + 1):
+            assert engine.extract(compiled, position) == engine.extract(reference, position)
+
+    def test_graph_distances(self):
+        structure = CompiledStructure('GGGAAACCC', '(((...)))', 'SSSHHHSSS', [])
+        distances = structure.graph_distances(1)
+        assert distances[1] == 1
+        assert distances[9] == 2
+        assert distances[5] == 5
+
+
+class TestFeatureEngineParity(object):
+
+    @parametrize('substrate', SUBSTRATES)
+    def test_ml_features(self, substrate):
+        columns = ml_feature_columns()
+        engine = FeatureEngine(columns[len(MUTATION_FEATURES):])
+
+        for text in load_records(substrate, limit=40):
+            secondary_structure = next(BpRnaIO.parse_iterator(io.StringIO(text)))
+            structure = CompiledStructure.from_bprna(text)
+            for position in range(1, structure.length + 1):
+                expected = legacy_bprna_features(secondary_structure, position)
+                assert engine.extract(structure, position)[0] == expected, (structure.reference_id, position)
+
+    def test_mutation_features(self):
+        engine = FeatureEngine(MUTATION_FEATURES)
+        records = load_records(limit=5)
+        wt = CompiledStructure.from_bprna(records[0])
+
+        for text in records:
+            structure = CompiledStructure.from_bprna(text)
+            rows = engine.extract(structure, 50, '44GtoA,51CtoU', wt_structure=wt)
+            assert [row[3] for row in rows] == [44, 51]
+            for row in rows:
+                position = row[3]
+                features = dict(zip(MUTATION_FEATURES, row))
+                assert features['num_mutations'] == 2
+                assert features['mut_site_dist'] == position - 50
+                assert features['mut_struct'] == structure.annotation[position - 1]
+                assert features['mut_ref_struct'] == wt.annotation[position - 1]
+                assert features['mut_same_as_site'] == \
+                    (1 if structure.annotation[position - 1] == structure.annotation[49] else 0)
+
+            assert engine.extract(structure, 50, 'WT')[0][:3] == [0, 0, 'wt']
+            # A malformed syntax - `None` for the mutation features, a single row
+            assert engine.extract(structure, 50, 'del5') == [[None] * len(MUTATION_FEATURES)]
+            assert engine.extract(structure, 50)[0][:3] == [0, 0, None]
+            assert engine.extract(structure, 50, 'indel45-47', wt_sequence='A' * 80)[0][:4] == \
+                [structure.length - 80, 1, 'indel', None]
+
+    @parametrize('substrate', SUBSTRATES)
+    def test_rf_features(self, substrate):
+        legacy = import_rf_generator()
+        engine = FeatureEngine(rf_feature_columns(2))
+
+        compared = 0
+        for text in load_records(substrate, limit=40):
+            annotation = text.split('\n')
+            features = annotation[5]
+            structure = CompiledStructure.from_bprna(text)
+            for site in range(1, structure.length + 1):
+                row = dict(zip(engine.columns, engine.extract(structure, site, 'WT')[0]))
+                assert row['editing_feature'] == features[site - 1]
+
+                if legacy_stem_length_defined(features, site - 1):
+                    assert row['stem_length'] == legacy.get_structure_length(features, site - 1, 'S'), \
+                        (structure.reference_id, site)
+                else:
+                    # The legacy scan fails when no stem precedes the site
+                    with pytest.raises(TypeError):
+                        legacy.get_structure_length(features, site - 1, 'S')
+
+                x1 = legacy.get_downstream_nonstem_info(features, site - 1, annotation)
+                assert (row['x1feat_downstream_of_edit_site'],
+                        row['x1feat_downstream_of_edit_site_length_editing_strand'],
+                        row['x1feat_downstream_of_edit_site_length_complementary_strand'],
+                        row['x1feat_downstream_of_edit_site_5prime_cp'],
+                        row['x1feat_downstream_of_edit_site_3prime_cp']) == x1[:5], (structure.reference_id, site)
+
+                # x2 is the next non-stem run, after the end of x1
+                x2 = legacy.get_downstream_nonstem_info(features, x1[5] + 1, annotation) \
+                    if x1[0] is not None else x1
+                assert (row['x2feat_downstream_of_edit_site'],
+                        row['x2feat_downstream_of_edit_site_length_editing_strand'],
+                        row['x2feat_downstream_of_edit_site_length_complementary_strand'],
+                        row['x2feat_downstream_of_edit_site_5prime_cp'],
+                        row['x2feat_downstream_of_edit_site_3prime_cp']) == x2[:5], (structure.reference_id, site)
+                compared += 1
+
+        assert compared > 0
+
+    @parametrize('substrate', SUBSTRATES)
+    def test_rf_downstream_features(self, substrate):
+        legacy = import_rf_generator()
+        engine = FeatureEngine(rf_feature_columns(4))
+        x_columns = [column for column in engine.columns if column.startswith('x')]
+
+        for text in load_records(substrate, limit=20):
+            annotation = text.split('\n')
+            features = annotation[5]
+            structure = CompiledStructure.from_bprna(text)
+            element_table = legacy.get_element_table(features, annotation)
+            for site in range(1, structure.length + 1):
+                row = dict(zip(engine.columns, engine.extract(structure, site, 'WT')[0]))
+                expected = [value
+                            for info in legacy.get_downstream_nonstem_features(features, site - 1, annotation, 4,
+                                                                               element_table)
+                            for value in info[:5]]
+                assert [row[column] for column in x_columns] == expected
+
+    @parametrize('substrate', SUBSTRATES)
+    def test_rf_mutation_features(self, substrate):
+        legacy = import_rf_generator()
+        engine = FeatureEngine(['mfeat', 'mfeat_prev', 'mfeat_next', 'mfeat_same_as_edit', 'mp_2d_dist_to_edit'])
+
+        for text in load_records(substrate, limit=3):
+            annotation = text.split('\n')
+            features = annotation[5]
+            structure = CompiledStructure.from_bprna(text)
+            graph = legacy.get_graph_representation({'inferred': text}, 'inferred')
+            site = 50
+            # Position "1" is skipped - the legacy scan for the previous run stops before index 0
+            for position in range(3, structure.length + 1):
+                mutation = '{}{}to{}'.format(position, structure.sequence_str[position - 1], 'A')
+                row = engine.extract(structure, site, mutation)[0]
+                expected = list(legacy.get_bprna_feature_labels(position - 1, features, site - 1))
+                expected.append(legacy.dijkstra(graph, site - 1, position - 1)[1])
+                assert row == expected, (structure.reference_id, position)
+
+    def test_rf_mutation_info(self):
+        legacy = import_rf_generator()
+        editing_levels = {
+            'MUT': {'mutation_syntax': '44GtoA,51CtoU', 'site': 50},
+            'WT': {'mutation_syntax': 'WT_2', 'site': 50},
+            'INDEL': {'mutation_syntax': 'indel45-47', 'site': 50},
+        }
+
+        mut_info = legacy.get_mut_info(editing_levels)
+        assert mut_info['MUT']['mut'] == {
+            0: {'mp': 44, 'adist': 6, 'mref': 'G', 'malt': 'A', 'mtype': 'mismatch'},
+            1: {'mp': 51, 'adist': -1, 'mref': 'C', 'malt': 'U', 'mtype': 'mismatch'},
+        }
+        assert mut_info['WT']['mut'] == {0: {'mp': None, 'adist': None, 'mref': None, 'malt': None, 'mtype': 'wt'}}
+        assert mut_info['INDEL']['mut'] == \
+            {0: {'mp': 45, 'adist': None, 'mref': None, 'malt': None, 'mtype': 'indel'}}
+
+        with pytest.raises(ValueError):
+            legacy.annotate_mutation('del5', 50)
+
+    def test_rf_bootstrap_ensemble(self, tmpdir, monkeypatch):
+        legacy = import_rf_generator()
+        sys.path.insert(0, os.path.join(REPO_DIR, 'bpRNA_wrapper'))
+        try:
+            import bpRNA_wrapper
+        finally:
+            sys.path.remove(os.path.join(REPO_DIR, 'bpRNA_wrapper'))
+
+        sequence = 'GGGAAACCCAGGCAAAAGCUUAA'
+        structures = ['(((...)))..((.(....))).', '((.....))..((......))..', '.' * 23]
+        items = [
+            {'rna_id': '001', 'sequence_string': sequence, 'computational_structure': structures[0],
+             'bootstrap_structures': [structures[0], structures[1], structures[0], structures[2]]},
+            {'rna_id': '002', 'sequence_string': sequence, 'computational_structure': structures[1],
+             'bootstrap_structures': [structures[1], structures[1]]},
+        ]
+        data_file = os.path.join(str(tmpdir), 'summary.json')
+        pickle_file = os.path.join(str(tmpdir), 'bprna.pickle')
+        with open(data_file, 'w') as outfile:
+            json.dump({'items': items}, outfile)
+        monkeypatch.setattr(sys, 'argv', ['bpRNA_wrapper.py', '--data_json', data_file, '--pickle_out', pickle_file,
+                                          '--text_out', os.path.join(str(tmpdir), 'bprna.txt')])
+        bpRNA_wrapper.main()
+
+        with open(pickle_file, 'rb') as infile:
+            bprna_data = pickle.load(infile)
+        # Plain data - the unique annotations, shared by the items, and per item arrays
+        bootstraps = bprna_data['001']['bootstraps']
+        assert bootstraps['annotations'] is bprna_data['002']['bootstraps']['annotations']
+        assert len(bootstraps['annotations']) == 3
+        assert bootstraps['structure_ids'].tolist() == [0, 1, 2] and bootstraps['counts'].tolist() == [2, 1, 1]
+
+        # A pseudoknot annotated by bpRNA.pl - its stored annotation is used, not dropped
+        pseudoknot_annotation = BpRnaAnnotator.to_st(sequence, structures[0]).replace(
+            structures[0], '((..[[..))..]]...' + '.' * 6)
+        bootstraps['annotations'].append(pseudoknot_annotation)
+        bootstraps['structure_ids'] = np.append(bootstraps['structure_ids'], 3)
+        bootstraps['counts'] = np.append(bootstraps['counts'], 4)
+
+        # The older {annotation: count} format - the same ensemble
+        legacy_data = {rna_id: {'bootstraps': {entry['bootstraps']['annotations'][structure_id]: count
+                                               for structure_id, count in zip(entry['bootstraps']['structure_ids'],
+                                                                              entry['bootstraps']['counts'])}}
+                       for rna_id, entry in bprna_data.items()}
+
+        for data in [bprna_data, legacy_data]:
+            ensemble = legacy.get_bootstrap_ensemble(data)
+            assert ensemble.counts('001').tolist() == [2, 1, 1, 4]
+            # The frequency of each code - the count weighted stored annotations (line 5), as the older script
+            annotations = [(annotation.split('\n')[5], count)
+                           for annotation, count in legacy_data['001']['bootstraps'].items()]
+            for code in 'SHE':
+                expected = [float(sum(count for annotation, count in annotations if annotation[base] == code)) / 8
+                            for base in range(len(sequence))]
+                assert ensemble.position_profile('001', code)[:, 0].tolist() == expected
+
+
+class TestFeatureRegistry(object):
+
+    def test_unknown_column(self):
+        with pytest.raises(ValueError):
+            FeatureEngine(['u1_no_such_template'])
+        with pytest.raises(ValueError):
+            FeatureEngine(['no_such_feature'])
+
+    def test_any_slot(self):
+        with open(EXAMPLE_FILE_PATH) as handle:
+            structure = CompiledStructure.from_bprna(handle.read())
+
+        engine = FeatureEngine(['d_count', 'd6_struct', 'd6_distance', 'd7_exist', 'x4feat_downstream_of_edit_site'])
+        assert engine.extract(structure, 50)[0] == [6, 'E', 23, 0, 'E']
+
+    def test_custom_registry(self):
+        registry = FeatureRegistry()
+
+        @registry.feature('site_gc')
+        def site_gc(context, mutation):
+            return 1 if context.structure.nt(context.editing_position) in 'GC' else 0
+
+        @registry.feature('mut_to_a', per_mutation=True)
+        def mut_to_a(context, mutation):
+            return 1 if mutation is not None and mutation.alt_nt == 'A' else 0
+
+        with open(EXAMPLE_FILE_PATH) as handle:
+            structure = CompiledStructure.from_bprna(handle.read())
+
+        engine = FeatureEngine(['site_gc', 'mut_to_a'], registry)
+        assert engine.extract(structure, 6, '44GtoA,45GtoC') == [[1, 1], [1, 0]]
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import json
+import os
+import re
+
+import pytest
+
+from neoRNA.analysis.feature_engine import CompiledStructure, FeatureEngine, ml_feature_columns
+from neoRNA.analysis.bpp_features import bpp_feature_columns
+from neoRNA.cli.commands import COMMANDS, count_barcode_reads
+from neoRNA.cli.context import LibraryContext
+from neoRNA.main import main, split_steps
+from neoRNA.structure.bp_rna_annotator import BpRnaAnnotator
+
+parametrize = pytest.mark.parametrize
+
+WT_SEQUENCE = 'GGGAAACCCAGGCAAAAGCUUAA'
+ITEMS = [
+    {'rna_id': '001', 'sequence_string': WT_SEQUENCE, 'mutation_syntax': 'WT',
+     'computational_structure': '(((...)))..((.(....))).',
+     'A-to-I_editing_level': 0.5, 'A-to-I_editing_site': 4},
+    {'rna_id': '002', 'sequence_string': 'GGGAAACCCAGGCAAAAGCUUGA', 'mutation_syntax': '22AtoG',
+     'computational_structure': '((.....))..((......))..',
+     'A-to-I_editing_level': 0.2, 'A-to-I_editing_site': 4},
+    {'rna_id': '003', 'sequence_string': 'GGCAAACCCAGGCAAAAGCUUGA', 'mutation_syntax': '3GtoC,22AtoG',
+     'computational_structure': '((.....))..((......))..',
+     'A-to-I_editing_level': 0.1, 'A-to-I_editing_site': 5},
+]
+
+
+@pytest.fixture
+def summary_file(tmpdir):
+    file_path = os.path.join(str(tmpdir), 'summary.json')
+    with open(file_path, 'w') as outfile:
+        json.dump({'items': ITEMS}, outfile)
+    return file_path
+
+
+def load_csv(file_path):
+    with open(file_path) as infile:
+        return list(csv.reader(infile))
+
+
+class TestCommands(object):
+
+    def test_registry(self):
+        assert list(COMMANDS) == ['annotate', 'fold', 'features', 'simscore', 'qc-barcode', 'qc-mut', 'render',
+                                  'summary']
+        assert split_steps(['fold', 'a.json', '+', 'features', 'a.json']) == [['fold', 'a.json'],
+                                                                              ['features', 'a.json']]
+
+    def test_annotate_features(self, tmpdir, summary_file):
+        st_folder = os.path.join(str(tmpdir), 'st')
+        features_file = os.path.join(str(tmpdir), 'features.csv')
+        assert main(['neoRNA', 'annotate', summary_file, '--out_folder', st_folder,
+                     '+', 'features', summary_file, '--bpp_features', '--out', features_file]) == 0
+
+        with open(os.path.join(st_folder, '002.st')) as infile:
+            assert infile.read() == BpRnaAnnotator.to_st(ITEMS[1]['sequence_string'],
+                                                         ITEMS[1]['computational_structure'], '002')
+
+        # The same rows as the feature engine - one per mutation
+        rows = load_csv(features_file)
+        columns = ml_feature_columns()
+        assert rows[0] == ['rna_id', 'editing_value', 'free_energy', 'sim_nor_score'] + columns \
+            + bpp_feature_columns()
+        assert [row[0] for row in rows[1:]] == ['001', '002', '003', '003']
+
+        engine = FeatureEngine(columns)
+        wt_structure = CompiledStructure.from_bprna(BpRnaAnnotator.to_st(WT_SEQUENCE,
+                                                                          ITEMS[0]['computational_structure']))
+        structure = CompiledStructure.from_bprna(BpRnaAnnotator.to_st(ITEMS[2]['sequence_string'],
+                                                                       ITEMS[2]['computational_structure']))
+        expected = engine.extract(structure, 5, '3GtoC,22AtoG', wt_structure=wt_structure)
+        for row, expected_row in zip(rows[3:], expected):
+            assert row[4:4 + len(columns)] == ['' if value is None else str(value) for value in expected_row]
+        # No BPP matrix
+        assert set(rows[1][4 + len(columns):]) == {''}
+
+    def test_fold_summary(self, tmpdir, summary_file):
+        folded_file = os.path.join(str(tmpdir), 'folded.jsonl')
+        index_file = os.path.join(str(tmpdir), 'index.csv')
+        features_file = os.path.join(str(tmpdir), 'features.csv')
+        assert main(['neoRNA', 'fold', summary_file, '--backend', 'stub', '--out', folded_file,
+                     '+', 'summary', folded_file, '--mutation_count', '1', '--out', index_file,
+                     '+', 'features', folded_file, '--bpp_features', '--out', features_file]) == 0
+
+        with open(folded_file) as infile:
+            items = [json.loads(line) for line in infile]
+        assert [item['computational_structure'] for item in items] == ['.' * len(WT_SEQUENCE)] * 3
+
+        assert load_csv(index_file)[1:] == [['002', '22AtoG', 'mismatch', '1', '4', '0.2']]
+
+        # The folded structures - all open, unpaired
+        rows = load_csv(features_file)
+        site_unpaired = rows[0].index('bpp_site_unpaired')
+        assert [float(row[site_unpaired]) for row in rows[1:]] == [1.0] * 4
+
+    def test_context_cache(self, summary_file):
+        with LibraryContext() as context:
+            items = context.summary_items(summary_file)
+            assert context.summary_items(summary_file) is items
+
+            structure = context.compiled_structure(WT_SEQUENCE, ITEMS[0]['computational_structure'])
+            assert context.compiled_structure(WT_SEQUENCE, ITEMS[0]['computational_structure']) is structure
+            assert context.st_str(WT_SEQUENCE, ITEMS[0]['computational_structure'], '001').startswith('#Name: 001')
+
+            assert context.map(lambda value: value * 2, [1, 2, 3]) == [2, 4, 6]
+
+        with LibraryContext(workers=3) as context:
+            assert context.map(lambda value: value * 2, range(10)) == list(range(0, 20, 2))
+
+    def test_overlays(self, tmpdir, summary_file):
+        overlay_file = os.path.join(str(tmpdir), 'adjusted.jsonl')
+        with open(overlay_file, 'w') as outfile:
+            outfile.write(json.dumps({'rna_id': '002', 'mutation_syntax': '3GtoC,22AtoG'}) + '\n')
+
+        with LibraryContext() as context:
+            items = context.summary_items(summary_file, [overlay_file])
+            assert items[1]['mutation_syntax'] == '3GtoC,22AtoG'
+            assert items[1]['sequence_string'] == ITEMS[1]['sequence_string']
+            assert context.summary_items(summary_file)[1] == ITEMS[1]
+            assert context.summary_index(summary_file, [overlay_file]).by_mutation_count(2) == ['002', '003']
+
+        index_file = os.path.join(str(tmpdir), 'index.csv')
+        assert main(['neoRNA', 'summary', summary_file, '--overlay', overlay_file, '--position', '3',
+                     '--out', index_file]) == 0
+        assert [row[0] for row in load_csv(index_file)[1:]] == ['002', '003']
+
+    def test_global_options(self, tmpdir, summary_file):
+        st_folder = os.path.join(str(tmpdir), 'st')
+        assert main(['neoRNA', '--workers', '2', 'annotate', summary_file, '--out_folder', st_folder,
+                     '+', 'annotate', summary_file, '--out_folder', st_folder]) == 0
+
+        # Only before the first step
+        with pytest.raises(SystemExit):
+            main(['neoRNA', 'annotate', summary_file, '--out_folder', st_folder,
+                  '+', '--workers', '2', 'annotate', summary_file, '--out_folder', st_folder])
+
+    def test_free_energy(self, tmpdir, monkeypatch):
+        # A stand-in "RNAfold" - writes its ".ps" file into the folder it runs in
+        bin_folder = os.path.join(str(tmpdir), 'bin')
+        os.makedirs(bin_folder)
+        rnafold_path = os.path.join(bin_folder, 'RNAfold')
+        with open(rnafold_path, 'w') as outfile:
+            outfile.write('#!/bin/sh\ncat > /dev/null\ntouch dot.ps\necho GGGAAACCC\necho "(((...))) [-1.50]"\n')
+        os.chmod(rnafold_path, 0o755)
+        monkeypatch.setenv('PATH', bin_folder + os.pathsep + os.environ['PATH'])
+
+        work_folder = os.path.join(str(tmpdir), 'work')
+        cwd = os.getcwd()
+        sequences = ['GGGAAACCC', 'GGGAAACCC', 'GGGAAUCCC', 'GGGAAGCCC']
+        with LibraryContext(workers=2, work_folder=work_folder) as context:
+            assert context.map(context.free_energy, sequences) == [(-1.5, '(((...)))')] * 4
+        assert os.getcwd() == cwd
+        # One folder per thread, never shared - RNAfold writes fixed file names
+        run_folders = os.listdir(work_folder)
+        assert 1 <= len(run_folders) <= 2
+        for run_folder in run_folders:
+            assert 'dot.ps' in os.listdir(os.path.join(work_folder, run_folder))
+
+    def test_qc_barcode(self):
+        barcodes = ['ACGTAC', 'GGCCTA', 'TTAG']
+        reverses = {'ACGTAC': 'GTACGT', 'GGCCTA': 'TAGGCC', 'TTAG': 'CTAA'}
+        lines = [
+            'NNACGTACAAAAGTACGT\n',
+            'AAACGTACAAAAGTACGT\n',
+            'AAACGTACCAAAGTACGT\n',
+            'AAACGTACCAANGTACGT\n',
+            'CCGGCCTACAAAATAGGCC\n',
+            'CCTTAGCGGGCTAA\n',
+            '@ACGTAC\n',
+            'GGGGGGGG\n',
+        ]
+
+        counts = count_barcode_reads(lines, barcodes, 2, 'C')
+
+        # Reference - the "grep" patterns
+        for barcode in barcodes:
+            reverse = reverses[barcode]
+            patterns = ['^[ATCG]{{2}}{}'.format(barcode),
+                        '^[ATCG]{{2}}{}[ATCG]{{4}}{}'.format(barcode, reverse),
+                        '^[ATCG]{{2}}{}C'.format(barcode),
+                        '^[ATCG]{{2}}{}C[ATCG]{{3}}{}'.format(barcode, reverse)]
+            assert counts[barcode] == [sum(1 for line in lines if re.search(pattern, line)) for pattern in patterns]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+from importlib import metadata
+
+import pytest
+
+from neoRNA import io
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+PACKAGE_DIR = os.path.dirname(TESTS_DIR)
+EXAMPLE_FILE_PATH = os.path.join(TESTS_DIR, 'io', 'example_files', 'bprna_example.st')
+
+# Import time budgets (seconds), in a fresh interpreter
+IMPORT_BUDGET = 0.5
+PARSE_BUDGET = 1.5
+
+# The modules not needed to parse a "bp-rna" file
+HEAVY_MODULES = ['Bio', 'jinja2', 'neoRNA.library']
+
+MEASURE_SCRIPT = r"""
+import sys, time
+start = time.perf_counter()
+from neoRNA import io
+import_time = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+start = time.perf_counter()
+records = list(io.parse({path!r}, 'bp-rna'))
+parse_time = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(import_time, parse_time, len(records), ','.join(loaded), ','.join(heavy))
+"""
+
+
+def measure():
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join([PACKAGE_DIR, os.environ.get('PYTHONPATH', '')]))
+    output = subprocess.check_output([sys.executable, '-c',
+                                      MEASURE_SCRIPT.format(heavy=HEAVY_MODULES, path=EXAMPLE_FILE_PATH)],
+                                     env=environment, universal_newlines=True)
+    values = output.strip().split(' ') + ['', '']
+    return float(values[0]), float(values[1]), int(values[2]), values[3], values[4]
+
+
+class FakeEntryPoint(object):
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class TestIoRegistry(object):
+
+    def test_import_budget(self):
+        # The best of a few runs - the first one may warm up the file cache
+        runs = [measure() for _ in range(3)]
+        import_time = min(run[0] for run in runs)
+        parse_time = min(run[1] for run in runs)
+
+        for _, _, count, loaded, heavy in runs:
+            assert count == 1
+            assert loaded == '' and heavy == ''
+        assert import_time < IMPORT_BUDGET
+        assert parse_time < PARSE_BUDGET
+
+    def test_lazy_lookup(self):
+        assert 'bp-rna' in io.file_types()
+
+        bp_rna_io = io.get_io('bp-rna')
+        from neoRNA.io.bp_rna_io import BpRnaIO
+        assert bp_rna_io is BpRnaIO
+        # Still exposed as attributes
+        assert io.BpRnaIO is BpRnaIO
+
+        with pytest.raises(ValueError):
+            io.get_io('not-a-file-type')
+        with pytest.raises(ValueError):
+            io.get_io('')
+        with pytest.raises(AttributeError):
+            getattr(io, 'NotAnIO')
+
+    def test_register(self, monkeypatch):
+        monkeypatch.setattr(io, '_FileTypeToIO', dict(io._FileTypeToIO))
+
+        io.register('bp-rna-copy', 'neoRNA.io.bp_rna_io:BpRnaIO')
+        records = list(io.parse(EXAMPLE_FILE_PATH, 'bp-rna-copy'))
+        assert len(records) == 1
+
+        with pytest.raises(ValueError):
+            io.register('bad', 'neoRNA.io.bp_rna_io.BpRnaIO')
+
+    def test_entry_points(self, monkeypatch):
+        monkeypatch.setattr(io, '_FileTypeToIO', dict(io._FileTypeToIO))
+        monkeypatch.setattr(io, '_entry_points_loaded', False)
+        monkeypatch.setattr(metadata, 'entry_points', lambda **kwargs: [
+            FakeEntryPoint('plugin-dbn', 'neoRNA.io.dot_bracket_io:DotBracketIO'),
+            # Does not replace a package IO
+            FakeEntryPoint('fasta', 'neoRNA.io.dot_bracket_io:DotBracketIO'),
+        ])
+
+        from neoRNA.io.dot_bracket_io import DotBracketIO
+        assert io.get_io('plugin-dbn') is DotBracketIO
+        assert io.get_io('fasta') is not DotBracketIO
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+import pytest
+
+from neoRNA import io
+from neoRNA.io.library_io import LibraryIO
+from neoRNA.library.library_item import LibraryItem
+from neoRNA.library.rna_library import RnaLibrary
+from neoRNA.library.shape_mapper.profile_arrays import ingest_profiles, read_item_profile, ProfileArrays, \
+    PROFILE_COLUMNS
+from neoRNA.library.shape_mapper.shape_reactivity_item import ShapeReactivityItem
+from neoRNA.util.json_serializable import as_python_object, PythonObjectEncoder
+
+parametrize = pytest.mark.parametrize
+
+PROFILE_HEADER = '\t'.join(['Nucleotide', 'Sequence'] + [column.capitalize() for column in PROFILE_COLUMNS])
+
+SEQUENCE = 'GGACUAC'
+
+
+def write_profile_files(folder, rna_id, total_nt):
+    r"""
+    Write a "profile" / "shape" file - with "nan", and the "nt" not in "high quality" (no "Norm" values).
+    """
+    profile_lines = [PROFILE_HEADER]
+    shape_lines = []
+    for index in range(total_nt):
+        position = index + 1
+        values = ['{}.{}'.format(position, column) for column in range(len(PROFILE_COLUMNS))]
+        if position % 3 == 0:
+            values[12] = 'nan'
+        if position % 4 == 0:
+            values = values[:-2] + ['', '']
+        profile_lines.append('\t'.join([str(position), SEQUENCE[index % len(SEQUENCE)]] + values))
+        shape_lines.append('{}\t{}'.format(position, '-999' if position % 3 == 0 else '0.{}'.format(position)))
+
+    profile_file = os.path.join(folder, 'Pipeline_{}_profile.txt'.format(rna_id))
+    shape_file = os.path.join(folder, 'Pipeline_{}.shape'.format(rna_id))
+    with open(profile_file, 'w') as outfile:
+        outfile.write('\n'.join(profile_lines) + '\n')
+    with open(shape_file, 'w') as outfile:
+        outfile.write('\n'.join(shape_lines) + '\n')
+
+    return profile_file, shape_file
+
+
+@pytest.fixture
+def profile_entries(tmpdir):
+    folder = str(tmpdir)
+    rna_ids = ['001', '002', '003', '004', '005']
+    entries = [write_profile_files(folder, rna_id, 5 + index * 3) for index, rna_id in enumerate(rna_ids)]
+    # "003" - ShapeMapper failed
+    entries[2] = (None, None)
+    return rna_ids, entries
+
+
+class TestProfileArrays(object):
+
+    def test_read_item(self, profile_entries):
+        _, entries = profile_entries
+        profile_file, shape_file = entries[1]
+        item_profile = read_item_profile(profile_file, shape_file)
+
+        # The same as the parsed objects
+        parsed_items = list(io.parse(profile_file, 'shape-profile'))
+        profile_items = item_profile.profile_items()
+        assert len(item_profile) == len(parsed_items) == 8
+        for parsed_item, profile_item in zip(parsed_items, profile_items):
+            assert vars(parsed_item) == vars(profile_item)
+        assert [item.in_high_quality for item in profile_items] == [True, True, True, False] * 2
+
+        # "-999" as "NaN"
+        assert np.isnan(item_profile.shape_reactivity[2])
+        assert [item.shape_reactivity for item in item_profile.shape_reactivity_items()][:3] == [0.1, 0.2, None]
+
+        assert len(read_item_profile(None, None)) == 0
+
+    @parametrize('workers', [1, 2])
+    def test_ingest(self, profile_entries, workers):
+        rna_ids, entries = profile_entries
+        profile_arrays = ingest_profiles(entries, rna_ids, workers=workers, chunk_size=2)
+
+        assert profile_arrays.offsets.tolist() == [0, 5, 13, 13, 27, 44]
+        assert profile_arrays.values.shape == (44, len(PROFILE_COLUMNS))
+        for rna_id, (profile_file, shape_file) in zip(rna_ids, entries):
+            expected = read_item_profile(profile_file, shape_file)
+            item_profile = profile_arrays.item(rna_id)
+            assert item_profile.positions.tolist() == expected.positions.tolist()
+            assert np.array_equal(item_profile.values, expected.values, equal_nan=True)
+            assert np.array_equal(item_profile.shape_reactivity, expected.shape_reactivity, equal_nan=True)
+
+        with pytest.raises(ValueError):
+            profile_arrays.item('006')
+
+    def test_save_load(self, tmpdir, profile_entries):
+        rna_ids, entries = profile_entries
+        folder = ProfileArrays.folder_path(os.path.join(str(tmpdir), 'rna_lib.rbin'))
+        assert folder == os.path.join(str(tmpdir), 'rna_lib_profile')
+        ingest_profiles(entries, rna_ids).save(folder)
+
+        profile_arrays = ProfileArrays.load(folder)
+        assert isinstance(profile_arrays.values, np.memmap)
+        assert profile_arrays.rna_ids == rna_ids
+
+        with open(os.path.join(folder, ProfileArrays.META_FILE_NAME)) as infile:
+            meta = json.load(infile)
+        meta['columns'] = meta['columns'][::-1]
+        with open(os.path.join(folder, ProfileArrays.META_FILE_NAME), 'w') as outfile:
+            json.dump(meta, outfile)
+        with pytest.raises(ValueError):
+            ProfileArrays.load(folder)
+
+    def test_library_item(self, tmpdir, profile_entries):
+        rna_ids, entries = profile_entries
+        folder = os.path.join(str(tmpdir), 'arrays')
+        ingest_profiles(entries, rna_ids).save(folder)
+
+        rna_items = [LibraryItem(rna_id, 'ACGTAC', SEQUENCE) for rna_id in rna_ids + ['006']]
+        assert ProfileArrays.load(folder).attach(rna_items) == 5
+        assert rna_items[-1].profile_arrays is None and rna_items[-1].profile_list == []
+
+        # The lists / dicts are built from the arrays
+        rna_item = rna_items[1]
+        profile_file, shape_file = entries[1]
+        assert [vars(item) for item in rna_item.profile_list] \
+            == [vars(item) for item in io.parse(profile_file, 'shape-profile')]
+        assert rna_item.profile_dict['4'].in_high_quality is False
+        assert rna_item.shape_reactivity_dict['2'].shape_reactivity == 0.2
+        assert rna_item.flatten_reactivity_list('shape')[:3] == [0.1, 0.2, ShapeReactivityItem.NUMBER_FOR_NONE]
+        assert rna_items[2].profile_list == [] and rna_items[2].flatten_reactivity_list('shape') == []
+
+        # Pickled with the arrays
+        loaded_item = json.loads(json.dumps(rna_item, cls=PythonObjectEncoder), object_hook=as_python_object)
+        assert len(loaded_item.profile_list) == 8
+        assert loaded_item.flatten_reactivity_list('shape') == rna_item.flatten_reactivity_list('shape')
+
+    def test_library_io(self, tmpdir, profile_entries):
+        rna_ids, entries = profile_entries
+        rna_items = [LibraryItem(rna_id, 'ACGTAC', SEQUENCE) for rna_id in rna_ids]
+        for rna_item, (profile_file, shape_file) in zip(rna_items, entries):
+            rna_item.shape_profile_file, rna_item.shape_reactivity_file = profile_file, shape_file
+        library = RnaLibrary()
+        library.rna_items = rna_items
+
+        rna_lib_file = os.path.join(str(tmpdir), 'rna_lib.rbin')
+        with open(rna_lib_file, 'w') as outfile:
+            outfile.write(json.dumps(library, cls=PythonObjectEncoder))
+        profile_folder = ProfileArrays.folder_path(rna_lib_file)
+        ingest_profiles(entries, rna_ids).save(profile_folder)
+
+        loaded_items = LibraryIO.as_python_object(rna_lib_file).rna_items
+        assert [len(rna_item.profile_list) for rna_item in loaded_items] == [5, 8, 0, 14, 17]
+
+        # Without the arrays folder
+        shutil.rmtree(profile_folder)
+        with pytest.raises(ValueError):
+            LibraryIO.as_python_object(rna_lib_file)
+
+        # Without ShapeMapper results, there is nothing to miss
+        for rna_item in rna_items:
+            rna_item.shape_profile_file = None
+        with open(rna_lib_file, 'w') as outfile:
+            outfile.write(json.dumps(library, cls=PythonObjectEncoder))
+        assert len(LibraryIO.as_python_object(rna_lib_file).rna_items) == 5
+
+    def test_library_item_old_pickle(self):
+        # An item pickled before `profile_arrays`
+        rna_item = LibraryItem('001', 'ACGTAC', SEQUENCE)
+        rna_item.shape_reactivity_list.append(ShapeReactivityItem(['1', '0.5']))
+        state = dict(rna_item.__dict__)
+        del state['profile_arrays']
+
+        loaded_item = pickle.loads(pickle.dumps(rna_item))
+        loaded_item.__dict__.clear()
+        loaded_item.__dict__.update(state)
+        assert loaded_item.profile_arrays is None
+        assert loaded_item.flatten_reactivity_list('shape') == [0.5]
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import importlib.util
+import json
+import os
+import re
+import stat
+import sys
+
+import pytest
+
+from neoRNA.library.library_config import RnaLibConfig
+from neoRNA.library.library_item import LibraryItem
+from neoRNA.library.shape_mapper import get_shape2_path
+from neoRNA.library.shape_mapper.shape_runner import ShapeMapperRunner
+from neoRNA.library.shape_mapper.shape_scheduler import ShapeMapperScheduler
+
+parametrize = pytest.mark.parametrize
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(TESTS_DIR)), 'rna-lib-analysis', 'scripts')
+PROFILING_SCRIPT_PATH = os.path.join(SCRIPTS_DIR, 'py_scripts', 'rna_lib_pipeline', 'rna_lib_profiling.py')
+
+# A fake "shapemapper" - it records its run, then writes the output files (or fails).
+FAKE_SHAPE_MAPPER = r"""#!{python}
+import json, os, sys, time
+
+args = sys.argv[1:]
+options = dict((args[index], args[index + 1]) for index in range(len(args) - 1) if args[index].startswith('--'))
+with open(options['--target']) as infile:
+    name = infile.readline().strip()[1:]
+
+os.makedirs(options['--temp'], exist_ok=True)
+with open(os.path.join(options['--temp'], 'reads.tmp'), 'w') as outfile:
+    outfile.write('temp')
+
+start = time.time()
+time.sleep(0.3)
+with open(os.environ['FAKE_SHAPE_MAPPER_LOG'], 'a') as outfile:
+    outfile.write(json.dumps([name, int(options.get('--nproc', 1)), start, time.time(), os.getcwd(),
+                              os.path.exists(options['--temp'])]) + '\n')
+
+if name in os.environ.get('FAKE_SHAPE_MAPPER_FAIL', '').split(','):
+    sys.exit(1)
+
+os.makedirs(options['--out'], exist_ok=True)
+for file_name in ['Pipeline_{{}}_profile.txt', 'Pipeline_{{}}.shape']:
+    with open(os.path.join(options['--out'], file_name.format(name)), 'w') as outfile:
+        outfile.write(name)
+"""
+
+CONFIG = """
+data_source_folder_path: '{data_folder}'
+output_folder_path: '{working_folder}'
+data_source_barcode_as_folder_name: false
+shape_use_folder: false
+shape_modified_r1: 'modified_R1.fastq'
+shape_modified_r2: 'modified_R2.fastq'
+shape_untreated_r1: 'untreated_R1.fastq'
+shape_untreated_r2: 'untreated_R2.fastq'
+shape_denatured_r1: ''
+shape_min_read_depth: 5000
+shape_extra_flags: '--overwrite --output-counted'
+shape_executable: '{executable}'
+"""
+
+RNA_IDS = ['001', '002', '003', '004']
+
+
+@pytest.fixture
+def configs(tmpdir, monkeypatch):
+    folder = str(tmpdir)
+    executable = os.path.join(folder, 'shapemapper')
+    with open(executable, 'w') as outfile:
+        outfile.write(FAKE_SHAPE_MAPPER.format(python=sys.executable))
+    os.chmod(executable, os.stat(executable).st_mode | stat.S_IEXEC)
+
+    data_folder = os.path.join(folder, 'data')
+    for rna_id in RNA_IDS:
+        os.makedirs(os.path.join(data_folder, rna_id))
+
+    config_file = os.path.join(folder, 'config.yaml')
+    with open(config_file, 'w') as outfile:
+        outfile.write(CONFIG.format(data_folder=data_folder, working_folder=os.path.join(folder, 'results'),
+                                    executable=executable))
+    configs = RnaLibConfig(config_file)
+    configs.decide_working_folder(folder)
+    os.makedirs(configs.working_folder)
+
+    monkeypatch.setenv('FAKE_SHAPE_MAPPER_LOG', os.path.join(folder, 'runs.jsonl'))
+    return configs
+
+
+def rna_items():
+    return [LibraryItem(rna_id, 'ACGTAC', 'GGGAAACCCAUGC') for rna_id in RNA_IDS]
+
+
+def load_runs(configs):
+    with open(os.path.join(os.path.dirname(configs.working_folder), 'runs.jsonl')) as infile:
+        return dict((run[0], run[1:]) for run in (json.loads(line) for line in infile))
+
+
+class TestShapeMapperScheduler(object):
+
+    def test_packing(self, configs):
+        scheduler = ShapeMapperScheduler(configs, total_cores=4)
+        results = scheduler.run(rna_items(), threads={'001': 3, '002': 2, '003': 1, '004': 8})
+
+        assert list(results) == RNA_IDS
+        assert all(result.ok for result in results.values())
+        assert [result.threads for result in results.values()] == [3, 2, 1, 4]
+
+        runs = load_runs(configs)
+        assert [runs[rna_id][0] for rna_id in RNA_IDS] == [3, 2, 1, 4]
+        # Run in the data folder of each item
+        for rna_id in RNA_IDS:
+            assert runs[rna_id][3] == os.path.join(configs['data_source_folder_path'], rna_id)
+
+        # Never more than the total cores at a time
+        events = sorted([(start, threads) for threads, start, end, _, _ in runs.values()] +
+                        [(end, -threads) for threads, start, end, _, _ in runs.values()])
+        used_cores = max_cores = 0
+        for _, threads in events:
+            used_cores += threads
+            max_cores = max(max_cores, used_cores)
+        assert max_cores <= 4
+
+        # "003" fits next to "001", ahead of "002"
+        assert runs['003'][1] < runs['001'][2]
+        assert runs['002'][1] >= runs['001'][2] - 0.05
+
+    def test_results(self, configs, monkeypatch):
+        monkeypatch.setenv('FAKE_SHAPE_MAPPER_FAIL', '002')
+        results = ShapeMapperScheduler(configs, threads_per_job=2).run(rna_items())
+
+        assert [rna_id for rna_id, result in results.items() if not result.ok] == ['002']
+        assert results['002'].return_code == 1 and results['002'].profile_file is None
+
+        # The temp folders are removed as soon as the jobs finish
+        assert all(run[4] for run in load_runs(configs).values())
+        assert os.listdir(get_shape2_path('temp', configs.working_folder)) == []
+
+        # The output files are indexed
+        assert results['001'].profile_file == get_shape2_path('profile', configs.working_folder, '001', 'ACGTAC')
+        assert results['001'].shape_file == get_shape2_path('shape', configs.working_folder, '001', 'ACGTAC')
+        index = ShapeMapperScheduler.load_index(configs.working_folder)
+        assert index == results
+        assert os.path.exists(os.path.join(results['002'].output_folder, ShapeMapperScheduler.JOB_OUTPUT_FILE_NAME))
+
+    def test_other_name(self, tmpdir):
+        output_folder = str(tmpdir)
+        for file_name in ['Sample_001_profile.txt', 'Sample_001.shape']:
+            with open(os.path.join(output_folder, file_name), 'w') as outfile:
+                outfile.write('')
+
+        assert ShapeMapperScheduler.find_output_file(output_folder, '001', ShapeMapperScheduler.PROFILE_FILE_SUFFIX) \
+            == os.path.join(output_folder, 'Sample_001_profile.txt')
+        assert ShapeMapperScheduler.find_output_file(output_folder, '002', ShapeMapperScheduler.SHAPE_FILE_SUFFIX) \
+            is None
+
+
+def render_job_script(template, values):
+    r"""
+    Render a PyPPL job script - only the "squote" placeholders are used.
+    """
+    return re.sub(r'{{\s*(\S+)\s*\|\s*squote\s*}}', lambda match: repr(values[match.group(1)]), template)
+
+
+class TestProfilingJobScript(object):
+
+    def test_shape_mapper_job(self, monkeypatch):
+        # The profiling script only runs under `__main__` - loading it has no side effects
+        monkeypatch.syspath_prepend(SCRIPTS_DIR)
+        spec = importlib.util.spec_from_file_location('rna_lib_profiling', PROFILING_SCRIPT_PATH)
+        profiling = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(profiling)
+
+        calls = []
+        monkeypatch.setattr(ShapeMapperRunner, 'shape_mapper_v2',
+                            classmethod(lambda cls, configs_json, rna_item_json: calls.append((configs_json,
+                                                                                               rna_item_json))))
+        job_script = render_job_script(profiling.SHAPE_MAPPER_JOB_SCRIPT,
+                                       {'args.configs': '{"a": "it\'s"}', 'in.rna_item_json': '{"rna_id": "001"}'})
+        exec(compile(job_script, 'pShape.script', 'exec'), {'__name__': '__main__'})
+
+        assert calls == [('{"a": "it\'s"}', '{"rna_id": "001"}')]
+
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import os
+import pytest
+
+from neoRNA.library.summary_index import StructureSummaryIndex, structure_hash
+from neoRNA.util.file_utils import FileUtils
+
+parametrize = pytest.mark.parametrize
+
+SUMMARY_ITEMS = [
+    {'rna_id': '001', 'mutation_syntax': 'wt', 'sequence_string': 'GGGAAACCC',
+     'computational_structure': '(((...)))', 'A-to-I_editing_level': 0.5, 'A-to-I_editing_site': 5},
+    {'rna_id': '002', 'mutation_syntax': '2GtoA', 'sequence_string': 'GAGAAACCC',
+     'computational_structure': '.((...)).', 'A-to-I_editing_level': 0.2, 'A-to-I_editing_site': 5},
+    {'rna_id': '003', 'mutation_syntax': '2GtoA,8CtoU', 'sequence_string': 'GAGAAACUC',
+     'computational_structure': '(((...)))', 'A-to-I_editing_level': None, 'A-to-I_editing_site': 5},
+    {'rna_id': '004', 'mutation_syntax': 'indel4-5', 'sequence_string': 'GGGACCC',
+     'computational_structure': '.......', 'A-to-I_editing_level': 0.1, 'A-to-I_editing_site': 4},
+    {'rna_id': '005', 'mutation_syntax': '8CtoG', 'sequence_string': 'GGGAAACGC',
+     'computational_structure': '.........', 'A-to-I_editing_level': 0.3, 'A-to-I_editing_site': 5},
+]
+
+
+@pytest.fixture(params=['summary.json', 'summary.jsonl'])
+def summary_file(request, tmpdir):
+    file_path = os.path.join(str(tmpdir), request.param)
+    FileUtils.save_json_items(file_path, SUMMARY_ITEMS)
+    return file_path
+
+
+class TestStructureSummaryIndex(object):
+
+    def test_lookup(self, summary_file):
+        index = StructureSummaryIndex.load(summary_file)
+        assert len(index) == 5 and '003' in index and '006' not in index
+
+        assert index.wt_rna_id == '001'
+        assert index.wt()['sequence_string'] == 'GGGAAACCC'
+        assert index.get('004') == SUMMARY_ITEMS[3]
+
+        assert index.by_mutation_position(2) == ['002', '003']
+        assert index.by_mutation_position(5) == ['004']
+        assert index.by_mutation_count(1) == ['002', '004', '005']
+        assert index.by_structure('(((...)))') == ['001', '003']
+        assert index.by_structure(structure_hash('.......'), hashed=True) == ['004']
+
+        # Single mutants in the 3' stem
+        assert index.query(mutation_count=1, positions=[7, 8, 9]) == ['005']
+        assert index.query(predicate=lambda record: record['editing_level'] is None) == ['003']
+
+    def test_persist(self, summary_file):
+        index_file = StructureSummaryIndex.index_file_path(summary_file)
+        assert not os.path.exists(index_file)
+        StructureSummaryIndex.load(summary_file)
+        assert os.path.exists(index_file)
+
+        # Loaded from the index file
+        index = StructureSummaryIndex.load(summary_file)
+        assert index.get('005')['mutation_syntax'] == '8CtoG'
+
+        # Out of date - rebuilt
+        FileUtils.save_json_items(summary_file, SUMMARY_ITEMS[:2])
+        assert len(StructureSummaryIndex.load(summary_file)) == 2
+
+    def test_editing_levels(self, summary_file, tmpdir):
+        editing_level_file = os.path.join(str(tmpdir), 'editing_level_position.csv')
+        with open(editing_level_file, 'w') as outfile:
+            outfile.write('RNA_ID_STR,Avg,Editing_position\n001,0.9,5\n003,NA,6\n004,0.4,NA\n')
+
+        index = StructureSummaryIndex.load(summary_file, editing_level_file)
+        assert index.get('001')['A-to-I_editing_level'] == 0.9
+        assert index.record('003')['editing_level'] is None
+        assert index.record('003')['editing_site'] == 6
+        assert index.record('004')['editing_site'] is None
+        assert index.record('002')['editing_level'] == 0.2
+
+    def test_overlays(self, summary_file, tmpdir):
+        overlay_file = os.path.join(str(tmpdir), 'adjusted.overlay.jsonl')
+        FileUtils.save_json_items(overlay_file, [
+            {'rna_id': '002', 'sequence_string': 'GAGAAAC', 'computational_structure': '(.(.).)'},
+            {'rna_id': '005', 'mutation_syntax': '2GtoA'},
+        ])
+
+        index = StructureSummaryIndex.load(summary_file, overlay_file_paths=[overlay_file])
+        assert index.get('002')['sequence_string'] == 'GAGAAAC'
+        assert index.get('002')['A-to-I_editing_level'] == 0.2
+        assert index.by_structure('(.(.).)') == ['002']
+        assert index.by_mutation_position(2) == ['002', '003', '005']
+
+        # The index with overlays is only reused for the same overlays
+        assert StructureSummaryIndex.load(summary_file, overlay_file_paths=[overlay_file]).get('005') == \
+            dict(SUMMARY_ITEMS[4], mutation_syntax='2GtoA')
+        assert StructureSummaryIndex.load(summary_file).get('005') == SUMMARY_ITEMS[4]
+
+        FileUtils.save_json_items(overlay_file, [{'rna_id': '006', 'mutation_syntax': 'wt'}])
+        with pytest.raises(ValueError):
+            StructureSummaryIndex.load(summary_file, overlay_file_paths=[overlay_file])
+
+    @parametrize('mutation_syntax', ['', 'wt_2', 'del5'])
+    def test_malformed_syntax(self, mutation_syntax):
+        record = StructureSummaryIndex.build_record(dict(SUMMARY_ITEMS[1], mutation_syntax=mutation_syntax))
+        if mutation_syntax == 'wt_2':
+            assert record['mutation_type'] is not None and record['mutation_count'] == 0
+        else:
+            assert record['mutation_type'] is None and record['mutation_count'] is None
+        assert record['mutation_positions'] == []
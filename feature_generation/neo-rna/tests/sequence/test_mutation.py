@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from neoRNA.sequence.sequence import Sequence
+from neoRNA.sequence.mutation import Mutation, MutationType, parse_mutation_syntax, format_mutation_syntax, \
+    call_mutations
+
+parametrize = pytest.mark.parametrize
+
+
+class TestMutationSyntax(object):
+
+    def test_parse(self):
+        assert parse_mutation_syntax(None) == []
+        assert parse_mutation_syntax('WT') == [Mutation(MutationType.WildType, None, None, None)]
+        assert parse_mutation_syntax('indel') == [Mutation(MutationType.Indel, None, None, None)]
+        assert parse_mutation_syntax('indel45-47') == [Mutation(MutationType.Indel, 45, None, None, 47)]
+        assert parse_mutation_syntax(' 44gtoA, 51CtoU') == [
+            Mutation(MutationType.Mismatch, 44, 'G', 'A', 44),
+            Mutation(MutationType.Mismatch, 51, 'C', 'U', 51),
+        ]
+
+    @parametrize('mutation_syntax', ['', '44GtoA,', '44G>A', '0AtoG', 'wild', 'indel-3', '44GtoA,indel'])
+    def test_parse_invalid(self, mutation_syntax):
+        with pytest.raises(ValueError):
+            parse_mutation_syntax(mutation_syntax)
+
+    @parametrize('mutation_syntax, expected', [
+        ('', None), ('44G>A', None), ('del5', None), ('44GtoA,indel', None),
+        ('wt_2', [Mutation(MutationType.WildType, None, None, None)]),
+        ('indel-3', [Mutation(MutationType.Indel, None, None, None)]),
+        ('46AtoG', [Mutation(MutationType.Mismatch, 46, 'A', 'G', 46)]),
+    ])
+    def test_parse_lenient(self, mutation_syntax, expected):
+        assert parse_mutation_syntax(mutation_syntax, strict=False) == expected
+
+    @parametrize('mutation_syntax', ['wt', 'indel', 'indel12', 'indel12-14', '46AtoG', '12AtoG,30CtoU'])
+    def test_round_trip(self, mutation_syntax):
+        assert format_mutation_syntax(parse_mutation_syntax(mutation_syntax)) == mutation_syntax
+
+    def test_format(self):
+        assert format_mutation_syntax([]) is None
+        with pytest.raises(ValueError):
+            format_mutation_syntax(parse_mutation_syntax('wt') + parse_mutation_syntax('46AtoG'))
+
+
+class TestCallMutations(object):
+
+    def test_library(self):
+        wt_sequence = 'GGGAAACCCUUU'
+        sequences = ['GGGAAACCCUUU', 'GGGAGACCCUUA', 'GGGACCCUUU', 'GGGAAAUUCCCUUU', 'GGGAAACCCTTT']
+        mutation_table = call_mutations(wt_sequence, sequences, seq_type_rna=True)
+
+        assert mutation_table.mutation_counts.tolist() == [0, 2, 1, 1, 0]
+        assert mutation_table.syntax_strings('wt') == ['wt', '5AtoG,12UtoA', 'indel5-6', 'indel7-6', 'wt']
+        assert mutation_table.positions(1) == [5, 12]
+        assert mutation_table.mutations(1)[0] == Mutation(MutationType.Mismatch, 5, 'A', 'G', 5)
+
+        # As strings - "T" and "U" differ
+        assert call_mutations(wt_sequence, sequences).mutation_counts.tolist() == [0, 2, 1, 1, 3]
+
+    def test_generate_mutation_syntax(self):
+        sequence = Sequence('GGGAGACCCUUA')
+        assert sequence.generate_mutation_syntax('GGGAAACCCUUU', seq_type_rna=True) == ([5, 12], ['5AtoG', '12UtoA'])
+        assert sequence.generate_mutation_syntax('GGGAAACCCUUU', seq_type_rna=True,
+                                                 sequence_position_counter_offset=10) == ([15, 22],
+                                                                                          ['15AtoG', '22UtoA'])
+        assert sequence.generate_mutation_syntax('GGGAAACCCUU', seq_type_rna=True) == (None, None)
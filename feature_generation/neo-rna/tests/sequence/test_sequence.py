@@ -35,3 +35,19 @@ class TestSequence(object):
         assert sequence.length is 11
         assert sequence.start_position is 12
         assert sequence.end_position is 22
+
+    def test_sequence_lazy_seq(self):
+        sequence = Sequence(self.sequence, self.sequence_range)
+
+        assert not hasattr(sequence, '__dict__')
+        assert sequence.sequence_str == self.sequence
+        assert sequence.get_nt(12) == 'C' and sequence.get_nt(22) == 'U' and sequence.get_nt(23) is None
+        assert str(sequence.get_dna_sequence()) == 'CTCTGATCTCT'
+        assert str(sequence.get_rna_sequence()) == self.sequence
+        assert sequence.sequence is sequence.sequence
+
+        dna_sequence = Sequence('CTCTGATCTCT')
+        assert dna_sequence.get_dna_sequence() == 'CTCTGATCTCT'
+        assert dna_sequence.get_rna_sequence() == self.sequence
+        assert dna_sequence.get_reverse_complement() == 'AGAGATCAGAG'
+        assert dna_sequence.generate_mutation_syntax('CUCUGAUCUCC', seq_type_rna=True) == ([11], ['11CtoU'])
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import os
+
+import pytest
+
+from neoRNA.io.bp_rna_io import BpRnaIO
+from neoRNA.structure import SecondaryStructureElementType
+from neoRNA.structure.bp_rna_annotator import BpRnaAnnotator
+
+parametrize = pytest.mark.parametrize
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+EXAMPLE_FILE_PATH = os.path.join(TESTS_DIR, 'io', 'example_files', 'bprna_example.st')
+FEATURE_GENERATION_DIR = os.path.dirname(os.path.dirname(TESTS_DIR))
+REPO_DIR = os.path.dirname(FEATURE_GENERATION_DIR)
+BPRNA_FILE_PATH = os.path.join(REPO_DIR, 'bpRNA_wrapper', 'bpRNA.txt.gz')
+
+
+def load_records():
+    r"""
+    All the records of the bundled `bpRNA.pl` output, as "#Name..." texts.
+    """
+
+    records = []
+    if os.path.exists(BPRNA_FILE_PATH):
+        with gzip.open(BPRNA_FILE_PATH, 'rt') as handle:
+            chunks = handle.read().split('\n>')
+        for chunk in chunks:
+            body = chunk.partition('\n')[2]
+            records.append(body.rstrip('\n') + '\n')
+
+    return records
+
+
+RECORDS = load_records()
+with open(EXAMPLE_FILE_PATH) as example_handle:
+    EXAMPLE_RECORD = example_handle.read()
+
+
+def element_summary(element):
+    return (element.ele_type, element.raw_string, element.base_pair_count,
+            [(str(sequence), sequence.start_position, sequence.end_position) for sequence in element.sequence_list],
+            [str(base_pair) for base_pair in element.base_pair_list])
+
+
+class TestBpRnaAnnotator(object):
+
+    @parametrize('record', RECORDS, ids=range(len(RECORDS)))
+    def test_to_st(self, record):
+        lines = record.split('\n')
+        name = lines[0].split(': ', 1)[1]
+        assert BpRnaAnnotator.to_st(lines[3], lines[4], name) == record
+
+    @parametrize('record', [EXAMPLE_RECORD] + RECORDS, ids=range(len(RECORDS) + 1))
+    def test_to_secondary_structure(self, record):
+        expected = next(BpRnaIO.parse_iterator(io.StringIO(record)))
+        lines = record.split('\n')
+        secondary_structure = BpRnaAnnotator.to_secondary_structure(lines[3], lines[4], expected.comment)
+
+        assert secondary_structure.comment == expected.comment
+        assert secondary_structure.dot_bracket_annotation == expected.dot_bracket_annotation
+        assert [element_summary(element) for element in secondary_structure.elements] \
+            == [element_summary(element) for element in expected.elements]
+
+    def test_annotate(self):
+        annotation = BpRnaAnnotator.annotate('GGGAAACCCAGGCAAAAGCUUAA', '(((...)))..((.(....))).')
+        assert annotation.structure_array == 'SSSHHHSSSXXSSBSHHHHSSSE'
+        assert annotation.segment_count == 2
+        assert [element.label for element in annotation.elements] \
+            == ['S1', 'S2', 'S3', 'H1', 'H2', 'B1', 'X1', 'E1', 'segment1', 'segment2']
+
+        stems = [element for element in annotation.elements
+                 if element.ele_type == SecondaryStructureElementType.Stem]
+        assert stems[1].spans == [(12, 13), (21, 22)]
+
+    def test_run(self):
+        st_str, secondary_structure = BpRnaAnnotator.run('GGGAAACCCAGGCAAAAGCUUAA', '(((...)))..((.(....))).')
+        assert st_str == BpRnaAnnotator.to_st('GGGAAACCCAGGCAAAAGCUUAA', '(((...)))..((.(....))).')
+        assert st_str.split('\n')[1] == '#Length:  23 '
+        assert secondary_structure.comment == BpRnaAnnotator.DEFAULT_NAME
+        assert len(list(secondary_structure.get_elements(SecondaryStructureElementType.Unpaired))) == 1
+
+    @parametrize('dot_bracket', ['((..[[..))..]]', '((...)'])
+    def test_invalid(self, dot_bracket):
+        with pytest.raises(ValueError):
+            BpRnaAnnotator.annotate('A' * len(dot_bracket), dot_bracket)
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import random
+
+import numpy as np
+import pytest
+
+from neoRNA.structure import DotBracketNotation
+from neoRNA.structure.pairing import NESTED_BRACKETS, partner_array, partner_matrix, pair_list, to_pair_table, \
+    to_ct, to_bpseq, graph_edges
+
+parametrize = pytest.mark.parametrize
+
+
+def random_structure(length, families='()[]Aa'):
+    r"""
+    A random structure, with crossing pairs between the families.
+    """
+    structure = ['.'] * length
+    for index in range(0, len(families), 2):
+        opener, closer = families[index], families[index + 1]
+        stack = []
+        for position in range(length):
+            if structure[position] != '.':
+                continue
+            draw = random.random()
+            if draw < 0.2:
+                structure[position] = opener
+                stack.append(position)
+            elif draw < 0.4 and stack:
+                stack.pop()
+                structure[position] = closer
+        for position in stack:
+            structure[position] = '.'
+    return ''.join(structure)
+
+
+class TestPairing(object):
+
+    def test_partner_array(self):
+        structure = '((..[[..))..]]A.{.a}.<>'
+        partners = partner_array(structure)
+        assert partners.dtype == np.int32
+        assert pair_list(partners) == [(1, 8), (0, 9), (5, 12), (4, 13), (14, 18), (16, 19), (21, 22)]
+
+        # Nested pairs only
+        assert pair_list(partner_array(structure, NESTED_BRACKETS)) == [(1, 8), (0, 9)]
+        assert list(to_pair_table(partner_array('(.)'))) == [3, 3, 0, 1]
+
+    @parametrize('structure', ['((..)', '(..))', ')(', '[..)'])
+    def test_unbalanced(self, structure):
+        with pytest.raises(ValueError):
+            partner_array(structure)
+        with pytest.raises(ValueError):
+            partner_matrix([structure])
+
+    def test_not_strict(self):
+        assert pair_list(partner_array(')((..)', NESTED_BRACKETS, strict=False)) == [(2, 5)]
+
+    def test_partner_matrix(self):
+        random.seed(7)
+        structures = [random_structure(random.randint(0, 60)) for _ in range(200)]
+        matrix = partner_matrix(structures, length=64)
+        assert matrix.shape == (200, 64) and matrix.dtype == np.int32
+        for row, structure in zip(matrix, structures):
+            assert list(row[:len(structure)]) == list(partner_array(structure))
+            assert (row[len(structure):] == -1).all()
+
+    def test_formats(self):
+        partners = partner_array('((.))')
+        assert to_ct('GGACC', partners)[0] == '1 G 0 2 5 1'
+        assert to_bpseq('GGACC', partners) == ['1 G 5', '2 G 4', '3 A 0', '4 C 2', '5 C 1']
+        assert graph_edges(partner_array('(.)')).tolist() == [[0, 2], [0, 1], [1, 2], [1, 0], [2, 0], [2, 1]]
+
+    def test_dot_bracket_notation(self):
+        notation = DotBracketNotation('test', 'GGAAACCAGGAAAC', '((..[..))...].')
+        assert notation.to_ct()[4] == '5 A 4 6 13 5'
+        assert notation.to_bpseq()[12] == '13 A 5'
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+
+import pytest
+
+from neoRNA.io.bp_rna_io import BpRnaIO
+from neoRNA.structure import SecondaryStructureElementType
+
+parametrize = pytest.mark.parametrize
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+EXAMPLE_FILE_PATH = os.path.join(TESTS_DIR, 'io', 'example_files', 'bprna_example.st')
+
+
+@pytest.fixture
+def secondary_structure():
+    with open(EXAMPLE_FILE_PATH) as handle:
+        return next(BpRnaIO.parse_iterator(io.StringIO(handle.read())))
+
+
+class TestSecondaryStructure(object):
+
+    def test_element_spans(self, secondary_structure):
+        for element in secondary_structure.elements:
+            assert not hasattr(element, '__dict__')
+            assert list(element.spans) == [value for sequence in element.sequence_list
+                                           for value in (sequence.start_position or 0, sequence.end_position or 0)]
+
+        spans = secondary_structure.element_spans
+        assert spans.shape[1] == 3
+        assert spans.shape[0] == sum(1 for element in secondary_structure.elements
+                                     for sequence in element.sequence_list if sequence.start_position)
+
+    @parametrize('position', [1, 11, 28, 38, 81])
+    def test_get_elements_at(self, secondary_structure, position):
+        expected = [element for element in secondary_structure.elements if element.is_contain(position)[0]]
+        assert secondary_structure.get_elements_at(position) == expected
+
+        stems = secondary_structure.get_elements_at(position, SecondaryStructureElementType.Stem)
+        assert stems == [element for element in expected if element.ele_type == SecondaryStructureElementType.Stem]
+
+    def test_element_position(self, secondary_structure):
+        hairpin = next(secondary_structure.get_elements(SecondaryStructureElementType.Hairpin))
+        start, end = hairpin.spans[0], hairpin.spans[1]
+
+        assert hairpin.is_contain(start) == (True, hairpin.sequence_list[0])
+        assert hairpin.is_before(end + 1) and not hairpin.is_before(end)
+        assert hairpin.is_after(start - 1)
+        assert hairpin.distance(end + 3) == (-3, hairpin.sequence_list[0])
+        assert hairpin.distance(start - 2) == (2, hairpin.sequence_list[0])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import pytest
+
+from neoRNA.util.file_utils import FileUtils
+from neoRNA.util.runner.batch_fold_runner import get_fold_runner, StubFoldRunner
+
+parametrize = pytest.mark.parametrize
+
+
+class TestBatchFoldRunner(object):
+
+    @parametrize('workers', [1, 3])
+    def test_stub_batch(self, workers):
+        sequences = ['GGGAAACCC', 'ACGU', 'GGGAAACCC', 'A' * 20]
+        fold_runner = get_fold_runner('stub')
+        assert isinstance(fold_runner, StubFoldRunner)
+
+        results = list(fold_runner.fold_batch(sequences, workers=workers))
+        assert [index for index, structure, bpp in results] == list(range(len(sequences)))
+        for (index, structure, bpp), sequence_str in zip(results, sequences):
+            assert structure == '.' * len(sequence_str)
+            assert bpp.shape == (len(sequence_str), len(sequence_str))
+
+    @parametrize('workers', [1, 2])
+    def test_fold_distinct(self, workers):
+        sequences = ['GGGAAACCC', '', 'ACGU', 'GGGAAACCC', None, 'ACGU']
+        results = list(get_fold_runner('stub').fold_distinct(sequences, workers=workers))
+        assert [index for index, structure, bpp in results] == [0, 2, 3, 5]
+        for index, structure, bpp in results:
+            assert structure == '.' * len(sequences[index])
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            get_fold_runner('mfold')
+
+
+class TestJsonItems(object):
+
+    @parametrize('file_name', ['items.json', 'items.jsonl'])
+    def test_save_load(self, tmpdir, file_name):
+        file_path = os.path.join(str(tmpdir), file_name)
+        items = [{'rna_id': '001', 'bpp': [[0.0, 0.5], [0.5, 0.0]]}, {'rna_id': '002', 'bpp': None}]
+
+        assert FileUtils.save_json_items(file_path, (item for item in items)) == 2
+        assert list(FileUtils.load_json_items(file_path)) == items
+
+        if file_name.endswith('.json'):
+            # Same as dumping the whole object at once
+            FileUtils.save_json_to_file(file_path + '.ref', {'items': items})
+            assert open(file_path).read() == open(file_path + '.ref').read()
+
+    def test_overlay(self, tmpdir):
+        file_path = os.path.join(str(tmpdir), 'items.json')
+        FileUtils.save_json_items(file_path, [{'rna_id': '001', 'seq': 'A', 'level': 0.1},
+                                              {'rna_id': '002', 'seq': 'C', 'level': 0.2}])
+        overlay_paths = [os.path.join(str(tmpdir), 'overlay_{}.jsonl'.format(index)) for index in range(2)]
+        FileUtils.save_json_items(overlay_paths[0], [{'rna_id': '002', 'seq': 'G'}])
+        FileUtils.save_json_items(overlay_paths[1], [{'rna_id': '002', 'seq': 'U'}])
+
+        assert list(FileUtils.load_json_items_with_overlay(file_path, overlay_paths)) == [
+            {'rna_id': '001', 'seq': 'A', 'level': 0.1},
+            {'rna_id': '002', 'seq': 'U', 'level': 0.2},
+        ]
+        assert list(FileUtils.load_json_items_with_overlay(file_path)) == list(FileUtils.load_json_items(file_path))
+
+        # A record not in the base file
+        FileUtils.save_json_items(overlay_paths[1], [{'rna_id': '002', 'seq': 'U'}, {'rna_id': '003', 'seq': 'A'}])
+        with pytest.raises(ValueError):
+            list(FileUtils.load_json_items_with_overlay(file_path, overlay_paths))
+
+    def test_empty(self, tmpdir):
+        file_path = os.path.join(str(tmpdir), 'items.json')
+        assert FileUtils.save_json_items(file_path, iter([])) == 0
+        assert json.load(open(file_path)) == {'items': []}
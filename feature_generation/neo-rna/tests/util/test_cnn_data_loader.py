@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+NEURAL_NET_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(TESTS_DIR))), 'neural_net')
+sys.path.insert(0, NEURAL_NET_DIR)
+
+from build_cnn_dataset import one_hot_encode, pad_offsets, seq_lut, struct_lut  # noqa: E402
+from cnn_data_loader import CNNBatchGenerator  # noqa: E402
+
+parametrize = pytest.mark.parametrize
+
+SEQUENCES = ['GGGAAACCC', 'ACGUACGUACGUAC', 'GGCAAAGCC', 'ACGUACGUACGUACGUAC']
+STRUCTURES = ['SSSHHHSSS', 'EESSSHHHHSSSEE', 'SSSHHHSSS', 'EESSSHHHHHHHHSSSEE']
+
+
+def build_dataset(length):
+    r"""
+    A dataset as `build_cnn_dataset.build_dataset` writes it - padded (or cropped) to `length`, centered.
+    """
+    lengths = np.array([len(sequence) for sequence in SEQUENCES], dtype=np.int64)
+    offsets = pad_offsets(lengths, length, 'center')
+    return {
+        'seq': one_hot_encode(SEQUENCES, seq_lut, length, offsets),
+        'struct': one_hot_encode(STRUCTURES, struct_lut, length, offsets),
+        'y': np.linspace(0.1, 0.4, len(SEQUENCES)),
+        'length': lengths,
+        'offset': offsets,
+    }
+
+
+class TestCNNBatchGenerator(object):
+
+    @parametrize('length', [20, 12])
+    def test_jitter(self, length):
+        dataset = build_dataset(length)
+        generator = CNNBatchGenerator(dataset, batch_size=len(SEQUENCES), shuffle=False, jitter=5)
+
+        for epoch in range(20):
+            (seq, struct), y = generator[0]
+            assert y.tolist() == dataset['y'].tolist()
+            for row in range(len(SEQUENCES)):
+                # The nucleotides in the window are kept - shifted together, never pushed out
+                assert seq[row].sum() == dataset['seq'][row].sum()
+                assert struct[row].sum() == dataset['struct'][row].sum()
+                shift = int(np.argmax(seq[row].any(axis=1))) - int(np.argmax(dataset['seq'][row].any(axis=1)))
+                assert np.array_equal(np.roll(dataset['seq'][row], shift, axis=0), seq[row])
+                assert np.array_equal(np.roll(dataset['struct'][row], shift, axis=0), struct[row])
+                if dataset['length'][row] >= length:
+                    # Cropped by `--length` - no room to move
+                    assert shift == 0
+            generator.on_epoch_end()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+
+from functools import partial
+
+import pytest
+
+from neoRNA.util.runner.dag_runner import DagRunner, Stage, StageResource
+
+parametrize = pytest.mark.parametrize
+
+
+# ----------------------------------
+# Stage functions - module level, for the process pools
+
+def double(value):
+    return value * 2
+
+
+def slow_increase(value):
+    # The first items are the slowest - the later ones are streamed downstream first
+    time.sleep(0.05 * (5 - value) if value < 5 else 0)
+    return value + 1
+
+
+def fail_on(value, bad_values):
+    if value in bad_values:
+        raise ValueError('Bad value', value)
+    return value
+
+
+def flaky(value, folder, failures=2):
+    r"""
+    Fail the first "failures" runs of each value - counted with files, across the processes.
+    """
+    marker = os.path.join(folder, '{}.count'.format(value))
+    count = int(open(marker).read()) if os.path.exists(marker) else 0
+    with open(marker, 'w') as outfile:
+        outfile.write(str(count + 1))
+    if count < failures:
+        raise RuntimeError('Not yet', value)
+    return value
+
+
+def record(value, folder):
+    with open(os.path.join(folder, 'order.txt'), 'a') as outfile:
+        outfile.write('{}\n'.format(value))
+    return value
+
+
+def combine(values):
+    return sorted(values.items())
+
+
+def total(results):
+    return sum(results.values())
+
+
+class TestDagRunner(object):
+
+    @parametrize('resource', [StageResource.Io, StageResource.Cpu])
+    def test_stream(self, tmpdir, resource):
+        items = [(value, value) for value in range(8)]
+        runner = DagRunner([
+            Stage('increase', slow_increase, resource, workers=4),
+            Stage('record', partial(record, folder=str(tmpdir)), StageResource.Io, workers=1, depends=['increase']),
+            Stage('total', total, resource, depends=['record'], per_item=False),
+        ])
+        report = runner.run(items)
+
+        assert report.ok
+        # The results are in the input order
+        assert list(report.results['increase'].items()) == [(value, value + 1) for value in range(8)]
+        assert report.results['total'] == {None: sum(value + 1 for value in range(8))}
+
+        # Each item is sent downstream as soon as it is done - not in the input order
+        with open(os.path.join(str(tmpdir), 'order.txt')) as infile:
+            order = [int(line) for line in infile]
+        assert sorted(order) == list(range(1, 9))
+        assert order != sorted(order)
+
+        stats = report.stats['increase']
+        assert (stats.done, stats.failed, stats.skipped, stats.attempts) == (8, 0, 0, 8)
+        assert stats.throughput > 0 and stats.wall_time > 0
+        assert 'increase' in report.format()
+
+    def test_depends(self):
+        items = [('a', 1), ('b', 2)]
+        runner = DagRunner([
+            Stage('double', double, StageResource.Io),
+            Stage('same', partial(fail_on, bad_values=[]), StageResource.Io),
+            Stage('combine', combine, StageResource.Io, depends=['double', 'same']),
+            Stage('collect', dict, StageResource.Io, depends=['combine'], per_item=False),
+        ])
+        report = runner.run(items)
+
+        assert report.ok
+        assert report.results['collect'][None] == {'a': [('double', 2), ('same', 1)],
+                                                   'b': [('double', 4), ('same', 2)]}
+
+    @parametrize('resource', [StageResource.Io, StageResource.Cpu])
+    def test_retry(self, tmpdir, resource):
+        runner = DagRunner([
+            Stage('flaky', partial(flaky, folder=str(tmpdir)), resource, workers=2, retries=2, backoff=0.01),
+        ])
+        report = runner.run([(value, value) for value in range(3)])
+
+        assert report.ok
+        assert report.stats['flaky'].attempts == 9
+        assert list(report.results['flaky'].values()) == [0, 1, 2]
+
+    def test_failures(self):
+        runner = DagRunner([
+            Stage('check', partial(fail_on, bad_values=[2, 4]), StageResource.Io, retries=1, backoff=0),
+            Stage('double', double, StageResource.Io, depends=['check']),
+            Stage('total', total, StageResource.Io, depends=['double'], per_item=False),
+            Stage('fail', partial(fail_on, bad_values=[8]), StageResource.Io, depends=['total'], per_item=False,
+                  retries=0),
+            Stage('after', double, StageResource.Io, depends=['fail'], per_item=False),
+        ])
+        report = runner.run([(value, value) for value in range(5)])
+
+        assert not report.ok
+        # The failed items are reported, and skipped downstream
+        assert [(failure.stage, failure.key, failure.attempts) for failure in report.failures] \
+            == [('check', 2, 2), ('check', 4, 2), ('fail', None, 1)]
+        assert 'ValueError' in report.failures[0].error
+        assert sorted(report.skipped['double']) == [2, 4]
+        assert report.stats['double'].done == 3
+
+        # The collect stage runs on the items which succeeded
+        assert report.results['total'] == {None: 8}
+        assert report.skipped['after'] == [None]
+        assert 'FAILED - check - 2' in report.format()
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            DagRunner([])
+        with pytest.raises(ValueError):
+            DagRunner([Stage('a', double, depends=['b']), Stage('b', double, depends=['a'])])
+        with pytest.raises(ValueError):
+            DagRunner([Stage('a', double), Stage('a', double)])
+        with pytest.raises(ValueError):
+            DagRunner([Stage('a', double, per_item=False), Stage('b', double, depends=['a'])])
+        with pytest.raises(ValueError):
+            Stage('a', double, 'gpu')
+
+        assert StageResource.default_workers(StageResource.Matlab) == 1
+        assert not StageResource.uses_processes(StageResource.Io)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+import os
+import math
+import pytest
+from xml.etree import ElementTree
+
+from neoRNA.util.runner.svg_structure_runner import SvgStructureRunner, radial_layout, pair_table
+
+parametrize = pytest.mark.parametrize
+
+SVG_NS = '{http://www.w3.org/2000/svg}'
+
+
+class TestSvgStructureRunner(object):
+
+    @parametrize('structure', ['.........', '(((...)))', '((((...((((....))))..((((....)))).))))....'])
+    def test_layout(self, structure):
+        coordinates = radial_layout(structure)
+        assert len(coordinates) == len(structure)
+
+        # Even backbone, no overlapping nt, and base pairs as long as the backbone
+        table = pair_table(structure)
+        for index in range(len(structure) - 1):
+            assert math.dist(coordinates[index], coordinates[index + 1]) == pytest.approx(15.0)
+        for index in range(len(structure)):
+            for other in range(index + 1, len(structure)):
+                assert math.dist(coordinates[index], coordinates[other]) > 14.9
+            if table[index + 1]:
+                assert math.dist(coordinates[index], coordinates[table[index + 1] - 1]) == pytest.approx(15.0)
+
+    @parametrize('workers', [1, 2])
+    def test_gen_struct_images(self, tmpdir, workers):
+        runner = SvgStructureRunner()
+        out_folder = str(tmpdir.mkdir('images'))
+        options = {
+            'baseNum': '#000000',
+            'highlightRegion': runner.gen_highlight_region_str([{'nt_range': '5-5', 'fill': '#0B4F6C'}]),
+            'annotations': runner.gen_annotation_str([{'annotation_str': 'E-5', 'anchor': '5'}]),
+            'title': 'RNA & co',
+        }
+        jobs = [{
+            'sequence': 'GGGAAACCC',
+            'structure': '(((...)))',
+            'out_file': os.path.join(out_folder, '{}.{}'.format(index, runner.IMAGE_EXTENSION)),
+            'options': options,
+        } for index in range(4)]
+
+        assert len(runner.gen_struct_images(jobs, workers=workers)) == 4
+        root = ElementTree.parse(jobs[0]['out_file']).getroot()
+        assert [circle.get('fill') for circle in root.iter(SVG_NS + 'circle')] == ['#0B4F6C']
+        assert len(list(root.iter(SVG_NS + 'line'))) == 3
+        texts = [text.text for text in root.iter(SVG_NS + 'text')]
+        assert 'RNA & co' in texts and 'E-5' in texts
+
+        # Up to date - nothing to render
+        assert runner.gen_struct_images(jobs, workers=workers) == []
+
+    def test_unbalanced_structure(self, tmpdir):
+        with pytest.raises(ValueError):
+            pair_table('((...)')
+        out_file = os.path.join(str(tmpdir), 'bad.svg')
+        assert SvgStructureRunner().gen_struct_images([{
+            'sequence': 'GGAAAC', 'structure': '((...)', 'out_file': out_file, 'options': {}}]) == []
+        assert not os.path.exists(out_file)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+import pytest
+
+from neoRNA.util.runner.verna_runner import VarnaRunner
+
+parametrize = pytest.mark.parametrize
+
+# A "java" stand-in - writes the arguments into the "-o" file
+FAKE_JAVA = '''#!/usr/bin/env python
+import sys
+args = sys.argv[1:]
+with open(args[args.index('-o') + 1], 'w') as outfile:
+    outfile.write(' '.join(args))
+'''
+
+
+@pytest.fixture
+def fake_java(tmpdir, monkeypatch):
+    bin_folder = tmpdir.mkdir('bin')
+    java_path = os.path.join(str(bin_folder), 'java')
+    with open(java_path, 'w') as outfile:
+        outfile.write(FAKE_JAVA)
+    os.chmod(java_path, os.stat(java_path).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', str(bin_folder) + os.pathsep + os.environ['PATH'])
+    return java_path
+
+
+class TestVarnaRunner(object):
+
+    @parametrize('workers', [1, 4])
+    def test_gen_struct_images(self, tmpdir, fake_java, workers):
+        varna = VarnaRunner('VARNA.jar')
+        out_folder = str(tmpdir.mkdir('images'))
+        jobs = [{
+            'sequence': 'GGGAAACCC',
+            'structure': '(((...)))',
+            'out_file': os.path.join(out_folder, '{}.png'.format(index)),
+            'options': {'title': 'RNA {}'.format(index)},
+        } for index in range(6)]
+
+        assert len(varna.gen_struct_images(jobs, workers=workers)) == 6
+        assert '-title RNA 3' in open(os.path.join(out_folder, '3.png')).read()
+
+        # Up to date - nothing to render
+        assert varna.gen_struct_images(jobs, workers=workers) == []
+
+        # Changed options, or a missing image
+        jobs[1]['options'] = {'title': 'changed'}
+        os.remove(jobs[2]['out_file'])
+        assert sorted(varna.gen_struct_images(jobs, workers=workers)) == [jobs[1]['out_file'], jobs[2]['out_file']]
+        assert len(varna.gen_struct_images(jobs, workers=workers, skip_existing=False)) == 6
+
+    def test_runner_options(self, tmpdir, fake_java):
+        varna = VarnaRunner('VARNA.jar')
+        varna.varna_options['resolution'] = '2.0'
+        params = varna.gen_params('GGGAAACCC', '(((...)))', 'out.png', {'title': 'RNA'})
+        assert params['resolution'] == '2.0' and params['title'] == 'RNA'
+        assert varna.gen_params('GGGAAACCC', '(((...)))', 'out.png', {'resolution': '1.0'})['resolution'] == '1.0'
+
+    def test_failed_images(self, tmpdir, fake_java):
+        varna = VarnaRunner('VARNA.jar')
+        out_folder = str(tmpdir.mkdir('images'))
+        jobs = [{
+            'sequence': 'GGGAAACCC',
+            'structure': '(((...)))',
+            'out_file': os.path.join(out_folder, name),
+        } for name in ['1.png', os.path.join('missing', '2.png')]]
+
+        report = varna.render_struct_images(jobs)
+        assert report.rendered_files == [jobs[0]['out_file']]
+        assert report.failed_files == [jobs[1]['out_file']]
+        assert report.up_to_date_files == []
+
+        # The failed image is not "up to date"
+        report = varna.render_struct_images(jobs)
+        assert (report.rendered_files, report.failed_files, report.up_to_date_files) \
+            == ([], [jobs[1]['out_file']], [jobs[0]['out_file']])
+
+    def test_option_strings(self):
+        varna = VarnaRunner('VARNA.jar')
+        regions = varna.gen_highlight_region_str([{'nt_range': '47-47', 'fill': '#0B4F6C'}, {'nt_range': '5-5'}])
+        assert regions == '47-47:fill=#0B4F6C,outline=#FFFFFF;5-5:fill=#C55337,outline=#FFFFFF'
+        annotations = varna.gen_annotation_str([{'annotation_str': 'E-47', 'anchor': '47'}])
+        assert annotations == 'E-47:type=B,anchor=47,outline=#000000,size=6'
+        # The class defaults stay untouched
+        assert 'nt_range' not in VarnaRunner.DEFAULT_HIGHLIGHT_REGION_OPTIONS
+        assert VarnaRunner.DEFAULT_ANNOTATION_OPTIONS['anchor'] == '66'
@@ -20,6 +20,9 @@
 #
 # ## Output
 # - Plot (Editing Level vs Ensemble Probability)
+# - The "ensemble features" (in "csv") of all isoforms of the "WT" length - the partition function based
+#   probabilities of the "WT" structure / constraint and of each "WT" pair. They can be added to the ML feature
+#   matrix (see `ana_gen_ml_features.py --ensemble_features`).
 #
 #
 
@@ -36,7 +39,6 @@ local_module_path = \
                     os.path.realpath(__file__)))))
 sys.path.append(local_module_path)
 
-import json
 import csv
 
 import logging
@@ -46,7 +48,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy.stats import pearsonr
 
-from neoRNA.util.runner.rnafold_runner import RnaFoldRunner
+from neoRNA.analysis.ensemble_probability import ENSEMBLE_BACKENDS, get_ensemble_backend, compute_library, \
+    decode_soft_pairs, pair_column_names
+from neoRNA.util.file_utils import FileUtils
 
 # ----------------------------------
 # region Parsing Argument
@@ -60,6 +64,10 @@ arguments_parser = argparse.ArgumentParser(description='RNA Lib Analysis Script
 arguments_parser.add_argument('rna_lib_struct_summary_file',
                               metavar='rna_lib_struct_summary_file.json',
                               help='The file path to the "RNA Lib Structure Summary" file.')
+arguments_parser.add_argument('--overlay', dest='overlays',
+                              action='append', default=None,
+                              help='An "overlay" file (".jsonl") of updated records, merged into the summary items, '
+                                   'such as the output of "util_adjust_sequence.py". Can be repeated.')
 
 # Parameters
 arguments_parser.add_argument('--wt', dest='wt_sequence',
@@ -74,6 +82,12 @@ arguments_parser.add_argument('--wt_pair', dest='wt_pair_structure',
 arguments_parser.add_argument('--wt_constraint',
                               action="store",
                               help='"WT" constraint string.')
+arguments_parser.add_argument('--ensemble_backend',
+                              action='store', default='auto', choices=['auto'] + sorted(ENSEMBLE_BACKENDS),
+                              help='The partition function backend. Default - "auto", ViennaRNA if installed.')
+arguments_parser.add_argument('--workers',
+                              action='store', type=int, default=1,
+                              help='The number of worker processes. Default - 1.')
 
 # Output
 arguments_parser.add_argument('--out', dest='out',
@@ -91,12 +105,19 @@ rna_lib_struct_summary_file_path = os.path.abspath(args.rna_lib_struct_summary_f
 # Validation
 if not os.path.exists(rna_lib_struct_summary_file_path.strip()):
     raise ValueError('"RNA Lib Structure Summary" file does not exist. ')
+overlay_file_paths = [os.path.abspath(overlay_file) for overlay_file in args.overlays or []]
+for overlay_file_path in overlay_file_paths:
+    if not os.path.exists(overlay_file_path):
+        raise ValueError('"Overlay" file does not exist. ', overlay_file_path)
 
 #
 wt_sequence = args.wt_sequence.strip()
-wt_structure = args.wt_structure.strip()
-wt_pair_structure = args.wt_pair_structure.strip()
-wt_constraint = args.wt_constraint.strip()
+wt_structure = args.wt_structure.strip() if args.wt_structure else ''
+wt_pair_structure = args.wt_pair_structure.strip() if args.wt_pair_structure else ''
+wt_constraint = args.wt_constraint.strip() if args.wt_constraint else ''
+
+ensemble_backend = args.ensemble_backend
+workers = max(1, args.workers or 1)
 
 if not wt_constraint:
     raise ValueError('"WT" constraint required. ')
@@ -140,62 +161,20 @@ if not os.path.isabs(output_file_path):
 # ----------------------------------
 # region Load "RNA Lib Structure Summary" Data
 
-# RSample results, indexed by "RNA ID"
-rna_lib_struct_summary_dict = {}
-
-with open(rna_lib_struct_summary_file_path) as infile:
-    rna_lib_struct_summary_dict = json.load(infile)
+# Only the isoforms of the "WT" length
+rna_items = [rna_item for rna_item in FileUtils.load_json_items_with_overlay(rna_lib_struct_summary_file_path,
+                                                                             overlay_file_paths)
+             if len(rna_item['sequence_string']) == len(wt_sequence)]
 
 # endregion
 
 
 # ----------------------------------
-# region Extract FE and Calc Prob
+# region Calc Prob
 
 # Canonical BPs
 canonical_base_pairs = [('A', 'U'), ('U', 'A'), ('G', 'C'), ('C', 'G'), ('G', 'U'), ('U', 'G')]
 
-
-# Decode the "WT Constraint" string to find "Soft Pairs".
-def decode_soft_pair(constraint_str: str) -> list:
-    r"""
-    Decode the "WT Constraint" string to find "Soft Pairs".
-
-    Parameters
-    ----------
-    constraint_str: str
-
-    Returns
-    -------
-
-    """
-
-    #
-    left_bracket_pos_list = list()
-    soft_pair_list = list()
-
-    #
-    left_bracket_char = '('
-    right_bracket_char = ')'
-
-    #
-    constraint_char_list = list(constraint_str)
-    for idx in range(len(constraint_char_list)):
-        #
-        if constraint_char_list[idx] == left_bracket_char:
-            left_bracket_pos_list.append(idx)
-        elif constraint_char_list[idx] == right_bracket_char:
-            # Find a "PREVIOUS" left to be a pair
-            if len(left_bracket_pos_list) > 0:
-                left_pos = left_bracket_pos_list.pop()
-                soft_pair_list.append((left_pos, idx))
-
-    #
-    return soft_pair_list
-
-
-rna_fold_runner = RnaFoldRunner()
-
 editing_value_list = list()
 fe_probability_list = list()
 
@@ -206,76 +185,62 @@ editing_value_all_canonical_list = list()
 fe_probability_all_canonical_list = list()
 
 # Decode the "WT pair" structure
-wt_defined_bp_list = decode_soft_pair(wt_pair_structure)
+wt_defined_bp_list = decode_soft_pairs(wt_pair_structure)
 logger.info('---- WT Defined Pairs: {} '.format(wt_defined_bp_list))
 
-# Loop
-for rna_item in rna_lib_struct_summary_dict['items']:
-    #
-    rna_id = rna_item['rna_id']
-    # logger.info('---------- RNA Item: {} ----------'.format(rna_id))
 
-    #
-    sequence_string = rna_item['sequence_string']
-    editing_value = rna_item['A-to-I_editing_level']
-    editing_position = rna_item['A-to-I_editing_site']
-
-    # Skip the RNA item if
-    # - the "sequence length" is NOT the SAME as WT
-    # - Editing value is not available
-    if len(sequence_string) != len(wt_sequence) or not editing_value:
-        continue
+def calc_ensemble_probabilities():
+    r"""
+    Compute the ensemble probabilities of all isoforms, and collect the plot / CSV data.
+    """
 
     #
-    csv_rna_item = list()
-    csv_rna_item.append(rna_id)
-    csv_rna_item.append(float(editing_value))
-    editing_value_list.append(float(editing_value))
-
-    # FInd Non-canonical BPs within "All" soft pairs
-    non_canonical_pair_positions = []
-    for soft_bp in wt_defined_bp_list:
-        #
-        bp = (sequence_string[soft_bp[0]], sequence_string[soft_bp[1]])
-        if bp not in canonical_base_pairs:
-            #
-            non_canonical_pair_positions.append(soft_bp[0])
-            non_canonical_pair_positions.append(soft_bp[1])
-
-    # Extract MFE & Ensemble FE
-    mfe_wt_constraint, structure_wt_constraint = rna_fold_runner.extract_free_energy(sequence_string, wt_constraint)
-    fe_ensemble, structure_ensemble = rna_fold_runner.extract_free_energy(sequence_string)
+    backend = get_ensemble_backend(ensemble_backend)
+    ensemble_results = compute_library([rna_item['sequence_string'] for rna_item in rna_items], backend,
+                                       target_structure=wt_structure or None, constraint=wt_constraint,
+                                       soft_pairs=wt_defined_bp_list, workers=workers)
 
-    # Probability
-    probability = np.exp(-1 * mfe_wt_constraint / 0.6) / np.exp(-1 * fe_ensemble / 0.6)
-    # Apply a threshold
-    # probability = threshold(probability)
-
-    # logger.info('---- Ensemble-FE: {} | MFE: {} | prob: {}'.format(str(fe_ensemble), str(mfe_wt_constraint),
-    #                                                                str(probability)))
-
-    # Apply "Non-canonical BP" penalty
-    num_non_canonical = len(set(non_canonical_pair_positions))
-    if num_non_canonical > 0:
+    # Loop
+    for rna_item, ensemble_result in zip(rna_items, ensemble_results):
         #
-        probability /= num_non_canonical
-        # probability /= (0.5 * num_non_canonical)
-        # probability = max( 0.0, probability - num_non_canonical * k )
-        # probability -= num_non_canonical * 0.01
-    else:
-        # Add it to a special list for "NO Non-canonical BP"
-        editing_value_all_canonical_list.append(float(editing_value))
-        fe_probability_all_canonical_list.append(probability)
+        rna_id = rna_item['rna_id']
+        sequence_string = rna_item['sequence_string']
+        editing_value = rna_item['A-to-I_editing_level']
 
-    #
-    fe_probability_list.append(probability)
-    csv_rna_item.append(probability)
-
-    #
-    csv_data_list.append(csv_rna_item)
+        # FInd Non-canonical BPs within "All" soft pairs
+        non_canonical_pair_positions = []
+        for soft_bp in wt_defined_bp_list:
+            #
+            bp = (sequence_string[soft_bp[0]], sequence_string[soft_bp[1]])
+            if bp not in canonical_base_pairs:
+                #
+                non_canonical_pair_positions.append(soft_bp[0])
+                non_canonical_pair_positions.append(soft_bp[1])
+
+        # Probability of the "WT" constraint within the ensemble
+        probability = float(np.exp(ensemble_result.log_p_constraint))
+
+        # Apply "Non-canonical BP" penalty
+        num_non_canonical = len(set(non_canonical_pair_positions))
+        if num_non_canonical > 0:
+            #
+            probability /= num_non_canonical
 
-#
-rna_fold_runner.cleanup()
+        #
+        csv_data_list.append([rna_id, float(editing_value) if editing_value is not None else None, probability,
+                              ensemble_result.ensemble_fe,
+                              ensemble_result.log_p_structure,
+                              ensemble_result.log_p_constraint] + ensemble_result.pair_probabilities)
+
+        # Plot data - only with "editing value"
+        if not editing_value:
+            continue
+        editing_value_list.append(float(editing_value))
+        fe_probability_list.append(probability)
+        if num_non_canonical == 0:
+            # Add it to a special list for "NO Non-canonical BP"
+            editing_value_all_canonical_list.append(float(editing_value))
+            fe_probability_all_canonical_list.append(probability)
 
 # endregion
 
@@ -283,49 +248,61 @@ rna_fold_runner.cleanup()
 # ----------------------------------
 # region Plot
 
-# Examine the probability size
-logger.info('========= Examine Probability ========== \n---- MAX: {} \n---- MIN: {}'
-            .format(str(np.max(fe_probability_list)), str(np.min(fe_probability_list))))
+def plot():
+    # Examine the probability size
+    logger.info('========= Examine Probability ========== \n---- MAX: {} \n---- MIN: {}'
+                .format(str(np.max(fe_probability_list)), str(np.min(fe_probability_list))))
 
-corr, p_value = pearsonr(fe_probability_list, editing_value_list)
-logger.info('---- Correlation coefficient: {} | P value: {}'.format(str(corr), str(p_value)))
+    corr, p_value = pearsonr(fe_probability_list, editing_value_list)
+    logger.info('---- Correlation coefficient: {} | P value: {}'.format(str(corr), str(p_value)))
 
-#
-plt.scatter(fe_probability_list, editing_value_list,
-            c='b', s=45.0, lw=0, alpha=0.5)
-plt.xlabel('Probability of WT Secondary Structure')
-plt.ylabel('Editing Level')
-plt.axis([-0.03, 0.4, -0.1, 1.05])
-
-# Text
-plt.text(-0.0, 0.99, wt_structure, family='monospace', fontsize=10)
-plt.text(-0.0, 0.95, wt_constraint, family='monospace', fontsize=10)
-plt.text(-0.0, 0.91, 'Pearson Corr = {}, P_value = {}'.format(str(corr), str(p_value)),
-         family='monospace', fontsize=8)
-
-# Save
-fig = plt.gcf()
-fig.set_size_inches(18.5, 10.5)
-fig.savefig(output_file_path, dpi=100)
-# plt.show()
+    #
+    plt.scatter(fe_probability_list, editing_value_list,
+                c='b', s=45.0, lw=0, alpha=0.5)
+    plt.xlabel('Probability of WT Secondary Structure')
+    plt.ylabel('Editing Level')
+    plt.axis([-0.03, 0.4, -0.1, 1.05])
+
+    # Text
+    plt.text(-0.0, 0.99, wt_structure, family='monospace', fontsize=10)
+    plt.text(-0.0, 0.95, wt_constraint, family='monospace', fontsize=10)
+    plt.text(-0.0, 0.91, 'Pearson Corr = {}, P_value = {}'.format(str(corr), str(p_value)),
+             family='monospace', fontsize=8)
+
+    # Save
+    fig = plt.gcf()
+    fig.set_size_inches(18.5, 10.5)
+    fig.savefig(output_file_path, dpi=100)
+    # plt.show()
 
 # endregion
 
 # ----------------------------------
 # region Output Plot Data
 
-with open('{}.csv'.format(output_file_path), 'w') as outfile:
-    # Head Line
-    head_line = [
-        'rna_id',
-        'editing_value',
-        'probability',
-    ]
-    outfile.write(','.join(head_line) + '\n')
-    csv_writer = csv.writer(outfile)
-
-    for item in csv_data_list:
-        # outfile.write(','.join(data_line))
-        csv_writer.writerow(item)
+def output_ensemble_features():
+    #
+    with open('{}.csv'.format(output_file_path), 'w') as outfile:
+        # Head Line
+        head_line = [
+            'rna_id',
+            'editing_value',
+            'probability',
+            'ensemble_fe',
+            'log_p_wt_structure',
+            'log_p_wt_constraint',
+        ] + pair_column_names(wt_defined_bp_list)
+        outfile.write(','.join(head_line) + '\n')
+        csv_writer = csv.writer(outfile)
+
+        for item in csv_data_list:
+            csv_writer.writerow(item)
 
 # endregion
+
+
+# The ensemble probabilities are computed in worker processes
+if __name__ == '__main__':
+    calc_ensemble_probabilities()
+    plot()
+    output_ensemble_features()
@@ -11,6 +11,9 @@
 #   - It is in "json" format.
 # - Data Type
 # - WT sequence
+# - Optional. The "ensemble features" file (in "csv"), from `ana_ensemble_prob.py`.
+# - Optional. The "bootstrap features" - from the "bootstrap_structures" of the items.
+# - Optional. The "BPP features" - from the "base pair probability" matrices of the items.
 #
 # ## Output
 # - The feature output is in `csv` format.
@@ -33,7 +36,6 @@ local_module_path = \
                     os.path.realpath(__file__)))))
 sys.path.append(local_module_path)
 
-import json
 import csv
 
 from collections import defaultdict
@@ -41,14 +43,15 @@ from collections import defaultdict
 import logging
 from py_scripts import setup_logging
 
-from typing import Tuple, List, Any
+from typing import Tuple, Any
 
 from neoRNA import io
-from neoRNA.sequence.sequence import Sequence
-from neoRNA.structure import SecondaryStructureElementType
 from neoRNA.structure.secondary_structure import SecondaryStructure
-from neoRNA.analysis.editing_analysis import EditingAnalysis
-from neoRNA.analysis.editing_analysis_item import EditingAnalysisItem
+from neoRNA.structure.bp_rna_annotator import BpRnaAnnotator
+from neoRNA.analysis.feature_engine import CompiledStructure, FeatureEngine, ml_feature_columns
+from neoRNA.analysis.bootstrap_ensemble import BootstrapEnsemble, bootstrap_feature_columns
+from neoRNA.analysis.bpp_features import bpp_feature_columns, compute_library as compute_bpp_features
+from neoRNA.sequence.mutation import MutationType, parse_mutation_syntax
 from neoRNA.util.file_utils import FileUtils
 
 from neoRNA.util.runner.rnafold_runner import RnaFoldRunner
@@ -67,6 +70,10 @@ arguments_parser = argparse.ArgumentParser(description='RNA Lib Analysis Script
 arguments_parser.add_argument('rna_lib_struct_summary_file',
                               metavar='rna_lib_struct_summary_file.json',
                               help='The file path to the "RNA Lib Structure Summary" file.')
+arguments_parser.add_argument('--overlay', dest='overlays',
+                              action='append', default=None,
+                              help='An "overlay" file (".jsonl") of updated records, merged into the summary items, '
+                                   'such as the output of "util_adjust_sequence.py". Can be repeated.')
 
 # Parameters
 arguments_parser.add_argument('--data_type',
@@ -75,6 +82,19 @@ arguments_parser.add_argument('--data_type',
 arguments_parser.add_argument('--wt', dest='wt_sequence',
                               action="store", default='',
                               help='"WT" sequence.')
+arguments_parser.add_argument('--ensemble_features',
+                              action="store", default=None,
+                              help='The "ensemble features" file (csv, from "ana_ensemble_prob.py"). Optional. '
+                                   'Its columns are added to the features, by "rna_id".')
+arguments_parser.add_argument('--bootstrap_features',
+                              action="store_true", default=False,
+                              help='Add the features of the "bootstrap structures" of the items, such as the '
+                                   'frequency of each element type at the editing site. '
+                                   'Each unique structure is annotated once.')
+arguments_parser.add_argument('--bpp_features',
+                              action="store_true", default=False,
+                              help='Add the features of the "base pair probability" matrix ("<data_type>_bpp") of '
+                                   'the items, such as the unpaired probability of the editing site.')
 
 # Output
 arguments_parser.add_argument('--out', dest='out',
@@ -95,6 +115,10 @@ rna_lib_struct_summary_file_path = os.path.abspath(args.rna_lib_struct_summary_f
 # Validation
 if not os.path.exists(rna_lib_struct_summary_file_path.strip()):
     raise ValueError('"RNA Lib Structure Summary" file does not exist. ')
+overlay_file_paths = [os.path.abspath(overlay_file) for overlay_file in args.overlays or []]
+for overlay_file_path in overlay_file_paths:
+    if not os.path.exists(overlay_file_path):
+        raise ValueError('"Overlay" file does not exist. ', overlay_file_path)
 
 #
 data_type = args.data_type.strip().lower()
@@ -103,6 +127,10 @@ wt_sequence = args.wt_sequence.strip()
 # if not wt_sequence:
 #     raise ValueError('"WT" sequence required. ')
 
+ensemble_features_file_path = args.ensemble_features
+bootstrap_features_enabled = args.bootstrap_features
+bpp_features_enabled = args.bpp_features
+
 output_file_path = args.out.strip()
 bprna_output_file_path = args.out_bprna
 
@@ -150,11 +178,47 @@ if bprna_output_file_path and not os.path.isabs(output_file_path):
 # ----------------------------------
 # region Load "RNA Lib Structure Summary" Data
 
-# RSample results, indexed by "RNA ID"
-rna_lib_struct_summary_dict = {}
-
-with open(rna_lib_struct_summary_file_path) as infile:
-    rna_lib_struct_summary_dict = json.load(infile)
+# RSample results, with the overlays merged
+rna_lib_struct_summary_dict = {
+    'items': list(FileUtils.load_json_items_with_overlay(rna_lib_struct_summary_file_path, overlay_file_paths)),
+}
+
+# "Ensemble features", indexed by "RNA ID". The columns other than the plot data
+ensemble_feature_columns = list()
+ensemble_feature_dict = dict()
+if ensemble_features_file_path:
+    with open(ensemble_features_file_path) as infile:
+        csv_reader = csv.DictReader(infile)
+        ensemble_feature_columns = [column for column in csv_reader.fieldnames
+                                    if column not in ('rna_id', 'editing_value', 'probability')]
+        for row in csv_reader:
+            ensemble_feature_dict[row['rna_id']] = [row[column] for column in ensemble_feature_columns]
+
+# "Bootstrap structures", deduplicated for all the items
+bootstrap_ensemble = None
+bootstrap_columns = list()
+if bootstrap_features_enabled:
+    bootstrap_ensemble = BootstrapEnsemble.from_items(rna_lib_struct_summary_dict['items'])
+    bootstrap_columns = bootstrap_feature_columns()
+    logger.info('Bootstrap structures: {} unique, for {} items'.format(bootstrap_ensemble.structure_count,
+                                                                        len(bootstrap_ensemble)))
+
+# "BPP features", for the whole library at once, indexed by "RNA ID"
+bpp_columns = list()
+bpp_feature_dict = dict()
+if bpp_features_enabled:
+    bpp_columns = bpp_feature_columns()
+    bpp_entries = []
+    for rna_item in rna_lib_struct_summary_dict['items']:
+        # One per feature row (a single one if no mutation) - the mismatch positions only
+        mutation_positions = [mutation.position if mutation is not None and mutation.mut_type == MutationType.Mismatch
+                              else None
+                              for mutation in parse_mutation_syntax(rna_item.get('mutation_syntax'), strict=False) or [None]]
+        bpp_entries.append((rna_item.get('_'.join([data_type, 'bpp'])), rna_item['A-to-I_editing_site'],
+                            mutation_positions))
+    for rna_item, bpp_features in zip(rna_lib_struct_summary_dict['items'], compute_bpp_features(bpp_entries)):
+        bpp_feature_dict[rna_item['rna_id']] = [bpp_features.site + mutation_values
+                                                for mutation_values in bpp_features.mutations]
 
 # endregion
 
@@ -164,6 +228,14 @@ with open(rna_lib_struct_summary_file_path) as infile:
 
 def parse_bprna_annotation(structure_content: str) -> Tuple[str, SecondaryStructure]:
 
+    # Annotate in-process - the same ".st" text as `bpRNA.pl`
+    _, sequence_string, structure_string = structure_content.split('\n')
+    try:
+        return BpRnaAnnotator.run(sequence_string, structure_string)
+    except ValueError:
+        # Pseudoknots - only `bpRNA.pl` handles them
+        pass
+
     # use an intermediate tmp file because bpRNA needs it
     out_tmp = open('tmp.dbn', 'w')
     out_tmp.write(structure_content + '\n')
@@ -184,322 +256,13 @@ def parse_bprna_annotation(structure_content: str) -> Tuple[str, SecondaryStruct
             return annotation, secondary_structure
 
 
-def extract_analysis_item_features(analysis_item: EditingAnalysisItem = None,
-                                   represent_sequence: Sequence = None) -> List[Any]:
-    r"""
-    Extract ML features from an "analysis item".
-
-    Current features for each item:
-    - struct - element type
-    - length
-    - length_stem
-    - length_hairpin
-    - length_bulge
-    - length_interior_es
-    - length_interior_ecs
-    - 5prm_cp_hairpin
-    - 5prm_cp_bulge
-    - 3prm_cp_bulge
-    - 5prm_cp_interior
-    - 3prm_cp_interior
-
-    Parameters
-    ----------
-    analysis_item: EditingAnalysisItem
-    represent_sequence: Sequence
-
-    Returns
-    -------
-
-    """
-    # Defaults
-    struct = analysis_item.element_type if analysis_item else empty_value_str
-    length = empty_value_numeric
-    length_stem = empty_value_numeric
-    length_hairpin = empty_value_numeric
-    length_bulge = empty_value_numeric
-    length_interior_es = empty_value_numeric
-    length_interior_ecs = empty_value_numeric
-    five_pprm_cp_hairpin = empty_value_str
-    five_pprm_cp_bulge = empty_value_str
-    three_pprm_cp_bulge = empty_value_str
-    five_pprm_cp_interior = empty_value_str
-    three_pprm_cp_interior = empty_value_str
-
-    if analysis_item:
-
-        # Strand Length
-        if represent_sequence:
-            length = represent_sequence.length
-
-        #
-        if struct == SecondaryStructureElementType.Stem:
-            length_stem = length
-        elif struct == SecondaryStructureElementType.Hairpin:
-            length_hairpin = length
-            five_pprm_cp_hairpin = analysis_item.closing_base_pair()
-        elif struct == SecondaryStructureElementType.Bulge:
-            length_bulge = length
-            five_pprm_cp_bulge = analysis_item.closing_base_pair()
-            three_pprm_cp_bulge = analysis_item.closing_base_pair(five_prim=False)
-        elif struct == SecondaryStructureElementType.Interior:
-            length_interior_es = length
-            five_pprm_cp_interior = analysis_item.closing_base_pair()
-
-            # Try to get "complementary strand" sequence
-            represent_sequence_ecs = analysis_item.complementary_strand_sequence(represent_sequence)
-            length_interior_ecs = represent_sequence_ecs.length if represent_sequence_ecs else 0
-            three_pprm_cp_interior = analysis_item.closing_base_pair(five_prim=False)
-
-    #
-    return [struct, length,
-            length_stem, length_hairpin, length_bulge, length_interior_es, length_interior_ecs,
-            five_pprm_cp_hairpin, five_pprm_cp_bulge, three_pprm_cp_bulge, five_pprm_cp_interior, three_pprm_cp_interior]
-
-
-def extract_bprna_features(sequence: Sequence, secondary_structure: SecondaryStructure, editing_position: int) -> List[Any]:
-    r"""
-    Extract ML features from bpRNA structure.
-
-    Current Features:
-    - u_count
-    - u_stem_length
-    - u_hairpin_length
-    - d_count
-    - "editing site" structure element
-    - "upstream" structure elements
-    - "downstream" structure elements
-
-    Parameters
-    ----------
-    sequence: Sequence
-    secondary_structure: SecondaryStructure
-    editing_position: int
-
-    Returns
-    -------
-
-    """
-    #
-    # info_dict = CommentParser.parse_bp_rna(secondary_structure.comment)
-
-    # Defaults
-    all_stem_length = empty_value_numeric
-    u_count = 0
-    u_all_stem_length = empty_value_numeric
-    u_hairpin_length = empty_value_numeric
-    d_count = 0
-    d_all_stem_length = empty_value_numeric
-
-    site_structure_features = list()
-    upstream_structure_feature_list = list()
-    downstream_structure_feature_list = list()
-
-    # Analyze
-    editing_analysis = EditingAnalysis(secondary_structure, editing_position)
-    editing_analysis.analysis()
-
-    # Separate items, by "distance"
-    editing_site_items = list()
-    upstream_items = list()
-    downstream_items = list()
-    analysis_items_by_distance = editing_analysis.analysis_items_by_distance
-
-    # Loop from "smallest", stack the "positive" items  - the "last" one is the FIRST "up stream" item
-    for distance in sorted(analysis_items_by_distance.keys()):
-        item, distance_sequence = analysis_items_by_distance[distance]
-        if distance < 0:
-            upstream_items.append((item, distance, distance_sequence))
-        elif distance == 0:
-            editing_site_items.append((item, distance_sequence))
-        else:
-            break
-    # Loop from "largest", stach the "positive" items - the "last" one is the FIRST "down stream" item
-    for distance in sorted(analysis_items_by_distance.keys(), reverse=True):
-        item, distance_sequence = analysis_items_by_distance[distance]
-        if distance > 0:
-            downstream_items.append((item, distance, distance_sequence))
-        else:
-            break
-
-    # ----------------------------------
-    # region "Editing Site" element
-    #
-
-    # site_feature = secondary_structure.get_annotation(editing_position)
-    # editing_site_items = editing_analysis.get_analysis_items([EditingAnalysisItemType.Contain])
-    if len(editing_site_items) > 0:
-        # Only get the "first" one as "editing level" item
-        site_item, site_included_sequence = editing_site_items[0]
-        site_structure_features = extract_analysis_item_features(site_item, site_included_sequence)
-
-        # Special features
-        site_prev_nt = sequence.get_nt(editing_position - 1)
-        site_next_nt = sequence.get_nt(editing_position + 1)
-        site_prev_struct = secondary_structure.get_annotation(site_included_sequence.start_position - 1)
-        site_next_struct = secondary_structure.get_annotation(site_included_sequence.end_position + 1)
-
-        # site_1_1
-        site_1_1 = empty_value_str
-        if site_item.element_type == SecondaryStructureElementType.Interior:
-            # Get the "ECS" sequence
-            site_included_sequence_ecs = site_item.complementary_strand_sequence(site_included_sequence)
-            # Only get "1:1 Interior Loop"
-            if site_included_sequence.length == 1 \
-                    and site_included_sequence_ecs and site_included_sequence_ecs.length == 1:
-                # Keep the record
-                site_1_1 = '{}:{}'.format(site_included_sequence.sequence_str,
-                                                   site_included_sequence_ecs.sequence_str)
-        # Stem
-        if site_item.element_type == SecondaryStructureElementType.Stem:
-            #
-            site_nt = sequence.get_nt(editing_position)
-            site_ecs_position, site_ecs_nt = site_item.complementary_nt(site_included_sequence, editing_position)
-            if site_ecs_nt:
-                # Keep the record
-                site_1_1 = '{}:{}'.format(site_nt, site_ecs_nt)
-
-        # Insert above features into a proper place - "index -> 1"
-        site_structure_features.insert(1, site_1_1)
-        site_structure_features.insert(1, site_next_struct)
-        site_structure_features.insert(1, site_prev_struct)
-        site_structure_features.insert(1, site_next_nt)
-        site_structure_features.insert(1, site_prev_nt)
-
-        # Stem length
-        if site_item.element_type == SecondaryStructureElementType.Stem:
-            if site_item and site_item.loop_length() is not None:
-                if all_stem_length is None:
-                    all_stem_length = 0
-                all_stem_length += site_item.loop_length()
-
-    # endregion
-
-    # ----------------------------------
-    # region Upstream Items
-
-    #
-    upstreams_hairpin_found = False
-    upstreams_found = 0
-    while upstream_items:
-        u_item, u_distance, u_distance_sequence = upstream_items.pop()
-        u_structure_features = extract_analysis_item_features(u_item, u_distance_sequence)
-
-        #
-        u_structure_features.insert(0, u_distance)
-        u_structure_features.insert(0, 1)  # set "exist" to "1"
-
-        # Use "insert" so that later we can "pop" it
-        upstream_structure_feature_list.insert(0, u_structure_features)
-
-        #
-        if u_item.element_type == SecondaryStructureElementType.Stem:
-            if u_item and u_item.loop_length() is not None:
-                if u_all_stem_length is None:
-                    u_all_stem_length = 0
-                u_all_stem_length += u_item.loop_length()
-        if not upstreams_hairpin_found and u_item.element_type == SecondaryStructureElementType.Hairpin:
-            u_hairpin_length = u_item.loop_length()
-            upstreams_hairpin_found = True
-
-        #
-        upstreams_found += 1
-
-    u_count = upstreams_found
-    # Stem Length
-    if u_all_stem_length is not None:
-        if all_stem_length is None:
-            all_stem_length = 0
-        all_stem_length += u_all_stem_length
-
-    # endregion
-
-    # ----------------------------------
-    # region Downstream
-
-    #
-    downstreams_found = 0
-    while downstream_items:
-        d_item, d_distance, d_distance_sequence = downstream_items.pop()
-        d_structure_features = extract_analysis_item_features(d_item, d_distance_sequence)
-
-        #
-        d_structure_features.insert(0, d_distance)
-        d_structure_features.insert(0, 1)  # set "exist" to "1"
-
-        #
-        downstream_structure_feature_list.insert(0, d_structure_features)
-
-        #
-        if d_item.element_type == SecondaryStructureElementType.Stem:
-            if d_item and d_item.loop_length() is not None:
-                if d_all_stem_length is None:
-                    d_all_stem_length = 0
-                d_all_stem_length += d_item.loop_length()
-
-        #
-        downstreams_found += 1
-    d_count = downstreams_found
-    # Stem Length
-    if d_all_stem_length is not None:
-        if all_stem_length is None:
-            all_stem_length = 0
-        all_stem_length += d_all_stem_length
-
-    # endregion
-
-    # Build features
-    bprna_features = list()
-
-    #
-    bprna_features.append(all_stem_length)
-
-    # site features
-    bprna_features += site_structure_features
-
-    # upstream features
-    bprna_features.append(u_count)
-    bprna_features.append(u_all_stem_length)
-    bprna_features.append(u_hairpin_length)
-    # Structure element features
-    for index in range(0, num_upstream_elements):
-        if len(upstream_structure_feature_list) > 0:
-            u_features = upstream_structure_feature_list.pop()
-            bprna_features += u_features
-        else:
-            # Insert "empty" element
-            empty_u_features = extract_analysis_item_features()
-            empty_u_features.insert(0, 0)  # set "distance" to "0"
-            empty_u_features.insert(0, 0)  # set "exist" to "0"
-
-            bprna_features += empty_u_features
-
-    # downstream features
-    bprna_features.append(d_count)
-    bprna_features.append(d_all_stem_length)
-    # Structure element features
-    for index in range(0, num_downstream_elements):
-        if len(downstream_structure_feature_list) > 0:
-            d_features = downstream_structure_feature_list.pop()
-            bprna_features += d_features
-        else:
-            # Insert "empty" element
-            empty_d_features = extract_analysis_item_features()
-            empty_d_features.insert(0, 0)   # set "distance" to "0"
-            empty_d_features.insert(0, 0)   # set "exist" to "0"
-
-            bprna_features += empty_d_features
-
-    return bprna_features
-
-
 # Dict to keep the bpRNA content (text-based)
 # rna_lib_bprna_dict = dict()
 rna_lib_bprna_dict = defaultdict(Any)
-rna_lib_secondary_structure_dict = defaultdict(Any)
+rna_lib_compiled_structure_dict = defaultdict(Any)
 
 # WT structure
-wt_secondary_structure = None
+wt_structure = None
 
 # Prepare the "secondary structure" for all RNA items, also identify "WT"
 for rna_item in rna_lib_struct_summary_dict['items']:
@@ -507,14 +270,9 @@ for rna_item in rna_lib_struct_summary_dict['items']:
     rna_id = rna_item['rna_id']
 
     sequence_string = rna_item['sequence_string']
-    sequence = Sequence(sequence_string)
     # Either "computational_structure" or "experimental_structure"
     structure_string = rna_item['_'.join([data_type, 'structure'])]
 
-    #
-    editing_value = rna_item['A-to-I_editing_level']
-    editing_position = rna_item['A-to-I_editing_site']
-
     #
     rna_lib_bprna_dict[rna_id] = dict()
 
@@ -522,35 +280,14 @@ for rna_item in rna_lib_struct_summary_dict['items']:
     comment = ','.join(['>' + rna_id, data_type])
     bprna_annotation, secondary_structure = parse_bprna_annotation('\n'.join([comment, sequence_string, structure_string]))
     rna_lib_bprna_dict[rna_id][data_type] = bprna_annotation
-    rna_lib_secondary_structure_dict[rna_id] = secondary_structure
+    # Parsed once, for all the features
+    rna_lib_compiled_structure_dict[rna_id] = CompiledStructure.from_bprna(bprna_annotation, reference_id=rna_id)
 
     # Check if it is "WT"
     if 'mutation_syntax' in rna_item \
             and rna_item['mutation_syntax'].strip().lower().startswith('wt'):
         #
-        wt_secondary_structure = secondary_structure
-
-    # Consider "bootstrap" structures
-    # if "bootstrap_structures" in rna_item:
-    #     #
-    #     logger.info('  -- Process "bootstrap" data -->')
-    #
-    #     #
-    #     bootstrap_structures = rna_item['bootstrap_structures']
-    #     bootstrap_counts = dict()
-    #     for key, group in groupby(bootstrap_structures):
-    #         #
-    #         bootstrap_counts[key] = len(list(group))
-    #
-    #     #
-    #     bootstrap_index = 0
-    #     rna_lib_bprna_dict[rna_id]['bootstraps'] = dict()
-    #     for bootstrap_structure, bootstrap_count in bootstrap_counts.items():
-    #         #
-    #         comment = ','.join(['>' + rna_id, 'bootstrap-' + str(bootstrap_index), 'frequency-' + str(bootstrap_count)])
-    #         bprna_annotation, secondary_structure = parse_bprna_annotation('\n'.join([comment, sequence_string, bootstrap_structure]))
-    #         rna_lib_bprna_dict[rna_id]['bootstraps'][bootstrap_structure] = bprna_annotation
-    #         bootstrap_index += 1
+        wt_structure = rna_lib_compiled_structure_dict[rna_id]
 
 
 # Construct feature list for each RNA item.
@@ -565,6 +302,9 @@ simtree_runner = SimTreeRunner(simtree_jar_location, os.getcwd())
 
 # os.removedirs()
 
+# Features
+feature_engine = FeatureEngine(ml_feature_columns(num_upstream_elements, num_downstream_elements))
+
 #
 for rna_item in rna_lib_struct_summary_dict['items']:
     #
@@ -575,7 +315,6 @@ for rna_item in rna_lib_struct_summary_dict['items']:
     #     continue
 
     sequence_string = rna_item['sequence_string']
-    sequence = Sequence(sequence_string)
     # Either "computational_structure" or "experimental_structure"
     structure_string = rna_item['_'.join([data_type, 'structure'])]
 
@@ -589,174 +328,25 @@ for rna_item in rna_lib_struct_summary_dict['items']:
     # RNA Structure Similarity against WT
     simtree_normalized_score = empty_value_numeric
     simtree_flipping_modes = empty_value_str
-    if wt_secondary_structure:
+    if wt_structure:
         simtree_normalized_score, simtree_flipping_modes \
-            = simtree_runner.compare_rna_structure(structure_string, wt_secondary_structure.dot_bracket)
-
-    #
-    secondary_structure = rna_lib_secondary_structure_dict[rna_id]
-
-    # Parse the ML features
-    structure_features = extract_bprna_features(sequence, secondary_structure, editing_position)
-    site_struct = structure_features[0]  # The first one is for "editing site"
-
-    # Check Other Features - "mutation" related
-    num_mutations = 0
-    mut_exist = 0
-    mut_type = empty_value_str
-    mut_pos = empty_value_numeric
-    mut_ref_nt = empty_value_str
-    mut_nt = empty_value_str
-    mut_site_distance = empty_value_numeric
-    mut_struct = empty_value_str
-    mut_ref_struct = empty_value_str
-    mut_prev_struct = empty_value_str
-    mut_next_struct = empty_value_str
-    mut_same_as_site = None
-    if 'mutation_syntax' in rna_item:
-        mutation_syntax = rna_item['mutation_syntax'].strip()
-        if mutation_syntax.lower().startswith('indel'):
-            # indel
-            mut_type = 'indel'
-            mut_exist = 1
-            num_mutations = len(structure_string) - len(wt_sequence)
-
-            #
-            features = list()
-            features.append(rna_id)
-            features.append(editing_value)
-            features.append(fe_ensemble)
-            features.append(simtree_normalized_score)
-            # features.append(simtree_flipping_modes)
-
-            features.append(num_mutations)
-            features.append(mut_exist)
-            features.append(mut_type)
-            features.append(mut_pos)
-            features.append(mut_site_distance)
-            features.append(mut_ref_nt)
-            features.append(mut_nt)
-            features.append(mut_struct)
-            features.append(mut_ref_struct)
-            features.append(mut_prev_struct)
-            features.append(mut_next_struct)
-            features.append(mut_same_as_site)
-
-            #
-            rna_lib_features_list.append(features + structure_features)
-        elif mutation_syntax.lower().startswith('wt'):
-            # WT
-            mut_type = 'wt'
-
-            #
-            features = list()
-            features.append(rna_id)
-            features.append(editing_value)
-            features.append(fe_ensemble)
-            features.append(simtree_normalized_score)
-            # features.append(simtree_flipping_modes)
-
-            features.append(num_mutations)
-            features.append(mut_exist)
-            features.append(mut_type)
-            features.append(mut_pos)
-            features.append(mut_site_distance)
-            features.append(mut_ref_nt)
-            features.append(mut_nt)
-            features.append(mut_struct)
-            features.append(mut_ref_struct)
-            features.append(mut_prev_struct)
-            features.append(mut_next_struct)
-            features.append(mut_same_as_site)
-
-            #
-            rna_lib_features_list.append(features + structure_features)
-        else:
-            mut_type = 'mismatch'
-            mutation_syntax_list = mutation_syntax.split(',')
-            num_mutations = len(mutation_syntax_list)
-            mut_exist = 1
-
-            # Has mutations - loop each mutation
-            # EACH mutation will have its own record
-            for mutation_string in mutation_syntax_list:
-                mut_pos = mutation_string[:-4]
-                mut_ref_nt = mutation_string[-4]
-                mut_nt = mutation_string[-1]
-                mut_site_distance = int(mut_pos) - editing_position
-                mut_struct = secondary_structure.get_annotation(int(mut_pos))
-                # Struct Type from "WT" from the "SAME" position
-                mut_ref_struct = wt_secondary_structure.get_annotation(int(mut_pos))
-
-                #
-                mut_same_as_site = 1 if mut_struct == site_struct else 0
-
-                #
-                mut_prev_struct = None
-                pos = int(mut_pos)
-                while pos:
-                    pos -= 1
-                    struct = secondary_structure.get_annotation(pos)
-                    if struct != mut_struct:
-                        mut_prev_struct = struct
-                        break
-
-                mut_next_struct = None
-                pos = int(mut_pos)
-                while pos:
-                    pos += 1
-                    struct = secondary_structure.get_annotation(pos)
-                    if struct != mut_struct:
-                        mut_next_struct = struct
-                        break
-
-                #
-                features = list()
-                features.append(rna_id)
-                features.append(editing_value)
-                features.append(fe_ensemble)
-                features.append(simtree_normalized_score)
-                # features.append(simtree_flipping_modes)
-
-                features.append(num_mutations)
-                features.append(mut_exist)
-                features.append(mut_type)
-                features.append(mut_pos)
-                features.append(mut_site_distance)
-                features.append(mut_ref_nt)
-                features.append(mut_nt)
-                features.append(mut_struct)
-                features.append(mut_ref_struct)
-                features.append(mut_prev_struct)
-                features.append(mut_next_struct)
-                features.append(mut_same_as_site)
-
-                #
-                rna_lib_features_list.append(features + structure_features)
-    else:
-        # No mutation related features
-        features = list()
-        features.append(rna_id)
-        features.append(editing_value)
-        features.append(fe_ensemble)
-        features.append(simtree_normalized_score)
-        # features.append(simtree_flipping_modes)
-
-        features.append(num_mutations)
-        features.append(mut_exist)
-        features.append(mut_type)
-        features.append(mut_pos)
-        features.append(mut_site_distance)
-        features.append(mut_ref_nt)
-        features.append(mut_nt)
-        features.append(mut_struct)
-        features.append(mut_ref_struct)
-        features.append(mut_prev_struct)
-        features.append(mut_next_struct)
-        features.append(mut_same_as_site)
-
-        #
-        rna_lib_features_list.append(features + structure_features)
+            = simtree_runner.compare_rna_structure(structure_string, wt_structure.dot_bracket)
+
+    # Structure and "mutation" features - one row per mutation
+    feature_rows = feature_engine.extract(rna_lib_compiled_structure_dict[rna_id], editing_position,
+                                          rna_item.get('mutation_syntax'),
+                                          wt_structure=wt_structure, wt_sequence=wt_sequence)
+    # Ensemble probabilities - "empty" for the items without
+    ensemble_row = ensemble_feature_dict.get(rna_id, [empty_value_numeric] * len(ensemble_feature_columns))
+    # Bootstrap features - "empty" for the items without
+    bootstrap_row = bootstrap_ensemble.features(rna_id, editing_position) \
+        if bootstrap_ensemble is not None else []
+    # BPP features - one per feature row
+    bpp_rows = bpp_feature_dict.get(rna_id, [[]] * len(feature_rows))
+
+    for feature_row, bpp_row in zip(feature_rows, bpp_rows):
+        rna_lib_features_list.append([rna_id, editing_value, fe_ensemble, simtree_normalized_score] + feature_row
+                                     + ensemble_row + bootstrap_row + bpp_row)
 
 # endregion
 
@@ -770,77 +360,7 @@ headers = [
     'free_energy',
     'sim_nor_score',
     # 'sim_flip_mode',
-
-    'num_mutations',
-    'mut_exist',
-    'mut_type',
-    'mut_pos',
-    'mut_site_dist',
-    'mut_ref_nt',
-    'mut_nt',
-    'mut_struct',
-    'mut_ref_struct',
-    'mut_prev_struct',
-    'mut_next_struct',
-    'mut_same_as_site',
-
-    'all_stem_length',
-
-    'site_struct',
-
-    'site_prev_nt',
-    'site_next_nt',
-    'site_prev_struct',
-    'site_next_struct',
-    'site_1_1',
-
-    'site_length',
-    'site_length_stem',
-    'site_length_hairpin',
-    'site_length_bulge',
-    'site_length_internal_es',
-    'site_length_internal_ecs',
-    'site_5prm_cp_hairpin',
-    'site_5prm_cp_bulge',
-    'site_3prm_cp_bulge',
-    'site_5prm_cp_internal',
-    'site_3prm_cp_internal',
-
-    'u_count',
-    'u_all_stem_length',
-    'u_hairpin_length',
-]
-
-# Build "header" for upstream structure elements
-feature_template = [
-    'exist',
-    'distance',
-
-    'struct',
-    'length',
-    'length_stem',
-    'length_hairpin',
-    'length_bulge',
-    'length_internal_es',
-    'length_internal_ecs',
-    '5prm_cp_hairpin',
-    '5prm_cp_bulge',
-    '3prm_cp_bulge',
-    '5prm_cp_internal',
-    '3prm_cp_internal',
-]
-for index in range(1, num_upstream_elements + 1):
-    #
-    for template in feature_template:
-        headers.append('u{}_{}'.format(str(index), template))
-
-#
-headers.append('d_count')
-headers.append('d_all_stem_length')
-for index in range(1, num_downstream_elements + 1):
-    #
-    for template in feature_template:
-        headers.append('d{}_{}'.format(str(index), template))
+] + feature_engine.columns + ensemble_feature_columns + bootstrap_columns + bpp_columns
 
 # Write the "headers" line
 writer = csv.writer(open(output_file_path, 'w'))
@@ -39,6 +39,8 @@ from py_scripts import setup_logging
 
 from typing import Tuple, List, Any
 
+from neoRNA.sequence.mutation import MutationType, parse_mutation_syntax
+
 
 # ----------------------------------
 # region Parsing Argument
@@ -145,35 +147,6 @@ if not os.path.isabs(output_file_path):
 # ----------------------------------
 # region Load "RNA Lib Structure Summary" Data
 
-def parse_mut_syntax(mut_syntax_str: str):
-    """
-    Parse the mutation syntax, and return the following info:
-    - mut position
-    - mut
-
-    Parameters
-    ----------
-    mut_syntax_str str The mutation syntax string.
-
-    Returns
-    -------
-
-    """
-
-    #
-    import re
-
-    # Regex format to match the string
-    regex = "^(?P<mut_position>[0-9]+)(?P<mutation>\w+)$"
-    matched = re.match(regex, mut_syntax_str.strip())
-
-    if not matched:
-        return None
-
-    #
-    return matched.groupdict()
-
-
 #
 rna_lib_struct_summary_list = []
 
@@ -185,21 +158,24 @@ with open(rna_lib_struct_summary_file_path) as infile:
     #
     for item in reader:
         #
-        mut_syntax_str = item['mutation_syntax']
+        mutations = parse_mutation_syntax(item['mutation_syntax'], strict=False)
+        if not mutations:
+            logger.warning('Skip the item with an invalid mutation syntax: {} - {}'.format(
+                item['rna_id'], item['mutation_syntax']))
+            continue
 
         # Check if it is "wt"
-        if mut_syntax_str.startswith('wt'):
+        if mutations[0].mut_type == MutationType.WildType:
             wt_struct_summary = item
             continue
 
-        if mut_syntax_str.startswith('indel'):
+        if mutations[0].mut_type == MutationType.Indel:
             continue
 
         # Determine it is to check "single" or "double" mutations
-        mut_syntax_list = mut_syntax_str.split(',')
-        if mut_type == 'single' and len(mut_syntax_list) == 1:
+        if mut_type == 'single' and len(mutations) == 1:
             #
-            rna_lib_struct_summary_list.append(item)
+            rna_lib_struct_summary_list.append((item, mutations[0]))
 
 # endregion
 
@@ -230,19 +206,13 @@ def determine_mut_category(mut_position, mut_str, dot_bracket_annotation):
 output_list = []
 
 #
-for rna in rna_lib_struct_summary_list:
+for rna, mutation in rna_lib_struct_summary_list:
     #
-    mut_syntax_str = rna['mutation_syntax']
     dot_bracket_annotation = rna['computational_dot_bracket_annotation']
 
-    # Parse mut syntax
-    mut_syntax_list = mut_syntax_str.split(',')
-    mut_syntax = mut_syntax_list[0]
-    mut_syntax_parsed = parse_mut_syntax(mut_syntax)
-
     # Determine the "mut category"
-    mut_position = mut_syntax_parsed['mut_position']
-    mut_str = mut_syntax_parsed['mutation']
+    mut_position = mutation.position
+    mut_str = '{}to{}'.format(mutation.ref_nt, mutation.alt_nt)
 
     wt_sequence_str = wt_struct_summary['sequence_string']
     #
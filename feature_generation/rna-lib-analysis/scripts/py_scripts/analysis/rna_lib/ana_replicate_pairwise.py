@@ -23,13 +23,10 @@ sys.path.append(local_module_path)
 import logging
 from py_scripts import setup_logging
 
-import json
-
 from pyppl import PyPPL, Proc
 
+from neoRNA.io.library_io import LibraryIO
 from neoRNA.library.rna_library import RnaLibrary
-from neoRNA.util.file_utils import FileUtils
-from neoRNA.util.json_serializable import as_python_object
 
 
 # ----------------------------------
@@ -95,12 +92,9 @@ logger = logging.getLogger(logger_name)
 # ----------------------------------
 # region Prep - RNA Lib Object
 
-rna_library_1_str = FileUtils.load_file_as_str(replicate_1_file_path)
-rna_library_1: RnaLibrary = json.loads(rna_library_1_str, object_hook=as_python_object)
-
-
-rna_library_2_str = FileUtils.load_file_as_str(replicate_2_file_path)
-rna_library_2: RnaLibrary = json.loads(rna_library_2_str, object_hook=as_python_object)
+# NOTE: the profile data is memory-mapped, if saved as arrays next to the files
+rna_library_1: RnaLibrary = LibraryIO.as_python_object(replicate_1_file_path)
+rna_library_2: RnaLibrary = LibraryIO.as_python_object(replicate_2_file_path)
 
 # endregion
 
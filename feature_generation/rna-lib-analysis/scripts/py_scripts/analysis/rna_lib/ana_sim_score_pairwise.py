@@ -28,7 +28,6 @@ local_module_path = \
                     os.path.realpath(__file__)))))
 sys.path.append(local_module_path)
 
-import json
 import csv
 
 from collections import defaultdict
@@ -39,6 +38,7 @@ from py_scripts import setup_logging
 from typing import Tuple, List, Any
 
 from neoRNA.sequence.sequence import Sequence
+from neoRNA.library.summary_index import StructureSummaryIndex
 
 from neoRNA.util.runner.simtree_runner import SimTreeRunner
 
@@ -55,6 +55,10 @@ arguments_parser = argparse.ArgumentParser(description='RNA Lib Analysis Script
 arguments_parser.add_argument('rna_lib_struct_summary_file',
                               metavar='rna_lib_struct_summary_file.json',
                               help='The file path to the "RNA Lib Structure Summary" file.')
+arguments_parser.add_argument('--overlay', dest='overlays',
+                              action='append', default=None,
+                              help='An "overlay" file (".jsonl") of updated records, merged into the summary items, '
+                                   'such as the output of "util_adjust_sequence.py". Can be repeated.')
 
 # Parameters
 
@@ -75,6 +79,10 @@ rna_lib_struct_summary_file_path = os.path.abspath(args.rna_lib_struct_summary_f
 # Validation
 if not os.path.exists(rna_lib_struct_summary_file_path.strip()):
     raise ValueError('"RNA Lib Structure Summary" file does not exist. ')
+overlay_file_paths = [os.path.abspath(overlay_file) for overlay_file in args.overlays or []]
+for overlay_file_path in overlay_file_paths:
+    if not os.path.exists(overlay_file_path):
+        raise ValueError('"Overlay" file does not exist. ', overlay_file_path)
 
 #
 
@@ -112,11 +120,9 @@ if not os.path.isabs(output_file_path):
 # ----------------------------------
 # region Load "RNA Lib Structure Summary" Data
 
-# RSample results, indexed by "RNA ID"
-rna_lib_struct_summary_dict = {}
-
-with open(rna_lib_struct_summary_file_path) as infile:
-    rna_lib_struct_summary_dict = json.load(infile)
+# Indexed once, and saved next to the summary
+rna_lib_struct_summary_index = StructureSummaryIndex.load(rna_lib_struct_summary_file_path,
+                                                         overlay_file_paths=overlay_file_paths)
 
 # endregion
 
@@ -127,21 +133,11 @@ with open(rna_lib_struct_summary_file_path) as infile:
 wt_dot_bracket_structure_computational = None
 wt_dot_bracket_structure_experimental = None
 
-# Prepare the "secondary structure" for all RNA items, also identify "WT"
-for rna_item in rna_lib_struct_summary_dict['items']:
+wt_rna_item = rna_lib_struct_summary_index.wt()
+if wt_rna_item:
     #
-    rna_id = rna_item['rna_id']
-
-    # Both "computational_structure" and "experimental_structure"
-    structure_string_computational = rna_item['computational_structure']
-    structure_string_experimental = rna_item['experimental_structure']
-
-    # Check if it is "WT"
-    if 'mutation_syntax' in rna_item \
-            and rna_item['mutation_syntax'].strip().lower().startswith('wt'):
-        #
-        wt_dot_bracket_structure_computational = structure_string_computational
-        wt_dot_bracket_structure_experimental = structure_string_experimental
+    wt_dot_bracket_structure_computational = wt_rna_item['computational_structure']
+    wt_dot_bracket_structure_experimental = wt_rna_item['experimental_structure']
 
 
 #
@@ -151,7 +147,7 @@ simtree_runner = SimTreeRunner(simtree_jar_location, os.getcwd())
 
 #
 output_data_list = list()
-for rna_item in rna_lib_struct_summary_dict['items']:
+for rna_item in rna_lib_struct_summary_index.items():
     #
     rna_id = rna_item['rna_id']
     logger.info('---------- RNA Item: {} ----------'.format(rna_id))
@@ -12,12 +12,17 @@
 # - Editing Level file
 #
 # ## Output
-# - RNA Lib Structure Summary file, in "JSON" format
+# - RNA Lib Structure Summary file, in "JSON" format, or one item per line when it ends with ".jsonl"
+#
+# The "editing level" file is indexed first (only the records passing the "threshold"), then the
+# "bpRNA" files are parsed in parallel workers, skipping the records not in the index. Items are
+# written as soon as their file is done, so neither side is ever held in memory as a whole.
 #
 
 import os
 import argparse
-import subprocess
+import multiprocessing
+from io import StringIO
 
 
 # Add "py_scripts" into module path, relative to "current" script
@@ -31,19 +36,15 @@ sys.path.append(local_module_path)
 import logging
 from py_scripts import setup_logging
 
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Optional
 
-import json
 import csv
 
 from neoRNA import io
-from neoRNA.sequence.sequence import Sequence
-from neoRNA.structure.secondary_structure import SecondaryStructure
-
-from neoRNA.util.runner.matlab_runner import MatlabRunner
 from neoRNA.util.file_utils import FileUtils
 
 
+
 # ----------------------------------
 # region Parse Arguments
 
@@ -69,10 +70,14 @@ def parse_args():
                                   action='store', type=float, default=0.0,
                                   help='The "threshold" of editing level. Default - 0.0. ')
 
+    arguments_parser.add_argument('--workers',
+                                  action='store', type=int, default=os.cpu_count(),
+                                  help='The number of processes parsing the "bpRNA" files. Default - number of CPUs. ')
+
     # Output
     arguments_parser.add_argument('--out',
                                   action='store', default='chromosone.json',
-                                  help='Filename of RNA Lib Structure file.')
+                                  help='Filename of RNA Lib Structure file. Use ".jsonl" for one item per line.')
 
     # endregion
 
@@ -119,6 +124,7 @@ def prep(args: Any):
     bprna_folder_path = os.path.abspath(args.bprna_folder)
     editing_level_file_path = os.path.abspath(args.editing_level_file)
     editing_level_threshold = args.threshold
+    workers = max(1, args.workers or 1)
 
     #
     cwd = os.getcwd()
@@ -127,7 +133,7 @@ def prep(args: Any):
         output_file_path = os.path.join(cwd, output_file_path)
 
     # return
-    return logger, bprna_folder_path, editing_level_file_path, editing_level_threshold, output_file_path
+    return logger, bprna_folder_path, editing_level_file_path, editing_level_threshold, workers, output_file_path
 
 # endregion
 
@@ -135,26 +141,46 @@ def prep(args: Any):
 # ----------------------------------
 # region Load Data
 
-def load(logger, config, bprna_folder_path, editing_level_file_path):
-    #
-    # Only load "bpRNA" file
-    bprna_files = [f for f in os.listdir(bprna_folder_path)
-                   if os.path.isfile(os.path.join(bprna_folder_path, f))
-                   and os.path.splitext(f)[1] == '.st']
-
-    # bpRNA structures
-    bprna_structure_dict: Dict[str, SecondaryStructure] = dict()
-    for file in bprna_files:
-        #
-        file_path = os.path.join(bprna_folder_path, file)
-
-        with open(file_path) as handle:
-            for secondary_structure in io.parse(handle, "bp-rna"):
-                #
-                chromosome_id = secondary_structure.comment
-                bprna_structure_dict[chromosome_id] = secondary_structure
-    #
-    return bprna_files, bprna_structure_dict
+def load(logger, config, editing_level_file_path, editing_level_threshold) -> Dict[str, Dict[str, Any]]:
+    r"""
+    Index the "editing level" file by "chromosome id" (`<#chrom>_<position>`).
+
+    Only the records passing the "threshold" are kept, and only the fields needed for the output items.
+    """
+    editing_level_index: Dict[str, Dict[str, Any]] = dict()
+    total_records = 0
+
+    with open(editing_level_file_path) as infile:
+        reader = csv.DictReader(infile, dialect='excel-tab')
+        for record in reader:
+            total_records += 1
+            #
+            editing_level = float(record['editlevel']) if record['editlevel'] != 'N/A' else None
+            # Check if the "editing level" passes the "threshold"
+            if not editing_level or editing_level < editing_level_threshold:
+                continue
+
+            #
+            chromosome_id = '{}_{}'.format(record['#chrom'], record['position'])
+            editing_level_index[chromosome_id] = {
+                'gene': record['gene'],
+                'strand': record['strand'],
+                'annotation': ' | '.join([record['annot1'], record['annot2']]),
+                'total_reads': int(record['coverage']),
+                'edited_reads': int(record['editedreads']),
+                'A-to-I_editing_level': editing_level,
+            }
+
+    logger.info('Editing level records: {}, passing the threshold: {}'.format(total_records,
+                                                                              len(editing_level_index)))
+    return editing_level_index
+
+
+def list_bprna_files(bprna_folder_path) -> List[str]:
+    # Only "bpRNA" files, sorted so the output order does not depend on the file system
+    return sorted(os.path.join(bprna_folder_path, f) for f in os.listdir(bprna_folder_path)
+                  if os.path.isfile(os.path.join(bprna_folder_path, f))
+                  and os.path.splitext(f)[1] == '.st')
 
 # endregion
 
@@ -162,84 +188,110 @@ def load(logger, config, bprna_folder_path, editing_level_file_path):
 # ----------------------------------
 # region Process
 
-def process(logger, config, bprna_structure_dict, editing_level_file_path, editing_level_threshold):
-    #
-    output_entries = list()
+# The "editing level" index, shared by the worker processes
+_editing_level_index: Optional[Dict[str, Dict[str, Any]]] = None
 
-    #
-    bprna_id_list = bprna_structure_dict.keys()
 
-    #
-    with open(editing_level_file_path) as infile:
-        reader = csv.DictReader(infile, dialect='excel-tab')
-        for record in reader:
-            #
-            chromosome_id = '{}_{}'.format(record['#chrom'], record['position'])
-            logger.info('---------- Chromosome Item: {} ----------'.format(chromosome_id))
+def init_worker(editing_level_index: Dict[str, Dict[str, Any]]):
+    global _editing_level_index
+    _editing_level_index = editing_level_index
 
-            # Check if this "chromosome" has "bpRNA" results.
-            # If "not", skip it
-            if chromosome_id not in bprna_id_list:
-                continue
 
-            editing_level = float(record['editlevel']) if record['editlevel'] != 'N/A' else None
-            logger.info('---------- Editing Level: {} ----------'.format(str(editing_level)))
-            # Check if the "editing level" passes the "threshold"
-            if not editing_level or editing_level < editing_level_threshold:
-                continue
+def split_bprna_records(handle):
+    r"""
+    Split a "bpRNA" file into (chromosome_id, record text) pairs, without parsing the records.
 
-            # Other Info
-            gene = record['gene']
-            strand = record['strand']
-            annotation = ' | '.join([record['annot1'], record['annot2']])
-            total_reads = int(record['coverage'])
-            edited_reads = int(record['editedreads'])
+    A record starts with its "#Name: " line.
+    """
+    chromosome_id = None
+    lines = []
+    for line in handle:
+        if line.startswith('#Name:'):
+            if chromosome_id is not None:
+                yield chromosome_id, ''.join(lines)
+            chromosome_id = line[7:].rstrip()
+            lines = []
+        if chromosome_id is not None:
+            lines.append(line)
+    if chromosome_id is not None:
+        yield chromosome_id, ''.join(lines)
 
-            #
-            bprna_structure = bprna_structure_dict[chromosome_id]
 
-            # Get the "editing position"
-            sequence_str = str(bprna_structure.sequence.get_rna_sequence())
-            editing_position = int((len(sequence_str) - 1) / 2)
+def process_bprna_file(file_path: str) -> List[Dict[str, Any]]:
+    r"""
+    Build the output items of one "bpRNA" file.
 
+    Only the records whose "chromosome id" is in the "editing level" index are parsed.
+    """
+    output_entries = list()
+    with open(file_path) as handle:
+        for chromosome_id, record_text in split_bprna_records(handle):
             #
-            entry = {
-                'rna_id': chromosome_id,
-                'gene': gene,
-                'strand': strand,
-                'annotation': annotation,
-                'total_reads': total_reads,
-                'edited_reads': edited_reads,
-                #
-                'sequence_string': sequence_str,
-                'computational_structure': bprna_structure.dot_bracket,
+            editing_info = _editing_level_index.get(chromosome_id)
+            if editing_info is None:
+                continue
+
+            for bprna_structure in io.parse(StringIO(record_text), "bp-rna"):
+                # Get the "editing position"
+                sequence_str = str(bprna_structure.sequence.get_rna_sequence())
+                editing_position = int((len(sequence_str) - 1) / 2)
 
                 #
-                'A-to-I_editing_level': editing_level,
-                'A-to-I_editing_site': editing_position,
-            }
-            output_entries.append(entry)
+                entry = {
+                    'rna_id': chromosome_id,
+                    'gene': editing_info['gene'],
+                    'strand': editing_info['strand'],
+                    'annotation': editing_info['annotation'],
+                    'total_reads': editing_info['total_reads'],
+                    'edited_reads': editing_info['edited_reads'],
+                    #
+                    'sequence_string': sequence_str,
+                    'computational_structure': bprna_structure.dot_bracket,
+
+                    #
+                    'A-to-I_editing_level': editing_info['A-to-I_editing_level'],
+                    'A-to-I_editing_site': editing_position,
+                }
+                output_entries.append(entry)
 
     #
     return output_entries
 
+
+def process(logger, config, bprna_files, editing_level_index, workers):
+    r"""
+    Yield the output items, one "bpRNA" file at a time.
+    """
+    if not editing_level_index:
+        return
+
+    if workers <= 1:
+        init_worker(editing_level_index)
+        results = map(process_bprna_file, bprna_files)
+        for file_path, output_entries in zip(bprna_files, results):
+            logger.debug('{}: {} items'.format(os.path.basename(file_path), len(output_entries)))
+            yield from output_entries
+        return
+
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(editing_level_index,)) as pool:
+        # "imap" keeps the file order, while the workers run ahead
+        results = pool.imap(process_bprna_file, bprna_files, chunksize=max(1, len(bprna_files) // (workers * 16)))
+        for file_path, output_entries in zip(bprna_files, results):
+            logger.debug('{}: {} items'.format(os.path.basename(file_path), len(output_entries)))
+            yield from output_entries
+
 # endregion
 
 
 # ----------------------------------
 # region Output
 
-def output(logger, config, output_file_path, output_entries):
-    #
-    rna_library_structure_summary_dict = {
-        "items": output_entries,
-    }
-    json_data = json.dumps(rna_library_structure_summary_dict,
-                           sort_keys=True,
-                           indent=4, ensure_ascii=True)
+def output(logger, config, output_file_path, output_entries) -> int:
+    # Items are written as they come, one per line for ".jsonl" files
+    item_count = FileUtils.save_json_items(output_file_path, output_entries)
 
-    # Output JSON as file
-    FileUtils.save_file(output_file_path, json_data)
+    logger.info('Items written: {}'.format(item_count))
+    return item_count
 
 # endregion
 
@@ -255,13 +307,15 @@ def main():
     config = {}
 
     # Prep
-    logger, bprna_folder_path, editing_level_file_path, editing_level_threshold, output_file_path = prep(args)
+    logger, bprna_folder_path, editing_level_file_path, editing_level_threshold, workers, output_file_path \
+        = prep(args)
 
-    # Load original data
-    bprna_files, bprna_structure_dict = load(logger, config, bprna_folder_path, editing_level_file_path)
+    # Load original data - the "editing level" index, the structures are parsed while processing
+    editing_level_index = load(logger, config, editing_level_file_path, editing_level_threshold)
+    bprna_files = list_bprna_files(bprna_folder_path)
 
     # Process data
-    output_entries = process(logger, config, bprna_structure_dict, editing_level_file_path, editing_level_threshold)
+    output_entries = process(logger, config, bprna_files, editing_level_index, workers)
 
     # Output
     output(logger, config, output_file_path, output_entries)
@@ -21,9 +21,11 @@
 #
 # ## Output
 # - The output includes two files:
-#   - RNA Lib Structure Summary file, in "JSON" format
+#   - RNA Lib Structure Summary file, in "JSON" format, or one item per line when it ends with ".jsonl"
 #   - Quick summary file, in "csv" format.
 #
+# All isoforms are built at once from the reference sequence, identical sequences are folded only once,
+# and the folding runs through a "fold backend" (Biers, ViennaRNA or a stub) across worker processes.
 #
 
 import os
@@ -33,75 +35,90 @@ import subprocess
 
 import logging
 
-import json
 import csv
 
 import numpy as np
 
-from neoRNA.sequence.sequence import Sequence
-from neoRNA.util.runner.matlab_runner import MatlabRunner
+from neoRNA.sequence.mutation import RNA_TRANSLATION, DNA_TRANSLATION, call_mutations
+from neoRNA.util.runner.batch_fold_runner import FOLD_BACKENDS, get_fold_runner
 from neoRNA.util.file_utils import FileUtils
 
 
+logger = logging.getLogger('neo_rna.script')
+
 # ----------------------------------
-# region Parsing Argument
+# region Parse Arguments
 #
 # :link: https://docs.python.org/dev/library/argparse.html
 #
 
-arguments_parser = argparse.ArgumentParser(description='RNA Lib Prep Script - Process "Degenerate Isoforms" data.')
-
-# Inputs
-arguments_parser.add_argument('original_data_file',
-                              metavar='original_data_file.csv',
-                              help='The file path to the "Original Data" file.')
-
-# Parameters
-arguments_parser.add_argument('--ref_sequence', dest='reference_sequence',
-                              action='store', default='',
-                              help='The reference sequence.')
-arguments_parser.add_argument('--mut_positions', dest='mutation_positions',
-                              action='store', default='',
-                              help='The mutation positions - by a string.')
-arguments_parser.add_argument('--editing_position', dest='editing_position',
-                              action='store', default=0,
-                              help='The editing position.')
-arguments_parser.add_argument('--id_prefix', dest='id_prefix',
-                              action='store', default='DG',
-                              help='The "prefix" used for generate the ID.')
-arguments_parser.add_argument('--use_rna',
-                              action='store_true',
-                              help='If using RNA sequence.')
-
-# Output
-arguments_parser.add_argument('--o_summary', dest='out_csv',
-                              action='store', default='output.csv',
-                              help='Filename of summary file.')
-arguments_parser.add_argument('--o_structure', dest='out_json',
-                              action='store', default='output.json',
-                              help='Filename of "RNA Structure Summary" file.')
-
-
-# parse the arguments
-args = arguments_parser.parse_args()
-
-# Get the "absolute path" for file / folder
-original_data_file_path = os.path.abspath(args.original_data_file)
-
-
-# Validation
-if not os.path.exists(original_data_file_path.strip()):
-    raise ValueError('"Original Data" file does not exist. ')
+def parse_args():
+
+    # region Parser
+    # -----------------------------------------
+    # Parser
+    # -----------------------------------------
+    arguments_parser = argparse.ArgumentParser(description='RNA Lib Prep Script - Process "Degenerate Isoforms" data.')
+
+    # Inputs
+    arguments_parser.add_argument('original_data_file',
+                                  metavar='original_data_file.csv',
+                                  help='The file path to the "Original Data" file.')
+
+    # Parameters
+    arguments_parser.add_argument('--ref_sequence', dest='reference_sequence',
+                                  action='store', default='',
+                                  help='The reference sequence.')
+    arguments_parser.add_argument('--mut_positions', dest='mutation_positions',
+                                  action='store', default='',
+                                  help='The mutation positions - by a string.')
+    arguments_parser.add_argument('--editing_position', dest='editing_position',
+                                  action='store', default='0',
+                                  help='The editing position.')
+    arguments_parser.add_argument('--id_prefix', dest='id_prefix',
+                                  action='store', default='DG',
+                                  help='The "prefix" used for generate the ID.')
+    arguments_parser.add_argument('--use_rna',
+                                  action='store_true',
+                                  help='If using RNA sequence.')
+
+    # Folding
+    arguments_parser.add_argument('--fold_backend',
+                                  action='store', default='biers', choices=sorted(FOLD_BACKENDS),
+                                  help='The backend used to predict the structures. Default - "biers".')
+    arguments_parser.add_argument('--workers',
+                                  action='store', type=int, default=1,
+                                  help='The number of folding processes. Default - 1.')
+
+    # Output
+    arguments_parser.add_argument('--o_summary', dest='out_csv',
+                                  action='store', default='output.csv',
+                                  help='Filename of summary file.')
+    arguments_parser.add_argument('--o_structure', dest='out_json',
+                                  action='store', default='output.json',
+                                  help='Filename of "RNA Structure Summary" file.')
+
+    # endregion
+
+    # region Validate
+    # -----------------------------------------
+    # Validate
+    # -----------------------------------------
+
+    args = arguments_parser.parse_args()
+    validate_args(args)
+
+    # endregion
 
-#
-reference_sequence_str = args.reference_sequence.strip()
-mutation_positions = list(map(int, args.mutation_positions.strip().split(',')))  # Convert a string to a list of "int".
-editing_position = int(args.editing_position.strip()) if args.editing_position.strip() is not None else 0
-id_prefix = args.id_prefix.strip()
-use_rna = args.use_rna
+    #
+    return args
 
-output_csv_file_path = args.out_csv.strip()
-output_json_file_path = args.out_json.strip()
+
+def validate_args(args):
+    #
+    original_data_file_path = os.path.abspath(args.original_data_file.strip())
+    if not os.path.exists(original_data_file_path):
+        raise ValueError('"Original Data" file does not exist. ')
 
 # endregion
 
@@ -109,9 +126,31 @@ output_json_file_path = args.out_json.strip()
 # ----------------------------------
 # region Prep
 
-cwd = os.getcwd()
-output_csv_file_path = os.path.join(cwd, output_csv_file_path)
-output_json_file_path = os.path.join(cwd, output_json_file_path)
+def prep(args):
+    #
+    logging.basicConfig(level=logging.INFO)
+
+    #
+    config = {
+        'reference_sequence': args.reference_sequence.strip(),
+        # Convert a string to a list of "int".
+        'mutation_positions': list(map(int, args.mutation_positions.strip().split(','))),
+        'editing_position': int(args.editing_position.strip() or 0),
+        'id_prefix': args.id_prefix.strip(),
+        'use_rna': args.use_rna,
+        'fold_backend': args.fold_backend,
+        'workers': max(1, args.workers),
+    }
+
+    #
+    original_data_file_path = os.path.abspath(args.original_data_file.strip())
+
+    cwd = os.getcwd()
+    output_csv_file_path = os.path.join(cwd, args.out_csv.strip())
+    output_json_file_path = os.path.join(cwd, args.out_json.strip())
+
+    # return
+    return config, original_data_file_path, output_csv_file_path, output_json_file_path
 
 # endregion
 
@@ -119,26 +158,33 @@ output_json_file_path = os.path.join(cwd, output_json_file_path)
 # ----------------------------------
 # region Load Original Data
 
-isoforms = []
-editing_value_1_dict = {}
-editing_value_2_dict = {}
+def load(original_data_file_path):
+    r"""
+    Load the "isoforms" and both "editing values" of the original data file.
+    """
 
-# Columns to load
-isoform_column_name = 'isoforms'
-editing_value_1_column_name = 'replicate 1'
-editing_value_2_column_name = 'replicate 2'
+    isoforms = []
+    editing_value_1_dict = {}
+    editing_value_2_dict = {}
+
+    # Columns to load
+    isoform_column_name = 'isoforms'
+    editing_value_1_column_name = 'replicate 1'
+    editing_value_2_column_name = 'replicate 2'
 
-#
-original_data = csv.DictReader(open(original_data_file_path, 'rU'))
-for line in original_data:
-    isoform = line[isoform_column_name]
-    isoforms.append(isoform)
     #
-    value_1 = line[editing_value_1_column_name]
-    editing_value_1_dict[isoform] = float(value_1) if value_1 != "NA" and value_1 != "#N/A" else None
+    with open(original_data_file_path, newline='') as original_data_file:
+        for line in csv.DictReader(original_data_file):
+            isoform = line[isoform_column_name]
+            isoforms.append(isoform)
+            #
+            value_1 = line[editing_value_1_column_name]
+            editing_value_1_dict[isoform] = float(value_1) if value_1 != "NA" and value_1 != "#N/A" else None
 
-    value_2 = line[editing_value_2_column_name]
-    editing_value_2_dict[isoform] = float(value_2) if value_2 != "NA" and value_2 != "#N/A" else None
+            value_2 = line[editing_value_2_column_name]
+            editing_value_2_dict[isoform] = float(value_2) if value_2 != "NA" and value_2 != "#N/A" else None
+
+    return isoforms, editing_value_1_dict, editing_value_2_dict
 
 # endregion
 
@@ -146,125 +192,148 @@ for line in original_data:
 # ----------------------------------
 # region Process Isoform
 
-def generate_isoform_sequence(reference_sequence, mutation_positions, isoform):
+def generate_isoform_sequences(reference_sequence, mutation_positions, isoforms, translation=None):
     r"""
-    Generate the sequence based on the given "isoform" sequence.
+    Generate the sequences of all "isoforms" at once.
+
+    The reference sequence is repeated as an (isoforms x length) char array, and the isoform
+    nucleotides are written into the "mutation position" columns.
 
     Parameters
     ----------
     reference_sequence: str
         The reference sequence.
-    mutation_positions: str
+    mutation_positions: List[int]
         The list of "mutation positions" (Start with "1").
+    isoforms: List[str]
+        The "isoform" strings - the "nt" on all mutation positions.
+    translation: bytes
+        Optional translation table applied to all sequences, e.g. `RNA_TRANSLATION`.
 
     Returns
     -------
-    isoform_sequence: str
-        The isoform sequence
-
+    isoform_sequences: List[str]
+        The isoform sequences. '' for an isoform which does not match the "mutation positions".
     """
 
-    if len(reference_sequence) == 0:
-        return ''
+    isoform_sequences = [''] * len(isoforms)
+    if len(reference_sequence) == 0 or len(isoforms) == 0:
+        return isoform_sequences
 
     # The length of "mut positions" and "isoform" string should be identical.
-    if len(mutation_positions) != len(isoform):
-        return ''
+    valid_indices = [index for index, isoform in enumerate(isoforms) if len(isoform) == len(mutation_positions)]
+    if not valid_indices:
+        return isoform_sequences
 
-    isoform_sequence_list = list(reference_sequence)
-    isoform_index = 0
-    for position in mutation_positions:
-        isoform_sequence_list[position - 1] = isoform[isoform_index]
-        isoform_index += 1
+    reference_bytes = reference_sequence.encode('ascii')
+    isoform_bytes = ''.join(isoforms[index] for index in valid_indices).encode('ascii')
+    if translation:
+        reference_bytes = reference_bytes.translate(translation)
+        isoform_bytes = isoform_bytes.translate(translation)
 
-    return "".join(isoform_sequence_list)
+    reference_array = np.frombuffer(reference_bytes, dtype=np.uint8)
+    columns = np.asarray(mutation_positions, dtype=np.int64) - 1
+    isoform_array = np.frombuffer(isoform_bytes, dtype=np.uint8).reshape(len(valid_indices), len(columns))
 
+    sequence_array = np.tile(reference_array, (len(valid_indices), 1))
+    sequence_array[:, columns] = isoform_array
 
-#
-quick_summary_items = []
-rna_library_structure_summary_items = list()
+    # One string per row
+    sequence_strs = sequence_array.view('S{}'.format(len(reference_array))).ravel()
+    for row, index in enumerate(valid_indices):
+        isoform_sequences[index] = sequence_strs[row].decode('ascii')
 
-#
-MatlabRunner.start_engine()
-#
-id_count = 1
-reference_sequence = Sequence(reference_sequence_str)
-for isoform in isoforms:
-    #
-    isoform_sequence_str = generate_isoform_sequence(reference_sequence_str, mutation_positions, isoform)
+    return isoform_sequences
 
-    if isoform_sequence_str == '':
-        continue
-    isoform_sequence = Sequence(isoform_sequence_str)
 
-    #
-    isoform_id = '{0}{1:0>4}'.format(id_prefix, id_count)
-    id_count += 1
-
-    # Mut Syntax
-    if use_rna:
-        seq_mut_positions, seq_mut_syntax = isoform_sequence.generate_mutation_syntax(
-            str(reference_sequence.get_rna_sequence()), seq_type_rna=True)
-    else:
-        seq_mut_positions, seq_mut_syntax = isoform_sequence.generate_mutation_syntax(
-            str(reference_sequence.get_dna_sequence()))
-
-    # QC on "syntax"
-    # Neil1 - discard the record which includes "46AtoG: or "46AtoG"
-    # if '46AtoG' in seq_mut_syntax or '48AtoG' in seq_mut_syntax:
-    #     continue
-
-    # Decide output sequence string, RNA or DNA
-    output_isoform_sequence_str = str(isoform_sequence.get_rna_sequence()) if use_rna \
-        else str(isoform_sequence.get_dna_sequence())
+def fold_isoforms(isoform_sequences, fold_runner, workers):
+    r"""
+    Fold the isoform sequences, each distinct sequence only once.
+
+    Yields (index, structure, bpp) in the isoform order, as soon as the fold of the sequence is done.
+    The results of a sequence are only kept until its last isoform has been yielded.
+    """
+
+    distinct_count = len(set(sequence_str for sequence_str in isoform_sequences if sequence_str))
+    logger.info('Isoforms: {}, distinct sequences to fold: {}'.format(len(isoform_sequences), distinct_count))
+
+    return fold_runner.fold_distinct(isoform_sequences, workers=workers)
+
+
+def generate_summary_items(config, isoforms, editing_value_1_dict, editing_value_2_dict, csv_writer):
+    r"""
+    Yield the "structure summary" items, and write the "quick summary" rows along the way.
+    """
+
+    reference_sequence_str = config['reference_sequence']
+    mutation_positions = config['mutation_positions']
+    editing_position = config['editing_position']
+    id_prefix = config['id_prefix']
+    use_rna = config['use_rna']
 
     #
-    editing_value_avg = (editing_value_1_dict[isoform] + editing_value_2_dict[isoform]) / 2.0
-
-    # Predict "Reference Structure"
-    biers_seqpos_out = range(1, len(output_isoform_sequence_str))
-    biers_offset = 0  # ALWAYS "0"
-    structure_na, bpp_na, bootstrap_na \
-        = MatlabRunner.rna_structure(output_isoform_sequence_str, biers_offset, biers_seqpos_out)
-
-    # Data entry for "summary" output
-    entry = list()
-    entry.append(isoform_id)
-    entry.append(isoform)
-    entry.append(output_isoform_sequence_str)
-    entry.append(','.join(seq_mut_syntax))
-    entry.append(len(seq_mut_positions))
-    entry.append(editing_position)
-    entry.append(editing_value_1_dict[isoform])
-    entry.append(editing_value_2_dict[isoform])
-    entry.append(editing_value_avg)
-
-    quick_summary_items.append(entry)
-
-    # Data entry for "structure summary" output
-    summary_item = {
-        "rna_id": isoform_id,
-        "sequence_string": output_isoform_sequence_str,
-        "mutation_syntax": ','.join(seq_mut_syntax) if seq_mut_syntax else None,
-
-        "computational_structure": structure_na,
-        "computational_bpp": np.array(bpp_na).tolist(),
+    translation = RNA_TRANSLATION if use_rna else DNA_TRANSLATION
+    isoform_sequences = generate_isoform_sequences(reference_sequence_str, mutation_positions, isoforms, translation)
+
+    # Mut Syntax - all isoforms against the reference at once
+    mutation_table = call_mutations(reference_sequence_str, isoform_sequences, seq_type_rna=use_rna)
 
+    # IDs only count the isoforms with a sequence
+    id_count = 0
+    fold_runner = get_fold_runner(config['fold_backend'])
+    for index, structure_na, bpp_na in fold_isoforms(isoform_sequences, fold_runner, config['workers']):
         #
-        "A-to-I_editing_level": editing_value_avg,
-        "A-to-I_editing_site": editing_position,
-    }
+        isoform = isoforms[index]
+        output_isoform_sequence_str = isoform_sequences[index]
+        seq_mut_syntax = mutation_table.syntax(index)
 
-    rna_library_structure_summary_items.append(summary_item)
+        #
+        id_count += 1
+        isoform_id = '{0}{1:0>4}'.format(id_prefix, id_count)
 
-#
-MatlabRunner.stop_engine()
+        # QC on "syntax"
+        # Neil1 - discard the record which includes "46AtoG: or "46AtoG"
+        # if '46AtoG' in seq_mut_syntax or '48AtoG' in seq_mut_syntax:
+        #     continue
+
+        #
+        editing_value_avg = (editing_value_1_dict[isoform] + editing_value_2_dict[isoform]) / 2.0
+
+        # Data entry for "summary" output
+        entry = list()
+        entry.append(isoform_id)
+        entry.append(isoform)
+        entry.append(output_isoform_sequence_str)
+        entry.append(','.join(seq_mut_syntax))
+        entry.append(len(seq_mut_syntax))
+        entry.append(editing_position)
+        entry.append(editing_value_1_dict[isoform])
+        entry.append(editing_value_2_dict[isoform])
+        entry.append(editing_value_avg)
+
+        csv_writer.writerow(entry)
+
+        # Data entry for "structure summary" output
+        summary_item = {
+            "rna_id": isoform_id,
+            "sequence_string": output_isoform_sequence_str,
+            "mutation_syntax": ','.join(seq_mut_syntax) if seq_mut_syntax else None,
+
+            "computational_structure": structure_na,
+            "computational_bpp": np.array(bpp_na).tolist(),
+
+            #
+            "A-to-I_editing_level": editing_value_avg,
+            "A-to-I_editing_site": editing_position,
+        }
+
+        yield summary_item
 
 # endregion
 
 
 # ----------------------------------
-# region Output - Quick Summary file
+# region Output
 
 headers = [
     'dg_id',
@@ -278,26 +347,40 @@ headers = [
     'editing_value_avg',
 ]
 
-writer = csv.writer(open(output_csv_file_path, 'w'))
-writer.writerow(headers)
 
-for entry in quick_summary_items:
-    writer.writerow(entry)
+def output(config, isoforms, editing_value_1_dict, editing_value_2_dict, output_csv_file_path, output_json_file_path):
+    r"""
+    Write the RNA Lib Structure Summary file, and the Quick Summary file along with it.
+    """
+    with open(output_csv_file_path, 'w') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(headers)
+
+        summary_items = generate_summary_items(config, isoforms, editing_value_1_dict, editing_value_2_dict, writer)
+        FileUtils.save_json_items(output_json_file_path, summary_items)
 
 # endregion
 
+
 # ----------------------------------
-# region Output - RNA Lib Structure Summary file
+# region Main Script
 
-#
-rna_library_structure_summary_dict = {
-    "items": rna_library_structure_summary_items,
-}
-json_data = json.dumps(rna_library_structure_summary_dict,
-                       sort_keys=True,
-                       indent=4, ensure_ascii=True)
-
-# Output JSON as file
-FileUtils.save_file(output_json_file_path, json_data)
+def main():
+    #
+    args = parse_args()
+
+    # Prep
+    config, original_data_file_path, output_csv_file_path, output_json_file_path = prep(args)
+
+    # Load original data
+    isoforms, editing_value_1_dict, editing_value_2_dict = load(original_data_file_path)
+
+    # Process and output
+    output(config, isoforms, editing_value_1_dict, editing_value_2_dict, output_csv_file_path, output_json_file_path)
+
+
+# NOTE: Guarded, since the fold worker processes may re-import this script ("spawn" start method)
+if __name__ == "__main__":
+    main()
 
 # endregion
@@ -33,6 +33,7 @@ import csv
 
 from neoRNA import io
 from neoRNA.structure.secondary_structure import SecondaryStructure
+from neoRNA.structure.bp_rna_annotator import BpRnaAnnotator
 
 # ----------------------------------
 # region Parse Arguments
@@ -228,6 +229,14 @@ def output(logger, config, output_file_path, output_entries):
 
 def parse_bprna_annotation(structure_content: str) -> Tuple[str, SecondaryStructure]:
 
+    # Annotate in-process - the same ".st" text as `bpRNA.pl`
+    _, sequence_string, structure_string = structure_content.split('\n')
+    try:
+        return BpRnaAnnotator.run(sequence_string, structure_string)
+    except ValueError:
+        # Pseudoknots - only `bpRNA.pl` handles them
+        pass
+
     # use an intermediate tmp file because bpRNA needs it
     out_tmp = open('tmp.dbn', 'w')
     out_tmp.write(structure_content + '\n')
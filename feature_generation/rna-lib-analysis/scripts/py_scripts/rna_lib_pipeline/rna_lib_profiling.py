@@ -24,6 +24,8 @@ import os
 import argparse
 
 import json
+from collections import namedtuple
+from functools import partial
 
 # Add "py_scripts" into module path, relative to "current" script
 import sys
@@ -37,11 +39,19 @@ sys.path.append(local_module_path)
 import logging
 from py_scripts import setup_logging
 
-from pyppl import PyPPL, Proc, Channel
+try:
+    from pyppl import PyPPL, Proc, Channel
+except ImportError:
+    # Only needed by the "pyppl" runner
+    PyPPL = None
 
 from neoRNA import io
 from neoRNA.library.library_config import RnaLibConfig
+from neoRNA.library.shape_mapper.shape_scheduler import ShapeMapperScheduler
 from neoRNA.util.json_serializable import PythonObjectEncoder
+from neoRNA.util.runner.dag_runner import DagRunner, Stage, StageResource
+
+from py_scripts.rna_lib_pipeline.script.proc_rna_lib_profiling_results import generate_rna_lib_profiling_results
 
 
 # ----------------------------------
@@ -50,24 +60,44 @@ from neoRNA.util.json_serializable import PythonObjectEncoder
 # :link: https://docs.python.org/dev/library/argparse.html
 #
 
-arguments_parser \
-    = argparse.ArgumentParser(description='RNA Lib Pipeline - Profiling')
-
-# Inputs
-arguments_parser.add_argument('config',
-                              metavar='rna_lib_config_file',
-                              help='The file path to RNA Lib config file.')
-
-
-# parse the arguments
-args = arguments_parser.parse_args()
-
-# Get the "absolute path" for file / folder
-config_file_path = os.path.abspath(args.config)
-
-# Validation
-if not os.path.exists(config_file_path):
-    raise ValueError('"RNA Lib" config file does not exist.')
+def parse_args():
+    arguments_parser \
+        = argparse.ArgumentParser(description='RNA Lib Pipeline - Profiling')
+
+    # Inputs
+    arguments_parser.add_argument('config',
+                                  metavar='rna_lib_config_file',
+                                  help='The file path to RNA Lib config file.')
+
+    # Runner
+    arguments_parser.add_argument('--runner',
+                                  action='store', default='pyppl', choices=['pyppl', 'local'],
+                                  help='The pipeline runner - "pyppl", or the built-in "local" DAG runner.')
+    arguments_parser.add_argument('--shape_cores',
+                                  action='store', default=None, type=int,
+                                  help='The total cores of the ShapeMapper jobs of the "local" runner. '
+                                       'Default to "shape_total_cores" of the config, or all the cores.')
+    arguments_parser.add_argument('--shape_threads',
+                                  action='store', default=None, type=int,
+                                  help='The threads of a ShapeMapper job of the "local" runner. '
+                                       'Default to "shape_threads_per_job" of the config, or "1".')
+    arguments_parser.add_argument('--profile_workers',
+                                  action='store', default=None, type=int,
+                                  help='The worker processes to read the ShapeMapper results of the "local" runner. '
+                                       'Default to all the cores.')
+
+    # parse the arguments
+    args = arguments_parser.parse_args()
+    validate_args(args)
+
+    return args
+
+
+def validate_args(args):
+    if not os.path.exists(os.path.abspath(args.config)):
+        raise ValueError('"RNA Lib" config file does not exist.')
+    if args.runner == 'pyppl' and PyPPL is None:
+        raise ValueError('"PyPPL" is not installed. Please use the "local" runner.')
 
 # endregion
 
@@ -76,7 +106,6 @@ if not os.path.exists(config_file_path):
 # region Set Logger
 #
 
-setup_logging(logging_level=logging.INFO)
 # Logger Name
 logger_name = 'neo_rna.script'
 logger = logging.getLogger(logger_name)
@@ -84,50 +113,73 @@ logger = logging.getLogger(logger_name)
 # endregion
 
 
-# ----------------------------------
-# region Prep - Config
-
-# Load the config
-configs = RnaLibConfig(config_file_path)
-
-# Validation
-if not configs:
-    raise ValueError('"RNA Lib" configs load error. Please double check. ')
-
-# Decide the working folder
-configs.decide_working_folder(os.getcwd())
-if not os.path.exists(configs.working_folder):
-    os.mkdir(configs.working_folder)
-os.chdir(configs.working_folder)
-
-# endregion
-
-
 # ----------------------------------
 # region Pipeline - Prep
 #
 #
 # The tool "PyPPL" cannot accept "python object" as input, we will need to convert it to
 #  "string" and then convert it back while using it.
-
-# Load RNA Items
-if not configs['rna_lib_file']:
-    raise ValueError('"RNA Lib" file load error. Please double check. ')
-
-rna_lib_items = []
-# A list of "RNA Lib items", each of which is in "python object string" format.
-# It is used to pass via "Channel".
-rna_lib_item_object_json_list = []
-for rna_item in io.parse(configs['rna_lib_file'], "rna-lib-def"):
-    rna_lib_items.append(rna_item)
-    # Convert each item object to "json string"
-    rna_lib_item_object_json_list.append(json.dumps(rna_item, cls=PythonObjectEncoder))
-
-# Convert the objects to "string" and pass it as "argument"
-configs_object_json = json.dumps(configs, cls=PythonObjectEncoder)
-# A "python object string" format of a list, which includes a list of "RNA Lib items".
-# It is used to passed as "whole"
-rna_lib_items_list_json = json.dumps(rna_lib_items, cls=PythonObjectEncoder)
+#
+# The inputs, paths and settings of a run are passed to the runners, and to their stages.
+
+ProfilingPipeline = namedtuple('ProfilingPipeline', [
+    'configs', 'configs_object_json', 'rna_lib_items', 'rna_lib_item_object_json_list', 'rna_lib_items_list_json',
+    'shape_output_folder', 'rna_lib_file_path', 'shape_cores', 'shape_threads', 'profile_workers',
+])
+
+
+def prepare_pipeline(args) -> ProfilingPipeline:
+    r"""
+    Load the config and the "RNA Lib" items, and decide the working folder (and move into it).
+    """
+
+    # Load the config
+    configs = RnaLibConfig(os.path.abspath(args.config))
+
+    # Validation
+    if not configs:
+        raise ValueError('"RNA Lib" configs load error. Please double check. ')
+
+    # Decide the working folder
+    configs.decide_working_folder(os.getcwd())
+    if not os.path.exists(configs.working_folder):
+        os.mkdir(configs.working_folder)
+    os.chdir(configs.working_folder)
+
+    # Load RNA Items
+    if not configs['rna_lib_file']:
+        raise ValueError('"RNA Lib" file load error. Please double check. ')
+
+    rna_lib_items = []
+    # A list of "RNA Lib items", each of which is in "python object string" format.
+    # It is used to pass via "Channel".
+    rna_lib_item_object_json_list = []
+    for rna_item in io.parse(configs['rna_lib_file'], "rna-lib-def"):
+        rna_lib_items.append(rna_item)
+        # Convert each item object to "json string"
+        rna_lib_item_object_json_list.append(json.dumps(rna_item, cls=PythonObjectEncoder))
+
+    return ProfilingPipeline(
+        configs=configs,
+        # Convert the objects to "string" and pass it as "argument"
+        configs_object_json=json.dumps(configs, cls=PythonObjectEncoder),
+        rna_lib_items=rna_lib_items,
+        rna_lib_item_object_json_list=rna_lib_item_object_json_list,
+        # A "python object string" format of a list, which includes a list of "RNA Lib items".
+        # It is used to passed as "whole"
+        rna_lib_items_list_json=json.dumps(rna_lib_items, cls=PythonObjectEncoder),
+        # ShapeMapper output folder path
+        shape_output_folder=os.path.join(configs.working_folder, 'shapemapper_results'),
+        # RNA Lib output file path
+        rna_lib_file_path=os.path.join(configs.working_folder,
+                                       'data_{}_run_{}_at_{}.rbin'.format(
+                                           configs['data_source_code'],
+                                           configs['running_code'],
+                                           configs['running_date'])),
+        shape_cores=args.shape_cores,
+        shape_threads=args.shape_threads,
+        profile_workers=args.profile_workers,
+    )
 
 # endregion
 
@@ -143,81 +195,157 @@ rna_lib_items_list_json = json.dumps(rna_lib_items, cls=PythonObjectEncoder)
 
 
 # ----------------------------------
-# region Pipeline - ShapeMapper
-
-# ShapeMapper output folder path
-shape_output_folder = os.path.join(configs.working_folder, 'shapemapper_results')
-
-pShape = Proc(desc='Run ShapeMapper 2.x')
-pShape.input = {"rna_item_json:var": Channel.create(rna_lib_item_object_json_list)}
-# Define the "output" channel - the "output folder"
-pShape.output = "shape_output_folder:var: {}".format(shape_output_folder)
-pShape.forks = 4
+# region Runner - PyPPL
 
-#
-pShape.args.configs = configs_object_json
-pShape.lang = 'python'
-pShape.script = """
+# The job scripts - PyPPL templates, rendered for each job
+SHAPE_MAPPER_JOB_SCRIPT = """
 #!/usr/bin/env python
 
 from neoRNA.library.shape_mapper.shape_runner import ShapeMapperRunner
 ShapeMapperRunner.shape_mapper_v2({{args.configs | squote}}, {{in.rna_item_json | squote}})
 """
+
+RNA_LIB_JOB_SCRIPT = """
+#!/usr/bin/env python
+
+from py_scripts.rna_lib_pipeline.script.proc_rna_lib_profiling_results import generate_rna_lib_profiling_results
+generate_rna_lib_profiling_results({{args.configs | squote}}, {{args.rna_items | squote}}, {{out.rna_lib_output_file | squote}})
+"""
+
+
+def run_pyppl(pipeline: ProfilingPipeline):
+    r"""
+    Run the pipeline with PyPPL.
+    """
+
+    # ----------------------------------
+    # region Pipeline - ShapeMapper
+
+    pShape = Proc(desc='Run ShapeMapper 2.x')
+    pShape.input = {"rna_item_json:var": Channel.create(pipeline.rna_lib_item_object_json_list)}
+    # Define the "output" channel - the "output folder"
+    pShape.output = "shape_output_folder:var: {}".format(pipeline.shape_output_folder)
+    pShape.forks = 4
+
+    #
+    pShape.args.configs = pipeline.configs_object_json
+    pShape.lang = 'python'
+    pShape.script = SHAPE_MAPPER_JOB_SCRIPT
+    # endregion
+
+    # ----------------------------------
+    # region Pipeline - Process RNA Lib Running Result
+
+    pRnaLib = Proc(desc='Process RNA Lib Running Result from ShapeMapper 2.x')
+
+    #
+    if pipeline.configs['run_shapemapper'] is True:
+        pRnaLib.depends = pShape
+        # automatically inferred from pShape.output
+        # Collapse the channel into "1".
+        pRnaLib.input = {"shape_output_folder:var": lambda ch: ch.collapse(col=0)}
+
+    pRnaLib.output = "rna_lib_output_file:var: {}".format(pipeline.rna_lib_file_path)
+    pRnaLib.forks = 1
+
+    #
+    pRnaLib.args.configs = pipeline.configs_object_json
+    pRnaLib.args.rna_items = pipeline.rna_lib_items_list_json
+    pRnaLib.lang = 'python'
+    pRnaLib.script = RNA_LIB_JOB_SCRIPT
+
+    # endregion
+
+    # ----------------------------------
+    # region Pipeline - Run
+
+    pyppl_config = {
+        'proc': {
+            'echo': True,  # Output all
+            'errhow': 'ignore',  # Ignore the error job
+            'errntry': 3
+        }
+    }
+
+    if pipeline.configs['run_shapemapper'] is True:
+        PyPPL(pyppl_config).start(pShape).run()
+    else:
+        # Only run "RNA Lib" process
+        PyPPL(pyppl_config).start(pRnaLib).run()
+
+    # endregion
+
 # endregion
 
 
 # ----------------------------------
-# region Pipeline - Process RNA Lib Running Result
+# region Runner - Local
 
-# RNA Lib output file path
-rna_lib_file_path = os.path.join(configs.working_folder,
-                                 'data_{}_run_{}_at_{}.rbin'.format(
-                                     configs['data_source_code'],
-                                     configs['running_code'],
-                                     configs['running_date']))
+def run_shape_mapper(rna_items, pipeline: ProfilingPipeline):
+    r"""
+    The "ShapeMapper" step of the "local" runner - the jobs are packed by their threads, within the total cores.
+    """
+    results = ShapeMapperScheduler(pipeline.configs, total_cores=pipeline.shape_cores,
+                                   threads_per_job=pipeline.shape_threads).run(list(rna_items.values()))
+    return [result for result in results.values() if not result.ok]
 
-pRnaLib = Proc(desc='Process RNA Lib Running Result from ShapeMapper 2.x')
 
-#
-if configs['run_shapemapper'] is True:
-    pRnaLib.depends = pShape
-    # automatically inferred from pShape.output
-    # Collapse the channel into "1".
-    pRnaLib.input = {"shape_output_folder:var": lambda ch: ch.collapse(col=0)}
+def process_rna_lib_results(shape_failures, pipeline: ProfilingPipeline):
+    r"""
+    The "RNA Lib" step of the "local" runner - it runs once, after ShapeMapper finishes (or fails) the items.
+    """
+    generate_rna_lib_profiling_results(pipeline.configs_object_json, pipeline.rna_lib_items_list_json,
+                                       pipeline.rna_lib_file_path, workers=pipeline.profile_workers)
+    return pipeline.rna_lib_file_path
 
-pRnaLib.output = "rna_lib_output_file:var: {}".format(rna_lib_file_path)
-pRnaLib.forks = 1
 
-#
-pRnaLib.args.configs = configs_object_json
-pRnaLib.args.rna_items = rna_lib_items_list_json
-pRnaLib.lang = 'python'
-pRnaLib.script = """
-#!/usr/bin/env python
+def run_local(pipeline: ProfilingPipeline) -> bool:
+    r"""
+    Run the pipeline with the built-in DAG runner.
+
+    Returns
+    -------
+    ok: bool
+        If all the items finished.
+    """
+
+    # NOTE: in threads of the current process - ShapeMapper runs in its own processes
+    stages = []
+    if pipeline.configs['run_shapemapper'] is True:
+        stages.append(Stage('shapemapper', partial(run_shape_mapper, pipeline=pipeline), StageResource.Io,
+                            workers=1, per_item=False, retries=0))
+    stages.append(Stage('rna_lib', partial(process_rna_lib_results, pipeline=pipeline), StageResource.Io,
+                        workers=1, depends=[stages[-1].name] if stages else None, per_item=False))
+
+    report = DagRunner(stages).run([(rna_item.rna_id, rna_item) for rna_item in pipeline.rna_lib_items])
+
+    shape_failures = report.results['shapemapper'].get(None) if 'shapemapper' in report.results else None
+    return report.ok and not shape_failures
 
-from py_scripts.rna_lib_pipeline.script.proc_rna_lib_profiling_results import generate_rna_lib_profiling_results
-generate_rna_lib_profiling_results({{args.configs | squote}}, {{args.rna_items | squote}}, {{out.rna_lib_output_file | squote}})
-"""
 
 # endregion
 
 
 # ----------------------------------
-# region Run Pipelines
+# region Main Script
+#
+# NOTE: only run under `__main__` - the "local" runner may start worker processes, which import this script.
 
-pyppl_config = {
-    'proc': {
-        'echo': True,  # Output all
-        'errhow': 'ignore',  # Ignore the error job
-        'errntry': 3
-    }
-}
+def main():
+    #
+    args = parse_args()
+    setup_logging(logging_level=logging.INFO)
 
-if configs['run_shapemapper'] is True:
-    PyPPL(pyppl_config).start(pShape).run()
-else:
-    # Only run "RNA Lib" process
-    PyPPL(pyppl_config).start(pRnaLib).run()
+    pipeline = prepare_pipeline(args)
+    if args.runner == 'local':
+        return 0 if run_local(pipeline) else 1
+
+    run_pyppl(pipeline)
+    return 0
 
-# endregion
 
+#
+if __name__ == '__main__':
+    sys.exit(main())
+
+# endregion
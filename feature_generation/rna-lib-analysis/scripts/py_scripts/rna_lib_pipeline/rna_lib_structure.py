@@ -27,7 +27,8 @@ import os
 import argparse
 
 import json
-import csv
+from collections import namedtuple
+from functools import partial
 
 # Add "py_scripts" into module path, relative to "current" script
 import sys
@@ -41,14 +42,23 @@ sys.path.append(local_module_path)
 import logging
 from py_scripts import setup_logging
 
-from pyppl import PyPPL, Proc, Channel
+try:
+    from pyppl import PyPPL, Proc, Channel
+except ImportError:
+    # Only needed by the "pyppl" runner
+    PyPPL = None
 
 from neoRNA.io.library_io import LibraryIO
 from neoRNA.library.rna_library import RnaLibrary
+from neoRNA.library.summary_index import load_editing_levels
 from neoRNA.util.json_serializable import PythonObjectEncoder
 
+from neoRNA.util.runner.dag_runner import DagRunner, Stage, StageResource
+
 from py_scripts.rna_lib_pipeline.script.proc_biers_rna_structure \
-    import biers_results_folder_path, biers_inference_structure_folder_path
+    import biers_rna_structure, biers_results_folder_path, biers_inference_structure_folder_path
+from py_scripts.rna_lib_pipeline.script.proc_bprna_rna_structure import bprna_rna_structure
+from py_scripts.rna_lib_pipeline.script.proc_rna_lib_structure_results import generate_rna_lib_structure_results
 
 # ----------------------------------
 # region Parsing Argument
@@ -56,64 +66,66 @@ from py_scripts.rna_lib_pipeline.script.proc_biers_rna_structure \
 # :link: https://docs.python.org/dev/library/argparse.html
 #
 
-arguments_parser \
-    = argparse.ArgumentParser(description='RNA Lib Pipeline - Structure Inferring')
-
-# Inputs
-arguments_parser.add_argument('rna_lib_profiling',
-                              metavar='rna_lib_profiling.rbin',
-                              help='The file path to RNA Lib profiling result file.')
-arguments_parser.add_argument('--editing_level',
-                              metavar='editing_level_file',
-                              help='The file path to the Editing Level file')
-
-# Sequence Slice
-arguments_parser.add_argument('--start', dest='sequence_start',
-                              action='store', default=1,
-                              help='Start point of the sequence. Default to "1" (from beginning).')
-arguments_parser.add_argument('--end', dest='sequence_end',
-                              action='store', default=None,
-                              help='End point of the sequence. Default to "None" (till end).')
+def parse_args():
+    arguments_parser \
+        = argparse.ArgumentParser(description='RNA Lib Pipeline - Structure Inferring')
+
+    # Inputs
+    arguments_parser.add_argument('rna_lib_profiling',
+                                  metavar='rna_lib_profiling.rbin',
+                                  help='The file path to RNA Lib profiling result file.')
+    arguments_parser.add_argument('--editing_level',
+                                  metavar='editing_level_file',
+                                  help='The file path to the Editing Level file')
+
+    # Sequence Slice
+    arguments_parser.add_argument('--start', dest='sequence_start',
+                                  action='store', default=1,
+                                  help='Start point of the sequence. Default to "1" (from beginning).')
+    arguments_parser.add_argument('--end', dest='sequence_end',
+                                  action='store', default=None,
+                                  help='End point of the sequence. Default to "None" (till end).')
+
+    #
+    arguments_parser.add_argument('--biers_bootstrap',
+                                  action='store', default=20,
+                                  help='The total of bootstrap runs.')
+    arguments_parser.add_argument('--indel',
+                                  action="store", default='None',
+                                  metavar='indel_rna_id_range',
+                                  help='The rna id range for "indel" cases')
+
+    # Runner
+    arguments_parser.add_argument('--runner',
+                                  action='store', default='pyppl', choices=['pyppl', 'local'],
+                                  help='The pipeline runner - "pyppl", or the built-in "local" DAG runner.')
+    arguments_parser.add_argument('--bprna_workers',
+                                  action='store', default=None, type=int,
+                                  help='The number of bpRNA workers of the "local" runner.')
+
+    # Output
+    arguments_parser.add_argument('--structure_out',
+                                  action='store', default='rna_lib_structure.rbin',
+                                  help='Filename of RNA Lib Structure file.')
+    arguments_parser.add_argument('--structure_summary_out',
+                                  action='store', default='rna_lib-structure_summary.json',
+                                  help='Filename of RNA Lib Structure Summary file.')
+
+    # parse the arguments
+    args = arguments_parser.parse_args()
+    validate_args(args)
+
+    return args
+
+
+def validate_args(args):
+    if not os.path.exists(os.path.abspath(args.rna_lib_profiling)):
+        raise ValueError('"RNA Lib" profiling file does not exist.')
+    if not args.editing_level or not os.path.exists(os.path.abspath(args.editing_level)):
+        raise ValueError('"Editing Level" file does not exist. ')
+    if args.runner == 'pyppl' and PyPPL is None:
+        raise ValueError('"PyPPL" is not installed. Please use the "local" runner.')
 
-#
-arguments_parser.add_argument('--biers_bootstrap',
-                              action='store', default=20,
-                              help='The total of bootstrap runs.')
-arguments_parser.add_argument('--indel',
-                              action="store", default='None',
-                              metavar='indel_rna_id_range',
-                              help='The rna id range for "indel" cases')
-
-# Output
-arguments_parser.add_argument('--structure_out',
-                              action='store', default='rna_lib_structure.rbin',
-                              help='Filename of RNA Lib Structure file.')
-arguments_parser.add_argument('--structure_summary_out',
-                              action='store', default='rna_lib-structure_summary.json',
-                              help='Filename of RNA Lib Structure Summary file.')
-
-# parse the arguments
-args = arguments_parser.parse_args()
-
-# Get the "absolute path" for file / folder
-profiling_file_path = os.path.abspath(args.rna_lib_profiling)
-editing_level_file_path = os.path.abspath(args.editing_level)
-
-# Validation
-if not os.path.exists(profiling_file_path):
-    raise ValueError('"RNA Lib" profiling file does not exist.')
-if editing_level_file_path and not os.path.exists(profiling_file_path):
-    raise ValueError('"Editing Level" file does not exist. ')
-
-# Values
-sequence_start = int(args.sequence_start) if args.sequence_start is not None else 1
-sequence_end = int(args.sequence_end) if args.sequence_end is not None else None
-biers_max_bootstrap = int(args.biers_bootstrap) if args.biers_bootstrap is not None else 20
-indel_rna_id_range = args.indel
-
-# Output
-structure_file = args.structure_out
-structure_summary_file = args.structure_summary_out
 
 # Internal Flags
 # -- If need to run Biers
@@ -132,7 +144,6 @@ summary_only = False
 # region Set Logger
 #
 
-setup_logging(logging_level=logging.INFO)
 # Logger Name
 logger_name = 'neo_rna.script'
 logger = logging.getLogger(logger_name)
@@ -141,218 +152,303 @@ logger = logging.getLogger(logger_name)
 
 
 # ----------------------------------
-# region Working Folder
+# region Pipeline - Prep
+#
+# The inputs, folders and settings of a run - passed to the runners, and to their stages.
+
+StructurePipeline = namedtuple('StructurePipeline', [
+    'rna_library_object_json', 'rna_lib_item_object_json_list', 'rna_id_list', 'editing_level_file_path',
+    'working_folder', 'structure_summary_file', 'sequence_start', 'sequence_end', 'biers_max_bootstrap',
+    'bprna_workers', 'biers_inference_structure_folder', 'biers_results_folder', 'bprna_results_folder',
+])
+
+
+def prepare_pipeline(args) -> StructurePipeline:
+    r"""
+    Decide the working folder (and move into it), and load the "RNA Lib" object.
+    """
 
-# Check the "main" output file
-# - If it is "absolute path", use its folder as "working folder".
-# - If not, use "current folder" as "working folder"
+    # Get the "absolute path" for file / folder
+    profiling_file_path = os.path.abspath(args.rna_lib_profiling)
+    editing_level_file_path = os.path.abspath(args.editing_level)
 
-if os.path.isabs(structure_file):
+    # Output
+    structure_file = args.structure_out
+    structure_summary_file = args.structure_summary_out
+
+    # ----------
+    # Working Folder
     #
-    os.chdir(os.path.dirname(structure_file))
-else:
+    # Check the "main" output file
+    # - If it is "absolute path", use its folder as "working folder".
+    # - If not, use "current folder" as "working folder"
+    if os.path.isabs(structure_file):
+        #
+        os.chdir(os.path.dirname(structure_file))
+
     #
     cwd = os.getcwd()
-    structure_file = os.path.join(cwd, structure_file)
 
-#
-cwd = os.getcwd()
-
-#
-if not os.path.isabs(structure_summary_file):
     #
-    structure_summary_file = os.path.join(cwd, structure_summary_file)
+    if not os.path.isabs(structure_summary_file):
+        #
+        structure_summary_file = os.path.join(cwd, structure_summary_file)
+
+    # ----------
+    # RNA Lib Object
+    rna_library: RnaLibrary = LibraryIO.as_python_object(profiling_file_path)
+
+    # Editing Level values & positions - loaded by the summary step, checked here before the long steps
+    load_editing_levels(editing_level_file_path)
+
+    # A list of "RNA Lib items", each of which is in "python object string" format.
+    # It is used to pass via "Channel".
+    rna_lib_item_object_json_list = []
+    rna_id_list = []
+    for rna_item in rna_library.rna_items:
+        rna_id_list.append(rna_item.rna_id)
+        # Convert it to "json string"
+        rna_lib_item_object_json_list.append(json.dumps(rna_item, cls=PythonObjectEncoder))
+
+    return StructurePipeline(
+        rna_library_object_json=json.dumps(rna_library, cls=PythonObjectEncoder),
+        rna_lib_item_object_json_list=rna_lib_item_object_json_list,
+        rna_id_list=rna_id_list,
+        editing_level_file_path=editing_level_file_path,
+        working_folder=cwd,
+        structure_summary_file=structure_summary_file,
+        sequence_start=int(args.sequence_start) if args.sequence_start is not None else 1,
+        sequence_end=int(args.sequence_end) if args.sequence_end is not None else None,
+        biers_max_bootstrap=int(args.biers_bootstrap) if args.biers_bootstrap is not None else 20,
+        bprna_workers=args.bprna_workers,
+        # Biers output folder path
+        biers_inference_structure_folder=biers_inference_structure_folder_path(cwd),
+        biers_results_folder=biers_results_folder_path(cwd),
+        bprna_results_folder=os.path.join(cwd, 'bpRNA_results'),
+    )
 
 # endregion
 
 
 # ----------------------------------
-# region Prep - RNA Lib Object
+# region Runner - PyPPL
 
-rna_library: RnaLibrary = LibraryIO.as_python_object(profiling_file_path)
-#
-rna_library_object_json = json.dumps(rna_library, cls=PythonObjectEncoder)
+def run_pyppl(pipeline):
+    r"""
+    Run the pipeline with PyPPL.
+    """
 
-# endregion
+    # ----------------------------------
+    # region Pipeline - Biers
 
+    pBiers = Proc(desc='Run Biers RNA Structure Inferring.')
+    pBiers.input = {
+        "rna_item_json:var": Channel.create(pipeline.rna_lib_item_object_json_list),
+        "rna_id:var": Channel.create(pipeline.rna_id_list)
+    }
+    # Define the "output" channel - the RNA ID
+    pBiers.output = "rna_id:var:{{in.rna_id}}"
+    pBiers.forks = 1  # MatLab ONLY does "1" thread....
 
-# ----------------------------------
-# region Prep - Editing Level
+    #
+    pBiers.args.local_module_path = local_module_path
+    pBiers.args.working_folder = pipeline.working_folder
+    pBiers.args.sequence_start = pipeline.sequence_start
+    pBiers.args.sequence_end = pipeline.sequence_end
+    pBiers.args.max_bootstrap = pipeline.biers_max_bootstrap
+    pBiers.args.override = biers_override
+    pBiers.lang = 'python'
+    pBiers.script = """
+#!/usr/bin/env python
 
-# Editing Level values & positions, indexed by "RNA ID"
-editing_levels = {}
-editing_positions = {}
+import os, sys
+sys.path.append({{args.local_module_path | squote}})
 
-# Columns to load
-rna_id_column_name = 'RNA_ID_STR'
-editing_level_column_name = 'Avg'
-editing_position_column_name = 'Editing_position'
+from py_scripts.rna_lib_pipeline.script.proc_biers_rna_structure import biers_rna_structure
+biers_rna_structure({{in.rna_item_json | squote}}, {{args.working_folder | squote}}, override={{args.override}}, sequence_start={{args.sequence_start}}, sequence_end={{args.sequence_end}}, max_bootstrap={{args.max_bootstrap}})
+"""
+    # endregion
+
+    # ----------------------------------
+    # region Pipeline - bpRNA
+
+    pBpRNA = Proc(desc='Run bpRNA to interpret RNA secondary structure.')
+    if bprna_run and biers_run:
+        pBpRNA.depends = pBiers
+        pBpRNA.input = "rna_id:var"
+    else:
+        pBpRNA.input = {
+            "rna_id:var": Channel.create(pipeline.rna_id_list)
+        }
+    pBpRNA.output = "rna_id:var:{{in.rna_id}}"
+    pBpRNA.forks = 1
 
-#
-editing_level_data = csv.DictReader(open(editing_level_file_path, 'rU'))
-for line in editing_level_data:
-    rna_id = line[rna_id_column_name]
-    #
-    score = line[editing_level_column_name]
-    editing_levels[rna_id] = float(score) if score != "NA" and score != "#N/A" else None
     #
-    position = line[editing_position_column_name]
-    editing_positions[rna_id] = position
+    pBpRNA.args.local_module_path = local_module_path
+    pBpRNA.args.working_folder = pipeline.working_folder
+    pBpRNA.args.biers_inference_structure_folder_path = pipeline.biers_inference_structure_folder
+    pBpRNA.args.bprna_results_folder_name = 'bpRNA_results'
+    pBpRNA.lang = 'python'
+    pBpRNA.script = """
+#!/usr/bin/env python
 
-# endregion
+import os, sys
+sys.path.append({{args.local_module_path | squote}})
 
+from py_scripts.rna_lib_pipeline.script.proc_bprna_rna_structure import bprna_rna_structure
+bprna_rna_structure({{in.rna_id | squote}}, {{args.biers_inference_structure_folder_path | squote}}, os.path.join({{args.working_folder | squote}}, {{args.bprna_results_folder_name | squote}}))
+"""
 
-# ----------------------------------
-# region Pipeline - Prep
+    # endregion
 
-# A list of "RNA Lib items", each of which is in "python object string" format.
-# It is used to pass via "Channel".
-rna_lib_item_object_json_list = []
-rna_id_list = []
-for rna_item in rna_library.rna_items:
-    rna_id_list.append(rna_item.rna_id)
-    # Convert it to "json string"
-    rna_lib_item_object_json_list.append(json.dumps(rna_item, cls=PythonObjectEncoder))
+    # ----------------------------------
+    # region Pipeline - Summary
 
-# FOR TESTING - Only run a few
-# rna_lib_item_object_json_list = rna_lib_item_object_json_list[slice(0, 2)]
-# rna_id_list = rna_id_list[slice(0, 2)]
+    #
+    pSummary = Proc(desc='Process Structure Summary Results.')
 
-# endregion
+    #
+    if summary_only is False:
+        if bprna_run:
+            # It has dependency
+            pSummary.depends = pBpRNA
+            # automatically inferred from pShape.output
+            # Collapse the channel into "1".
+            pSummary.input = {"rna_id:var": lambda ch: ch.collapse(col=0)}
+        if biers_run:
+            pSummary.depends = pBiers
+            pSummary.input = {"rna_id:var": lambda ch: ch.collapse(col=0)}
+
+    pSummary.output = "summary_file:var: {}".format(pipeline.structure_summary_file)
+    pSummary.forks = 1
 
+    #
+    pSummary.args.local_module_path = local_module_path
 
-# ----------------------------------
-# region Pipeline - Biers
+    pSummary.args.rna_library = pipeline.rna_library_object_json
 
-# Biers output folder path
-biers_inference_structure_folder = biers_inference_structure_folder_path(cwd)
+    pSummary.args.sequence_start = pipeline.sequence_start
+    pSummary.args.sequence_end = pipeline.sequence_end
 
-pBiers = Proc(desc='Run Biers RNA Structure Inferring.')
-pBiers.input = {
-    "rna_item_json:var": Channel.create(rna_lib_item_object_json_list),
-    "rna_id:var": Channel.create(rna_id_list)
-}
-# Define the "output" channel - the RNA ID
-pBiers.output = "rna_id:var:{{in.rna_id}}"
-pBiers.forks = 1  # MatLab ONLY does "1" thread....
+    pSummary.args.editing_level_file_path = pipeline.editing_level_file_path
+    pSummary.args.biers_results_folder_path = pipeline.biers_results_folder
+    pSummary.args.bprna_results_folder_path = pipeline.bprna_results_folder
 
-#
-pBiers.args.local_module_path = local_module_path
-pBiers.args.working_folder = cwd
-pBiers.args.sequence_start = sequence_start
-pBiers.args.sequence_end = sequence_end
-pBiers.args.max_bootstrap = biers_max_bootstrap
-pBiers.args.override = biers_override
-pBiers.lang = 'python'
-pBiers.script = """
+    pSummary.args.structure_summary_file_path = pipeline.structure_summary_file
+    pSummary.lang = 'python'
+    pSummary.script = """
 #!/usr/bin/env python
 
 import os, sys
 sys.path.append({{args.local_module_path | squote}})
 
-from py_scripts.rna_lib_pipeline.script.proc_biers_rna_structure import biers_rna_structure
-biers_rna_structure({{in.rna_item_json | squote}}, {{args.working_folder | squote}}, override={{args.override}}, sequence_start={{args.sequence_start}}, sequence_end={{args.sequence_end}}, max_bootstrap={{args.max_bootstrap}})
+from py_scripts.rna_lib_pipeline.script.proc_rna_lib_structure_results import generate_rna_lib_structure_results
+generate_rna_lib_structure_results({{args.rna_library | squote}}, {{args.editing_level_file_path | squote}}, {{args.biers_results_folder_path | squote}}, {{args.bprna_results_folder_path | squote}}, {{args.structure_summary_file_path | squote}}, {{args.sequence_start}}, {{args.sequence_end}})
 """
-# endregion
 
+    # endregion
 
-# ----------------------------------
-# region Pipeline - bpRNA
-
-pBpRNA = Proc(desc='Run bpRNA to interpret RNA secondary structure.')
-if bprna_run and biers_run:
-    pBpRNA.depends = pBiers
-    pBpRNA.input = "rna_id:var"
-else:
-    pBpRNA.input = {
-        "rna_id:var": Channel.create(rna_id_list)
+    # ----------------------------------
+    # region Pipeline - Run
+
+    # Config
+    pyppl_config = {
+        'proc': {
+            'echo': 'stderr',  # Output all stderr
+            'errhow': 'ignore',  # Ignore the error job
+            'errntry': 3
+        }
     }
-pBpRNA.output = "rna_id:var:{{in.rna_id}}"
-pBpRNA.forks = 1
 
-#
-pBpRNA.args.working_folder = cwd
-pBpRNA.args.biers_inference_structure_folder_path = biers_inference_structure_folder
-pBpRNA.args.bprna_results_folder_name = 'bpRNA_results'
-pBpRNA.script = """
-bpRNA.pl {{args.biers_inference_structure_folder_path}}/{{in.rna_id}}.dbn
-
-mkdir -p {{args.working_folder}}/{{args.bprna_results_folder_name}}
-mv {{in.rna_id}}.st {{args.working_folder}}/{{args.bprna_results_folder_name}}
-"""
+    if summary_only:
+        PyPPL(pyppl_config).start(pSummary).run()
+    elif biers_run:
+        PyPPL(pyppl_config).start(pBiers).run()
+    else:
+        PyPPL(pyppl_config).start(pBpRNA).run()
+
+    # endregion
 
 # endregion
 
 
 # ----------------------------------
-# region Pipeline - Summary
+# region Runner - Local
+
+def summarize_rna_lib_structure(rna_ids, pipeline: StructurePipeline):
+    r"""
+    The "summary" step of the "local" runner - it runs once, after the items are inferred (or failed).
+    """
+    logger.info('Summary of {} RNA items.'.format(len(rna_ids)))
+    generate_rna_lib_structure_results(pipeline.rna_library_object_json, pipeline.editing_level_file_path,
+                                       pipeline.biers_results_folder, pipeline.bprna_results_folder,
+                                       pipeline.structure_summary_file, pipeline.sequence_start, pipeline.sequence_end)
+    return pipeline.structure_summary_file
+
+
+def run_local(pipeline: StructurePipeline) -> bool:
+    r"""
+    Run the pipeline with the built-in DAG runner.
+
+    The items are streamed from Biers (one MATLAB engine) to bpRNA, and the failed ones are reported.
+
+    Returns
+    -------
+    ok: bool
+        If all the items finished.
+    """
+
+    stages = []
+    if summary_only is False:
+        if biers_run:
+            stages.append(Stage('biers',
+                                partial(biers_rna_structure, output_folder=pipeline.working_folder,
+                                        override=biers_override, sequence_start=pipeline.sequence_start,
+                                        sequence_end=pipeline.sequence_end,
+                                        max_bootstrap=pipeline.biers_max_bootstrap),
+                                StageResource.Matlab))
+        if bprna_run:
+            stages.append(Stage('bpRNA',
+                                partial(bprna_rna_structure,
+                                        structure_folder_path=pipeline.biers_inference_structure_folder,
+                                        output_folder_path=pipeline.bprna_results_folder),
+                                StageResource.Io, workers=pipeline.bprna_workers,
+                                depends=[stages[-1].name] if stages else None))
+    # NOTE: in a thread of the current process - it needs the RNA Library object
+    stages.append(Stage('summary', partial(summarize_rna_lib_structure, pipeline=pipeline), StageResource.Io,
+                        workers=1, depends=[stages[-1].name] if stages else None, per_item=False))
+
+    # The input - the item object for Biers, or the RNA ID for bpRNA
+    input_list = pipeline.rna_lib_item_object_json_list if biers_run and not summary_only else pipeline.rna_id_list
+    report = DagRunner(stages).run(zip(pipeline.rna_id_list, input_list))
+
+    return report.ok
 
-biers_results_folder = biers_results_folder_path(cwd)
-bprna_results_folder = os.path.join(cwd, 'bpRNA_results')
 
-#
-pSummary = Proc(desc='Process Structure Summary Results.')
+# endregion
 
-#
-if summary_only is False:
-    if bprna_run:
-        # It has dependency
-        pSummary.depends = pBpRNA
-        # automatically inferred from pShape.output
-        # Collapse the channel into "1".
-        pSummary.input = {"rna_id:var": lambda ch: ch.collapse(col=0)}
-    if biers_run:
-        pSummary.depends = pBiers
-        pSummary.input = {"rna_id:var": lambda ch: ch.collapse(col=0)}
-
-pSummary.output = "summary_file:var: {}".format(structure_summary_file)
-pSummary.forks = 1
 
+# ----------------------------------
+# region Main Script
 #
-pSummary.args.local_module_path = local_module_path
-
-pSummary.args.rna_library = rna_library_object_json
+# NOTE: only run under `__main__` - the "local" runner runs the steps in worker processes, which import this script.
 
-pSummary.args.sequence_start = sequence_start
-pSummary.args.sequence_end = sequence_end
-
-pSummary.args.editing_level_file_path = editing_level_file_path
-pSummary.args.biers_results_folder_path = biers_results_folder
-pSummary.args.bprna_results_folder_path = bprna_results_folder
-
-pSummary.args.structure_summary_file_path = structure_summary_file
-pSummary.lang = 'python'
-pSummary.script = """
-#!/usr/bin/env python
-
-import os, sys
-sys.path.append({{args.local_module_path | squote}})
-
-from py_scripts.rna_lib_pipeline.script.proc_rna_lib_structure_results import generate_rna_lib_structure_results
-generate_rna_lib_structure_results({{args.rna_library | squote}}, {{args.editing_level_file_path | squote}}, {{args.biers_results_folder_path | squote}}, {{args.bprna_results_folder_path | squote}}, {{args.structure_summary_file_path | squote}}, {{args.sequence_start}}, {{args.sequence_end}})
-"""
+def main():
+    #
+    args = parse_args()
+    setup_logging(logging_level=logging.INFO)
 
-# endregion
+    pipeline = prepare_pipeline(args)
+    if args.runner == 'local':
+        return 0 if run_local(pipeline) else 1
 
+    run_pyppl(pipeline)
+    return 0
 
-# ----------------------------------
-# region Pipeline - Run
-
-# Config
-pyppl_config = {
-    'proc': {
-        'echo': 'stderr',  # Output all stderr
-        'errhow': 'ignore',  # Ignore the error job
-        'errntry': 3
-    }
-}
 
-if summary_only:
-    PyPPL(pyppl_config).start(pSummary).run()
-elif biers_run:
-    PyPPL(pyppl_config).start(pBiers).run()
-else:
-    PyPPL(pyppl_config).start(pBpRNA).run()
+#
+if __name__ == '__main__':
+    sys.exit(main())
 
 # endregion
 
@@ -362,15 +458,13 @@ else:
 
 # Biers
 # from py_scripts.rna_lib_pipeline.script.proc_biers_rna_structure import biers_rna_structure
-# biers_rna_structure(rna_lib_item_object_json_list[1], cwd, sequence_start=14, max_bootstrap=20)
+# biers_rna_structure(pipeline.rna_lib_item_object_json_list[1], pipeline.working_folder, sequence_start=14,
+#                     max_bootstrap=20)
 
 # Summary
 # from py_scripts.rna_lib_pipeline.script.proc_rna_lib_structure_results import generate_rna_lib_structure_results
 # generate_rna_lib_structure_results(
-#     rna_library_object_json, editing_level_file_path, biers_results_folder, bprna_results_folder, structure_summary_file,
-#     sequence_start, sequence_end)
+#     pipeline.rna_library_object_json, pipeline.editing_level_file_path, pipeline.biers_results_folder,
+#     pipeline.bprna_results_folder, pipeline.structure_summary_file, pipeline.sequence_start, pipeline.sequence_end)
 
 # endregion
-
-
-
@@ -64,7 +64,8 @@ def biers_rna_structure(rna_items_json: str, output_folder: str,
 
     Returns
     -------
-
+    rna_id: str
+        The RNA ID, for the next steps.
     """
 
     # Parse the "Python Object"
@@ -143,6 +144,8 @@ def biers_rna_structure(rna_items_json: str, output_folder: str,
                                            OUTPUT_FOLDER_BIERS_RESULTS, '{}.json'.format(rna_id))
     FileUtils.save_json_to_file(biers_results_file_path, json_data)
 
+    return rna_id
+
 
 def biers_results_folder_path(working_folder):
     #
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Process Script - Annotate RNA Lib "Structure" (bpRNA)
+================
+"""
+
+import os
+import subprocess
+
+from neoRNA.io.dot_bracket_io import DotBracketIO
+from neoRNA.structure.bp_rna_annotator import BpRnaAnnotator
+
+from neoRNA.util.file_utils import FileUtils
+
+
+def bprna_rna_structure(rna_id: str, structure_folder_path: str, output_folder_path: str):
+    r"""
+    Annotate the inferred structure of a RNA Lib item, as the ".st" file of `bpRNA.pl`.
+
+    The annotation is done in-process, by `BpRnaAnnotator`. `bpRNA.pl` is only run for the structures with
+    pseudoknots.
+
+    Parameters
+    ----------
+    rna_id: str
+        The RNA ID - the input is "{rna_id}.dbn", the output is "{rna_id}.st".
+    structure_folder_path: str
+        The "folder path" to the "dbn" files.
+    output_folder_path: str
+        The "folder path" to bpRNA results.
+
+    Returns
+    -------
+    rna_id: str
+        The RNA ID, for the next steps.
+    """
+
+    structure_file_path = os.path.join(structure_folder_path, '{}.dbn'.format(rna_id))
+    os.makedirs(output_folder_path, exist_ok=True)
+
+    with open(structure_file_path) as handle:
+        _, sequence_str, structure_str = next(DotBracketIO.parse(handle))
+
+    try:
+        # NOTE: `bpRNA.pl` names the record after the input file
+        st_str = BpRnaAnnotator.to_st(sequence_str, structure_str, rna_id)
+    except ValueError:
+        # Pseudoknots - only `bpRNA.pl` handles them
+        subprocess.check_call(['bpRNA.pl', structure_file_path], cwd=output_folder_path)
+        return rna_id
+
+    FileUtils.save_file(os.path.join(output_folder_path, '{}.st'.format(rna_id)), st_str)
+
+    return rna_id
@@ -6,25 +6,34 @@ Process Script - Process RNA Lib "Profiling" Results
 """
 
 import json
+import logging
+import os
 
-from typing import List
+from typing import List, Optional
 
-from neoRNA import io
 from neoRNA.library.library_config import RnaLibConfig
 from neoRNA.library.library_item import LibraryItem
 from neoRNA.library.rna_library import RnaLibrary
 from neoRNA.library.shape_mapper import get_shape2_path
+from neoRNA.library.shape_mapper.profile_arrays import ingest_profiles, ProfileArrays
+from neoRNA.library.shape_mapper.shape_scheduler import ShapeMapperScheduler
 from neoRNA.util.file_utils import FileUtils
 
 from neoRNA.util.json_serializable import as_python_object, PythonObjectEncoder
 
+logger = logging.getLogger('neo_rna.script')
 
-def generate_rna_lib_profiling_results(configs_json: str, rna_items_json: str, output_file: str):
+
+def generate_rna_lib_profiling_results(configs_json: str, rna_items_json: str, output_file: str,
+                                       workers: Optional[int] = None, chunk_size: Optional[int] = None):
     r"""
     Generate RNA Lib "profiling" results file.
 
     It should be called after "ShapeMapper 2.x" finishes the run.
 
+    The "profile" / "shape" files of the items are read in chunks, by worker processes, into `ProfileArrays` -
+    saved next to the output file (see `ProfileArrays.folder_path`) and attached back by `LibraryIO`.
+
     Parameters
     ----------
     configs_json: str
@@ -33,6 +42,10 @@ def generate_rna_lib_profiling_results(configs_json: str, rna_items_json: str, o
         The RNA Lib Item object
     output_file: str
         The "file path" of data output.
+    workers: Optional[int]
+        The number of worker processes to read the files. Default to all the cores.
+    chunk_size: Optional[int]
+        The number of items read by a worker at a time.
 
     Returns
     -------
@@ -43,38 +56,45 @@ def generate_rna_lib_profiling_results(configs_json: str, rna_items_json: str, o
     configs: RnaLibConfig = json.loads(configs_json, object_hook=as_python_object)
     rna_items: List[LibraryItem] = json.loads(rna_items_json, object_hook=as_python_object)
 
+    # The output files of each item - if ShapeMapper was run by `ShapeMapperScheduler`
+    shape_index = ShapeMapperScheduler.load_index(configs.working_folder)
+
     #
-    updated_rna_items = []
+    shape_files = []
     for rna_item in rna_items:
         #
         rna_id = rna_item.rna_id
         barcode = rna_item.barcode
 
-        # Load "Profile" data
-        shape_profile = get_shape2_path('profile', configs.working_folder, rna_id, barcode.barcode)
-        for nt_profile in io.parse(shape_profile, "shape-profile"):
-            #
-            nt_position = nt_profile.nt_position
-            rna_item.profile_list.append(nt_profile)
-            rna_item.profile_dict[nt_position] = nt_profile
-
-        # Load "Shape Reactivity" data
-        shape_reactivity = get_shape2_path('shape', configs.working_folder, rna_id, barcode.barcode)
-        for nt_reactivity in io.parse(shape_reactivity, "shape-reactivity"):
-            #
-            nt_position = nt_reactivity.nt_position
-            rna_item.shape_reactivity_list.append(nt_reactivity)
-            rna_item.shape_reactivity_dict[nt_position] = nt_reactivity
-
-        updated_rna_items.append(rna_item)
+        shape_result = shape_index.get(rna_id)
+        if shape_result is not None:
+            if not shape_result.ok:
+                logger.warning('ShapeMapper failed - no profiling data: {}'.format(rna_id))
+                shape_files.append((None, None))
+                continue
+            shape_profile = shape_result.profile_file
+            shape_reactivity = shape_result.shape_file
+        else:
+            shape_profile = get_shape2_path('profile', configs.working_folder, rna_id, barcode.barcode)
+            shape_reactivity = get_shape2_path('shape', configs.working_folder, rna_id, barcode.barcode)
+        rna_item.shape_profile_file = shape_profile
+        rna_item.shape_reactivity_file = shape_reactivity
+
+        shape_files.append((shape_profile, shape_reactivity))
+
+    # Load "Profile" and "Shape Reactivity" data
+    profile_arrays = ingest_profiles(shape_files, [rna_item.rna_id for rna_item in rna_items],
+                                     workers=workers or os.cpu_count() or 1, chunk_size=chunk_size)
+    profile_arrays.save(ProfileArrays.folder_path(output_file))
 
     # Build RNA Library object
     library = RnaLibrary()
     library.load_meta(configs)
 
     #
-    library.rna_items = updated_rna_items
+    library.rna_items = rna_items
 
     # Output
+    # NOTE: without the "nt" data - it is in the arrays
     data_str = json.dumps(library, cls=PythonObjectEncoder)
     FileUtils.save_file(output_file, data_str)
@@ -7,11 +7,11 @@ Process Script - Process RNA Lib "Structure" Results
 
 import os
 import json
-import csv
 
 from typing import List, Optional
 
 from neoRNA.library.rna_library import RnaLibrary
+from neoRNA.library.summary_index import load_editing_levels
 from neoRNA.sequence.sequence import Sequence
 
 from neoRNA.util.file_utils import FileUtils
@@ -65,24 +65,8 @@ def generate_rna_lib_structure_results(rna_library_json: str,
 
     # Load Editing Level data
     # Editing Level values & positions, indexed by "RNA ID"
-    editing_levels = {}
-    editing_positions = {}
-
-    # Columns to load
-    rna_id_column_name = 'RNA_ID_STR'
-    editing_level_column_name = 'Avg'
-    editing_position_column_name = 'Editing_position'  # Based on the "FULL" sequence
-
-    #
-    editing_level_data = csv.DictReader(open(editing_level_file_path, 'rU'))
-    for line in editing_level_data:
-        rna_id = line[rna_id_column_name]
-        #
-        score = line[editing_level_column_name]
-        editing_levels[rna_id] = float(score) if score != "NA" and score != "#N/A" else None
-        #
-        position = line[editing_position_column_name]
-        editing_positions[rna_id] = position
+    # NOTE: The "editing position" is based on the "FULL" sequence
+    editing_levels, editing_positions = load_editing_levels(editing_level_file_path)
 
     wt_sequence = Sequence(rna_library.wide_type_rna_sequence)
 
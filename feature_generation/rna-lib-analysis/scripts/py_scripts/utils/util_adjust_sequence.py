@@ -7,12 +7,18 @@
 #
 # NOTE:
 # - If the "adjustment" affect the "editing position" / "mutation position", also need to update it.
+# - All adjusted sequences are refolded at once - each distinct sequence only once, across worker processes.
 #
 # ## Input
 # - RNA Lib Structure Summary file
 #   - It is in "json" format.
 # - "Sequence" to be "extracted"
 #
+# ## Output
+# - An "overlay" file (in ".jsonl"), with the updated records only.
+#   - Readers merge it into the summary - `--overlay` of the `neoRNA` CLI and the analysis scripts,
+#     `StructureSummaryIndex.load(..., overlay_file_paths=...)` or `FileUtils.load_json_items_with_overlay`.
+# - Or, with `--full`, the updated "RNA Lib Structure Summary" file - all the items, with the adjusted ones updated.
 #
 
 import os
@@ -34,8 +40,8 @@ sys.path.append(local_module_path)
 import logging
 from py_scripts import setup_logging
 
-from neoRNA.sequence.sequence import Sequence
-from neoRNA.util.runner.matlab_runner import MatlabRunner
+from neoRNA.sequence.mutation import call_mutations
+from neoRNA.util.runner.batch_fold_runner import FOLD_BACKENDS, get_fold_runner
 from neoRNA.util.file_utils import FileUtils
 
 # ----------------------------------
@@ -44,45 +50,55 @@ from neoRNA.util.file_utils import FileUtils
 # :link: https://docs.python.org/dev/library/argparse.html
 #
 
-arguments_parser \
-    = argparse.ArgumentParser(description='RNA Lib Util - Adjust RNA Sequence')
-
-# Inputs
-arguments_parser.add_argument('rna_lib_struct_summary_file',
-                              metavar='rna_lib_struct_summary_file.json',
-                              help='The file path to the "RNA Lib Structure Summary" file.')
-
-# Params
-arguments_parser.add_argument('--wt', dest='wt_sequence',
-                              action="store",
-                              help='The "WT sequence" (already extracted).')
-arguments_parser.add_argument('--extract', dest='sequence_to_extract',
-                              action="store",
-                              help='The "sequence" to be extracted.')
-
-
-# Output
-arguments_parser.add_argument('--out',
-                              action='store',
-                              help='The updated "RNA Lib Structure Summary" file.')
-
-
-# parse the arguments
-args = arguments_parser.parse_args()
-
-# Get the "absolute path" for file / folder
-rna_lib_struct_summary_file_path = os.path.abspath(args.rna_lib_struct_summary_file)
-
-# Validation
-if not os.path.exists(rna_lib_struct_summary_file_path):
-    raise ValueError('"RNA Lib" definition file does not exist.')
-
-#
-sequence_to_extract = args.sequence_to_extract.strip()
-wt_sequence_str = args.wt_sequence.strip()
-
-# Output
-output_file_path = args.out
+def parse_args():
+    arguments_parser \
+        = argparse.ArgumentParser(description='RNA Lib Util - Adjust RNA Sequence')
+
+    # Inputs
+    arguments_parser.add_argument('rna_lib_struct_summary_file',
+                                  metavar='rna_lib_struct_summary_file.json',
+                                  help='The file path to the "RNA Lib Structure Summary" file.')
+
+    # Params
+    arguments_parser.add_argument('--wt', dest='wt_sequence',
+                                  action="store",
+                                  help='The "WT sequence" (already extracted).')
+    arguments_parser.add_argument('--extract', dest='sequence_to_extract',
+                                  action="store",
+                                  help='The "sequence" to be extracted.')
+
+    # Folding
+    arguments_parser.add_argument('--fold_backend',
+                                  action='store', default='biers', choices=sorted(FOLD_BACKENDS),
+                                  help='The backend used to predict the structures. Default - "biers".')
+    arguments_parser.add_argument('--workers',
+                                  action='store', type=int, default=1,
+                                  help='The number of folding processes. Default - 1.')
+
+    # Output
+    arguments_parser.add_argument('--out',
+                                  action='store',
+                                  help='The "overlay" file (".jsonl") of the updated records. With "--full", the '
+                                       'updated "RNA Lib Structure Summary" file.')
+    arguments_parser.add_argument('--full',
+                                  action='store_true',
+                                  help='Write the entire "RNA Lib Structure Summary", instead of the updated records '
+                                       'only.')
+
+    # parse the arguments
+    args = arguments_parser.parse_args()
+    validate_args(args)
+
+    return args
+
+
+def validate_args(args):
+    if not os.path.exists(os.path.abspath(args.rna_lib_struct_summary_file)):
+        raise ValueError('"RNA Lib" definition file does not exist.')
+    if not args.out:
+        raise ValueError('"--out" is needed.')
+    if not args.full and not args.out.endswith('.jsonl'):
+        raise ValueError('The overlay file should be a ".jsonl" file.', args.out)
 
 # endregion
 
@@ -91,7 +107,6 @@ output_file_path = args.out
 # region Set Logger
 #
 
-setup_logging(logging_level=logging.INFO)
 # Logger Name
 logger_name = 'neo_rna.script'
 logger = logging.getLogger(logger_name)
@@ -100,114 +115,165 @@ logger = logging.getLogger(logger_name)
 
 
 # ----------------------------------
-# region Prep
+# region Generate
 
-if not os.path.isabs(output_file_path):
-    cwd = os.getcwd()
-    output_folder_path = os.path.join(cwd, output_file_path)
+# The fields of the items in the updated "RNA Lib Structure Summary"
+SUMMARY_ITEM_FIELDS = ['rna_id', 'sequence_string', 'A-to-I_editing_level', 'A-to-I_editing_site',
+                       'mutation_syntax', 'computational_structure', 'computational_bpp']
 
-# endregion
 
+def adjust_sequence(sequence_string, editing_position, sequence_to_extract):
+    r"""
+    Extract the "target sequence" from a sequence.
 
-# ----------------------------------
-# region Load "RNA Lib Structure Summary" Data
+    Returns (sequence_string, editing_position) after the extraction, or `None` if the sequence does not include it.
+    """
 
-# RSample results, indexed by "RNA ID"
-rna_lib_struct_summary_dict = {}
+    if len(sequence_to_extract) == 0:
+        return None
 
-with open(rna_lib_struct_summary_file_path) as infile:
-    rna_lib_struct_summary_dict = json.load(infile)
-
-# endregion
+    #
+    found_position_start = sequence_string.find(sequence_to_extract)
+    if found_position_start < 0:
+        return None
 
+    # Found
+    found_position_end = found_position_start + len(sequence_to_extract)    # "end" NOT included
 
-# ----------------------------------
-# region Generate
+    # Slice
+    sequence_string = sequence_string[0:found_position_start] + sequence_string[found_position_end:]
 
-#
-rna_item_list_updated = list()
+    # Check if need to update the "editing position"
+    if editing_position >= found_position_end:
+        editing_position = editing_position - len(sequence_to_extract)
 
-#
-MatlabRunner.start_engine()
-for rna_item in rna_lib_struct_summary_dict['items']:
-    #
-    rna_id = rna_item['rna_id']
-    logger.info('---------- RNA Item: {} ----------'.format(rna_id))
+    return sequence_string, editing_position
 
-    sequence_string = rna_item['sequence_string']
-    editing_value = rna_item['A-to-I_editing_level']
-    editing_position = rna_item['A-to-I_editing_site']
 
-    mutation_syntax_str = rna_item['mutation_syntax']
+def find_adjusted_records(rna_items, sequence_to_extract, wt_sequence_str):
+    r"""
+    The records of the RNA items which include the "target sequence" - with the new sequence, editing position and
+    "mutation syntax", but not yet refolded.
+    """
 
     #
-    computational_structure = rna_item['computational_structure']
-    computational_bpp = rna_item['computational_bpp']
-
-    # Determine if the RNA item includes the "target sequence"
-    if len(sequence_to_extract) > 0:
-        #
-        found_position_start = sequence_string.find(sequence_to_extract)
-        if found_position_start >= 0:
-            # Found
-            found_position_end = found_position_start + len(sequence_to_extract)    # "end" NOT included
-
-            # Slice
-            sequence_string_length = len(sequence_string)
-            sequence_string_sliced = sequence_string[0:found_position_start] \
-                                     + sequence_string[found_position_end:sequence_string_length]
-            sequence_string = sequence_string_sliced
-
-            # Check if need to update the "editing position"
-            if editing_position >= found_position_end:
-                editing_position = editing_position - len(sequence_to_extract)
-
-            # Determine "mutation syntax"
-            sequence = Sequence(sequence_string)
-            seq_mut_positions, seq_mut_syntax = sequence.generate_mutation_syntax(wt_sequence_str, seq_type_rna=True)
+    adjusted_records = list()
+    for rna_item in rna_items:
+        adjusted = adjust_sequence(rna_item['sequence_string'], rna_item['A-to-I_editing_site'], sequence_to_extract)
+        if adjusted is None:
+            continue
+
+        sequence_string, editing_position = adjusted
+        adjusted_records.append({
+            "rna_id": rna_item['rna_id'],
+            "sequence_string": sequence_string,
+
             #
-            if seq_mut_syntax is None:
-                mutation_syntax_str = 'indel'
-            elif len(seq_mut_syntax) == 0:
-                # WT
-                mutation_syntax_str = 'wt'
-            elif len(seq_mut_syntax) > 0:
-                mutation_syntax_str = ','.join(seq_mut_syntax)
-
-            # Update RNA Structure
-            seqpos_out = range(1, len(sequence_string))
-            structure_na, bpp_na, bootstrap_na = MatlabRunner.rna_structure(sequence_string, 0, seqpos_out)
-            computational_structure = structure_na
-            computational_bpp = np.array(bpp_na).tolist()
+            "A-to-I_editing_level": rna_item['A-to-I_editing_level'],
+            "A-to-I_editing_site": editing_position,
+        })
+
+    # Determine "mutation syntax" - all records against the "WT" at once
+    mutation_table = call_mutations(wt_sequence_str, [record['sequence_string'] for record in adjusted_records],
+                                    seq_type_rna=True)
+    for index, record in enumerate(adjusted_records):
+        if len(record['sequence_string']) != len(wt_sequence_str):
+            record['mutation_syntax'] = 'indel'
+        elif mutation_table.mutation_counts[index] == 0:
+            # WT
+            record['mutation_syntax'] = 'wt'
+        else:
+            record['mutation_syntax'] = ','.join(mutation_table.syntax(index))
+
+    return adjusted_records
+
+
+def generate_overlay_records(adjusted_records, fold_backend, workers):
+    r"""
+    Refold the adjusted records, and yield them with the new structure / BPP.
+    """
 
     #
-    item_data = {
-        "rna_id": rna_id,
-        "sequence_string": sequence_string,
+    fold_runner = get_fold_runner(fold_backend)
+    sequences = [record['sequence_string'] for record in adjusted_records]
+    for index, structure_na, bpp_na in fold_runner.fold_distinct(sequences, workers=workers):
+        record = adjusted_records[index]
+        logger.info('---------- RNA Item: {} ----------'.format(record['rna_id']))
+
+        # Update RNA Structure
+        record['computational_structure'] = structure_na
+        record['computational_bpp'] = np.asarray(bpp_na).tolist()
+        yield record
+
+        # Release the BPP once written
+        adjusted_records[index] = None
+
 
-        #
-        "A-to-I_editing_level": editing_value,
-        "A-to-I_editing_site": editing_position,
-        "mutation_syntax": mutation_syntax_str,
+def merge_summary_items(rna_items, overlay_records):
+    r"""
+    All the items of the "RNA Lib Structure Summary", with the adjusted ones replaced by their overlay records.
+    """
 
-        #
-        "computational_structure": computational_structure,
-        "computational_bpp": computational_bpp,
-    }
-    rna_item_list_updated.append(item_data)
+    overlay_dict = dict((record['rna_id'], record) for record in overlay_records)
+    for rna_item in rna_items:
+        rna_item = overlay_dict.get(rna_item['rna_id'], rna_item)
+        yield dict((field, rna_item[field]) for field in SUMMARY_ITEM_FIELDS)
 
 # endregion
 
 
 # ----------------------------------
-# region Output
+# region Main Script
+#
+# NOTE: only run under `__main__` - the folding runs in worker processes, which import this script.
+
+def main():
+    #
+    args = parse_args()
+    setup_logging(logging_level=logging.INFO)
 
-rna_lib_struct_summary_dict['items'] = rna_item_list_updated
-json_data = json.dumps(rna_lib_struct_summary_dict,
-                       sort_keys=True,
-                       indent=4, ensure_ascii=True)
+    # Get the "absolute path" for file / folder
+    rna_lib_struct_summary_file_path = os.path.abspath(args.rna_lib_struct_summary_file)
+
+    #
+    sequence_to_extract = args.sequence_to_extract.strip()
+    wt_sequence_str = args.wt_sequence.strip()
 
-# Output JSON as file
-FileUtils.save_file(output_file_path, json_data)
+    #
+    fold_backend = args.fold_backend
+    workers = max(1, args.workers or 1)
+
+    # Output
+    output_file_path = args.out
+    if not os.path.isabs(output_file_path):
+        cwd = os.getcwd()
+        output_file_path = os.path.join(cwd, output_file_path)
+
+    # Load "RNA Lib Structure Summary" Data
+    with open(rna_lib_struct_summary_file_path) as infile:
+        rna_lib_struct_summary_dict = json.load(infile)
+
+    records = find_adjusted_records(rna_lib_struct_summary_dict['items'], sequence_to_extract, wt_sequence_str)
+    logger.info('Records to refold: {}, distinct sequences: {}'.format(
+        len(records), len(set(record['sequence_string'] for record in records))))
+    overlay_records = generate_overlay_records(records, fold_backend, workers)
+
+    # Only the updated records
+    if not args.full:
+        record_count = FileUtils.save_json_items(output_file_path, overlay_records)
+        logger.info('Overlay records: {} - {}'.format(record_count, output_file_path))
+        return
+
+    # The entire summary
+    rna_lib_struct_summary_dict['items'] \
+        = list(merge_summary_items(rna_lib_struct_summary_dict['items'], overlay_records))
+    FileUtils.save_json_to_file(output_file_path, rna_lib_struct_summary_dict)
+    logger.info('Items: {}, adjusted: {} - {}'.format(
+        len(rna_lib_struct_summary_dict['items']), len(records), output_file_path))
+
+
+#
+if __name__ == '__main__':
+    main()
 
 # endregion
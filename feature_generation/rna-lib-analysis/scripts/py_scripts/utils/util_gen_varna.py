@@ -31,7 +31,9 @@ sys.path.append(local_module_path)
 import logging
 from py_scripts import setup_logging
 
+from neoRNA.sequence.mutation import MutationType, parse_mutation_syntax
 from neoRNA.util.runner.verna_runner import VarnaRunner
+from neoRNA.util.runner.svg_structure_runner import SvgStructureRunner
 
 # ----------------------------------
 # region Parsing Argument
@@ -39,41 +41,48 @@ from neoRNA.util.runner.verna_runner import VarnaRunner
 # :link: https://docs.python.org/dev/library/argparse.html
 #
 
-arguments_parser \
-    = argparse.ArgumentParser(description='RNA Lib Util - Generate VARNA RNA Structure Image')
-
-# Inputs
-arguments_parser.add_argument('rna_lib_struct_summary_file',
-                              metavar='rna_lib_struct_summary_file.json',
-                              help='The file path to the "RNA Lib Structure Summary" file.')
-
-# Params
-arguments_parser.add_argument('--varna', dest='varna_location',
-                              action="store",
-                              help='The "path" to VARNA jar package.')
-
-
-# Output
-arguments_parser.add_argument('--out_folder',
-                              action='store',
-                              help='The output folder.')
-
-
-# parse the arguments
-args = arguments_parser.parse_args()
-
-# Get the "absolute path" for file / folder
-rna_lib_struct_summary_file_path = os.path.abspath(args.rna_lib_struct_summary_file)
-
-# Validation
-if not os.path.exists(rna_lib_struct_summary_file_path):
-    raise ValueError('"RNA Lib" definition file does not exist.')
-
-#
-varna_location = args.varna_location.strip()
-
-# Output
-output_folder_path = args.out_folder
+def parse_args():
+    arguments_parser \
+        = argparse.ArgumentParser(description='RNA Lib Util - Generate VARNA RNA Structure Image')
+
+    # Inputs
+    arguments_parser.add_argument('rna_lib_struct_summary_file',
+                                  metavar='rna_lib_struct_summary_file.json',
+                                  help='The file path to the "RNA Lib Structure Summary" file.')
+
+    # Params
+    arguments_parser.add_argument('--varna', dest='varna_location',
+                                  action="store",
+                                  help='The "path" to VARNA jar package. Not needed for the "svg" renderer.')
+    arguments_parser.add_argument('--renderer',
+                                  action="store", choices=['varna', 'svg'], default='varna',
+                                  help='"varna" - PNG images by VARNA (Java). '
+                                       '"svg" - SVG images by the built-in renderer, no Java needed. '
+                                       'Default - "varna".')
+    arguments_parser.add_argument('--workers',
+                                  action="store", type=int, default=os.cpu_count(),
+                                  help='The number of images to render at a time. Default - number of CPUs.')
+    arguments_parser.add_argument('--force',
+                                  action="store_true",
+                                  help='Render all images, even the ones which are up to date.')
+
+    # Output
+    arguments_parser.add_argument('--out_folder',
+                                  action='store',
+                                  help='The output folder.')
+
+    # parse the arguments
+    args = arguments_parser.parse_args()
+    validate_args(args)
+
+    return args
+
+
+def validate_args(args):
+    if not os.path.exists(os.path.abspath(args.rna_lib_struct_summary_file)):
+        raise ValueError('"RNA Lib" definition file does not exist.')
+    if args.renderer == 'varna' and not (args.varna_location and args.varna_location.strip()):
+        raise ValueError('"--varna" is needed for the "varna" renderer.')
 
 # endregion
 
@@ -82,7 +91,6 @@ output_folder_path = args.out_folder
 # region Set Logger
 #
 
-setup_logging(logging_level=logging.INFO)
 # Logger Name
 logger_name = 'neo_rna.script'
 logger = logging.getLogger(logger_name)
@@ -90,31 +98,6 @@ logger = logging.getLogger(logger_name)
 # endregion
 
 
-# ----------------------------------
-# region Prep
-
-if not os.path.isabs(output_folder_path):
-    cwd = os.getcwd()
-    output_folder_path = os.path.join(cwd, output_folder_path)
-
-if not os.path.exists(output_folder_path):
-    os.mkdir(output_folder_path)
-
-# endregion
-
-
-# ----------------------------------
-# region Load "RNA Lib Structure Summary" Data
-
-# RSample results, indexed by "RNA ID"
-rna_lib_struct_summary_dict = {}
-
-with open(rna_lib_struct_summary_file_path) as infile:
-    rna_lib_struct_summary_dict = json.load(infile)
-
-# endregion
-
-
 # ----------------------------------
 # region Generate
 
@@ -131,100 +114,151 @@ def decode_mutation_syntax_str(mutation_syntax_str):
 
     """
 
-    if not mutation_syntax_str:
-        return []
+    # Only "mismatches" are highlighted
+    return [mutation.position for mutation in parse_mutation_syntax(mutation_syntax_str, strict=False) or []
+            if mutation.mut_type == MutationType.Mismatch]
 
-    if mutation_syntax_str.lower().startswith('indel') or mutation_syntax_str.lower().startswith('wt'):
-        return []
 
-    mutation_syntax_list = mutation_syntax_str.split(',')
-    mutation_positions = list()
-    for mutation_string in mutation_syntax_list:
-        mutation_position = mutation_string[:-4]
-        mutation_positions.append(mutation_position)
+def build_image_jobs(varna, rna_lib_struct_summary_dict, computational_output_folder, experimental_output_folder):
+    r"""
+    The image jobs of all the items - they are rendered in one batch.
+    """
 
-    return mutation_positions
+    image_jobs = list()
+    for rna_item in rna_lib_struct_summary_dict['items']:
+        #
+        rna_id = rna_item['rna_id']
+        logger.info('---------- RNA Item: {} ----------'.format(rna_id))
 
-# VARNA runner
-varna = VarnaRunner(varna_location)
+        sequence_string = rna_item['sequence_string']
+        editing_position = rna_item['A-to-I_editing_site']
 
-for rna_item in rna_lib_struct_summary_dict['items']:
-    #
-    rna_id = rna_item['rna_id']
-    logger.info('---------- RNA Item: {} ----------'.format(rna_id))
+        # Check if there is `mutation_syntax`
+        mutation_syntax_str = None
+        mutation_positions = []
+        if 'mutation_syntax' in rna_item:
+            mutation_syntax_str = rna_item['mutation_syntax']
+            mutation_positions = decode_mutation_syntax_str(mutation_syntax_str)
 
-    sequence_string = rna_item['sequence_string']
-    editing_value = rna_item['A-to-I_editing_level']
-    editing_position = rna_item['A-to-I_editing_site']
+        #
+        rna_id_str = '{}-{}'.format(rna_id, mutation_syntax_str) if mutation_syntax_str is not None \
+            else '{}'.format(rna_id)
+
+        # Generate Annotations & VARNA highlight regions
+        highlight_regions = list()
+        annotations = list()
+
+        # Add Editing Position
+        highlight_regions.append({
+            'nt_range': '{}-{}'.format(str(editing_position), str(editing_position)),
+            'fill': '#0B4F6C'
+        })
+        annotations.append({
+            'annotation_str': 'E-{}'.format(str(editing_position)),
+            'anchor': '{}'.format(str(editing_position)),
+        })
+        for mutation_position in mutation_positions:
+            #
+            highlight_region_options = {
+                'nt_range': '{}-{}'.format(str(mutation_position), str(mutation_position)),
+                'fill': '#C55337'    # Mut
+            }
+            highlight_regions.append(highlight_region_options)
+
+            #
+            annotation_options = {
+                'annotation_str': 'M-{}'.format(str(mutation_position)),
+                'anchor': '{}'.format(str(mutation_position)),
+            }
+            annotations.append(annotation_options)
+
+        # VARNA options
+        options = {
+            'baseNum': '#000000',
+            'highlightRegion': varna.gen_highlight_region_str(highlight_regions),
+            'annotations': varna.gen_annotation_str(annotations),
+
+            #
+            'title': rna_id_str
+        }
+
+        # "computational"
+        image_jobs.append({
+            'sequence': sequence_string,
+            'structure': rna_item['computational_structure'],
+            'out_file': os.path.join(computational_output_folder,
+                                     '{}.{}'.format(rna_id_str, varna.IMAGE_EXTENSION)),
+            'options': options,
+        })
+
+        # "experimental", Optional
+        if 'experimental_structure' in rna_item:
+            image_jobs.append({
+                'sequence': sequence_string,
+                'structure': rna_item['experimental_structure'],
+                'out_file': os.path.join(experimental_output_folder,
+                                         '{}.{}'.format(rna_id_str, varna.IMAGE_EXTENSION)),
+                'options': options,
+            })
+
+    return image_jobs
 
-    # Check if there is `mutation_syntax`
-    mutation_syntax_str = None
-    mutation_positions = []
-    if 'mutation_syntax' in rna_item:
-        mutation_syntax_str = rna_item['mutation_syntax']
-        mutation_positions = decode_mutation_syntax_str(mutation_syntax_str)
+# endregion
 
+
+# ----------------------------------
+# region Main Script
+#
+# NOTE: only run under `__main__` - the "svg" renderer runs in worker processes, which import this script.
+
+def main():
     #
-    rna_id_str = '{}-{}'.format(rna_id, mutation_syntax_str) if mutation_syntax_str is not None \
-        else '{}'.format(rna_id)
-
-    # Generate Annotations & VARNA highlight regions
-    highlight_regions = list()
-    annotations = list()
-
-    # Add Editing Position
-    highlight_regions.append({
-        'nt_range': '{}-{}'.format(str(editing_position), str(editing_position)),
-        'fill': '#0B4F6C'
-    })
-    annotations.append({
-        'annotation_str': 'E-{}'.format(str(editing_position)),
-        'anchor': '{}'.format(str(editing_position)),
-    })
-    for mutation_position in mutation_positions:
-        #
-        highlight_region_options = {
-            'nt_range': '{}-{}'.format(str(mutation_position), str(mutation_position)),
-            'fill': '#C55337'    # Mut
-        }
-        highlight_regions.append(highlight_region_options)
+    args = parse_args()
+    setup_logging(logging_level=logging.INFO)
 
-        #
-        annotation_options = {
-            'annotation_str': 'M-{}'.format(str(mutation_position)),
-            'anchor': '{}'.format(str(mutation_position)),
-        }
-        annotations.append(annotation_options)
+    # Get the "absolute path" for file / folder
+    rna_lib_struct_summary_file_path = os.path.abspath(args.rna_lib_struct_summary_file)
 
-    # VARNA options
-    options = {
-        'baseNum': '#000000',
-        'highlightRegion': varna.gen_highlight_region_str(highlight_regions),
-        'annotations': varna.gen_annotation_str(annotations),
+    #
+    renderer = args.renderer
+    varna_location = args.varna_location.strip() if args.varna_location else None
+    workers = max(1, args.workers or 1)
+    skip_existing = not args.force
 
-        #
-        'title': rna_id_str
-    }
+    # Output
+    output_folder_path = args.out_folder
+    if not os.path.isabs(output_folder_path):
+        cwd = os.getcwd()
+        output_folder_path = os.path.join(cwd, output_folder_path)
 
-    # "computational"
-    computational_structure_string = rna_item['computational_structure']
     computational_output_folder = os.path.join(output_folder_path, 'computational')
-    if not os.path.exists(computational_output_folder):
-        os.mkdir(computational_output_folder)
-    varna.gen_struct_image(sequence_string, computational_structure_string,
-                           out_file=os.path.join(computational_output_folder, '{}.png'.format(rna_id_str)),
-                           options=options)
-
-    # "experimental", Optional
-    if 'experimental_structure' in rna_item:
-        experimental_structure_string = rna_item['experimental_structure']
-        experimental_output_folder = os.path.join(output_folder_path, 'experimental')
-        if not os.path.exists(experimental_output_folder):
-            os.mkdir(experimental_output_folder)
-        varna.gen_struct_image(sequence_string, experimental_structure_string,
-                               out_file=os.path.join(experimental_output_folder, '{}.png'.format(rna_id_str)),
-                               options=options)
+    experimental_output_folder = os.path.join(output_folder_path, 'experimental')
+    os.makedirs(computational_output_folder, exist_ok=True)
 
+    # Load "RNA Lib Structure Summary" Data
+    with open(rna_lib_struct_summary_file_path) as infile:
+        rna_lib_struct_summary_dict = json.load(infile)
 
-# endregion
+    # VARNA runner, or its SVG stand-in - both take the same options
+    varna = SvgStructureRunner() if renderer == 'svg' else VarnaRunner(varna_location)
+
+    # All images are collected first, then rendered in one batch
+    image_jobs = build_image_jobs(varna, rna_lib_struct_summary_dict,
+                                  computational_output_folder, experimental_output_folder)
+    if any(job['out_file'].startswith(experimental_output_folder) for job in image_jobs):
+        os.makedirs(experimental_output_folder, exist_ok=True)
 
+    report = varna.render_struct_images(image_jobs, workers=workers, skip_existing=skip_existing)
+    logger.info('Images: {}, rendered: {}, up to date: {}, failed: {}'.format(
+        len(image_jobs), len(report.rendered_files), len(report.up_to_date_files), len(report.failed_files)))
+    for failed_file in report.failed_files:
+        logger.error('Image failed: {}'.format(failed_file))
+
+    return 1 if report.failed_files else 0
+
+
+#
+if __name__ == '__main__':
+    sys.exit(main())
+
+# endregion
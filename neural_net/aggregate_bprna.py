@@ -106,11 +106,11 @@ def main():
 
     neil1_names,neil1_seq,neil1_struct,max_len_neil1_seq,max_len_neil1_struct=process_bpRNA(args.neil1_bprna,'NEIL1')
     ttyh2_bc_names,ttyh2_bc_seq,ttyh2_bc_struct,max_len_ttyh2_bc_seq,max_len_ttyh2_bc_struct=process_bpRNA(args.ttyh2_bc_bprna,'TTYH2_BC')
-    ttyh2_ecs_names,ttyh2_ecs_seq,ttyh2_ecs_struct,max_len_ttyh2_ecs_seq,max_len_ttyh2_struct=process_bpRNA(args.ttyh2_ecs_bprna,'TTYH2_ECS')
+    ttyh2_ecs_names,ttyh2_ecs_seq,ttyh2_ecs_struct,max_len_ttyh2_ecs_seq,max_len_ttyh2_ecs_struct=process_bpRNA(args.ttyh2_ecs_bprna,'TTYH2_ECS')
     ajuba_names,ajuba_seq,ajuba_struct,max_len_ajuba_seq,max_len_ajuba_struct=process_bpRNA(args.ajuba_bprna,'AJUBA')
 
     max_seq_length=max([max_len_neil1_seq, max_len_ttyh2_bc_seq, max_len_ttyh2_ecs_seq, max_len_ajuba_seq ])
-    max_struct_length=max([max_len_neil1_struct, max_len_ttyh2_bc_struct, max_len_ttyh2_ecs_seq, max_len_ajuba_struct])
+    max_struct_length=max([max_len_neil1_struct, max_len_ttyh2_bc_struct, max_len_ttyh2_ecs_struct, max_len_ajuba_struct])
     
     print("max seq length:"+str(max_seq_length))
     print("max struct length:"+str(max_struct_length))
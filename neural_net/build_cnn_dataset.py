@@ -0,0 +1,263 @@
+#build one-hot encoded sequence and bpRNA structure tensors for the CNN models.
+#Replaces the per-isoform pickle from aggregate_bprna.py with contiguous arrays:
+#   seq    N x L x 4 (A,C,G,U)
+#   struct N x L x 6 (S,H,B,I,E,M)
+#   y, ids, substrate, length, offset
+#and, for substrates with "bootstraps": true, the bootstrapped structures
+#   bootstrap_struct M x L x 6, bootstrap_owner (row in struct), bootstrap_count
+#written to a single uncompressed .npz (or .h5 when h5py is installed) that open_dataset
+#memory-maps. Substrates are declared in a json config, see cnn_dataset.json
+import argparse
+import gzip
+import json
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+seq_alphabet='ACGU'
+struct_alphabet='SHBIEM'
+padding_modes=['center','left','right']
+
+
+def make_lookup_table(alphabet,case_insensitive=True):
+    #256 x len(alphabet) table indexed by the byte value of a character; anything not in the
+    #alphabet (N, X, K, padding) maps to an all-zero row
+    lut=np.zeros((256,len(alphabet)),dtype=np.uint8)
+    for i,ltr in enumerate(alphabet):
+        lut[ord(ltr),i]=1
+        if case_insensitive:
+            lut[ord(ltr.lower()),i]=1
+    return lut
+
+seq_lut=make_lookup_table(seq_alphabet)
+struct_lut=make_lookup_table(struct_alphabet,case_insensitive=False)
+
+
+def parse_args():
+    parser=argparse.ArgumentParser(description="build memory-mappable CNN inputs from bpRNA outputs")
+    parser.add_argument("--config",help="json file listing the substrates; see cnn_dataset.json")
+    parser.add_argument("--padding",default="center",choices=padding_modes)
+    parser.add_argument("--length",type=int,default=None,help="pad/crop to this length; defaults to the longest entry")
+    parser.add_argument("--dtype",default="uint8",choices=["uint8","float16"],help="dtype of the one-hot tensors")
+    parser.add_argument("--outf",help="output .npz or .h5 file")
+    return parser.parse_args()
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path,'rt')
+    return open(path,'r')
+
+
+def read_bprna(bprna_input,substrate,approach='computational'):
+    '''
+    stream a bpRNA text file and return the ids, sequences and structure strings of the
+    records whose header ends with the requested approach. Each record is
+    >header, #Name, #Length, #PageNumber, sequence, dot-bracket, structure string, ...
+    '''
+    names=[]
+    seqs=[]
+    structs=[]
+    header=None
+    line_index=0
+    with open_text(bprna_input) as f:
+        for line in f:
+            line=line.rstrip('\n')
+            if line.startswith('>'):
+                header=line[1:] if line[1:].endswith(approach) else None
+                line_index=0
+                continue
+            line_index+=1
+            if header is None:
+                continue
+            if line_index==4:
+                seqs.append(line)
+            elif line_index==6:
+                structs.append(line)
+                names.append(substrate+'_'+str(int(header.split(',')[0])))
+                header=None
+    return names,seqs,structs
+
+
+def read_bprna_bootstraps(bprna_input,substrate):
+    '''
+    stream the bootstrapped structures written by bpRNA_wrapper.py, with headers like
+    >001.0,bootstrap,count=813. Returns the owning isoform id, structure string and count of each.
+    '''
+    owners=[]
+    structs=[]
+    counts=[]
+    header=None
+    line_index=0
+    with open_text(bprna_input) as f:
+        for line in f:
+            line=line.rstrip('\n')
+            if line.startswith('>'):
+                fields=line[1:].split(',')
+                header=fields if len(fields)==3 and fields[1]=='bootstrap' else None
+                line_index=0
+                continue
+            line_index+=1
+            if header is not None and line_index==6:
+                owners.append(substrate+'_'+str(int(header[0].split('.')[0])))
+                structs.append(line)
+                counts.append(int(header[2].split('=')[1]))
+                header=None
+    return owners,structs,counts
+
+
+def pad_offsets(lengths,desired_length,padding):
+    to_add=np.maximum(desired_length-lengths,0)
+    if padding=='center':
+        #same split as aggregate_bprna.pad: the extra N goes on the right
+        return to_add//2
+    if padding=='left':
+        return to_add
+    return np.zeros(len(lengths),dtype=np.int64)
+
+
+def one_hot_encode(strings,lut,desired_length,offsets,dtype=np.uint8):
+    '''
+    encode all strings in one pass: the strings are joined into a single byte buffer, mapped
+    through the lookup table and scattered into a preallocated N x L x C array at their offsets.
+    Entries longer than desired_length are cropped.
+    '''
+    lengths=np.array([len(s) for s in strings],dtype=np.int64)
+    out=np.zeros((len(strings),desired_length,lut.shape[1]),dtype=dtype)
+    if len(strings)==0:
+        return out
+    buf=np.frombuffer(''.join(strings).encode('ascii'),dtype=np.uint8)
+    rows=np.repeat(np.arange(len(strings)),lengths)
+    starts=np.cumsum(lengths)-lengths
+    cols=np.arange(len(buf))-np.repeat(starts,lengths)+offsets[rows]
+    keep=cols<desired_length
+    out[rows[keep],cols[keep]]=lut[buf[keep]]
+    return out
+
+
+def load_labels(editing_df,substrate):
+    sep='\t' if editing_df.endswith('.txt') or editing_df.endswith('.tsv') else ','
+    df=pd.read_csv(editing_df,sep=sep)[['rna_id','editing_value']]
+    ids=substrate+'_'+df['rna_id'].astype(int).astype(str)
+    return dict(zip(ids,df['editing_value'].astype(float)))
+
+
+def build_dataset(config,padding='center',length=None,dtype='uint8'):
+    names=[]
+    seqs=[]
+    structs=[]
+    substrates=[]
+    labels=dict()
+    bootstrap_owners=[]
+    bootstrap_structs=[]
+    bootstrap_counts=[]
+    for entry in config['substrates']:
+        substrate=entry['name']
+        cur_names,cur_seqs,cur_structs=read_bprna(entry['bprna'],substrate,entry.get('approach','computational'))
+        print(substrate+": "+str(len(cur_names))+" isoforms")
+        names+=cur_names
+        seqs+=cur_seqs
+        structs+=cur_structs
+        substrates+=[substrate]*len(cur_names)
+        if 'editing_df' in entry:
+            labels.update(load_labels(entry['editing_df'],substrate))
+        if entry.get('bootstraps',False):
+            cur_owners,cur_structs,cur_counts=read_bprna_bootstraps(entry['bprna'],substrate)
+            bootstrap_owners+=cur_owners
+            bootstrap_structs+=cur_structs
+            bootstrap_counts+=cur_counts
+
+    seq_lengths=np.array([len(s) for s in seqs],dtype=np.int64)
+    struct_lengths=np.array([len(s) for s in structs],dtype=np.int64)
+    if length is None:
+        length=int(max(seq_lengths.max(),struct_lengths.max()))
+    print("padded length:"+str(length))
+    offsets=pad_offsets(seq_lengths,length,padding)
+    dataset=dict()
+    dataset['seq']=one_hot_encode(seqs,seq_lut,length,offsets,dtype)
+    dataset['struct']=one_hot_encode(structs,struct_lut,length,pad_offsets(struct_lengths,length,padding),dtype)
+    dataset['y']=np.array([labels.get(n,np.nan) for n in names],dtype=np.float32)
+    dataset['ids']=np.array(names)
+    dataset['substrate']=np.array(substrates)
+    dataset['length']=seq_lengths
+    dataset['offset']=offsets
+    if len(bootstrap_structs)>0:
+        #keep the bootstraps of isoforms in the dataset, aligned with the padding of their isoform
+        row_index=dict(zip(names,range(len(names))))
+        keep=[i for i,owner in enumerate(bootstrap_owners) if owner in row_index]
+        owner_rows=np.array([row_index[bootstrap_owners[i]] for i in keep],dtype=np.int64)
+        cur_structs=[bootstrap_structs[i] for i in keep]
+        #a bootstrap structure has the length of its isoform, so it reuses the isoform's offset
+        dataset['bootstrap_struct']=one_hot_encode(cur_structs,struct_lut,length,offsets[owner_rows],dtype)
+        dataset['bootstrap_owner']=owner_rows
+        dataset['bootstrap_count']=np.array([bootstrap_counts[i] for i in keep],dtype=np.int64)
+    return dataset
+
+
+def save_dataset(dataset,outf):
+    if outf.endswith('.h5') or outf.endswith('.hdf5'):
+        import h5py
+        with h5py.File(outf,'w') as f:
+            for key,value in dataset.items():
+                if value.dtype.kind=='U':
+                    value=value.astype('S')
+                f.create_dataset(key,data=value)
+    else:
+        #uncompressed, so every member can be memory-mapped by open_dataset
+        np.savez(outf,**dataset)
+
+
+def _memmap_npz_member(path,zf,info):
+    #locate the .npy payload of an uncompressed zip member and memory-map it in place
+    with open(path,'rb') as f:
+        f.seek(info.header_offset)
+        local_header=f.read(30)
+        name_len=int.from_bytes(local_header[26:28],'little')
+        extra_len=int.from_bytes(local_header[28:30],'little')
+        f.seek(info.header_offset+30+name_len+extra_len)
+        version=np.lib.format.read_magic(f)
+        if version==(1,0):
+            shape,fortran_order,dtype=np.lib.format.read_array_header_1_0(f)
+        else:
+            shape,fortran_order,dtype=np.lib.format.read_array_header_2_0(f)
+        data_offset=f.tell()
+    if dtype.hasobject:
+        return np.load(zf.open(info.filename))
+    order='F' if fortran_order else 'C'
+    return np.memmap(path,dtype=dtype,mode='r',offset=data_offset,shape=shape,order=order)
+
+
+def open_dataset(path,mmap=True):
+    '''
+    open a dataset written by save_dataset. Arrays in an uncompressed .npz are memory-mapped;
+    .h5 files return the h5py datasets, which read lazily.
+    '''
+    if path.endswith('.h5') or path.endswith('.hdf5'):
+        import h5py
+        return h5py.File(path,'r')
+    if not mmap:
+        return dict(np.load(path))
+    dataset=dict()
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            key=os.path.splitext(info.filename)[0]
+            if info.compress_type!=zipfile.ZIP_STORED:
+                dataset[key]=np.load(zf.open(info.filename))
+            else:
+                dataset[key]=_memmap_npz_member(path,zf,info)
+    return dataset
+
+
+def main():
+    args=parse_args()
+    config=json.load(open(args.config,'r'))
+    dataset=build_dataset(config,padding=args.padding,length=args.length,dtype=args.dtype)
+    print("seq:"+str(dataset['seq'].shape))
+    print("struct:"+str(dataset['struct'].shape))
+    save_dataset(dataset,args.outf)
+
+
+if __name__=="__main__":
+    main()
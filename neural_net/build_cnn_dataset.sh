@@ -0,0 +1,3 @@
+python build_cnn_dataset.py --config cnn_dataset.json \
+       --padding center \
+       --outf cnn_inputs.npz
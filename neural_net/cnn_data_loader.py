@@ -0,0 +1,181 @@
+#shuffled mini-batches for the CNN models, read from the memory-mapped dataset written by
+#build_cnn_dataset.py, so only the rows of the current batch are ever loaded in RAM.
+#Usable directly as a keras Sequence:
+#   train_gen=CNNBatchGenerator('cnn_inputs.npz',train_indices,jitter=5,seed=1234)
+#   model.fit(train_gen,validation_data=CNNBatchGenerator('cnn_inputs.npz',validate_indices,shuffle=False),...)
+import argparse
+import time
+
+import numpy as np
+
+from build_cnn_dataset import open_dataset
+
+try:
+    from keras.utils import Sequence
+except ImportError:
+    Sequence=object
+
+
+def split_indices(num_items,train_split_percent=0.70,eval_split_percent=0.15,seed=1234):
+    #random 70/15/15 train/validate/test split of the dataset rows, as in the CNN notebooks
+    indices=np.random.RandomState(seed).permutation(num_items)
+    num_train=int(round(train_split_percent*num_items))
+    num_eval=int(round(eval_split_percent*num_items))
+    return indices[0:num_train],indices[num_train:num_train+num_eval],indices[num_train+num_eval::]
+
+
+def substrate_indices(dataset,substrates):
+    #rows belonging to any of the given substrates, for the substrate-split notebooks
+    return np.flatnonzero(np.isin(np.asarray(dataset['substrate']),substrates))
+
+
+class CNNBatchGenerator(Sequence):
+    '''
+    Serves ([seq, struct], y) batches from a dataset file.
+
+    jitter: shift each isoform by up to this many positions within its padding. Seq and struct
+        move together and the shift never pushes the isoform off either end, so no
+        nucleotides are lost.
+    bootstrap_structures: replace each isoform's structure with one of its bootstrapped
+        structures, drawn with probability proportional to the bootstrap count. Isoforms
+        without bootstraps keep their own structure. The dataset needs the bootstrap_* arrays.
+    seed: batches depend only on (seed, epoch, batch index), so results do not change with the
+        number of loader workers or the order in which batches are requested.
+    '''
+    def __init__(self,dataset,indices=None,batch_size=32,shuffle=True,jitter=0,bootstrap_structures=False,seed=1234,drop_nan_labels=True):
+        super(CNNBatchGenerator,self).__init__()
+        if isinstance(dataset,str):
+            dataset=open_dataset(dataset)
+        self.dataset=dataset
+        self.seq=dataset['seq']
+        self.struct=dataset['struct']
+        self.y=np.asarray(dataset['y'])
+        self.length=np.asarray(dataset['length'])
+        self.offset=np.asarray(dataset['offset'])
+        if indices is None:
+            indices=np.arange(self.seq.shape[0])
+        indices=np.asarray(indices)
+        if drop_nan_labels:
+            indices=indices[~np.isnan(self.y[indices])]
+        self.indices=indices
+        self.batch_size=batch_size
+        self.shuffle=shuffle
+        self.jitter=jitter
+        self.seed=seed
+        self.epoch=0
+        self.bootstrap_structures=bootstrap_structures
+        if bootstrap_structures:
+            self._index_bootstraps()
+        self._order=self._epoch_order()
+
+    def _index_bootstraps(self):
+        #bootstraps sorted by owner row, each keyed by row + cumulative weight within the row, so
+        #one searchsorted of row + u draws a bootstrap for every row of a batch (inverse CDF)
+        if 'bootstrap_struct' not in self.dataset:
+            raise ValueError("bootstrap_structures=True needs a dataset built with \"bootstraps\": true")
+        self.bootstrap_struct=self.dataset['bootstrap_struct']
+        owner=np.asarray(self.dataset['bootstrap_owner'])
+        weight=np.asarray(self.dataset['bootstrap_count'],dtype=np.float64)
+        num_rows=self.seq.shape[0]
+        order=np.argsort(owner,kind='mergesort')
+        sorted_owner=owner[order]
+        row_total=np.bincount(sorted_owner,weights=weight[order],minlength=num_rows)
+        row_before=np.cumsum(row_total)-row_total
+        cdf=(np.cumsum(weight[order])-row_before[sorted_owner])/row_total[sorted_owner]
+        self.bootstrap_rows=order
+        self.bootstrap_key=sorted_owner+cdf
+        self.bootstrap_num=np.bincount(owner,minlength=num_rows)
+
+    def _epoch_order(self):
+        if not self.shuffle:
+            return self.indices
+        return np.random.RandomState([self.seed,self.epoch]).permutation(self.indices)
+
+    def __len__(self):
+        return int(np.ceil(len(self.indices)/float(self.batch_size)))
+
+    def on_epoch_end(self):
+        self.epoch+=1
+        self._order=self._epoch_order()
+
+    def _sample_bootstraps(self,rows,rng):
+        #bootstrap index for each row, or -1 for rows without bootstraps
+        struct_rows=np.full(len(rows),-1,dtype=np.int64)
+        has_bootstrap=self.bootstrap_num[rows]>0
+        cur=rows[has_bootstrap]
+        picks=np.searchsorted(self.bootstrap_key,cur+rng.random_sample(len(cur)),side='right')
+        struct_rows[has_bootstrap]=self.bootstrap_rows[picks]
+        return struct_rows
+
+    def _shift(self,batch,shifts):
+        #move each row by its shift along the length axis, filling with zeros (padding)
+        positions=np.arange(batch.shape[1])[None,:]-shifts[:,None]
+        valid=(positions>=0)&(positions<batch.shape[1])
+        shifted=np.take_along_axis(batch,np.clip(positions,0,batch.shape[1]-1)[:,:,None],axis=1)
+        shifted[~valid]=0
+        return shifted
+
+    def _take(self,array,rows):
+        #read rows in increasing order, which memory maps and h5py datasets handle best
+        read_order=np.argsort(rows,kind='mergesort')
+        batch=np.empty((len(rows),)+array.shape[1:],dtype=array.dtype)
+        batch[read_order]=np.asarray(array[rows[read_order]])
+        return batch
+
+    def __getitem__(self,index):
+        rows=self._order[index*self.batch_size:(index+1)*self.batch_size]
+        rng=np.random.RandomState([self.seed,self.epoch,index])
+        seq=self._take(self.seq,rows)
+        struct=self._take(self.struct,rows)
+        if self.bootstrap_structures:
+            struct_rows=self._sample_bootstraps(rows,rng)
+            use_bootstrap=struct_rows>=0
+            if use_bootstrap.any():
+                struct[use_bootstrap]=self._take(self.bootstrap_struct,struct_rows[use_bootstrap])
+        if self.jitter>0:
+            offset=self.offset[rows]
+            #isoforms cropped to the window (longer than --length) have no room on the right
+            room_right=np.maximum(seq.shape[1]-self.length[rows]-offset,0)
+            low=np.maximum(-self.jitter,-offset)
+            high=np.minimum(self.jitter,room_right)
+            shifts=low+np.floor(rng.random_sample(len(rows))*(high-low+1)).astype(np.int64)
+            seq=self._shift(seq,shifts)
+            struct=self._shift(struct,shifts)
+        return [seq,struct],self.y[rows]
+
+
+def benchmark(generator,num_batches=None,epochs=1):
+    #batches and samples per second served by the generator
+    num_batches=len(generator) if num_batches is None else min(num_batches,len(generator))
+    num_samples=0
+    start=time.time()
+    for epoch in range(epochs):
+        for i in range(num_batches):
+            X,y=generator[i]
+            num_samples+=len(y)
+        generator.on_epoch_end()
+    elapsed=time.time()-start
+    return {'batches_per_sec':epochs*num_batches/elapsed,'samples_per_sec':num_samples/elapsed,'seconds':elapsed}
+
+
+def parse_args():
+    parser=argparse.ArgumentParser(description="benchmark the CNN batch generator on a dataset file")
+    parser.add_argument("--dataset")
+    parser.add_argument("--batch_size",type=int,default=32)
+    parser.add_argument("--jitter",type=int,default=0)
+    parser.add_argument("--bootstrap_structures",action="store_true")
+    parser.add_argument("--epochs",type=int,default=1)
+    parser.add_argument("--seed",type=int,default=1234)
+    return parser.parse_args()
+
+
+def main():
+    args=parse_args()
+    generator=CNNBatchGenerator(args.dataset,batch_size=args.batch_size,jitter=args.jitter,bootstrap_structures=args.bootstrap_structures,seed=args.seed)
+    result=benchmark(generator,epochs=args.epochs)
+    print("batches/sec:"+str(round(result['batches_per_sec'],1)))
+    print("samples/sec:"+str(round(result['samples_per_sec'],1)))
+
+
+if __name__=="__main__":
+    main()
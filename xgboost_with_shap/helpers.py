@@ -30,13 +30,13 @@ def print_aggregate_peformance_metrics(train_labels,train_preds,eval_labels,eval
             
 
 def aggregate_performance_metrics(train_labels,train_preds,eval_labels,eval_preds,test_labels,test_preds,train_subset=None,eval_subset=None,test_subset=None,positive_thresh=0.5):
-    if train_subset!=None:
+    if train_subset is not None:
         train_labels=train_labels[train_subset]
-        tain_preds=train_preds[train_subset]
-    if eval_subset!=None:
+        train_preds=train_preds[train_subset]
+    if eval_subset is not None:
         eval_labels=eval_labels[eval_subset]
         eval_preds=eval_preds[eval_subset]
-    if test_subset!=None:
+    if test_subset is not None:
         test_labels=test_labels[test_subset]
         test_preds=test_preds[test_subset]
     metrics=dict()
@@ -58,6 +58,163 @@ def get_performance_metrics(labels,preds,positive_thresh):
     return metrics
 
 
+#Vectorized versions of the metrics in get_performance_metrics. Each row of labels/preds is an
+#independent prediction vector (e.g. models x seeds x splits, or bootstrap resamples), so all of
+#them are scored with array operations instead of one scipy/sklearn call per vector.
+batch_metric_names=['Spearman','Pearson','MAE','MAPE','RMSE','auPRC','auROC']
+
+def _dense_ranks(values):
+    #0-based dense ranks of each row; ties share a rank
+    order=np.argsort(values,axis=1,kind='mergesort')
+    sorted_values=np.take_along_axis(values,order,axis=1)
+    new_value=np.ones(values.shape,dtype=bool)
+    new_value[:,1:]=sorted_values[:,1:]!=sorted_values[:,:-1]
+    dense=np.empty(values.shape,dtype=np.int64)
+    np.put_along_axis(dense,order,np.cumsum(new_value,axis=1)-1,axis=1)
+    return dense
+
+def _average_ranks(dense):
+    #1-based average ranks (as in scipy.stats.rankdata) from dense ranks, one bincount for all rows
+    num_rows,num_cols=dense.shape
+    offsets=dense+np.arange(num_rows)[:,None]*num_cols
+    counts=np.bincount(offsets.ravel(),minlength=num_rows*num_cols).reshape(num_rows,num_cols)
+    cum_counts=np.cumsum(counts,axis=1)
+    avg_ranks=cum_counts-(counts-1)/2.0
+    return np.take_along_axis(avg_ranks,dense,axis=1)
+
+def _rowwise_pearson(a,b):
+    a=a-a.mean(axis=1,keepdims=True)
+    b=b-b.mean(axis=1,keepdims=True)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        return (a*b).sum(axis=1)/np.sqrt((a*a).sum(axis=1)*(b*b).sum(axis=1))
+
+def _rowwise_auroc(positive,pred_ranks):
+    #Mann-Whitney U statistic from the average ranks of the predictions
+    num_pos=positive.sum(axis=1)
+    num_neg=positive.shape[1]-num_pos
+    rank_sum=(pred_ranks*positive).sum(axis=1)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        return (rank_sum-num_pos*(num_pos+1)/2.0)/(num_pos*num_neg)
+
+def _rowwise_auprc(positive,pred_dense):
+    #average precision as in sklearn: sum over thresholds of (R_n - R_n-1) * P_n
+    order=np.argsort(-pred_dense,axis=1,kind='mergesort')
+    sorted_dense=np.take_along_axis(pred_dense,order,axis=1)
+    sorted_positive=np.take_along_axis(positive,order,axis=1)
+    tp=np.cumsum(sorted_positive,axis=1)
+    #last position of each group of tied predictions is a threshold
+    threshold=np.ones(tp.shape,dtype=bool)
+    threshold[:,:-1]=sorted_dense[:,:-1]!=sorted_dense[:,1:]
+    prev_tp=np.zeros(tp.shape)
+    prev_tp[:,1:]=np.maximum.accumulate(np.where(threshold,tp,0),axis=1)[:,:-1]
+    precision=tp/np.arange(1,tp.shape[1]+1)
+    num_pos=positive.sum(axis=1)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        return (threshold*(tp-prev_tp)*precision).sum(axis=1)/num_pos
+
+def _batch_metrics(labels,preds,label_dense,pred_dense,positive_thresh,pseudocount=0.01):
+    label_ranks=_average_ranks(label_dense)
+    pred_ranks=_average_ranks(pred_dense)
+    errors=labels-preds
+    metrics=dict()
+    metrics['Spearman']=_rowwise_pearson(label_ranks,pred_ranks)
+    metrics['Pearson']=_rowwise_pearson(labels,preds)
+    metrics['MAE']=np.abs(errors).mean(axis=1)
+    metrics['MAPE']=np.abs(errors/(pseudocount+labels)).mean(axis=1)
+    metrics['RMSE']=np.sqrt((errors*errors).mean(axis=1))
+    #same thresholds as get_performance_metrics
+    metrics['auPRC']=_rowwise_auprc(labels>positive_thresh,pred_dense)
+    metrics['auROC']=_rowwise_auroc(labels>=positive_thresh,pred_ranks)
+    return metrics
+
+def _as_rows(labels,preds):
+    preds=np.atleast_2d(np.asarray(preds,dtype=np.float64))
+    labels=np.asarray(labels,dtype=np.float64)
+    labels=np.broadcast_to(labels,preds.shape) if labels.ndim==1 else labels
+    return labels,preds
+
+def get_performance_metrics_batch(labels,preds,positive_thresh=0.5):
+    """
+    All metrics of get_performance_metrics for many prediction vectors at once.
+    labels is (N,) or (M,N), preds is (N,) or (M,N); returns metric name -> array of length M.
+    Spearman/Pearson are the correlation values only (no p-values).
+    """
+    labels,preds=_as_rows(labels,preds)
+    return _batch_metrics(labels,preds,_dense_ranks(labels),_dense_ranks(preds),positive_thresh)
+
+def bootstrap_performance_metrics(labels,preds,positive_thresh=0.5,n_bootstrap=1000,ci=0.95,seed=1234,chunk_size=100):
+    """
+    Point estimates and percentile bootstrap confidence intervals for every metric and every row
+    of preds (M,N) against labels (N,). The resampling indices are drawn once and shared by all
+    rows, and the rank transforms are computed once on the full vectors and gathered for each
+    resample. Returns metric name -> dict with 'value', 'lower' and 'upper' arrays of length M.
+    """
+    labels=np.asarray(labels,dtype=np.float64)
+    preds=np.atleast_2d(np.asarray(preds,dtype=np.float64))
+    num_models,num_points=preds.shape
+    label_dense=_dense_ranks(labels[None,:])[0]
+    pred_dense=_dense_ranks(preds)
+    point=_batch_metrics(labels[None,:].repeat(num_models,axis=0),preds,label_dense[None,:].repeat(num_models,axis=0),pred_dense,positive_thresh)
+
+    rng=np.random.RandomState(seed)
+    indices=rng.randint(0,num_points,size=(n_bootstrap,num_points))
+    samples={name:np.empty((num_models,n_bootstrap)) for name in batch_metric_names}
+    for start in range(0,n_bootstrap,chunk_size):
+        cur=indices[start:start+chunk_size]
+        num_cur=cur.shape[0]
+        #(models x resamples) rows, each gathered from the precomputed values and dense ranks
+        cur_labels=np.tile(labels[cur],(num_models,1))
+        cur_label_dense=np.tile(label_dense[cur],(num_models,1))
+        cur_preds=preds[:,cur].reshape(num_models*num_cur,num_points)
+        cur_pred_dense=pred_dense[:,cur].reshape(num_models*num_cur,num_points)
+        cur_metrics=_batch_metrics(cur_labels,cur_preds,cur_label_dense,cur_pred_dense,positive_thresh)
+        for name in batch_metric_names:
+            samples[name][:,start:start+num_cur]=cur_metrics[name].reshape(num_models,num_cur)
+
+    alpha=(1-ci)/2.0
+    result=dict()
+    for name in batch_metric_names:
+        result[name]={'value':point[name],
+                      'lower':np.nanquantile(samples[name],alpha,axis=1),
+                      'upper':np.nanquantile(samples[name],1-alpha,axis=1)}
+    return result
+
+def performance_metrics_table(entries,key_names,positive_thresh=0.5,n_bootstrap=0,ci=0.95,seed=1234):
+    """
+    Tidy table (one row per entry and metric) for the barplot/R scripts.
+    entries is a list of (key, labels, preds) where key is a tuple matching key_names,
+    e.g. (model, seed, split). Entries that share the same labels are scored together in one batch.
+    Columns: key_names..., Metric, Value and, when n_bootstrap > 0, Lower and Upper.
+    """
+    groups=dict()
+    for key,labels,preds in entries:
+        labels=np.asarray(labels,dtype=np.float64)
+        group_key=(labels.shape[0],labels.tobytes())
+        if group_key not in groups:
+            groups[group_key]=(labels,[],[])
+        groups[group_key][1].append(key)
+        groups[group_key][2].append(np.asarray(preds,dtype=np.float64))
+    rows=[]
+    for labels,keys,preds in groups.values():
+        preds=np.vstack(preds)
+        if n_bootstrap>0:
+            metrics=bootstrap_performance_metrics(labels,preds,positive_thresh,n_bootstrap=n_bootstrap,ci=ci,seed=seed)
+        else:
+            metrics={name:{'value':values} for name,values in get_performance_metrics_batch(labels,preds,positive_thresh).items()}
+        for i,key in enumerate(keys):
+            for name in batch_metric_names:
+                row=dict(zip(key_names,key))
+                row['Metric']=name
+                row['Value']=metrics[name]['value'][i]
+                if n_bootstrap>0:
+                    row['Lower']=metrics[name]['lower'][i]
+                    row['Upper']=metrics[name]['upper'][i]
+                rows.append(row)
+    columns=list(key_names)+['Metric','Value']+(['Lower','Upper'] if n_bootstrap>0 else [])
+    return pd.DataFrame(rows,columns=columns)
+
+
+
 
 def shap_contribs_subgroup(shap_values,feature_group):
     shap_mean_abs_by_subject=abs(shap_values).mean(axis=0)
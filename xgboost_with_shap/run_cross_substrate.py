@@ -0,0 +1,220 @@
+#train xgboost models on one set of substrates and evaluate them on others, for a grid of
+#(train substrates, test substrates, feature subsets, seeds). The feature matrices are encoded
+#with format_for_xgboost once, saved as .npy files, and memory-mapped by every worker process.
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from helpers import *
+import feature_subsets
+
+metric_names=['Spearman','Pearson','MAE','MAPE','RMSE','auPRC','auROC']
+helper_metric_names=['Spearman corr','Pearson corr','MAE','MAPE','RMSE','auPRC','auROC']
+
+#memory-mapped matrices, loaded once per worker process
+worker_data=dict()
+
+
+def parse_args():
+    parser=argparse.ArgumentParser(description="Parallel cross-substrate training and evaluation of xgboost models")
+    parser.add_argument("--feature_matrices",nargs="+",help="feature matrix csv files, one per substrate")
+    parser.add_argument("--substrates",nargs="+",help="substrate names, in the same order as --feature_matrices")
+    parser.add_argument("--train",nargs="+",help="training substrate groups; join substrates with ',' to train on several, e.g. NEIL1,AJUBA")
+    parser.add_argument("--test",nargs="+",default=None,help="test substrates; defaults to every substrate not used for training")
+    parser.add_argument("--feature_subsets",nargs="+",default=["all"],help="names of lists in feature_subsets.py; 'all' uses every feature")
+    parser.add_argument("--seeds",nargs="+",type=int,default=[1234])
+    parser.add_argument("--positive_thresh",type=float,default=0.2)
+    parser.add_argument("--num_round",type=int,default=1000)
+    parser.add_argument("--early_stopping_rounds",type=int,default=10)
+    parser.add_argument("--nthread",type=int,default=1,help="xgboost threads per job")
+    parser.add_argument("--n_jobs",type=int,default=os.cpu_count(),help="number of worker processes")
+    parser.add_argument("--cache_dir",default="encoded_matrices",help="folder for the memory-mapped encoded matrices")
+    parser.add_argument("--outf",help="output performance table, tab-separated")
+    return parser.parse_args()
+
+
+#bump when format_for_xgboost or the encoding below changes, so cached matrices are re-encoded
+ENCODING_VERSION=1
+
+
+def encoding_key(substrate,feature_matrix):
+    '''
+    everything the encoded matrix depends on: the input file (path, size, mtime) and the encoding version.
+    '''
+    stat=os.stat(feature_matrix)
+    return {'substrate':substrate,
+            'feature_matrix':os.path.abspath(feature_matrix),
+            'size':stat.st_size,
+            'mtime':stat.st_mtime,
+            'encoding_version':ENCODING_VERSION}
+
+
+def encode_substrate(substrate,feature_matrix,cache_dir):
+    '''
+    format a feature matrix for xgboost and save it to cache_dir as a float32 .npy file.
+    The cache file name includes a hash of encoding_key, so a different input file or encoding
+    never reuses a stale matrix. Files are written under a temporary name and renamed, so an
+    interrupted run never leaves a truncated matrix behind.
+    '''
+    key=encoding_key(substrate,feature_matrix)
+    key_hash=hashlib.sha1(json.dumps(key,sort_keys=True).encode('utf-8')).hexdigest()[0:12]
+    prefix=os.path.join(cache_dir,substrate+'.'+key_hash)
+    x_path=prefix+'.X.npy'
+    columns_path=prefix+'.columns.json'
+    if os.path.exists(x_path) and os.path.exists(columns_path):
+        return prefix
+    sep='\t' if feature_matrix.endswith('.txt') or feature_matrix.endswith('.tsv') else ','
+    data=pd.read_csv(feature_matrix,header=0,sep=sep,index_col=0)
+    #remove any null editing level values
+    data=data[~data["editing_value"].isnull().values]
+    data=format_for_xgboost(data)
+    data=data.apply(pd.to_numeric,errors='coerce')
+    #the matrix is written last: it marks the cache entry as complete
+    with open(columns_path+'.tmp','w') as outf:
+        json.dump(list(data.columns),outf)
+    os.replace(columns_path+'.tmp',columns_path)
+    with open(x_path+'.tmp','wb') as outf:
+        np.save(outf,data.values.astype(np.float32))
+    os.replace(x_path+'.tmp',x_path)
+    return prefix
+
+
+def load_substrate(prefix):
+    if prefix not in worker_data:
+        X=np.load(prefix+'.X.npy',mmap_mode='r')
+        columns=json.load(open(prefix+'.columns.json','r'))
+        worker_data[prefix]=(X,columns)
+    X,columns=worker_data[prefix]
+    return pd.DataFrame(np.asarray(X),columns=columns)
+
+
+def get_feature_subset(name):
+    if name=="all":
+        return None
+    if not hasattr(feature_subsets,name):
+        raise ValueError("Feature subset "+name+" is not defined in feature_subsets.py")
+    return getattr(feature_subsets,name)
+
+
+def run_job(job):
+    train_prefixes,test_prefix,subset_name,seed,args=job
+    random.seed(seed)
+    np.random.seed(seed)
+
+    train_data=pd.concat([load_substrate(p) for p in train_prefixes],axis=0,sort=False)
+    train_split,eval_split=split_train_eval_by_mut_pos(train_data[~train_data['mut_pos'].isna()])
+    null_mut_pos=train_data[train_data['mut_pos'].isna()]
+    train_split=pd.concat((train_split,null_mut_pos),axis=0)
+    test_split=load_substrate(test_prefix)
+
+    train_split.reset_index(inplace=True,drop=True)
+    eval_split.reset_index(inplace=True,drop=True)
+    test_split.reset_index(inplace=True,drop=True)
+
+    #remove features that don't change across isoforms, or are null for all isoforms
+    to_drop=set()
+    for split in [train_split,eval_split,test_split]:
+        to_drop.update(get_singleval_features(split))
+        to_drop.update(get_all_null_features(split))
+    to_drop.discard('editing_value')
+
+    #keep the columns present in all three splits
+    common=set(train_split.columns).intersection(eval_split.columns).intersection(test_split.columns)
+    common=common-to_drop-set(['editing_value'])
+    subset=get_feature_subset(subset_name)
+    if subset is not None:
+        common=common.intersection(filter_features(train_split,subset))
+    common=sorted(common)
+
+    import xgboost
+    dtrain=xgboost.DMatrix(train_split[common],train_split['editing_value'])
+    deval=xgboost.DMatrix(eval_split[common],eval_split['editing_value'])
+    dtest=xgboost.DMatrix(test_split[common],test_split['editing_value'])
+    param=dict()
+    param['nthread']=args.nthread
+    param['seed']=seed
+    #the last metric in 'eval_metric' is used for early stopping, as in the notebooks. The ranking
+    #metrics (aucpr, auc, map) are left out since newer xgboost rejects them for continuous labels
+    param['eval_metric']=['mae','rmse']
+    evallist=[(deval,'eval'),(dtrain,'train')]
+    bst=xgboost.train(param,dtrain,args.num_round,evallist,early_stopping_rounds=args.early_stopping_rounds,verbose_eval=False)
+
+    metrics=aggregate_performance_metrics(train_split['editing_value'].values,
+                                          bst.predict(dtrain),
+                                          eval_split['editing_value'].values,
+                                          bst.predict(deval),
+                                          test_split['editing_value'].values,
+                                          bst.predict(dtest),
+                                          positive_thresh=args.positive_thresh)
+    return metrics
+
+
+def main():
+    args=parse_args()
+    if len(args.feature_matrices)!=len(args.substrates):
+        raise ValueError("--feature_matrices and --substrates must have the same length")
+    if not os.path.exists(args.cache_dir):
+        os.makedirs(args.cache_dir)
+
+    #encode every substrate once; the workers only memory-map the results
+    prefixes=dict()
+    for substrate,feature_matrix in zip(args.substrates,args.feature_matrices):
+        print("encoding features for substrate:"+substrate)
+        prefixes[substrate]=encode_substrate(substrate,feature_matrix,args.cache_dir)
+
+    jobs=[]
+    for train_group in args.train:
+        train_substrates=train_group.split(',')
+        if args.test is None:
+            test_substrates=[s for s in args.substrates if s not in train_substrates]
+        else:
+            test_substrates=args.test
+        for test_substrate,subset_name,seed in itertools.product(test_substrates,args.feature_subsets,args.seeds):
+            get_feature_subset(subset_name)
+            job=([prefixes[s] for s in train_substrates],prefixes[test_substrate],subset_name,seed,args)
+            jobs.append((train_group,test_substrate,subset_name,seed,job))
+    print("scheduling "+str(len(jobs))+" jobs across "+str(args.n_jobs)+" workers")
+
+    rows=[]
+    with ProcessPoolExecutor(max_workers=args.n_jobs) as executor:
+        futures=dict()
+        for train_group,test_substrate,subset_name,seed,job in jobs:
+            futures[executor.submit(run_job,job)]=(train_group,test_substrate,subset_name,seed)
+        for future in as_completed(futures):
+            train_group,test_substrate,subset_name,seed=futures[future]
+            metrics=future.result()
+            print("finished train:"+train_group+" test:"+test_substrate+" subset:"+subset_name+" seed:"+str(seed))
+            for split in ['Train','Eval','Test']:
+                row=dict()
+                #the barplot scripts melt on the character columns, so the seed is written as a label
+                row['Substrate']=test_substrate if split=='Test' else train_group.replace(',','+')
+                row['Train']=train_group.replace(',','+')
+                row['Test']=test_substrate
+                row['FeatureSubset']=subset_name
+                row['Seed']='seed'+str(seed)
+                row['Split']=split
+                for name,helper_name in zip(metric_names,helper_metric_names):
+                    value=metrics[split][helper_name]
+                    #spearmanr/pearsonr return (correlation, p-value)
+                    if isinstance(value,tuple) or hasattr(value,'statistic'):
+                        value=value[0]
+                    row[name]=float(value)
+                rows.append(row)
+
+    columns=['Substrate','Train','Test','FeatureSubset','Seed','Split']+metric_names
+    table=pd.DataFrame(rows,columns=columns)
+    table=table.sort_values(by=['Train','Test','FeatureSubset','Seed','Split'])
+    table.to_csv(args.outf,sep='\t',index=False,header=True)
+
+
+if __name__=="__main__":
+    main()
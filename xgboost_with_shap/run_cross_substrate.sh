@@ -0,0 +1,8 @@
+python run_cross_substrate.py --feature_matrices ../feature_matrices/neil1_computational.features.csv ../feature_matrices/ttyh2_computational.features.csv ../feature_matrices/ajuba_bc_computational.features.csv \
+       --substrates NEIL1 TTYH2 AJUBA \
+       --train NEIL1 TTYH2 AJUBA NEIL1,AJUBA AJUBA,TTYH2 \
+       --feature_subsets all mut site u_d no_mut \
+       --seeds 1234 1235 1236 \
+       --nthread 4 \
+       --n_jobs 8 \
+       --outf performance_barplots/Cross_Substrate_Performance.tsv
@@ -0,0 +1,127 @@
+#batched, cached TreeSHAP values and per-feature-group importances for xgboost models
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import feature_subsets
+
+
+def model_hash(bst):
+    return hashlib.sha1(bytes(bst.save_raw())).hexdigest()
+
+
+def data_hash(X):
+    h=hashlib.sha1()
+    h.update('\t'.join([str(c) for c in X.columns]).encode())
+    h.update(np.ascontiguousarray(X.values,dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+
+def compute_shap_values(bst,X,chunk_size=1000,n_threads=None,cache_dir=None):
+    '''
+    TreeSHAP values (xgboost pred_contribs) for every row of X, computed in row chunks across
+    a thread pool. The bias column is dropped so the result lines up with X.columns.
+    When cache_dir is set the values are stored there, keyed by model hash + data hash, and
+    later calls with the same model and data load them back memory-mapped.
+    '''
+    import xgboost
+    cache_path=None
+    if cache_dir is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        cache_path=os.path.join(cache_dir,model_hash(bst)+'.'+data_hash(X)+'.shap.npy')
+        if os.path.exists(cache_path):
+            return pd.DataFrame(np.load(cache_path,mmap_mode='r'),columns=X.columns,index=X.index)
+    if n_threads is None:
+        n_threads=os.cpu_count()
+    values=np.ascontiguousarray(X.values,dtype=np.float32)
+    shap_values=np.empty(values.shape,dtype=np.float32)
+
+    def predict_chunk(start):
+        end=min(start+chunk_size,values.shape[0])
+        dchunk=xgboost.DMatrix(values[start:end],feature_names=list(X.columns))
+        contribs=bst.predict(dchunk,pred_contribs=True)
+        shap_values[start:end]=contribs[:,:-1]
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        list(executor.map(predict_chunk,range(0,values.shape[0],chunk_size)))
+    if cache_path is not None:
+        #write to a temporary file and rename it, so an interrupted run never leaves a truncated cache
+        fd,tmp_path=tempfile.mkstemp(dir=cache_dir,suffix='.shap.npy.tmp')
+        try:
+            with os.fdopen(fd,'wb') as outf:
+                np.save(outf,shap_values)
+            os.replace(tmp_path,cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return pd.DataFrame(shap_values,columns=X.columns,index=X.index)
+
+
+def get_feature_groups(module=feature_subsets):
+    #every list of feature patterns defined in feature_subsets.py, keyed by its name
+    groups=dict()
+    for name in dir(module):
+        value=getattr(module,name)
+        if not name.startswith('_') and isinstance(value,list):
+            groups[name]=value
+    return groups
+
+
+def build_group_index(columns,groups):
+    '''
+    (num features x num groups) indicator matrix; entry [i,j] is 1 when column i matches any
+    of the regex patterns of group j, with the same matching as helpers.filter_features.
+    A column matched by several patterns of the same group is counted once.
+    '''
+    columns=list(columns)
+    group_names=list(groups.keys())
+    index=np.zeros((len(columns),len(group_names)),dtype=np.float64)
+    compiled=dict()
+    for j,name in enumerate(group_names):
+        for pattern in groups[name]:
+            if pattern not in compiled:
+                regex=re.compile(pattern)
+                compiled[pattern]=np.array([regex.search(str(c)) is not None for c in columns],dtype=bool)
+            index[compiled[pattern],j]=1
+    return pd.DataFrame(index,index=columns,columns=group_names)
+
+
+def group_importances(shap_values,groups=None,group_index=None):
+    '''
+    Fraction of the total mean |SHAP| attributed to each feature group, for all groups at once.
+    shap_values is a DataFrame of per-row SHAP values; pass a prebuilt group_index to reuse it
+    across models that share columns.
+    '''
+    if group_index is None:
+        if groups is None:
+            groups=get_feature_groups()
+        group_index=build_group_index(shap_values.columns,groups)
+    mean_abs=np.abs(np.asarray(shap_values,dtype=np.float64)).mean(axis=0)
+    mean_abs_norm=mean_abs/mean_abs.sum()
+    contribs=mean_abs_norm@group_index.values
+    return pd.Series(contribs,index=group_index.columns,name='contribution')
+
+
+def group_importance_table(shap_values_by_model,groups=None):
+    '''
+    Long table of group importances (model, subset, contribution) for a dict of
+    model name -> SHAP value DataFrame. The group index is built once per distinct column set.
+    '''
+    if groups is None:
+        groups=get_feature_groups()
+    group_indexes=dict()
+    tables=[]
+    for model_name,shap_values in shap_values_by_model.items():
+        key=tuple(shap_values.columns)
+        if key not in group_indexes:
+            group_indexes[key]=build_group_index(shap_values.columns,groups)
+        contribs=group_importances(shap_values,group_index=group_indexes[key])
+        table=pd.DataFrame({'model':model_name,'subset':contribs.index,'contribution':contribs.values})
+        tables.append(table)
+    return pd.concat(tables,axis=0,ignore_index=True)